@@ -1,7 +1,7 @@
 #!/bin/bash
 
 if [ "$#" -lt 2 ]; then
-    echo "Usage: $0 <nuke-version> <windows/linux> [optional: --podman, --skip-load]"
+    echo "Usage: $0 <nuke-version> <windows/linux> [optional: --podman, --skip-load, --skip-export]"
     exit 1
 fi
 
@@ -9,14 +9,21 @@ NUKEVERSION="$1"
 OPERATING_SYSTEM="$2"
 USE_PODMAN=false
 SKIP_LOAD=false
+SKIP_EXPORT=false
 
 for arg in "${@:3}"; do
     case "$arg" in
         --podman) USE_PODMAN=true ;;
         --skip-load) SKIP_LOAD=true ;;
+        --skip-export) SKIP_EXPORT=true ;;
     esac
 done
 
+if $USE_PODMAN && $SKIP_EXPORT; then
+    echo "Podman builds in its own storage, --skip-export is only supported for docker."
+    exit 1
+fi
+
 
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
@@ -53,9 +60,11 @@ else
         --rm \
         docker.io/docker:dind \
         sh -c "apk add --no-cache bash && \
-        /nukedockerbuild/scripts/build.sh ${NUKEVERSION} ${OPERATING_SYSTEM}"
+        /nukedockerbuild/scripts/build.sh ${NUKEVERSION} ${OPERATING_SYSTEM} $($SKIP_EXPORT && echo --skip-export)"
 
-    if ! $SKIP_LOAD; then
+    # The image is built with the docker socket of the host, so without
+    # an export it is already available and there is nothing to load.
+    if ! $SKIP_LOAD && ! $SKIP_EXPORT; then
         docker load -i ${SCRIPT_DIR}/build/nukedockerbuild:${NUKEVERSION}-${OPERATING_SYSTEM}.tar.gz
         docker run \
             -v "${SCRIPT_DIR}/build:/build" \
@@ -4,6 +4,10 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 for directory in ./dockerfiles/*/; do
     version=$(basename "$directory") 
+    # Base images are built by build.sh for the images that use them.
+    if [ "$version" = "base" ]; then
+        continue
+    fi
     for system in "$directory"*; do
         operating_system=$(basename "$system")
         ${SCRIPT_DIR}/build.sh $version $operating_system
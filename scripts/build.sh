@@ -1,17 +1,21 @@
 #!/bin/bash
 
 if [ "$#" -lt 2 ]; then
-    echo "Usage: $0 <nuke-version> <windows/linux> [optional: --podman]"
+    echo "Usage: $0 <nuke-version> <windows/linux> [optional: --podman, --skip-export]"
     exit 1
 fi
 
 NUKEVERSION="$1"
 OPERATING_SYSTEM="$2"
 USE_PODMAN=false
+SKIP_EXPORT=false
 
-if [ "$#" -eq 3 ] && [ "$3" == "--podman" ]; then
-    USE_PODMAN=true
-fi
+for arg in "${@:3}"; do
+    case "$arg" in
+        --podman) USE_PODMAN=true ;;
+        --skip-export) SKIP_EXPORT=true ;;
+    esac
+done
 
 MAIN_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
 DOCKERFILE_DIR=${MAIN_DIR}/dockerfiles/${NUKEVERSION}/${OPERATING_SYSTEM}
@@ -53,32 +57,75 @@ cd ${MAIN_DIR}/dockerfiles/${NUKEVERSION}/${OPERATING_SYSTEM} || exit 1
 echo "Creating image for Nuke version: ${NUKEVERSION}:${OPERATING_SYSTEM}"
 SOURCES_DIR="_nuke_sources"
 
-mkdir -p ${SOURCES_DIR}
-${MAIN_DIR}/scripts/get_nuke_${OPERATING_SYSTEM}.sh Dockerfile ${SOURCES_DIR}
+NUKE_SOURCE=$(grep "LABEL 'com.nukedockerbuild.nuke_source'" Dockerfile | awk -F"=" '{print $2}' | tr -d "'")
+
+if [ -f "${SOURCES_DIR}.prepared" ] && [ "$(cat ${SOURCES_DIR}.prepared)" == "${NUKE_SOURCE}" ]; then
+    echo "Using Nuke sources that are already prepared for ${NUKE_SOURCE}"
+else
+    rm -rf ${SOURCES_DIR} ${SOURCES_DIR}_shared ${SOURCES_DIR}.prepared
+    mkdir -p ${SOURCES_DIR}
+    ${MAIN_DIR}/scripts/get_nuke_${OPERATING_SYSTEM}.sh Dockerfile ${SOURCES_DIR}
+fi
+
+# Prepared sources can be hard links into the file store. Remove files
+# before they are overwritten, so the stored copy is never written to.
+remove_overwritten() {
+    find "$1" ! -type d -exec sh -c 'rm -f "$0/$1"' "${SOURCES_DIR}" {} \;
+}
 
 if [ -d "cmake" ]; then
     echo "Found cmake folder for backwards compatibility"
+    remove_overwritten cmake
     cp -r cmake ${SOURCES_DIR}
 fi
 
 if [ -d "tests" ]; then
     echo "Found test folder for backwards compatibility"
+    remove_overwritten tests
     cp -r tests ${SOURCES_DIR}
 fi
 
+BUILD_ARGS=(--build-arg NUKE_SOURCE_FILES=${SOURCES_DIR})
+# Only dockerfiles with shared sources declare the argument. The files shared
+# by all minor versions of the major are only split off when the sources are
+# prepared on the host, otherwise the folder stays empty.
+if grep -q "^ARG NUKE_SHARED_SOURCE_FILES$" Dockerfile; then
+    mkdir -p ${SOURCES_DIR}_shared
+    BUILD_ARGS+=(--build-arg NUKE_SHARED_SOURCE_FILES=${SOURCES_DIR}_shared)
+fi
+
+BASE_IMAGE=$(grep -m1 "^FROM nukedockerbuild-base:" Dockerfile | awk '{print $2}')
+if [ -n "${BASE_IMAGE}" ]; then
+    BASE_DIR=${MAIN_DIR}/dockerfiles/base/${BASE_IMAGE#nukedockerbuild-base:}
+    # The base image is also tagged with a hash of its build context, so an
+    # edited base dockerfile is built again instead of reusing the old image.
+    CONTEXT_HASH=$(cd "${BASE_DIR}" && find . -type f | LC_ALL=C sort | xargs sha256sum | sha256sum | cut -c1-12)
+    CONTEXT_IMAGE=${BASE_IMAGE}-${CONTEXT_HASH}
+    if $USE_PODMAN; then
+        podman image exists ${CONTEXT_IMAGE} || podman build -t ${BASE_IMAGE} -t ${CONTEXT_IMAGE} ${BASE_DIR}
+    else
+        docker image inspect ${CONTEXT_IMAGE} > /dev/null 2>&1 || docker buildx build -t ${BASE_IMAGE} -t ${CONTEXT_IMAGE} ${BASE_DIR}
+    fi
+fi
+
 if $USE_PODMAN; then
     podman build \
         -t nukedockerbuild:${NUKEVERSION}-${OPERATING_SYSTEM} \
-        --build-arg NUKE_SOURCE_FILES=${SOURCES_DIR} \
+        "${BUILD_ARGS[@]}" \
         .
 
     podman save nukedockerbuild:${NUKEVERSION}-${OPERATING_SYSTEM} | gzip > /build/nukedockerbuild-${NUKEVERSION}-${OPERATING_SYSTEM}.tar.gz
 else
     docker buildx build \
         -t nukedockerbuild:${NUKEVERSION}-${OPERATING_SYSTEM} \
-        --build-arg NUKE_SOURCE_FILES=${SOURCES_DIR} \
+        "${BUILD_ARGS[@]}" \
         .
 
+    if $SKIP_EXPORT; then
+        echo "Skipping export, the image is exported on the host."
+        exit 0
+    fi
+
     docker save nukedockerbuild:${NUKEVERSION}-${OPERATING_SYSTEM} | gzip > /build/nukedockerbuild-${NUKEVERSION}-${OPERATING_SYSTEM}.tar.gz
     chmod 777 /build/nukedockerbuild:${NUKEVERSION}-${OPERATING_SYSTEM}.tar.gz
 fi
@@ -20,14 +20,43 @@ fi
 
 filename=$(basename "$url")
 nuke_temp_files=/tmp/nuke_temp_files
+script_dir="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+cached_installer=${script_dir}/../build/cache/installers/urls/$(printf '%s' "$url" | sha256sum | cut -d' ' -f1)
+lock_file=${script_dir}/../sources.lock
+
+expected_sha256=""
+if [ -f "${lock_file}" ]; then
+    expected_sha256=$(awk -v version="$version" -v url="$url" '$1 == version && $2 == "linux" && $6 == url {print $3}' "${lock_file}")
+fi
+
+verify_installer() {
+    if [ -n "${expected_sha256}" ] && [ "$1" != "${expected_sha256}" ]; then
+        echo "Error: installer does not match sources.lock, expected ${expected_sha256} but got $1."
+        rm -rf ${nuke_temp_files}
+        exit 1
+    fi
+}
 
 echo "Download and extract Nuke in temp folder"
 mkdir ${nuke_temp_files}
-curl -o ${nuke_temp_files}/${filename} ${url}
-tar zxvf ${nuke_temp_files}/${filename} -C ${nuke_temp_files}
+if [ -f "${cached_installer}" ]; then
+    echo "Using cached installer: ${cached_installer}"
+    # Cached installers link to a blob named after their sha256.
+    verify_installer "$(basename "$(readlink "${cached_installer}")")"
+    tar zxvf ${cached_installer} -C ${nuke_temp_files}
+else
+    # The installer is hashed while it is downloaded.
+    set -o pipefail
+    actual_sha256=$(curl -fsSL ${url} | tee ${nuke_temp_files}/${filename} | sha256sum | cut -d' ' -f1) || {
+        echo "Error: download of ${url} failed."
+        exit 1
+    }
+    verify_installer "${actual_sha256}"
+    tar zxvf ${nuke_temp_files}/${filename} -C ${nuke_temp_files}
 
-echo "Remove compressed Nuke"
-rm ${nuke_temp_files}/${filename}
+    echo "Remove compressed Nuke"
+    rm ${nuke_temp_files}/${filename}
+fi
 
 echo "Install Nuke to ${target_folder}"
 if (( $(echo "$version < 12.0" | bc -l) )); then
@@ -47,5 +76,23 @@ fi
 
 find ${target_folder} -mindepth 1 -maxdepth 1 ! -name "tests" ! -name "cmake" ! -name "include" ! -name "*Fdk*" ! -name "*Fn*" ! -name "*Ndk*" ! -name "*DDI*" ! -name "source" -exec rm -rf {} \;
 
+# The retain manifest lists the headers the NDK examples include and the
+# libraries cmake links, see nuke-dockerbuild build --scan_includes. It is
+# only used for the installer it is computed from, and never if it lists
+# no files, as that would remove every file.
+retain_manifest="$(cd "$(dirname "$dockerfile_path")" && pwd)/_nuke_sources.retain"
+if [ -f "${retain_manifest}" ]; then
+    manifest_source=$(sed -n 's/^# nuke_source: //p' "${retain_manifest}" | head -n 1)
+    if [ "${manifest_source}" != "${url}" ]; then
+        echo "Ignoring ${retain_manifest}, it is not computed from ${url}"
+    elif ! grep -qv -e '^#' -e '^$' "${retain_manifest}"; then
+        echo "Ignoring ${retain_manifest}, it does not list any file"
+    else
+        echo "Keep only files listed in ${retain_manifest}"
+        (cd ${target_folder} && find . ! -type d -printf '%P\n' | grep -vxFf <(grep -v -e '^#' -e '^$' "${retain_manifest}") | xargs -r -d '\n' rm -f)
+        find ${target_folder} -mindepth 1 -type d -empty -delete
+    fi
+fi
+
 echo "Clean nuke temp files"
 rm -rf ${nuke_temp_files}
@@ -19,17 +19,46 @@ fi
 
 filename=$(basename "$url")
 nuke_temp_files=/tmp/nuke_temp_files
+script_dir="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+cached_installer=${script_dir}/../build/cache/installers/urls/$(printf '%s' "$url" | sha256sum | cut -d' ' -f1)
+lock_file=${script_dir}/../sources.lock
+
+expected_sha256=""
+if [ -f "${lock_file}" ]; then
+    expected_sha256=$(awk -v version="$version" -v url="$url" '$1 == version && $2 == "windows" && $6 == url {print $3}' "${lock_file}")
+fi
+
+verify_installer() {
+    if [ -n "${expected_sha256}" ] && [ "$1" != "${expected_sha256}" ]; then
+        echo "Error: installer does not match sources.lock, expected ${expected_sha256} but got $1."
+        rm -rf ${nuke_temp_files}
+        exit 1
+    fi
+}
 
 mkdir -p ${target_folder}
 
 
 echo "Download and extract Nuke in temp folder"
 mkdir -p ${nuke_temp_files}
-curl -o ${nuke_temp_files}/${filename} ${url}
-unzip ${nuke_temp_files}/${filename} -d ${nuke_temp_files}
+if [ -f "${cached_installer}" ]; then
+    echo "Using cached installer: ${cached_installer}"
+    # Cached installers link to a blob named after their sha256.
+    verify_installer "$(basename "$(readlink "${cached_installer}")")"
+    unzip ${cached_installer} -d ${nuke_temp_files}
+else
+    # The installer is hashed while it is downloaded.
+    set -o pipefail
+    actual_sha256=$(curl -fsSL ${url} | tee ${nuke_temp_files}/${filename} | sha256sum | cut -d' ' -f1) || {
+        echo "Error: download of ${url} failed."
+        exit 1
+    }
+    verify_installer "${actual_sha256}"
+    unzip ${nuke_temp_files}/${filename} -d ${nuke_temp_files}
 
-echo "Remove compressed Nuke"
-rm ${nuke_temp_files}/${filename}
+    echo "Remove compressed Nuke"
+    rm ${nuke_temp_files}/${filename}
+fi
 
 echo "Install Nuke to temp directory in Wine"
 
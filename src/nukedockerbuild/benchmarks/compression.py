@@ -0,0 +1,170 @@
+"""Benchmark of the export codecs on a synthetic image tarball.
+
+Run with: python -m nukedockerbuild.benchmarks.compression --size 512
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+from nukedockerbuild.builder.export import (
+    BLOCK_SIZE,
+    Codec,
+    CompressionOptions,
+    CompressionResult,
+    compress_stream,
+)
+
+_LAYER_SIZE = 64 * 1024 * 1024
+"""Size of a single layer in the synthetic image."""
+
+_TEXT = (
+    b'#include "DDImage/Iop.h"\n'
+    b"set(CMAKE_CXX_STANDARD 17)\n"
+    b"/usr/local/nuke_install/include/DDImage/Knobs.h\n"
+)
+
+
+def write_synthetic_image(path: Path, size: int, seed: int = 0) -> None:
+    """Write a tarball shaped like the output of docker save.
+
+    Layers are a mix of random data, like compiled binaries, and
+    repeating text, like headers and scripts.
+
+    Args:
+        path: path to write the tarball to.
+        size: approximate size of all layers in bytes.
+        seed: seed of the random data, for reproducible results.
+    """
+    generator = random.Random(seed)
+    layers = []
+    with tarfile.open(path, "w") as tar:
+        remaining = size
+        while remaining > 0:
+            layer_size = min(_LAYER_SIZE, remaining)
+            remaining -= layer_size
+            random_size = layer_size // 2
+            content = generator.randbytes(random_size) + (
+                _TEXT * (layer_size // len(_TEXT) + 1)
+            )[: layer_size - random_size]
+            name = f"{len(layers):04d}/layer.tar"
+            layers.append(name)
+            _add_file(tar, name, content)
+        _add_file(
+            tar,
+            "manifest.json",
+            json.dumps([{"Layers": layers}]).encode(),
+        )
+
+
+def _add_file(tar: tarfile.TarFile, name: str, content: bytes) -> None:
+    """Add a file with content to the tarball."""
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+
+
+def _compress_single_threaded(source: Path, level: int) -> CompressionResult:
+    """Compress like gzip in build.sh does, as baseline."""
+    start = time.perf_counter()
+    with (
+        source.open("rb") as file,
+        tempfile.TemporaryFile() as output,
+    ):
+        with gzip.GzipFile(
+            fileobj=output, mode="wb", compresslevel=level, mtime=0
+        ) as compressed:
+            shutil.copyfileobj(file, compressed, BLOCK_SIZE)
+        output_bytes = output.tell()
+    return CompressionResult(
+        codec=Codec.GZIP,
+        input_bytes=source.stat().st_size,
+        output_bytes=output_bytes,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def benchmark_codecs(
+    source: Path,
+    threads: int,
+    codecs: list[Codec] | None = None,
+    levels: list[int] | None = None,
+) -> list[dict]:
+    """Compress the tarball with every codec and level.
+
+    Args:
+        source: the tarball to compress.
+        threads: amount of worker threads for the parallel codecs.
+        codecs: codecs to benchmark, defaults to all.
+        levels: levels to benchmark, defaults to the codec default.
+
+    Returns:
+        a result per run, starting with single threaded gzip.
+    """
+    baseline = _compress_single_threaded(source, Codec.GZIP.default_level)
+    results = [{"name": "gzip single thread", "threads": 1}]
+    results[0].update(baseline.to_dict())
+    for codec in codecs or list(Codec):
+        for level in levels or [codec.default_level]:
+            with source.open("rb") as file, tempfile.TemporaryFile() as output:
+                result = compress_stream(
+                    file,
+                    output,
+                    CompressionOptions(codec, level=level, threads=threads),
+                )
+            entry = {
+                "name": f"{codec.value} level {level}",
+                "threads": threads,
+            }
+            entry.update(result.to_dict())
+            entry["speedup"] = round(baseline.seconds / result.seconds, 2)
+            results.append(entry)
+    return results
+
+
+def main(args: list[str] | None = None) -> None:
+    """Run the benchmark and write the results as JSON to stdout."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the export codecs."
+    )
+    parser.add_argument(
+        "--size", type=int, default=256, help="Size of the image in MB."
+    )
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--codecs", nargs="+", choices=[codec.value for codec in Codec]
+    )
+    parser.add_argument("--levels", type=int, nargs="+")
+    arguments = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory, "image.tar")
+        write_synthetic_image(source, arguments.size * 1024 * 1024)
+        results = benchmark_codecs(
+            source,
+            threads=arguments.threads,
+            codecs=(
+                [Codec(codec) for codec in arguments.codecs]
+                if arguments.codecs
+                else None
+            ),
+            levels=arguments.levels,
+        )
+    sys.stdout.write(f"{json.dumps(results, indent=2)}\n")
+
+
+if __name__ == "__main__":
+    main()
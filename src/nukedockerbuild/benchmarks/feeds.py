@@ -0,0 +1,60 @@
+"""Synthetic release feeds shaped like the NukeVersionParser JSON.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+from itertools import count
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.datamodel.constants import CPP_VERSIONS
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+_RELEASES_URL = "https://thefoundry.s3.amazonaws.com/products/nuke/releases"
+
+
+def synthetic_feed(releases: int) -> dict[str, dict[str, dict]]:
+    """Return a release feed with the provided amount of releases.
+
+    Releases are spread over the supported majors. Every release gets its
+    own minor version, so each one results in its own dockerfiles like
+    the minor releases feed does.
+
+    Args:
+        releases: amount of releases in the feed.
+
+    Returns:
+        releases by version, grouped by major version.
+    """
+    majors = sorted(CPP_VERSIONS)
+    feed: dict[str, dict[str, dict]] = {str(major): {} for major in majors}
+    minors = _minor_versions()
+    for index in range(releases):
+        major = majors[index % len(majors)]
+        if index % len(majors) == 0:
+            minor = next(minors)
+        release = f"{major}.{minor}v{index % 9 + 1}"
+        url = f"{_RELEASES_URL}/{release}/Nuke{release}"
+        feed[str(major)][release] = {
+            "installer": {
+                "mac_x86_64": f"{url}-mac-x86_64.dmg",
+                "linux_x86_64": f"{url}-linux-x86_64.tgz",
+                "windows_x86_64": f"{url}-win-x86_64.zip",
+            },
+        }
+    return feed
+
+
+def _minor_versions() -> Iterator[int]:
+    """Return minor versions that do not collide once used as a float.
+
+    Minor versions ending in a zero are skipped, as 15.10 and 15.1 are
+    the same float and would end up in the same dockerfile.
+    """
+    yield 0
+    for minor in count(1):
+        if minor % 10:
+            yield minor
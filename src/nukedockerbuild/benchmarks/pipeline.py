@@ -0,0 +1,326 @@
+"""End-to-end benchmark of collecting, rendering, planning and writing.
+
+Run with: python -m nukedockerbuild.benchmarks.pipeline --output run.json
+Compare with: ... --output new.json --compare run.json --threshold 0.2
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from nukedockerbuild.benchmarks.feeds import synthetic_feed
+from nukedockerbuild.creator.collector import get_dockerfiles
+from nukedockerbuild.creator.create_dockerfiles import (
+    plan_dockerfiles,
+    write_dockerfiles,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+DEFAULT_SIZES: tuple[int, ...] = (10, 1000, 10000)
+"""Amount of releases in the synthetic feeds that are benchmarked."""
+
+STAGES: tuple[str, ...] = (
+    "parse",
+    "collect",
+    "render",
+    "write",
+    "plan",
+    "rewrite",
+)
+"""Stages of the pipeline, in the order they are run."""
+
+
+@dataclass
+class StageResult:
+    """Measurements of a single stage for a single feed size."""
+
+    stage: str
+    items: int
+    """Amount of releases or dockerfiles processed by the stage."""
+    seconds: float
+    peak_memory: int | None = None
+    """Peak of memory allocated during the stage in bytes, if measured."""
+
+    @property
+    def items_per_second(self) -> float:
+        """Return throughput of the stage."""
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        """Return the result as a JSON serializable dict."""
+        return {
+            "items": self.items,
+            "seconds": round(self.seconds, 6),
+            "items_per_second": round(self.items_per_second, 1),
+            "peak_memory": self.peak_memory,
+        }
+
+
+@dataclass
+class Regression:
+    """Stage that got slower or uses more memory than allowed."""
+
+    releases: str
+    stage: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        """Return the current value relative to the baseline."""
+        return self.current / self.baseline
+
+    def format(self) -> str:
+        """Return the regression as a human readable line."""
+        return (
+            f"{self.releases} releases, {self.stage}: {self.metric} went "
+            f"from {self.baseline} to {self.current} "
+            f"({self.ratio - 1:+.0%})."
+        )
+
+
+def _measure(
+    stage: str,
+    function: Callable[[], int],
+    setup: Callable[[], None] | None = None,
+    *,
+    measure_memory: bool = True,
+) -> StageResult:
+    """Time function and measure its peak memory in a separate run.
+
+    Memory is traced in its own run, as tracing slows down allocations
+    and would distort the timing.
+
+    Args:
+        stage: name of the stage.
+        function: stage to run, returning the amount of items processed.
+        setup: resets state between the timed and the traced run.
+        measure_memory: also measure the peak memory.
+
+    Returns:
+        measurements of the stage.
+    """
+    start = time.perf_counter()
+    items = function()
+    seconds = time.perf_counter() - start
+    peak_memory = None
+    if measure_memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            function()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return StageResult(stage, items, seconds, peak_memory)
+
+
+def benchmark_pipeline(
+    releases: int, directory: Path, *, measure_memory: bool = True
+) -> dict[str, StageResult]:
+    """Run every stage of the pipeline for a synthetic feed.
+
+    Args:
+        releases: amount of releases in the synthetic feed.
+        directory: empty directory to write the dockerfiles tree to.
+        measure_memory: also measure the peak memory of every stage.
+
+    Returns:
+        measurements by stage name.
+    """
+    raw_feed = json.dumps(synthetic_feed(releases))
+    results: dict[str, StageResult] = {}
+    state: dict[str, Any] = {}
+
+    def parse() -> int:
+        state["data"] = json.loads(raw_feed)
+        return releases
+
+    def collect() -> int:
+        state["dockerfiles"] = get_dockerfiles(state["data"])
+        return len(state["dockerfiles"])
+
+    def render() -> int:
+        for dockerfile in state["dockerfiles"]:
+            dockerfile.to_dockerfile()
+        return len(state["dockerfiles"])
+
+    def write() -> int:
+        plan = write_dockerfiles(directory, state["dockerfiles"])
+        return len(plan.to_write)
+
+    def clear() -> None:
+        for path in directory.glob("dockerfiles/*/*/Dockerfile"):
+            path.unlink()
+
+    def plan() -> int:
+        return len(plan_dockerfiles(directory, state["dockerfiles"]).planned)
+
+    def rewrite() -> int:
+        plan = write_dockerfiles(directory, state["dockerfiles"])
+        return len(plan.planned)
+
+    stages = {
+        "parse": (parse, None),
+        "collect": (collect, None),
+        "render": (render, None),
+        "write": (write, clear),
+        "plan": (plan, None),
+        "rewrite": (rewrite, None),
+    }
+    for stage in STAGES:
+        function, setup = stages[stage]
+        results[stage] = _measure(
+            stage, function, setup, measure_memory=measure_memory
+        )
+    return results
+
+
+def run_benchmarks(
+    sizes: tuple[int, ...] = DEFAULT_SIZES, *, measure_memory: bool = True
+) -> dict:
+    """Benchmark the pipeline for every feed size.
+
+    Args:
+        sizes: amounts of releases to benchmark.
+        measure_memory: also measure the peak memory of every stage.
+
+    Returns:
+        JSON serializable results, by feed size and stage.
+    """
+    results = {}
+    for releases in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            stage_results = benchmark_pipeline(
+                releases, Path(directory), measure_memory=measure_memory
+            )
+        results[str(releases)] = {
+            stage: result.to_dict() for stage, result in stage_results.items()
+        }
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def find_regressions(
+    baseline: dict,
+    current: dict,
+    threshold: float = 0.2,
+    memory_threshold: float | None = None,
+) -> list[Regression]:
+    """Return stages that regressed compared to the baseline results.
+
+    Args:
+        baseline: results of an earlier run.
+        current: results of this run.
+        threshold: allowed relative increase of the duration.
+        memory_threshold: allowed relative increase of the peak memory,
+            defaults to the duration threshold.
+
+    Returns:
+        all regressions, for stages and sizes present in both results.
+    """
+    if memory_threshold is None:
+        memory_threshold = threshold
+    regressions = []
+    for releases, stages in current["results"].items():
+        baseline_stages = baseline["results"].get(releases, {})
+        for stage, result in stages.items():
+            baseline_result = baseline_stages.get(stage)
+            if not baseline_result:
+                continue
+            for metric, allowed in (
+                ("seconds", threshold),
+                ("peak_memory", memory_threshold),
+            ):
+                baseline_value = baseline_result.get(metric)
+                current_value = result.get(metric)
+                if not baseline_value or current_value is None:
+                    continue
+                if current_value > baseline_value * (1 + allowed):
+                    regressions.append(
+                        Regression(
+                            releases,
+                            stage,
+                            metric,
+                            baseline_value,
+                            current_value,
+                        )
+                    )
+    return regressions
+
+
+def main(args: list[str] | None = None) -> None:
+    """Run the benchmarks and exit with 1 if a stage regressed."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the dockerfile generation pipeline."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=list(DEFAULT_SIZES),
+        help="Amounts of releases in the synthetic feeds.",
+    )
+    parser.add_argument("--output", help="Path to write the results to.")
+    parser.add_argument(
+        "--compare", help="Results of an earlier run to compare against."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed relative increase of durations, like 0.2 for 20%%.",
+    )
+    parser.add_argument(
+        "--memory_threshold",
+        type=float,
+        help="Allowed relative increase of peak memory. Defaults to the "
+        "duration threshold.",
+    )
+    parser.add_argument("--skip_memory", action="store_true")
+    arguments = parser.parse_args(args)
+
+    logging.getLogger("nukedockerbuild").setLevel(logging.WARNING)
+    results = run_benchmarks(
+        tuple(arguments.sizes), measure_memory=not arguments.skip_memory
+    )
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        Path(arguments.output).write_text(f"{output}\n")
+    sys.stdout.write(f"{output}\n")
+
+    if not arguments.compare:
+        return
+    regressions = find_regressions(
+        json.loads(Path(arguments.compare).read_text()),
+        results,
+        threshold=arguments.threshold,
+        memory_threshold=arguments.memory_threshold,
+    )
+    for regression in regressions:
+        sys.stderr.write(f"Regression: {regression.format()}\n")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Benchmark of rendering dockerfiles for a large synthetic release matrix.
+
+Run with: python -m nukedockerbuild.benchmarks.render --count 50000
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass
+from itertools import count as counter
+
+from nukedockerbuild.creator.collector import MINIMUM_WINDOWS_VERSION
+from nukedockerbuild.datamodel.constants import (
+    CPP_VERSIONS,
+    OperatingSystem,
+)
+from nukedockerbuild.datamodel.docker_data import (
+    BUILDKIT_SYNTAX,
+    Dockerfile,
+    clear_render_plans,
+)
+
+_MINOR_VERSIONS = 10
+"""Minor versions generated per major version."""
+
+
+def synthetic_dockerfiles(
+    amount: int,
+    *,
+    use_base_images: bool = False,
+    use_cache_mounts: bool = False,
+) -> list[Dockerfile]:
+    """Return dockerfiles for a synthetic release matrix.
+
+    Every supported major gets minor versions, and every minor gets as
+    many patch releases as needed to reach the amount. Windows is only
+    generated for the versions that support it.
+
+    Args:
+        amount: amount of dockerfiles to generate.
+        use_base_images: start from shared toolchain images.
+        use_cache_mounts: mount package manager caches with BuildKit.
+
+    Returns:
+        the generated dockerfiles.
+    """
+    dockerfiles = []
+    for patch in counter(1):
+        for major in sorted(CPP_VERSIONS):
+            for minor in range(_MINOR_VERSIONS):
+                for operating_system in OperatingSystem:
+                    if len(dockerfiles) == amount:
+                        return dockerfiles
+                    if operating_system == OperatingSystem.WINDOWS and (
+                        major < MINIMUM_WINDOWS_VERSION.major
+                    ):
+                        continue
+                    release = f"{major}.{minor}v{patch}"
+                    dockerfiles.append(
+                        Dockerfile(
+                            operating_system=operating_system,
+                            nuke_version=float(f"{major}.{minor}"),
+                            nuke_source=(
+                                "https://thefoundry.s3.amazonaws.com/products/"
+                                f"nuke/releases/{release}/Nuke{release}-"
+                                f"{operating_system.value}-x86_64.tgz"
+                            ),
+                            use_base_image=use_base_images,
+                            use_cache_mounts=use_cache_mounts,
+                        )
+                    )
+    return dockerfiles
+
+
+def render_uncompiled(dockerfile: Dockerfile) -> str:
+    """Render a dockerfile from its properties, without a render plan.
+
+    This is how dockerfiles were rendered before render plans, and is
+    used as the baseline of the benchmark.
+
+    Args:
+        dockerfile: the dockerfile to render.
+
+    Returns:
+        the rendered dockerfile.
+    """
+    base_dockerfile = dockerfile.base_dockerfile
+    from_image = (
+        base_dockerfile.tag
+        if base_dockerfile
+        else dockerfile.upstream_image.value
+    )
+    sections = [
+        BUILDKIT_SYNTAX if dockerfile.use_cache_mounts else "",
+        f"FROM {from_image}",
+        dockerfile.labels,
+        dockerfile.args,
+        dockerfile.copy,
+        dockerfile.run_commands,
+        dockerfile.work_dir,
+        dockerfile.environments,
+    ]
+    return "\n\n".join(section for section in sections if section)
+
+
+@dataclass
+class RenderBenchmark:
+    """Result of rendering the same dockerfiles with and without plans."""
+
+    dockerfiles: int
+    uncompiled_seconds: float
+    compiled_seconds: float
+    """Duration including compiling the render plans."""
+
+    @property
+    def uncompiled_per_second(self) -> float:
+        """Return dockerfiles rendered per second without plans."""
+        return self.dockerfiles / self.uncompiled_seconds
+
+    @property
+    def compiled_per_second(self) -> float:
+        """Return dockerfiles rendered per second with plans."""
+        return self.dockerfiles / self.compiled_seconds
+
+    @property
+    def speedup(self) -> float:
+        """Return how many times faster rendering with plans is."""
+        return self.uncompiled_seconds / self.compiled_seconds
+
+    def to_dict(self) -> dict:
+        """Return the result as a JSON serializable dict."""
+        return {
+            "dockerfiles": self.dockerfiles,
+            "uncompiled_seconds": round(self.uncompiled_seconds, 4),
+            "compiled_seconds": round(self.compiled_seconds, 4),
+            "uncompiled_per_second": round(self.uncompiled_per_second),
+            "compiled_per_second": round(self.compiled_per_second),
+            "speedup": round(self.speedup, 2),
+        }
+
+
+def benchmark_render(dockerfiles: list[Dockerfile]) -> RenderBenchmark:
+    """Render all dockerfiles with and without render plans.
+
+    Args:
+        dockerfiles: the dockerfiles to render.
+
+    Raises:
+        ValueError: if both ways of rendering do not give the same result.
+
+    Returns:
+        durations of both ways of rendering.
+    """
+    start = time.perf_counter()
+    uncompiled = [render_uncompiled(dockerfile) for dockerfile in dockerfiles]
+    uncompiled_seconds = time.perf_counter() - start
+
+    clear_render_plans()
+    start = time.perf_counter()
+    compiled = [dockerfile.to_dockerfile() for dockerfile in dockerfiles]
+    compiled_seconds = time.perf_counter() - start
+
+    if compiled != uncompiled:
+        msg = "Rendering with plans does not match rendering without."
+        raise ValueError(msg)
+    return RenderBenchmark(
+        dockerfiles=len(dockerfiles),
+        uncompiled_seconds=uncompiled_seconds,
+        compiled_seconds=compiled_seconds,
+    )
+
+
+def main(args: list[str] | None = None) -> None:
+    """Run the benchmark and write the result as JSON to stdout."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark rendering of dockerfiles."
+    )
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--base_images", action="store_true")
+    parser.add_argument("--cache_mounts", action="store_true")
+    arguments = parser.parse_args(args)
+    result = benchmark_render(
+        synthetic_dockerfiles(
+            arguments.count,
+            use_base_images=arguments.base_images,
+            use_cache_mounts=arguments.cache_mounts,
+        )
+    )
+    sys.stdout.write(f"{json.dumps(result.to_dict(), indent=2)}\n")
+
+
+if __name__ == "__main__":
+    main()
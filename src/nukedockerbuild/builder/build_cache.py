@@ -0,0 +1,255 @@
+"""Cache of successful builds, keyed on a digest of their inputs.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.builder.targets import read_base_image, read_nuke_source
+from nukedockerbuild.creator.manifest import (
+    BASE_DIRECTORY,
+    DOCKERFILES_DIRECTORY,
+    content_hash,
+)
+from nukedockerbuild.datamodel.constants import (
+    BASE_IMAGE_REPOSITORY,
+    OperatingSystem,
+)
+from nukedockerbuild.files import write_atomic
+from nukedockerbuild.sources.include_graph import RETAIN_MANIFEST
+
+if TYPE_CHECKING:
+    from nukedockerbuild.builder.targets import BuildTarget
+    from nukedockerbuild.sources.downloader import DownloadCache
+    from nukedockerbuild.sources.lockfile import SourcesLock
+
+logger = logging.getLogger(__name__)
+
+BUILD_CACHE_FILE = Path("build/cache/builds.json")
+"""Build cache relative to the base level directory."""
+
+TOOLCHAIN_DIRECTORY = Path("dependencies/windows")
+"""Toolchain files that are copied next to the Windows dockerfiles."""
+
+BUILD_SCRIPTS: tuple[Path, ...] = (
+    Path("build.sh"),
+    Path("scripts/build.sh"),
+    Path("scripts/get_nuke_linux.sh"),
+    Path("scripts/get_nuke_windows.sh"),
+)
+"""Scripts that build the image from the dockerfile."""
+
+COMPATIBILITY_DIRECTORIES: tuple[str, ...] = ("cmake", "tests")
+"""Folders next to a dockerfile that build.sh adds to the Nuke sources."""
+
+_FROM = re.compile(r"^FROM\s+(?:--\S+\s+)*(\S+)", re.MULTILINE)
+
+
+@dataclass
+class CachedBuild:
+    """Successful build of a target, recorded in the cache."""
+
+    target: str
+    """Name of the target, like 15.1-linux."""
+    key: str
+    """Digest of the inputs the image was built from."""
+    tag: str
+    built: str
+    """Moment the build finished, as ISO 8601 timestamp in UTC."""
+
+    def to_dict(self) -> dict:
+        """Return the build as a JSON serializable dict."""
+        return {"key": self.key, "tag": self.tag, "built": self.built}
+
+
+@dataclass
+class BuildCache:
+    """Digests of the inputs of every successful build.
+
+    The key of a target covers everything that determines its image: the
+    rendered dockerfile, the Nuke installer, the upstream and base images,
+    the Windows toolchain and the build scripts. A target whose key
+    matches its last successful build does not need to be built again.
+    """
+
+    directory: Path
+    """Base level directory containing build.sh and the dockerfiles."""
+    path: Path | None = None
+    """JSON file storing the builds, defaults to build/cache/builds.json."""
+    download_cache: DownloadCache | None = None
+    """Cache to read the checksum of downloaded installers from."""
+    sources_lock: SourcesLock | None = None
+    """Lock to read pinned checksums from, known before downloading."""
+    _builds: dict[str, CachedBuild] | None = field(
+        default=None, init=False, repr=False
+    )
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        """Default the path to the build directory."""
+        if self.path is None:
+            self.path = self.directory / BUILD_CACHE_FILE
+
+    def input_key(self, target: BuildTarget) -> str:
+        """Return the digest of all inputs of the target.
+
+        Args:
+            target: the target to get the key for.
+
+        Returns:
+            hex digest of the inputs.
+        """
+        digest = hashlib.sha256()
+        for name, value in self._inputs(target):
+            digest.update(f"{name}\0{value}\0".encode())
+        return digest.hexdigest()
+
+    def _inputs(self, target: BuildTarget) -> list[tuple[str, str]]:
+        """Return the name and value of every input of the target."""
+        dockerfile = self.directory / target.dockerfile
+        content = dockerfile.read_text()
+        inputs = [
+            ("dockerfile", content_hash(content)),
+            *(("upstream", image) for image in _FROM.findall(content)),
+        ]
+        nuke_source = read_nuke_source(dockerfile)
+        if nuke_source:
+            inputs.append(("nuke_source", nuke_source))
+            sha256 = self._installer_sha256(target, nuke_source)
+            if sha256:
+                inputs.append(("nuke_source_sha256", sha256))
+        base_image = read_base_image(dockerfile)
+        if base_image:
+            base_dockerfile = Path(
+                self.directory,
+                DOCKERFILES_DIRECTORY,
+                BASE_DIRECTORY,
+                base_image.removeprefix(f"{BASE_IMAGE_REPOSITORY}:"),
+                "Dockerfile",
+            )
+            if base_dockerfile.is_file():
+                base_content = base_dockerfile.read_text()
+                inputs.append(("base", content_hash(base_content)))
+                inputs.extend(
+                    ("upstream", image)
+                    for image in _FROM.findall(base_content)
+                )
+        paths = [
+            dockerfile.parent / name
+            for name in (*COMPATIBILITY_DIRECTORIES, RETAIN_MANIFEST)
+        ]
+        paths.extend(self.directory / script for script in BUILD_SCRIPTS)
+        if target.operating_system == OperatingSystem.WINDOWS:
+            paths.append(self.directory / TOOLCHAIN_DIRECTORY)
+        for path in paths:
+            inputs.extend(_file_hashes(self.directory, path))
+        return inputs
+
+    def _installer_sha256(
+        self, target: BuildTarget, nuke_source: str
+    ) -> str | None:
+        """Return the checksum of the installer of the target, if known."""
+        locked = (
+            self.sources_lock.get(
+                target.nuke_version,
+                target.operating_system.value,
+                nuke_source,
+            )
+            if self.sources_lock
+            else None
+        )
+        if locked:
+            return locked.sha256
+        cached = (
+            self.download_cache.lookup(nuke_source)
+            if self.download_cache
+            else None
+        )
+        return cached.sha256 if cached else None
+
+    def lookup(self, target: BuildTarget) -> CachedBuild | None:
+        """Return the last successful build of the target, if any."""
+        with self._lock:
+            return self._load().get(target.name)
+
+    def is_current(self, target: BuildTarget, key: str) -> bool:
+        """Return if the last successful build has the same inputs."""
+        cached = self.lookup(target)
+        return cached is not None and cached.key == key
+
+    def record(self, target: BuildTarget, key: str) -> CachedBuild:
+        """Record a successful build of the target.
+
+        Args:
+            target: the target that was built.
+            key: digest of the inputs it was built from.
+
+        Returns:
+            the recorded build.
+        """
+        cached = CachedBuild(
+            target=target.name,
+            key=key,
+            tag=target.tag,
+            built=datetime.now(UTC).isoformat(timespec="seconds"),
+        )
+        with self._lock:
+            builds = self._load()
+            builds[target.name] = cached
+            write_atomic(
+                self.path,
+                json.dumps(
+                    {
+                        name: build.to_dict()
+                        for name, build in sorted(builds.items())
+                    },
+                    indent=2,
+                ),
+            )
+        return cached
+
+    def _load(self) -> dict[str, CachedBuild]:
+        """Return the builds in the cache file, read once."""
+        if self._builds is None:
+            try:
+                data = json.loads(self.path.read_text())
+            except FileNotFoundError:
+                data = {}
+            except ValueError:
+                msg = f"Ignoring invalid build cache '{self.path}'."
+                logger.warning(msg)
+                data = {}
+            self._builds = {
+                name: CachedBuild(target=name, **build)
+                for name, build in data.items()
+            }
+        return self._builds
+
+
+def _file_hashes(directory: Path, path: Path) -> list[tuple[str, str]]:
+    """Return the relative path and hash of every file below path."""
+    if path.is_file():
+        files = [path]
+    elif path.is_dir():
+        files = sorted(child for child in path.rglob("*") if child.is_file())
+    else:
+        return []
+    return [
+        (
+            file.relative_to(directory).as_posix(),
+            hashlib.sha256(file.read_bytes()).hexdigest(),
+        )
+        for file in files
+    ]
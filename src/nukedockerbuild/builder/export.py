@@ -0,0 +1,308 @@
+"""Export of built images with multi-threaded compression.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import gzip
+import logging
+import os
+import subprocess
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import TYPE_CHECKING, BinaryIO
+
+from nukedockerbuild.tracing import span
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 4 * 1024 * 1024
+"""Amount of bytes compressed by a single worker at once."""
+
+
+class Codec(StrEnum):
+    """Compression codecs for exported images."""
+
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+    @property
+    def extension(self) -> str:
+        """Return the file extension of an image compressed with it."""
+        if self == Codec.ZSTD:
+            return ".tar.zst"
+        return ".tar.gz"
+
+    @property
+    def default_level(self) -> int:
+        """Return the default compression level."""
+        if self == Codec.ZSTD:
+            return 3
+        return 6
+
+
+@dataclass
+class CompressionResult:
+    """Statistics of compressing a single stream."""
+
+    codec: Codec
+    input_bytes: int
+    output_bytes: int
+    seconds: float
+
+    @property
+    def ratio(self) -> float:
+        """Return the input size relative to the compressed size."""
+        if not self.output_bytes:
+            return 0.0
+        return self.input_bytes / self.output_bytes
+
+    @property
+    def megabytes_per_second(self) -> float:
+        """Return the amount of input compressed per second in MB/s."""
+        if not self.seconds:
+            return 0.0
+        return self.input_bytes / self.seconds / 1_000_000
+
+    def to_dict(self) -> dict:
+        """Return the result as a JSON serializable dict."""
+        return {
+            "codec": self.codec.value,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "seconds": round(self.seconds, 4),
+            "ratio": round(self.ratio, 3),
+            "megabytes_per_second": round(self.megabytes_per_second, 1),
+        }
+
+
+@dataclass(frozen=True)
+class CompressionOptions:
+    """Codec and settings to compress a stream with."""
+
+    codec: Codec = Codec.GZIP
+    level: int | None = None
+    """Compression level, defaults to the codec default."""
+    threads: int | None = None
+    """Amount of worker threads, defaults to the CPU count."""
+    block_size: int = BLOCK_SIZE
+    """Amount of bytes read and compressed at once."""
+
+
+def compress_stream(
+    source: BinaryIO,
+    destination: BinaryIO,
+    options: CompressionOptions | None = None,
+) -> CompressionResult:
+    """Compress source into destination with multiple threads.
+
+    Gzip is compressed as independent gzip members per block, which
+    concatenated are a valid gzip file that docker load reads as one.
+    Zstd uses the worker threads of the zstd library.
+
+    Args:
+        source: stream to compress, like the output of docker save.
+        destination: stream to write the compressed data to.
+        options: codec and settings to compress with, defaults to gzip
+            at its default level with a thread per CPU.
+
+    Raises:
+        ValueError: if zstd is requested without zstandard installed.
+
+    Returns:
+        statistics of the compression.
+    """
+    options = options or CompressionOptions()
+    codec = options.codec
+    level = codec.default_level if options.level is None else options.level
+    threads = options.threads or os.cpu_count() or 1
+    start = time.perf_counter()
+    if codec == Codec.ZSTD:
+        input_bytes, output_bytes = _compress_zstd(
+            source, destination, level, threads, options.block_size
+        )
+    else:
+        input_bytes, output_bytes = _compress_gzip(
+            source, destination, level, threads, options.block_size
+        )
+    return CompressionResult(
+        codec=codec,
+        input_bytes=input_bytes,
+        output_bytes=output_bytes,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def _compress_gzip(
+    source: BinaryIO,
+    destination: BinaryIO,
+    level: int,
+    threads: int,
+    block_size: int,
+) -> tuple[int, int]:
+    """Compress blocks to gzip members concurrently, keeping their order.
+
+    zlib releases the GIL while compressing, so the blocks are compressed
+    in parallel. Only a few blocks per thread are in flight, which keeps
+    memory bounded for images of any size.
+
+    Returns:
+        amount of bytes read and written.
+    """
+    input_bytes = 0
+    output_bytes = 0
+    pending = deque()
+    with ThreadPoolExecutor(
+        max_workers=threads, thread_name_prefix="gzip"
+    ) as executor:
+        while block := source.read(block_size):
+            input_bytes += len(block)
+            pending.append(
+                executor.submit(gzip.compress, block, level, mtime=0)
+            )
+            if len(pending) >= threads * 2:
+                compressed = pending.popleft().result()
+                output_bytes += destination.write(compressed)
+        while pending:
+            output_bytes += destination.write(pending.popleft().result())
+    return input_bytes, output_bytes
+
+
+def _compress_zstd(
+    source: BinaryIO,
+    destination: BinaryIO,
+    level: int,
+    threads: int,
+    block_size: int,
+) -> tuple[int, int]:
+    """Compress to a single zstd frame with the zstd worker threads.
+
+    Returns:
+        amount of bytes read and written.
+    """
+    if zstandard is None:
+        msg = "Compressing with zstd needs the zstandard package."
+        raise ValueError(msg)
+    compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+    counter = _CountingWriter(destination)
+    input_bytes = 0
+    with compressor.stream_writer(counter, closefd=False) as writer:
+        while block := source.read(block_size):
+            input_bytes += len(block)
+            writer.write(block)
+    return input_bytes, counter.written
+
+
+@dataclass
+class _CountingWriter:
+    """Writer that counts the bytes written to the wrapped stream."""
+
+    stream: BinaryIO
+    written: int = 0
+
+    def write(self, data: bytes) -> int:
+        """Write data to the stream and count it."""
+        self.written += len(data)
+        return self.stream.write(data)
+
+
+@dataclass
+class ImageExporter:
+    """Export images from the container engine as compressed tarballs."""
+
+    codec: Codec = Codec.GZIP
+    level: int | None = None
+    """Compression level, defaults to the codec default."""
+    threads: int | None = None
+    """Amount of worker threads, defaults to the CPU count."""
+    engine: str = "docker"
+    """Container engine to save the images with."""
+    block_size: int = field(default=BLOCK_SIZE, repr=False)
+
+    def export_path(self, tag: str, directory: Path) -> Path:
+        """Return the path an image is exported to.
+
+        Args:
+            tag: tag of the image, like nukedockerbuild:15.1-linux.
+            directory: directory to export to.
+
+        Returns:
+            path like nukedockerbuild-15.1-linux.tar.zst.
+        """
+        return directory / f"{tag.replace(':', '-')}{self.codec.extension}"
+
+    def export(self, tag: str, directory: Path) -> CompressionResult:
+        """Stream the saved image through the codec into directory.
+
+        Args:
+            tag: tag of the image to export.
+            directory: directory to write the compressed image to.
+
+        Raises:
+            ValueError: if saving the image failed.
+
+        Returns:
+            statistics of the compression.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        export_path = self.export_path(tag, directory)
+        partial_path = export_path.with_name(f"{export_path.name}.partial")
+        with (
+            span("export", tag=tag, codec=self.codec.value) as export_span,
+            tempfile.TemporaryFile() as stderr_file,
+            subprocess.Popen(
+                save_command(self.engine, tag),
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+            ) as process,
+            partial_path.open("wb") as file,
+        ):
+            result = compress_stream(
+                process.stdout,
+                file,
+                CompressionOptions(
+                    self.codec, self.level, self.threads, self.block_size
+                ),
+            )
+            process.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors="replace")
+            export_span.add(byte_count=result.input_bytes, item_count=1)
+        if process.returncode != 0:
+            partial_path.unlink(missing_ok=True)
+            msg = f"Saving '{tag}' failed: {stderr.strip()}"
+            raise ValueError(msg)
+        partial_path.replace(export_path)
+        msg = (
+            f"Exported '{tag}' to '{export_path}' with {self.codec.value}, "
+            f"ratio {result.ratio:.2f} at "
+            f"{result.megabytes_per_second:.1f} MB/s."
+        )
+        logger.info(msg)
+        return result
+
+
+def save_command(engine: str, tag: str) -> list[str]:
+    """Return the command that writes the image tarball to stdout.
+
+    Args:
+        engine: container engine to save the image with.
+        tag: tag of the image to save.
+
+    Returns:
+        the command to run.
+    """
+    return [engine, "save", tag]
@@ -0,0 +1,523 @@
+"""Size analysis of built images, per layer and per installed path.
+
+The image is read offline, from the tarball of docker save or from an
+OCI image layout like the layer store. Every layer is mapped back to the
+dockerfile instruction that produced it through the history of the image
+config, and the largest paths of the Nuke install and the msvc toolchain
+are listed as they end up in the final filesystem of the image.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import posixpath
+import re
+import tarfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING
+
+from nukedockerbuild.builder.layer_store import INDEX_MEDIA_TYPE
+from nukedockerbuild.datamodel.constants import NUKE_INSTALL_DIRECTORY
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+WATCHED_PATHS = (NUKE_INSTALL_DIRECTORY, "/opt/msvc")
+"""Paths in the image to list the largest paths of."""
+
+DEFAULT_DEPTH = 2
+"""Levels below a watched path that sizes are summed up to."""
+
+DEFAULT_LIMIT = 20
+"""Amount of largest paths listed per watched path."""
+
+DEFAULT_TOLERANCE = 0.05
+"""Growth relative to the baseline that is not a regression yet."""
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_WHITEOUT_PREFIX = ".wh."
+_OPAQUE_WHITEOUT = ".wh..wh..opq"
+_REF_NAME_ANNOTATIONS = (
+    "org.opencontainers.image.ref.name",
+    "io.containerd.image.name",
+)
+_SHELL_PREFIX = re.compile(
+    r"^(?:RUN )?(?:\|\d+ (?:\S+=\S* )*)?/bin/sh -c (#\(nop\) )?"
+)
+"""Shell the builders prefix RUN instructions with in the history."""
+
+
+@dataclass
+class PathSize:
+    """Size of all files below a path in the final filesystem."""
+
+    path: str
+    size: int = 0
+    files: int = 0
+    largest: list[PathSize] = field(default_factory=list)
+    """Largest paths below this path, only for watched paths."""
+
+    def to_dict(self) -> dict:
+        """Return the size as a JSON serializable dict."""
+        data = {"path": self.path, "size": self.size, "files": self.files}
+        if self.largest:
+            data["largest"] = [path.to_dict() for path in self.largest]
+        return data
+
+
+@dataclass
+class LayerSize:
+    """Size of a single layer and the instruction that produced it."""
+
+    index: int
+    digest: str
+    size: int
+    """Size of the layer as stored, compressed or not."""
+    uncompressed_size: int = 0
+    """Size of all files added by the layer."""
+    files: int = 0
+    instruction: str | None = None
+    """Dockerfile instruction, None if the image has no history."""
+
+    def to_dict(self) -> dict:
+        """Return the size as a JSON serializable dict."""
+        return {
+            "index": self.index,
+            "digest": self.digest,
+            "size": self.size,
+            "uncompressed_size": self.uncompressed_size,
+            "files": self.files,
+            "instruction": self.instruction,
+        }
+
+
+@dataclass
+class ImageSizeReport:
+    """Size of an image per layer and per watched path."""
+
+    tag: str
+    layers: list[LayerSize]
+    paths: dict[str, PathSize]
+    """Size of every watched path, with its largest paths."""
+
+    @property
+    def size(self) -> int:
+        """Return the size of all layers as stored."""
+        return sum(layer.size for layer in self.layers)
+
+    @property
+    def uncompressed_size(self) -> int:
+        """Return the size of all files added by the layers."""
+        return sum(layer.uncompressed_size for layer in self.layers)
+
+    def to_dict(self) -> dict:
+        """Return the report as a JSON serializable dict."""
+        return {
+            "tag": self.tag,
+            "size": self.size,
+            "uncompressed_size": self.uncompressed_size,
+            "layers": [layer.to_dict() for layer in self.layers],
+            "paths": {
+                path: size.to_dict() for path, size in self.paths.items()
+            },
+        }
+
+    def format(self) -> str:
+        """Return the report as human readable lines."""
+        lines = [
+            (
+                f"{self.tag}: {_megabytes(self.uncompressed_size)} MB in "
+                f"{len(self.layers)} layers "
+                f"({_megabytes(self.size)} MB stored)."
+            )
+        ]
+        lines.extend(
+            f"  #{layer.index:<3} {_megabytes(layer.uncompressed_size):>9} MB"
+            f"  {_shorten(layer.instruction or 'unknown instruction')}"
+            for layer in sorted(
+                self.layers,
+                key=lambda layer: layer.uncompressed_size,
+                reverse=True,
+            )
+        )
+        for path in self.paths.values():
+            lines.append(
+                f"{path.path}: {_megabytes(path.size)} MB in "
+                f"{path.files} files."
+            )
+            lines.extend(
+                f"  {_megabytes(largest.size):>9} MB  {largest.path}"
+                for largest in path.largest
+            )
+        return "\n".join(lines)
+
+
+def analyze_image(
+    path: Path,
+    tag: str | None = None,
+    *,
+    watched_paths: tuple[str, ...] = WATCHED_PATHS,
+    depth: int = DEFAULT_DEPTH,
+    limit: int = DEFAULT_LIMIT,
+) -> ImageSizeReport:
+    """Analyze the size of an image saved to disk.
+
+    Args:
+        path: tarball of docker save, or directory of an OCI image layout.
+        tag: tag of the image to analyze, defaults to the first image.
+        watched_paths: paths in the image to list the largest paths of.
+        depth: levels below a watched path that sizes are summed up to.
+        limit: amount of largest paths listed per watched path.
+
+    Raises:
+        ValueError: if the image is not found or cannot be read.
+
+    Returns:
+        the size report of the image.
+    """
+    with _open_image(path, tag) as image:
+        history = [
+            entry
+            for entry in image.config.get("history", [])
+            if not entry.get("empty_layer")
+        ]
+        instructions = (
+            [_instruction(entry.get("created_by", "")) for entry in history]
+            if len(history) == len(image.layers)
+            else [None] * len(image.layers)
+        )
+        diff_ids = image.config.get("rootfs", {}).get("diff_ids", [])
+        filesystem: dict[str, int] = {}
+        layers = []
+        for index, (blob, instruction) in enumerate(
+            zip(image.layers, instructions, strict=True)
+        ):
+            layer = LayerSize(
+                index,
+                diff_ids[index] if index < len(diff_ids) else blob.digest,
+                blob.size,
+                instruction=instruction,
+            )
+            with blob.open() as stream:
+                _apply_layer(stream, layer, filesystem, watched_paths)
+            layers.append(layer)
+    report = ImageSizeReport(
+        image.tag,
+        layers,
+        {
+            watched_path: _watched_size(
+                watched_path, filesystem, depth, limit
+            )
+            for watched_path in watched_paths
+        },
+    )
+    msg = (
+        f"Analyzed '{report.tag}', {report.uncompressed_size} bytes in "
+        f"{len(layers)} layers."
+    )
+    logger.info(msg)
+    return report
+
+
+def find_regressions(
+    report: ImageSizeReport,
+    baseline: dict,
+    *,
+    tolerance: float = DEFAULT_TOLERANCE,
+    max_bytes: int | None = None,
+) -> list[str]:
+    """Compare the report to the report of an earlier build.
+
+    Args:
+        report: the report of the current image.
+        baseline: report of an earlier build, as written by to_dict.
+        tolerance: growth relative to the baseline that is allowed.
+        max_bytes: maximum uncompressed size of the image, if any.
+
+    Returns:
+        a message per size that grew beyond the tolerance or maximum.
+    """
+    checks = [
+        (
+            "image",
+            report.uncompressed_size,
+            baseline.get("uncompressed_size"),
+        )
+    ]
+    baseline_paths = baseline.get("paths", {})
+    checks.extend(
+        (path, size.size, baseline_paths[path]["size"])
+        for path, size in report.paths.items()
+        if path in baseline_paths
+    )
+    regressions = [
+        f"'{name}' of {report.tag} grew from {previous} to {size} bytes, "
+        f"more than {tolerance:.0%}."
+        for name, size, previous in checks
+        if previous is not None and size > previous * (1 + tolerance)
+    ]
+    if max_bytes is not None and report.uncompressed_size > max_bytes:
+        regressions.append(
+            f"{report.tag} is {report.uncompressed_size} bytes, more than "
+            f"the maximum of {max_bytes} bytes."
+        )
+    return regressions
+
+
+@dataclass
+class _Blob:
+    """Layer of an image that can be opened as a stream."""
+
+    digest: str
+    size: int
+    open: Callable[[], IO[bytes]]
+
+
+@dataclass
+class _Image:
+    """Config and layers of an image read from disk."""
+
+    tag: str
+    config: dict
+    layers: list[_Blob]
+
+
+@contextmanager
+def _open_image(path: Path, tag: str | None) -> Iterator[_Image]:
+    """Open the image in an OCI layout directory or a saved tarball.
+
+    Raises:
+        ValueError: if the image is not found.
+    """
+    if path.is_dir():
+        yield _read_oci_layout(path, tag)
+        return
+    try:
+        with tarfile.open(path) as tar:
+            yield _read_saved_tarball(tar, tag)
+    except tarfile.TarError as exception:
+        msg = f"'{path}' is not a saved image: {exception}"
+        raise ValueError(msg) from exception
+
+
+def _read_saved_tarball(tar: tarfile.TarFile, tag: str | None) -> _Image:
+    """Return the image of a docker save tarball, in either format.
+
+    Raises:
+        ValueError: if the tarball has no manifest.json or no such tag.
+    """
+    try:
+        images = json.load(tar.extractfile(_resolve(tar, "manifest.json")))
+    except KeyError as exception:
+        msg = "The tarball has no manifest.json, it is not a saved image."
+        raise ValueError(msg) from exception
+    for image in images:
+        tags = image.get("RepoTags") or []
+        if tag is not None and tag not in tags:
+            continue
+        layers = []
+        for name in image["Layers"]:
+            member = _resolve(tar, name)
+            layers.append(
+                _Blob(
+                    posixpath.basename(posixpath.dirname(name))
+                    if name.endswith("/layer.tar")
+                    else posixpath.basename(name),
+                    member.size,
+                    lambda member=member: tar.extractfile(member),
+                )
+            )
+        return _Image(
+            tag or (tags[0] if tags else "untagged"),
+            json.load(tar.extractfile(_resolve(tar, image["Config"]))),
+            layers,
+        )
+    msg = f"'{tag}' is not in the saved tarball."
+    raise ValueError(msg)
+
+
+def _resolve(tar: tarfile.TarFile, name: str) -> tarfile.TarInfo:
+    """Return the member of the tarball, following links to layers.
+
+    Raises:
+        KeyError: if the member is not in the tarball.
+    """
+    member = tar.getmember(posixpath.normpath(name))
+    while member.issym() or member.islnk():
+        target = (
+            posixpath.join(posixpath.dirname(member.name), member.linkname)
+            if member.issym()
+            else member.linkname
+        )
+        member = tar.getmember(posixpath.normpath(target))
+    return member
+
+
+def _read_oci_layout(directory: Path, tag: str | None) -> _Image:
+    """Return the image of an OCI image layout.
+
+    Raises:
+        ValueError: if the layout has no image with the tag.
+    """
+
+    def read_blob(digest: str) -> dict:
+        return json.loads(_blob_path(directory, digest).read_bytes())
+
+    index = json.loads((directory / "index.json").read_bytes())
+    for entry in index.get("manifests", []):
+        annotations = entry.get("annotations", {})
+        names = [annotations.get(key) for key in _REF_NAME_ANNOTATIONS]
+        if tag is not None and tag not in names:
+            continue
+        manifest_entry = entry
+        # Nested indexes, like multi-platform images, use the first image.
+        while manifest_entry.get("mediaType") == INDEX_MEDIA_TYPE:
+            manifest_entry = read_blob(manifest_entry["digest"])[
+                "manifests"
+            ][0]
+        manifest = read_blob(manifest_entry["digest"])
+        return _Image(
+            tag or next(filter(None, names), "untagged"),
+            read_blob(manifest["config"]["digest"]),
+            [
+                _Blob(
+                    layer["digest"],
+                    layer["size"],
+                    lambda digest=layer["digest"]: _blob_path(
+                        directory, digest
+                    ).open("rb"),
+                )
+                for layer in manifest["layers"]
+            ],
+        )
+    msg = f"'{tag}' is not in the OCI layout '{directory}'."
+    raise ValueError(msg)
+
+
+def _blob_path(directory: Path, digest: str) -> Path:
+    """Return the path of a blob in an OCI layout."""
+    return directory.joinpath("blobs", *digest.split(":", 1))
+
+
+def _apply_layer(
+    stream: IO[bytes],
+    layer: LayerSize,
+    filesystem: dict[str, int],
+    watched_paths: tuple[str, ...],
+) -> None:
+    """Count the files of the layer and apply it to the filesystem.
+
+    Only files below the watched paths are kept in the filesystem. Files
+    removed by whiteouts of the layer are removed before its own files
+    are added, as whiteouts only apply to the layers below.
+
+    Args:
+        stream: the layer tarball, compressed or not.
+        layer: size of the layer to count the files in.
+        filesystem: size of every watched file in the layers so far.
+        watched_paths: paths in the image to keep the files of.
+    """
+    removed: list[str] = []
+    added: dict[str, int] = {}
+    with _open_layer(stream) as tar:
+        for member in tar:
+            path = posixpath.join("/", posixpath.normpath(member.name))
+            directory, name = posixpath.split(path)
+            if name == _OPAQUE_WHITEOUT:
+                removed.append(directory)
+            elif name.startswith(_WHITEOUT_PREFIX):
+                removed.append(
+                    posixpath.join(directory, name[len(_WHITEOUT_PREFIX) :])
+                )
+            elif member.isfile():
+                layer.uncompressed_size += member.size
+                layer.files += 1
+                if _is_below(path, watched_paths):
+                    added[path] = member.size
+    if removed:
+        for path in [path for path in filesystem if _is_below(path, removed)]:
+            del filesystem[path]
+    filesystem.update(added)
+
+
+@contextmanager
+def _open_layer(stream: IO[bytes]) -> Iterator[tarfile.TarFile]:
+    """Open a layer tarball as a stream, uncompressed, gzip or zstd.
+
+    Raises:
+        ValueError: if the layer is zstd without zstandard installed.
+    """
+    if stream.peek(4)[:4] == _ZSTD_MAGIC:
+        if zstandard is None:
+            msg = "Reading zstd compressed layers needs zstandard."
+            raise ValueError(msg)
+        stream = zstandard.ZstdDecompressor().stream_reader(stream)
+    with tarfile.open(fileobj=stream, mode="r|*") as tar:
+        yield tar
+
+
+def _is_below(path: str, parents: tuple[str, ...] | list[str]) -> bool:
+    """Return if the path is one of the parents or below them."""
+    return any(
+        path == parent or path.startswith(f"{parent.rstrip('/')}/")
+        for parent in parents
+    )
+
+
+def _watched_size(
+    watched_path: str, filesystem: dict[str, int], depth: int, limit: int
+) -> PathSize:
+    """Return the size of a watched path with its largest paths."""
+    total = PathSize(watched_path)
+    by_path: dict[str, PathSize] = {}
+    for path, size in filesystem.items():
+        if not _is_below(path, (watched_path,)):
+            continue
+        total.size += size
+        total.files += 1
+        relative = posixpath.relpath(path, watched_path).split("/")
+        key = posixpath.join(watched_path, *relative[:depth])
+        summed = by_path.setdefault(key, PathSize(key))
+        summed.size += size
+        summed.files += 1
+    total.largest = sorted(
+        by_path.values(), key=lambda path: path.size, reverse=True
+    )[:limit]
+    return total
+
+
+def _instruction(created_by: str) -> str:
+    """Return the dockerfile instruction of a history entry.
+
+    BuildKit records instructions like RUN /bin/sh -c make # buildkit,
+    the legacy builder like /bin/sh -c #(nop) COPY dir:... in /usr.
+    """
+    text = created_by.strip().removesuffix("# buildkit").strip()
+    match = _SHELL_PREFIX.match(text)
+    if match is None:
+        return text
+    command = text[match.end() :].strip()
+    return command if match.group(1) else f"RUN {command}"
+
+
+def _shorten(text: str, width: int = 60) -> str:
+    """Return the first line of text, shortened to width."""
+    line = text.splitlines()[0] if text else text
+    return line if len(line) <= width else f"{line[: width - 3]}..."
+
+
+def _megabytes(byte_count: int) -> str:
+    """Return bytes as megabytes with a single decimal."""
+    return f"{byte_count / 1024 / 1024:.1f}"
@@ -0,0 +1,541 @@
+"""Content-addressed store for the layers of saved images.
+
+Every image in the matrix shares its upstream and toolchain layers with
+the other minor versions. Instead of a full tarball per image, the output
+of docker save is unpacked into a single OCI image layout that keeps every
+layer once, from which a loadable tarball is rebuilt per tag on demand.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import logging
+import posixpath
+import subprocess
+import tarfile
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, BinaryIO
+
+from nukedockerbuild.builder.export import (
+    CompressionOptions,
+    compress_stream,
+    save_command,
+)
+from nukedockerbuild.files import CHUNK_SIZE, open_atomic, write_atomic
+from nukedockerbuild.tracing import span
+
+if TYPE_CHECKING:
+    from nukedockerbuild.builder.export import Codec
+
+logger = logging.getLogger(__name__)
+
+LAYER_STORE_DIRECTORY = Path("build/layers")
+"""Layer store relative to the base level directory."""
+
+INLINE_SIZE = 1024 * 1024
+"""Files in the saved tarball up to this size are kept in memory.
+
+These are the manifests and image configs. They only end up in the store
+when an image references them, so metadata of docker save is not stored.
+"""
+
+REF_NAME_ANNOTATION = "org.opencontainers.image.ref.name"
+MANIFEST_MEDIA_TYPE = "application/vnd.oci.image.manifest.v1+json"
+INDEX_MEDIA_TYPE = "application/vnd.oci.image.index.v1+json"
+CONFIG_MEDIA_TYPE = "application/vnd.oci.image.config.v1+json"
+LAYER_MEDIA_TYPES: dict[bytes, str] = {
+    b"\x1f\x8b": "application/vnd.oci.image.layer.v1.tar+gzip",
+    b"\x28\xb5\x2f\xfd": "application/vnd.oci.image.layer.v1.tar+zstd",
+}
+"""Media type of compressed layers by their magic bytes."""
+TAR_MEDIA_TYPE = "application/vnd.oci.image.layer.v1.tar"
+
+
+@dataclass(frozen=True)
+class Descriptor:
+    """Reference to a blob in the store, as used by OCI manifests."""
+
+    media_type: str
+    digest: str
+    """Digest like sha256:<hex>."""
+    size: int
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Descriptor:
+        """Create the descriptor from its OCI representation."""
+        return cls(data["mediaType"], data["digest"], data["size"])
+
+    def to_dict(self) -> dict:
+        """Return the OCI representation of the descriptor."""
+        return {
+            "mediaType": self.media_type,
+            "digest": self.digest,
+            "size": self.size,
+        }
+
+    @property
+    def path(self) -> str:
+        """Return the path of the blob in an OCI layout."""
+        return posixpath.join("blobs", *self.digest.split(":", 1))
+
+
+@dataclass
+class StoreReport:
+    """Sizes of the store compared to a full tarball per image."""
+
+    images: int
+    blobs: int
+    logical_bytes: int
+    """Size of all blobs of every image, as if stored separately."""
+    stored_bytes: int
+    """Size of all blobs in the store, every blob counted once."""
+
+    @property
+    def ratio(self) -> float:
+        """Return the logical size relative to the stored size."""
+        if not self.stored_bytes:
+            return 0.0
+        return self.logical_bytes / self.stored_bytes
+
+    def to_dict(self) -> dict:
+        """Return the report as a JSON serializable dict."""
+        return {
+            "images": self.images,
+            "blobs": self.blobs,
+            "logical_bytes": self.logical_bytes,
+            "stored_bytes": self.stored_bytes,
+            "ratio": round(self.ratio, 2),
+        }
+
+
+@dataclass
+class LayerStore:
+    """Images stored as an OCI image layout with deduplicated blobs.
+
+    Layout of the store directory:
+        oci-layout: version of the OCI image layout.
+        index.json: manifest of every stored tag.
+        blobs/sha256/<digest>: manifests, image configs and layers.
+    """
+
+    directory: Path
+    engine: str = "docker"
+    """Container engine to save the images with."""
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def import_image(self, tag: str) -> Descriptor:
+        """Save the image from the container engine into the store.
+
+        Args:
+            tag: tag of the image, like nukedockerbuild:15.1-linux.
+
+        Raises:
+            ValueError: if saving the image failed.
+
+        Returns:
+            descriptor of the stored manifest.
+        """
+        with (
+            span("export", tag=tag, store="layers") as export_span,
+            tempfile.TemporaryFile() as stderr_file,
+            subprocess.Popen(
+                save_command(self.engine, tag),
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+            ) as process,
+        ):
+            error = None
+            try:
+                manifests = self.import_tarball(process.stdout, tags=[tag])
+            except (tarfile.TarError, ValueError) as exception:
+                process.kill()
+                error = exception
+            process.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors="replace")
+        if process.returncode != 0:
+            msg = f"Saving '{tag}' failed: {stderr.strip()}"
+            raise ValueError(msg) from error
+        if error:
+            raise error
+        export_span.add(
+            byte_count=sum(
+                descriptor.size for descriptor in self._blobs(manifests[tag])
+            ),
+            item_count=1,
+        )
+        return manifests[tag]
+
+    def import_tarball(
+        self, stream: IO[bytes], tags: list[str] | None = None
+    ) -> dict[str, Descriptor]:
+        """Unpack the output of docker save into the store.
+
+        Both the legacy format and the OCI format of docker save are
+        supported, as both list their images in manifest.json. Layers that
+        are already in the store are hashed but not written again.
+
+        Args:
+            stream: the saved tarball, read once from start to end.
+            tags: tags to store the images under, defaults to their tags
+                in the tarball.
+
+        Raises:
+            ValueError: if the tarball contains no images.
+
+        Returns:
+            descriptor of the stored manifest by tag.
+        """
+        self._ensure_layout()
+        saved = _SavedFiles()
+        with tarfile.open(fileobj=stream, mode="r|*") as tar:
+            for member in tar:
+                name = posixpath.normpath(member.name)
+                if member.issym():
+                    saved.links[name] = posixpath.normpath(
+                        posixpath.join(
+                            posixpath.dirname(name), member.linkname
+                        )
+                    )
+                elif member.islnk():
+                    saved.links[name] = posixpath.normpath(member.linkname)
+                elif member.isfile() and member.size <= INLINE_SIZE:
+                    saved.inline[name] = tar.extractfile(member).read()
+                elif member.isfile():
+                    saved.stored[name] = self._write_blob(
+                        tar.extractfile(member)
+                    )
+        if "manifest.json" not in saved.inline:
+            msg = "The tarball has no manifest.json, it is not a saved image."
+            raise ValueError(msg)
+        manifests = {}
+        for image in json.loads(saved.inline["manifest.json"]):
+            manifest = self._write_manifest(
+                self._saved_blob(saved, image["Config"], CONFIG_MEDIA_TYPE),
+                [self._saved_blob(saved, layer) for layer in image["Layers"]],
+            )
+            for tag in tags or image.get("RepoTags") or []:
+                manifests[tag] = manifest
+        if not manifests:
+            msg = "The tarball contains no tagged images."
+            raise ValueError(msg)
+        self._update_index(manifests)
+        return manifests
+
+    def tags(self) -> dict[str, Descriptor]:
+        """Return the manifest of every stored tag."""
+        return {
+            manifest["annotations"][REF_NAME_ANNOTATION]: (
+                Descriptor.from_dict(manifest)
+            )
+            for manifest in self._read_index()["manifests"]
+            if REF_NAME_ANNOTATION in manifest.get("annotations", {})
+        }
+
+    def write_tarball(self, tag: str, destination: BinaryIO) -> int:
+        """Write a tarball of a single tag that docker load accepts.
+
+        The tarball is an OCI image layout with the manifest.json of
+        docker save, so it is loadable by both older and newer engines.
+
+        Args:
+            tag: the stored tag to write.
+            destination: stream to write the tarball to.
+
+        Raises:
+            ValueError: if the tag is not in the store.
+
+        Returns:
+            amount of bytes written.
+        """
+        manifest = self.tags().get(tag)
+        if manifest is None:
+            msg = f"'{tag}' is not in the layer store '{self.directory}'."
+            raise ValueError(msg)
+        blobs = self._blobs(manifest)
+        config, *layers = blobs[1:]
+        index_entry = manifest.to_dict()
+        index_entry["annotations"] = {REF_NAME_ANNOTATION: tag}
+        metadata = {
+            "oci-layout": _oci_layout(),
+            "index.json": _index([index_entry]),
+            "manifest.json": json.dumps(
+                [
+                    {
+                        "Config": config.path,
+                        "RepoTags": [tag],
+                        "Layers": [layer.path for layer in layers],
+                    }
+                ]
+            ).encode(),
+        }
+        counter = _CountingStream(destination)
+        with tarfile.open(fileobj=counter, mode="w|") as tar:
+            for name, content in metadata.items():
+                _add_bytes(tar, name, content)
+            for descriptor in dict.fromkeys(blobs):
+                info = tarfile.TarInfo(descriptor.path)
+                info.size = descriptor.size
+                with self.blob_path(descriptor).open("rb") as file:
+                    tar.addfile(info, file)
+        return counter.written
+
+    def export(self, tag: str, path: Path, codec: Codec | None = None) -> Path:
+        """Rebuild the tarball of a single tag at path.
+
+        Args:
+            tag: the stored tag to export.
+            path: path to write the tarball to.
+            codec: compress the tarball with this codec, if provided.
+
+        Raises:
+            ValueError: if the tag is not in the store.
+
+        Returns:
+            path of the written tarball.
+        """
+        if codec is None:
+            with open_atomic(path, "wb") as file:
+                self.write_tarball(tag, file)
+            return path
+        with (
+            open_atomic(path, "wb") as file,
+            tempfile.TemporaryFile(dir=path.parent) as tarball,
+        ):
+            self.write_tarball(tag, tarball)
+            tarball.seek(0)
+            compress_stream(tarball, file, CompressionOptions(codec))
+        return path
+
+    def report(self) -> StoreReport:
+        """Return the deduplicated size of the store and its logical size.
+
+        Returns:
+            sizes of the store compared to a full tarball per tag.
+        """
+        tags = self.tags()
+        logical_bytes = sum(
+            descriptor.size
+            for manifest in tags.values()
+            for descriptor in self._blobs(manifest)
+        )
+        blob_paths = self._blob_paths()
+        return StoreReport(
+            images=len(tags),
+            blobs=len(blob_paths),
+            logical_bytes=logical_bytes,
+            stored_bytes=sum(path.stat().st_size for path in blob_paths),
+        )
+
+    def prune(self) -> int:
+        """Remove blobs that are not referenced by any stored tag.
+
+        Returns:
+            amount of bytes removed.
+        """
+        with self._lock:
+            referenced = {
+                self.blob_path(descriptor)
+                for manifest in self.tags().values()
+                for descriptor in self._blobs(manifest)
+            }
+            removed = 0
+            for path in self._blob_paths():
+                if path not in referenced:
+                    removed += path.stat().st_size
+                    path.unlink()
+        return removed
+
+    def _saved_blob(
+        self, saved: _SavedFiles, name: str, media_type: str | None = None
+    ) -> Descriptor:
+        """Return the stored blob of a file in the saved tarball.
+
+        Args:
+            saved: files read from the saved tarball.
+            name: path of the file in the tarball.
+            media_type: media type of the blob, detected for layers.
+
+        Raises:
+            ValueError: if the file is not in the tarball.
+
+        Returns:
+            descriptor of the blob.
+        """
+        name = posixpath.normpath(name)
+        name = saved.links.get(name, name)
+        if name in saved.stored:
+            descriptor = saved.stored[name]
+        elif name in saved.inline:
+            descriptor = self._write_blob(io.BytesIO(saved.inline[name]))
+        else:
+            msg = f"'{name}' is referenced but missing in the tarball."
+            raise ValueError(msg)
+        return Descriptor(
+            media_type or _layer_media_type(self.blob_path(descriptor)),
+            descriptor.digest,
+            descriptor.size,
+        )
+
+    def blob_path(self, descriptor: Descriptor) -> Path:
+        """Return the path of the blob in the store."""
+        return self.directory / descriptor.path
+
+    def _blob_paths(self) -> list[Path]:
+        """Return the paths of all complete blobs in the store."""
+        return [
+            path
+            for path in (self.directory / "blobs" / "sha256").glob("*")
+            if path.is_file() and not path.name.startswith(".")
+        ]
+
+    def _blobs(self, manifest: Descriptor) -> list[Descriptor]:
+        """Return manifest, config and layers of a stored manifest."""
+        data = json.loads(self.blob_path(manifest).read_bytes())
+        return [
+            manifest,
+            Descriptor.from_dict(data["config"]),
+            *(Descriptor.from_dict(layer) for layer in data["layers"]),
+        ]
+
+    def _write_blob(self, source: IO[bytes]) -> Descriptor:
+        """Hash and write source to its blob, unless it is stored already.
+
+        Returns:
+            descriptor of the blob, without media type.
+        """
+        blobs_directory = self.directory / "blobs" / "sha256"
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(
+            dir=blobs_directory, prefix=".", suffix=".partial", delete=False
+        ) as file:
+            while chunk := source.read(CHUNK_SIZE):
+                file.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        blob_path = blobs_directory / digest.hexdigest()
+        if blob_path.is_file():
+            Path(file.name).unlink()
+        else:
+            Path(file.name).replace(blob_path)
+        return Descriptor("", f"sha256:{digest.hexdigest()}", size)
+
+    def _write_manifest(
+        self, config: Descriptor, layers: list[Descriptor]
+    ) -> Descriptor:
+        """Write the OCI manifest of an image to its blob."""
+        content = json.dumps(
+            {
+                "schemaVersion": 2,
+                "mediaType": MANIFEST_MEDIA_TYPE,
+                "config": config.to_dict(),
+                "layers": [layer.to_dict() for layer in layers],
+            },
+            sort_keys=True,
+        ).encode()
+        descriptor = self._write_blob(io.BytesIO(content))
+        return Descriptor(
+            MANIFEST_MEDIA_TYPE, descriptor.digest, descriptor.size
+        )
+
+    def _ensure_layout(self) -> None:
+        """Create the directories and files of an empty OCI layout."""
+        blobs_directory = self.directory / "blobs" / "sha256"
+        blobs_directory.mkdir(parents=True, exist_ok=True)
+        layout_path = self.directory / "oci-layout"
+        if not layout_path.is_file():
+            layout_path.write_bytes(_oci_layout())
+
+    def _read_index(self) -> dict:
+        """Return index.json, or an empty index if nothing is stored."""
+        try:
+            return json.loads((self.directory / "index.json").read_bytes())
+        except FileNotFoundError:
+            return json.loads(_index([]))
+
+    def _update_index(self, manifests: dict[str, Descriptor]) -> None:
+        """Point the tags in index.json to their new manifests."""
+        with self._lock:
+            entries = [
+                entry
+                for entry in self._read_index()["manifests"]
+                if entry.get("annotations", {}).get(REF_NAME_ANNOTATION)
+                not in manifests
+            ]
+            for tag, manifest in manifests.items():
+                entry = manifest.to_dict()
+                entry["annotations"] = {REF_NAME_ANNOTATION: tag}
+                entries.append(entry)
+            write_atomic(self.directory / "index.json", _index(entries))
+        for tag, manifest in manifests.items():
+            msg = f"Stored '{tag}' as '{manifest.digest}'."
+            logger.info(msg)
+
+
+@dataclass
+class _SavedFiles:
+    """Files read from a saved tarball, by their path in the tarball."""
+
+    inline: dict[str, bytes] = field(default_factory=dict)
+    """Small files kept in memory."""
+    stored: dict[str, Descriptor] = field(default_factory=dict)
+    """Large files written to the store while reading."""
+    links: dict[str, str] = field(default_factory=dict)
+    """Target of symbolic and hard links, as layers can be linked."""
+
+
+@dataclass
+class _CountingStream:
+    """Write-only stream that counts the bytes written to the wrapped one."""
+
+    stream: BinaryIO
+    written: int = 0
+
+    def write(self, data: bytes) -> int:
+        """Write data to the stream and count it."""
+        self.written += len(data)
+        return self.stream.write(data)
+
+
+def _layer_media_type(path: Path) -> str:
+    """Return the media type of a layer by its magic bytes."""
+    with path.open("rb") as file:
+        magic = file.read(4)
+    for prefix, media_type in LAYER_MEDIA_TYPES.items():
+        if magic.startswith(prefix):
+            return media_type
+    return TAR_MEDIA_TYPE
+
+
+def _oci_layout() -> bytes:
+    """Return the content of the oci-layout file."""
+    return json.dumps({"imageLayoutVersion": "1.0.0"}).encode()
+
+
+def _index(manifests: list[dict]) -> bytes:
+    """Return the content of an index.json listing manifests."""
+    return json.dumps(
+        {
+            "schemaVersion": 2,
+            "mediaType": INDEX_MEDIA_TYPE,
+            "manifests": manifests,
+        },
+        indent=2,
+    ).encode()
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, content: bytes) -> None:
+    """Add a file with content to the tarball."""
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
@@ -0,0 +1,321 @@
+"""Runners that build a target with a container engine.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from math import floor
+from typing import TYPE_CHECKING, TextIO
+
+from nukedockerbuild.builder.targets import read_base_image, read_nuke_source
+from nukedockerbuild.datamodel.constants import (
+    IMAGE_REPOSITORY,
+    OperatingSystem,
+)
+from nukedockerbuild.sources.extractor import (
+    SOURCES_DIRECTORY,
+    PrepareOptions,
+    prepare_nuke_sources,
+)
+from nukedockerbuild.sources.shared_sources import split_shared_sources
+from nukedockerbuild.tracing import span
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from nukedockerbuild.builder.export import ImageExporter
+    from nukedockerbuild.builder.layer_store import LayerStore
+    from nukedockerbuild.builder.targets import BuildTarget
+    from nukedockerbuild.sources.downloader import DownloadCache
+    from nukedockerbuild.sources.file_store import FileStore
+    from nukedockerbuild.sources.lockfile import LockedSource, SourcesLock
+
+
+class BuildRunner(ABC):
+    """Interface for anything that is able to build a target."""
+
+    @abstractmethod
+    def build(self, target: BuildTarget, log_file: TextIO) -> int:
+        """Build the target.
+
+        Args:
+            target: the target to build.
+            log_file: file to stream all build output to.
+
+        Returns:
+            exit code of the build, 0 on success.
+        """
+
+    def has_artifact(self, target: BuildTarget) -> bool:
+        """Return if the image of an earlier build is still available.
+
+        Args:
+            target: the target to check.
+
+        Returns:
+            True if the earlier build can be reused instead of building.
+        """
+        return False
+
+
+@dataclass
+class ScriptRunner(BuildRunner):
+    """Runner that builds through build.sh in a dind or podman container."""
+
+    directory: Path
+    """Base level directory containing build.sh and the dockerfiles."""
+    use_podman: bool = False
+    """Build with podman instead of docker."""
+    load: bool = True
+    """Load the built image in the host engine afterwards."""
+    download_cache: DownloadCache | None = None
+    """Cache to fetch the installer into before building.
+
+    This needs to be inside the build directory, so the installer is
+    picked up by the scripts in the container.
+    """
+    prepare_sources: bool = False
+    """Extract only the needed Nuke files on the host for Linux targets."""
+    exporter: ImageExporter | None = None
+    """Export the built image on the host instead of gzip in build.sh."""
+    layer_store: LayerStore | None = None
+    """Store the layers of the built image instead of a tarball per image."""
+    sources_lock: SourcesLock | None = None
+    """Pinned installers to verify downloads and extractions against."""
+    scan_includes: bool = False
+    """Reduce prepared sources to the files the NDK examples need."""
+    file_store: FileStore | None = None
+    """Store to hard link identical prepared files of all versions from."""
+    _prepared_targets: set[str] = field(
+        default_factory=set, init=False, repr=False
+    )
+    _built_base_images: set[str] = field(
+        default_factory=set, init=False, repr=False
+    )
+    _base_image_locks: dict[str, threading.Lock] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def build(self, target: BuildTarget, log_file: TextIO) -> int:
+        """Build the target with build.sh.
+
+        build.sh builds the base image if it is not available yet. The
+        first target of every base image is therefore built on its own,
+        after which all other targets reuse the base image concurrently.
+
+        Args:
+            target: the target to build.
+            log_file: file to stream all build output to.
+
+        Returns:
+            exit code of build.sh.
+        """
+        base_image = read_base_image(self.directory / target.dockerfile)
+        if base_image is None or base_image in self._built_base_images:
+            return self._build(target, log_file)
+        with self._base_image_lock(base_image):
+            # Targets that waited for the first build find the base built.
+            if base_image not in self._built_base_images:
+                returncode = self._build(target, log_file)
+                if returncode == 0:
+                    self._built_base_images.add(base_image)
+                return returncode
+        return self._build(target, log_file)
+
+    def prepare_shared_sources(
+        self, targets: list[BuildTarget], log_file: TextIO
+    ) -> None:
+        """Prepare the sources of all Linux targets and split them per major.
+
+        The files that every minor version of a major has in common are
+        only known once all of them are prepared, so this runs before any
+        of them is built. Sources that are already prepared for the same
+        installer are split again without extracting them.
+
+        Args:
+            targets: targets to prepare, also those that are not rebuilt.
+            log_file: file to write the progress to.
+        """
+        majors: dict[int, list[Path]] = {}
+        for target in targets:
+            if target.operating_system != OperatingSystem.LINUX:
+                continue
+            dockerfile = self.directory / target.dockerfile
+            nuke_source = read_nuke_source(dockerfile)
+            if not nuke_source:
+                continue
+            marker = dockerfile.parent / f"{SOURCES_DIRECTORY}.prepared"
+            if not marker.is_file() or marker.read_text() != nuke_source:
+                if self.download_cache:
+                    self._fetch_installer(target, log_file)
+                self._prepare_sources(target, log_file)
+            self._prepared_targets.add(target.name)
+            majors.setdefault(floor(float(target.nuke_version)), []).append(
+                dockerfile.parent
+            )
+        for major, directories in sorted(majors.items()):
+            result = split_shared_sources(directories)
+            log_file.write(
+                f"Nuke {major} versions share {result.shared_files} files "
+                f"({result.shared_bytes} bytes), {result.delta_files} "
+                f"files ({result.delta_bytes} bytes) differ.\n"
+            )
+            log_file.flush()
+
+    def has_artifact(self, target: BuildTarget) -> bool:
+        """Return if the image of the target is where a build puts it.
+
+        Args:
+            target: the target to check.
+
+        Returns:
+            True if the image is in the layer store, the export directory
+            or the container engine.
+        """
+        if self.layer_store:
+            return target.tag in self.layer_store.tags()
+        build_directory = self.directory / "build"
+        if self.exporter:
+            return self.exporter.export_path(
+                target.tag, build_directory
+            ).is_file()
+        if not self.load:
+            return (
+                build_directory / f"{IMAGE_REPOSITORY}-{target.name}.tar.gz"
+            ).is_file()
+        engine = "podman" if self.use_podman else "docker"
+        try:
+            process = subprocess.run(
+                [engine, "image", "inspect", target.tag],
+                capture_output=True,
+                check=False,
+            )
+        except OSError:
+            return False
+        return process.returncode == 0
+
+    def _base_image_lock(self, base_image: str) -> threading.Lock:
+        """Return the lock that guards building the base image."""
+        with self._lock:
+            return self._base_image_locks.setdefault(
+                base_image, threading.Lock()
+            )
+
+    def _build(self, target: BuildTarget, log_file: TextIO) -> int:
+        """Prepare the target and run build.sh for it."""
+        if self.download_cache:
+            self._fetch_installer(target, log_file)
+        if (
+            self.prepare_sources
+            and target.operating_system == OperatingSystem.LINUX
+            and target.name not in self._prepared_targets
+        ):
+            self._prepare_sources(target, log_file)
+        command = [
+            str(self.directory / "build.sh"),
+            target.nuke_version,
+            target.operating_system.value,
+        ]
+        if self.use_podman:
+            command.append("--podman")
+        if not self.load:
+            command.append("--skip-load")
+        if self.exporter or self.layer_store:
+            command.append("--skip-export")
+        with span("build", target=target.name) as build_span:
+            process = subprocess.run(
+                command,
+                cwd=self.directory,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                check=False,
+            )
+            build_span.add(item_count=int(process.returncode == 0))
+        if process.returncode == 0 and self.exporter:
+            self._export(target, log_file)
+        if process.returncode == 0 and self.layer_store:
+            self._store(target, log_file)
+        return process.returncode
+
+    def _fetch_installer(self, target: BuildTarget, log_file: TextIO) -> None:
+        """Fetch the installer of the target into the download cache."""
+        nuke_source = read_nuke_source(self.directory / target.dockerfile)
+        if not nuke_source:
+            return
+        log_file.write(f"Fetching installer '{nuke_source}'.\n")
+        log_file.flush()
+        locked = self._locked_source(target, nuke_source)
+        cached = self.download_cache.fetch(
+            nuke_source, locked.sha256 if locked else None
+        )
+        log_file.write(f"Installer available at '{cached.path}'.\n")
+        log_file.flush()
+
+    def _export(self, target: BuildTarget, log_file: TextIO) -> None:
+        """Export the built image of the target to the build directory."""
+        log_file.write(f"Exporting '{target.tag}'.\n")
+        log_file.flush()
+        result = self.exporter.export(target.tag, self.directory / "build")
+        log_file.write(
+            f"Exported {result.input_bytes} bytes to {result.output_bytes} "
+            f"bytes (ratio {result.ratio:.2f}) at "
+            f"{result.megabytes_per_second:.1f} MB/s.\n"
+        )
+        log_file.flush()
+
+    def _store(self, target: BuildTarget, log_file: TextIO) -> None:
+        """Store the layers of the built image of the target."""
+        log_file.write(f"Storing the layers of '{target.tag}'.\n")
+        log_file.flush()
+        manifest = self.layer_store.import_image(target.tag)
+        log_file.write(f"Stored '{target.tag}' as '{manifest.digest}'.\n")
+        log_file.flush()
+
+    def _locked_source(
+        self, target: BuildTarget, nuke_source: str
+    ) -> LockedSource | None:
+        """Return the pinned installer of the target, if it is pinned."""
+        if self.sources_lock is None:
+            return None
+        return self.sources_lock.get(
+            target.nuke_version, target.operating_system.value, nuke_source
+        )
+
+    def _prepare_sources(self, target: BuildTarget, log_file: TextIO) -> None:
+        """Extract the Nuke files of the target next to its dockerfile."""
+        dockerfile = self.directory / target.dockerfile
+        nuke_source = read_nuke_source(dockerfile)
+        if not nuke_source:
+            return
+        log_file.write(f"Preparing Nuke sources from '{nuke_source}'.\n")
+        log_file.flush()
+        result = prepare_nuke_sources(
+            nuke_source,
+            float(target.nuke_version),
+            dockerfile.parent,
+            self._locked_source(target, nuke_source),
+            PrepareOptions(
+                download_cache=self.download_cache,
+                scan_includes=self.scan_includes,
+                file_store=self.file_store,
+            ),
+        )
+        log_file.write(
+            f"Extracted {result.files_written} files, skipped "
+            f"{result.members_skipped} files "
+            f"({result.bytes_skipped} bytes).\n"
+        )
+        if self.file_store:
+            log_file.write(
+                f"Linked {result.files_deduplicated} files "
+                f"({result.bytes_deduplicated} bytes) from the file store.\n"
+            )
+        log_file.flush()
@@ -0,0 +1,211 @@
+"""Scheduler that builds targets concurrently per operating system.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import logging
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.datamodel.constants import OperatingSystem
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from nukedockerbuild.builder.build_cache import BuildCache
+    from nukedockerbuild.builder.runner import BuildRunner
+    from nukedockerbuild.builder.targets import BuildTarget
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS: dict[OperatingSystem, int] = {
+    OperatingSystem.LINUX: 2,
+    OperatingSystem.WINDOWS: 1,
+}
+"""Default amount of concurrent builds per operating system."""
+
+
+@dataclass
+class BuildResult:
+    """Result of building a single target."""
+
+    target: BuildTarget
+    returncode: int
+    duration: float
+    """Duration of the build in seconds."""
+    log_path: Path
+    error: str | None = None
+    """Error raised while starting the build, if any."""
+    cached: bool = False
+    """The inputs did not change, so the earlier build was reused."""
+
+    @property
+    def succeeded(self) -> bool:
+        """Return if the build succeeded."""
+        return self.returncode == 0
+
+    def to_dict(self) -> dict:
+        """Return the result as a JSON serializable dict."""
+        return {
+            "target": self.target.name,
+            "tag": self.target.tag,
+            "succeeded": self.succeeded,
+            "returncode": self.returncode,
+            "duration": round(self.duration, 3),
+            "log": str(self.log_path),
+            "error": self.error,
+            "cached": self.cached,
+        }
+
+
+@dataclass
+class BuildSummary:
+    """Results of all builds in a single run."""
+
+    results: list[BuildResult] = field(default_factory=list)
+
+    @property
+    def succeeded(self) -> list[BuildResult]:
+        """Return all builds that succeeded."""
+        return [result for result in self.results if result.succeeded]
+
+    @property
+    def failed(self) -> list[BuildResult]:
+        """Return all builds that failed."""
+        return [result for result in self.results if not result.succeeded]
+
+    @property
+    def cached(self) -> list[BuildResult]:
+        """Return all targets that reused their earlier build."""
+        return [result for result in self.results if result.cached]
+
+    def to_dict(self) -> dict:
+        """Return the summary as a JSON serializable dict."""
+        return {
+            "total": len(self.results),
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "cached": len(self.cached),
+            "results": [result.to_dict() for result in self.results],
+        }
+
+
+@dataclass
+class BuildScheduler:
+    """Build targets concurrently with a worker limit per system."""
+
+    runner: BuildRunner
+    log_directory: Path
+    """Directory to write a log file per target to."""
+    max_workers: dict[OperatingSystem, int] = field(
+        default_factory=lambda: dict(DEFAULT_MAX_WORKERS)
+    )
+    """Amount of concurrent builds per operating system."""
+    build_cache: BuildCache | None = None
+    """Skip targets whose inputs did not change since their last build."""
+
+    def run(self, targets: list[BuildTarget]) -> BuildSummary:
+        """Build all targets and wait for them to finish.
+
+        Linux and Windows targets are built in separate pools, so a slow
+        Windows build never takes a slot from the Linux builds.
+
+        Args:
+            targets: targets to build.
+
+        Returns:
+            summary with a result per target, in the order provided.
+        """
+        self.log_directory.mkdir(parents=True, exist_ok=True)
+        executors = {
+            operating_system: ThreadPoolExecutor(
+                max_workers=max(1, self.max_workers.get(operating_system, 1)),
+                thread_name_prefix=f"build-{operating_system.value}",
+            )
+            for operating_system in OperatingSystem
+        }
+        try:
+            futures = [
+                executors[target.operating_system].submit(
+                    self._build, target
+                )
+                for target in targets
+            ]
+            results = [future.result() for future in futures]
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+        return BuildSummary(results)
+
+    def _build(self, target: BuildTarget) -> BuildResult:
+        """Build a single target and stream its output to a log file.
+
+        Args:
+            target: the target to build.
+
+        Returns:
+            result of the build.
+        """
+        log_path = self.log_directory / f"{target.name}.log"
+        start = time.perf_counter()
+        if self._is_unchanged(target):
+            msg = f"Inputs of '{target.name}' did not change, skipping build."
+            logger.info(msg)
+            return BuildResult(
+                target=target,
+                returncode=0,
+                duration=time.perf_counter() - start,
+                log_path=log_path,
+                cached=True,
+            )
+        msg = f"Started build for '{target.name}', logging to '{log_path}'."
+        logger.info(msg)
+        error = None
+        try:
+            with log_path.open("w") as log_file:
+                returncode = self.runner.build(target, log_file)
+            if returncode == 0 and self.build_cache:
+                # The key is taken after the build, as the installer
+                # checksum is only known once it is downloaded.
+                self.build_cache.record(
+                    target, self.build_cache.input_key(target)
+                )
+        except (OSError, ValueError, subprocess.SubprocessError) as exception:
+            returncode = -1
+            error = str(exception)
+        duration = time.perf_counter() - start
+        status = "succeeded" if returncode == 0 else "failed"
+        msg = f"Build for '{target.name}' {status} in {duration:.1f}s."
+        logger.info(msg)
+        return BuildResult(
+            target=target,
+            returncode=returncode,
+            duration=duration,
+            log_path=log_path,
+            error=error,
+        )
+
+    def _is_unchanged(self, target: BuildTarget) -> bool:
+        """Return if the last build of the target can be reused.
+
+        Args:
+            target: the target to check.
+
+        Returns:
+            True if the inputs match the last successful build and its
+            image is still available.
+        """
+        if self.build_cache is None:
+            return False
+        try:
+            key = self.build_cache.input_key(target)
+        except OSError:
+            return False
+        return self.build_cache.is_current(
+            target, key
+        ) and self.runner.has_artifact(target)
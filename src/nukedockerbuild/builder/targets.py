@@ -0,0 +1,101 @@
+"""Discovery of build targets in the dockerfiles tree.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.creator.manifest import find_dockerfiles
+from nukedockerbuild.datamodel.constants import (
+    BASE_IMAGE_REPOSITORY,
+    IMAGE_REPOSITORY,
+    OperatingSystem,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+_NUKE_SOURCE_LABEL = re.compile(
+    r"^LABEL 'com\.nukedockerbuild\.nuke_source'='(.*)'$", re.MULTILINE
+)
+_BASE_IMAGE = re.compile(
+    rf"^FROM ({re.escape(BASE_IMAGE_REPOSITORY)}:\S+)", re.MULTILINE
+)
+
+
+@dataclass(frozen=True)
+class BuildTarget:
+    """Image that can be built from a dockerfile in the tree."""
+
+    nuke_version: str
+    """Nuke version as used in the dockerfiles tree, for example 15.1."""
+    operating_system: OperatingSystem
+    dockerfile: Path
+    """Path to the dockerfile, relative to the base level directory."""
+
+    @property
+    def name(self) -> str:
+        """Return name of the target, for example 15.1-linux."""
+        return f"{self.nuke_version}-{self.operating_system.value}"
+
+    @property
+    def tag(self) -> str:
+        """Return the tag of the image that is built for this target."""
+        return f"{IMAGE_REPOSITORY}:{self.name}"
+
+
+def find_build_targets(directory: Path) -> list[BuildTarget]:
+    """Return all targets that can be built from the dockerfiles tree.
+
+    Args:
+        directory: base level directory containing the dockerfiles.
+
+    Returns:
+        targets sorted by Nuke version and operating system.
+    """
+    targets = [
+        BuildTarget(
+            nuke_version=dockerfile.parent.parent.name,
+            operating_system=OperatingSystem(dockerfile.parent.name),
+            dockerfile=dockerfile,
+        )
+        for dockerfile in find_dockerfiles(directory)
+        if dockerfile.parent.name in {os.value for os in OperatingSystem}
+    ]
+    return sorted(
+        targets,
+        key=lambda target: (
+            float(target.nuke_version),
+            target.operating_system.value,
+        ),
+    )
+
+
+def read_nuke_source(dockerfile: Path) -> str | None:
+    """Return the Nuke source URL from the label in a dockerfile.
+
+    Args:
+        dockerfile: path to the dockerfile to read.
+
+    Returns:
+        the URL, or None if the dockerfile has no Nuke source label.
+    """
+    match = _NUKE_SOURCE_LABEL.search(dockerfile.read_text())
+    return match.group(1) if match else None
+
+
+def read_base_image(dockerfile: Path) -> str | None:
+    """Return the shared toolchain image a dockerfile starts from.
+
+    Args:
+        dockerfile: path to the dockerfile to read.
+
+    Returns:
+        tag of the base image, or None if it starts from an upstream image.
+    """
+    match = _BASE_IMAGE.search(dockerfile.read_text())
+    return match.group(1) if match else None
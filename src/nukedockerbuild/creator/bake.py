@@ -0,0 +1,259 @@
+"""Bake file that builds all dockerfiles in a single buildx invocation.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from math import floor
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.datamodel.constants import OperatingSystem
+from nukedockerbuild.datamodel.docker_data import BaseDockerfile
+from nukedockerbuild.sources.extractor import (
+    SHARED_SOURCES_DIRECTORY,
+    SOURCES_DIRECTORY,
+)
+
+if TYPE_CHECKING:
+    from nukedockerbuild.creator.create_dockerfiles import PlannedDockerfile
+
+BAKE_FILE = "docker-bake.hcl"
+"""Name of the bake file written next to the dockerfiles folder."""
+
+BAKE_MATRIX_FILE = "docker-bake.json"
+"""Name of the JSON version of the bake file, also usable as CI matrix."""
+
+BUILDKIT_CACHE_DIRECTORY = "build/cache/buildkit"
+"""Directory the BuildKit cache of every target is exported to."""
+
+BASE_GROUP = "base"
+"""Group containing all shared toolchain images."""
+
+DEFAULT_GROUP = "default"
+"""Group that is built when bake is called without targets."""
+
+
+@dataclass
+class BakeTarget:
+    """Single target in the bake file."""
+
+    name: str
+    context: str
+    """Build context, relative to the bake file."""
+    tags: list[str]
+    args: dict[str, str] = field(default_factory=dict)
+    contexts: dict[str, str] = field(default_factory=dict)
+    """Named contexts, used to build from other targets."""
+    cache_from: list[str] = field(default_factory=list)
+    cache_to: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        """Return the target in the bake JSON format."""
+        target = {
+            "context": self.context,
+            "dockerfile": "Dockerfile",
+            "tags": self.tags,
+            "platforms": ["linux/amd64"],
+        }
+        if self.args:
+            target["args"] = self.args
+        if self.contexts:
+            target["contexts"] = self.contexts
+        target["cache-from"] = self.cache_from
+        target["cache-to"] = self.cache_to
+        return target
+
+
+@dataclass
+class BakeFile:
+    """Targets and groups to build the dockerfiles tree with buildx bake."""
+
+    targets: list[BakeTarget] = field(default_factory=list)
+    groups: dict[str, list[str]] = field(default_factory=dict)
+    """Target names by group name."""
+
+    @classmethod
+    def from_planned(cls, planned: list[PlannedDockerfile]) -> BakeFile:
+        """Create the bake file for all planned dockerfiles.
+
+        Base images become their own targets, which the Nuke targets use
+        as named context. Targets are sorted, so the same dockerfiles
+        always result in the same bake file.
+
+        Args:
+            planned: all dockerfiles of the tree.
+
+        Returns:
+            bake file containing a target per dockerfile.
+        """
+        base_dockerfiles = []
+        nuke_dockerfiles = []
+        for planned_dockerfile in planned:
+            if isinstance(planned_dockerfile.dockerfile, BaseDockerfile):
+                base_dockerfiles.append(planned_dockerfile)
+            else:
+                nuke_dockerfiles.append(planned_dockerfile)
+        base_dockerfiles.sort(key=lambda base: base.dockerfile.name)
+        nuke_dockerfiles.sort(
+            key=lambda nuke: (
+                nuke.dockerfile.nuke_version,
+                nuke.dockerfile.operating_system.value,
+            )
+        )
+
+        bake_file = cls()
+        for planned_dockerfile in base_dockerfiles:
+            target = _base_target(planned_dockerfile)
+            bake_file.targets.append(target)
+            bake_file._add_to_group(BASE_GROUP, target.name)
+        for planned_dockerfile in nuke_dockerfiles:
+            dockerfile = planned_dockerfile.dockerfile
+            target = _nuke_target(planned_dockerfile)
+            bake_file.targets.append(target)
+            bake_file._add_to_group(DEFAULT_GROUP, target.name)
+            bake_file._add_to_group(
+                dockerfile.operating_system.value, target.name
+            )
+            bake_file._add_to_group(
+                f"nuke-{floor(dockerfile.nuke_version)}", target.name
+            )
+        return bake_file
+
+    def to_dict(self) -> dict:
+        """Return the bake file in the bake JSON format."""
+        return {
+            "group": {
+                name: {"targets": targets}
+                for name, targets in sorted(self.groups.items())
+            },
+            "target": {
+                target.name: target.to_dict() for target in self.targets
+            },
+        }
+
+    def to_json(self) -> str:
+        """Return the bake file as JSON."""
+        return f"{json.dumps(self.to_dict(), indent=2)}\n"
+
+    def to_hcl(self) -> str:
+        """Return the bake file as HCL."""
+        blocks = [
+            _hcl_block("group", name, {"targets": targets})
+            for name, targets in sorted(self.groups.items())
+        ]
+        blocks.extend(
+            _hcl_block("target", target.name, target.to_dict())
+            for target in self.targets
+        )
+        return "\n\n".join(blocks) + "\n"
+
+    def _add_to_group(self, group: str, target_name: str) -> None:
+        """Add the target to group, creating the group if needed."""
+        self.groups.setdefault(group, []).append(target_name)
+
+
+def target_name(dockerfile_name: str) -> str:
+    """Return a valid bake target name, as bake does not allow dots.
+
+    Args:
+        dockerfile_name: name like 15.1-linux.
+
+    Returns:
+        target name like nuke-15-1-linux.
+    """
+    return f"nuke-{dockerfile_name.replace('.', '-')}"
+
+
+def _cache_options(*names: str) -> tuple[list[str], list[str]]:
+    """Return the cache-from and cache-to options for targets.
+
+    Every target exports to its own directory, as concurrent exports to a
+    single local cache overwrite each other. Targets do read the cache of
+    the targets they build from.
+
+    Args:
+        names: name of the target, followed by targets it builds from.
+
+    Returns:
+        cache-from and cache-to options.
+    """
+    cache_from = [
+        f"type=local,src={BUILDKIT_CACHE_DIRECTORY}/{name}" for name in names
+    ]
+    cache_to = [
+        f"type=local,dest={BUILDKIT_CACHE_DIRECTORY}/{names[0]},mode=max"
+    ]
+    return cache_from, cache_to
+
+
+def _base_target(planned_dockerfile: PlannedDockerfile) -> BakeTarget:
+    """Return the target for a shared toolchain image."""
+    base_dockerfile: BaseDockerfile = planned_dockerfile.dockerfile
+    name = f"base-{base_dockerfile.name}"
+    cache_from, cache_to = _cache_options(name)
+    return BakeTarget(
+        name=name,
+        context=planned_dockerfile.path.parent.as_posix(),
+        tags=[base_dockerfile.tag],
+        cache_from=cache_from,
+        cache_to=cache_to,
+    )
+
+
+def _nuke_target(planned_dockerfile: PlannedDockerfile) -> BakeTarget:
+    """Return the target for a Nuke image."""
+    dockerfile = planned_dockerfile.dockerfile
+    name = target_name(
+        f"{dockerfile.nuke_version}-{dockerfile.operating_system.value}"
+    )
+    args = {"NUKE_SOURCE_FILES": SOURCES_DIRECTORY}
+    if "NUKE_SHARED_SOURCE_FILES" in dockerfile.args:
+        args["NUKE_SHARED_SOURCE_FILES"] = SHARED_SOURCES_DIRECTORY
+    if dockerfile.operating_system == OperatingSystem.WINDOWS:
+        args["TOOLCHAIN"] = "toolchain.cmake"
+    contexts = {}
+    cache_names = [name]
+    base_dockerfile = dockerfile.base_dockerfile
+    if base_dockerfile:
+        base_name = f"base-{base_dockerfile.name}"
+        contexts[base_dockerfile.tag] = f"target:{base_name}"
+        cache_names.append(base_name)
+    cache_from, cache_to = _cache_options(*cache_names)
+    return BakeTarget(
+        name=name,
+        context=planned_dockerfile.path.parent.as_posix(),
+        tags=[dockerfile.tag],
+        args=args,
+        contexts=contexts,
+        cache_from=cache_from,
+        cache_to=cache_to,
+    )
+
+
+def _hcl_block(block_type: str, name: str, attributes: dict) -> str:
+    """Return a labeled HCL block with its attributes."""
+    lines = [f"{block_type} {_hcl_value(name)} {{"]
+    width = max(len(key) for key in attributes)
+    lines.extend(
+        f"  {key.ljust(width)} = {_hcl_value(value)}"
+        for key, value in attributes.items()
+    )
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def _hcl_value(value: str | list | dict) -> str:
+    """Return value as HCL expression."""
+    if isinstance(value, list):
+        return f"[{', '.join(_hcl_value(item) for item in value)}]"
+    if isinstance(value, dict):
+        items = ", ".join(
+            f"{_hcl_value(key)} = {_hcl_value(item)}"
+            for key, item in value.items()
+        )
+        return f"{{ {items} }}"
+    # Escape template sequences, HCL would interpolate them otherwise.
+    return json.dumps(value).replace("${", "$${").replace("%{", "%%{")
@@ -6,29 +6,210 @@
 from __future__ import annotations
 
 import logging
-import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-import requests
-
-from nukedockerbuild.datamodel.constants import (
-    JSON_DATA_SOURCE,
-    OperatingSystem,
-)
+from nukedockerbuild.creator.feed_fetcher import FeedFetcher
+from nukedockerbuild.creator.feed_stream import iter_releases, read_chunks
+from nukedockerbuild.creator.release_index import ReleaseIndex
+from nukedockerbuild.datamodel.constants import OperatingSystem
 from nukedockerbuild.datamodel.docker_data import Dockerfile
+from nukedockerbuild.datamodel.version import NukeVersion
+from nukedockerbuild.tracing import span
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from nukedockerbuild.creator.feed_cache import FeedCache
+    from nukedockerbuild.creator.feed_fetcher import FeedResponse
+
+MINIMUM_VERSION = NukeVersion(10)
+"""Oldest version to create images for, as older ones are EOL."""
 
-_VERSION_REGEX = re.compile("^[^v]*")
+MINIMUM_WINDOWS_VERSION = NukeVersion(12)
+"""Oldest version to create Windows images for."""
+
+_OPERATING_SYSTEMS = (OperatingSystem.LINUX, OperatingSystem.WINDOWS)
 
 logger = logging.getLogger(__name__)
 
 
-def fetch_json_data() -> dict:
-    """Fetch data from JSON on Github and return as dict."""
-    fetched_data = requests.get(JSON_DATA_SOURCE, timeout=10)
-    if fetched_data.status_code != 200:
-        msg = "Request returned 404. Please check the URL and try again."
-        raise ValueError(msg)
+@dataclass(frozen=True)
+class DockerfileOptions:
+    """Options of the generated dockerfiles and the releases to select."""
+
+    use_base_images: bool = False
+    """Start from shared toolchain images."""
+    use_cache_mounts: bool = False
+    """Mount package manager caches with BuildKit."""
+    use_shared_sources: bool = False
+    """Copy the Nuke files shared by a major in a layer of their own."""
+    versions: Iterable[str] | None = None
+    """Only versions like 15, 15.1 or 15.1v7, or all."""
+    operating_systems: Iterable[OperatingSystem] | None = None
+    """Only these operating systems, or all."""
+    since: NukeVersion | None = None
+    """Only versions from this version onwards, if provided."""
+
+    @property
+    def is_selection(self) -> bool:
+        """Return if only a selection of the releases is generated."""
+        return bool(self.versions or self.operating_systems or self.since)
+
+    def to_dict(self) -> dict:
+        """Return the options as JSON serializable dict."""
+        return {
+            "base_images": self.use_base_images,
+            "cache_mounts": self.use_cache_mounts,
+            "shared_sources": self.use_shared_sources,
+            "versions": list(self.versions) if self.versions else None,
+            "operating_systems": [
+                operating_system.value
+                for operating_system in self.operating_systems or []
+            ],
+            "since": str(self.since) if self.since else None,
+        }
+
+
+def fetch_json_data(
+    cache: FeedCache | None = None,
+    *,
+    offline: bool = False,
+    fetcher: FeedFetcher | None = None,
+) -> dict | None:
+    """Fetch the release feed from its mirrors and return as dict.
+
+    If a cache is provided, the request is made conditional on the cached
+    snapshot and every successful response is staged in it. The staged
+    response needs to be committed once the dockerfiles are written.
+
+    Args:
+        cache: optional cache to make the request conditional with.
+        offline: return the cached snapshot without making any request.
+        fetcher: fetcher with the mirrors to fetch from, defaults to the
+            feed on Codeberg only.
+
+    Raises:
+        ValueError: if every mirror failed, or if offline is requested
+            without a snapshot being available.
+
+    Returns:
+        the fetched data, or None if the data has not been modified since
+        the cached snapshot.
+    """
+    if offline:
+        with span("parse", source="cache") as parse_span:
+            cached_data = cache.load() if cache else None
+            parse_span.add(item_count=_count_releases(cached_data))
+        if cached_data is None:
+            msg = "No cached release data available to use offline."
+            raise ValueError(msg)
+        logger.info("Using cached JSON data containing Nuke releases.")
+        return cached_data
+
+    response = _fetch_feed(cache, fetcher)
+    if response is None:
+        return None
+    data = response.data
+    _stage_feed(cache, response)
+    return data
+
+
+def _fetch_feed(
+    cache: FeedCache | None, fetcher: FeedFetcher | None
+) -> FeedResponse | None:
+    """Fetch the feed, streaming its body to the cache directory.
+
+    Returns:
+        the response, or None if the feed has not been modified.
+    """
+    fetcher = fetcher or FeedFetcher()
+    headers = {}
+    if cache:
+        headers = {
+            mirror: cache.conditional_headers(mirror)
+            for mirror in fetcher.mirrors
+        }
+        cache.directory.mkdir(parents=True, exist_ok=True)
+    response = fetcher.fetch(
+        headers, directory=cache.directory if cache else None
+    )
+    if response.not_modified:
+        logger.info("JSON data containing Nuke releases is not modified.")
+        return None
     logger.info("Fetched JSON data containing Nuke releases.")
-    return fetched_data.json()
+    return response
+
+
+def _stage_feed(cache: FeedCache | None, response: FeedResponse) -> None:
+    """Stage the fetched feed in the cache, or remove it without a cache."""
+    if cache:
+        cache.stage_file(
+            response.path,
+            etag=response.etag,
+            last_modified=response.last_modified,
+            source=response.source,
+        )
+    else:
+        response.discard()
+
+
+def _count_releases(data: dict | None) -> int:
+    """Return the amount of releases in the release data."""
+    if not data:
+        return 0
+    return sum(len(major_releases) for major_releases in data.values())
+
+
+def fetch_release_index(
+    cache: FeedCache | None = None,
+    *,
+    offline: bool = False,
+    fetcher: FeedFetcher | None = None,
+    fingerprint: str | None = None,
+) -> ReleaseIndex | None:
+    """Return the index of the releases in the feed.
+
+    The feed is parsed as a stream, one release at a time, while it is
+    written to the cache, so the feed itself is never held in memory.
+    Offline, the cached snapshot is parsed the same way. This also happens
+    if the feed is not modified, but the dockerfiles were last generated
+    with other options or templates.
+
+    Args:
+        cache: optional cache to make the request conditional with.
+        offline: read the cached snapshot without making any request.
+        fetcher: fetcher with the mirrors to fetch from.
+        fingerprint: hash of the options and templates to generate with,
+            compared to the one the cache was committed with.
+
+    Raises:
+        ValueError: if fetching failed, or if offline is requested
+            without a valid snapshot being available.
+
+    Returns:
+        index of the releases, or None if the feed has not been modified
+        since the cached snapshot and the fingerprint did not change.
+    """
+    if not offline:
+        response = _fetch_feed(cache, fetcher)
+        if response is not None:
+            _stage_feed(cache, response)
+            return ReleaseIndex.from_releases(response.releases)
+        if cache.fingerprint == fingerprint:
+            return None
+        logger.info("Options or templates changed, using cached JSON data.")
+    if cache is None or not cache.snapshot_path.is_file():
+        msg = "No cached release data available to use offline."
+        raise ValueError(msg)
+    with (
+        span("parse", source="cache") as parse_span,
+        cache.snapshot_path.open("rb") as file,
+    ):
+        index = ReleaseIndex.from_releases(iter_releases(read_chunks(file)))
+        parse_span.add(byte_count=file.tell(), item_count=len(index))
+    logger.info("Using cached JSON data containing Nuke releases.")
+    return index
 
 
 def _nuke_version_to_float(nuke_version: str) -> float:
@@ -40,50 +221,78 @@ def _nuke_version_to_float(nuke_version: str) -> float:
     Returns:
         nuke version as float, for example 10.0
     """
-    if "v" not in nuke_version:
-        msg = f"Provided data is not a valid version. '{nuke_version}'"
-        raise ValueError(msg)
-    match = re.search(_VERSION_REGEX, nuke_version)
-    return float(match.group())
+    return NukeVersion.from_string(nuke_version).minor_version
 
 
-def get_dockerfiles(data: dict) -> list[Dockerfile]:
+def get_dockerfiles(
+    data: dict | ReleaseIndex, options: DockerfileOptions | None = None
+) -> list[Dockerfile]:
     """Convert provided data dict to list of Dockerfile.
 
     Args:
-        data: the requested JSON data.
+        data: the requested JSON data, or the index of its releases.
+        options: options of the dockerfiles and the releases to select,
+            defaults to all releases without any option.
 
     Returns:
-        list of Dockerfile.
+        list of Dockerfile, newest release first.
     """
-    releases = {
-        inner_key: inner_value
-        for _, outer_value in data.items()
-        for inner_key, inner_value in outer_value.items()
-    }
-    dockerfiles: list[Dockerfile] = []
-    for version, release_data in releases.items():
-        installer_data = release_data.get("installer")
-        version_number = _nuke_version_to_float(version)
-
-        # As everything below Nuke 13 is considered EOL. Skipping it.
-        if version_number < 10:
-            continue
-
-        for os in ["linux_x86_64", "windows_x86_64"]:
-            if os == "windows_x86_64" and version_number < 12:
-                continue
-            install_url = installer_data.get(os)
-            if not install_url:
-                continue
-            dockerfiles.append(
-                Dockerfile(
-                    operating_system=OperatingSystem.from_mapped_name(os),
-                    nuke_version=version_number,
-                    nuke_source=install_url,
-                )
-            )
+    dockerfiles = list(iter_dockerfiles(data, options))
     msg = f"Found {len(dockerfiles)} possible dockerfiles."
     logger.info(msg)
 
     return dockerfiles
+
+
+def iter_dockerfiles(
+    data: dict | ReleaseIndex, options: DockerfileOptions | None = None
+) -> Iterator[Dockerfile]:
+    """Yield a Dockerfile for every selected release and system.
+
+    The filters are applied to the release index, so dockerfiles are only
+    created for the releases that are selected. Only the newest patch
+    release of every minor version is used. Dockerfiles are created one at
+    a time as they are consumed.
+
+    Args:
+        data: the requested JSON data, or the index of its releases.
+        options: options of the dockerfiles and the releases to select,
+            defaults to all releases without any option.
+
+    Yields:
+        Dockerfile, newest release first.
+    """
+    options = options or DockerfileOptions()
+    index = (
+        data
+        if isinstance(data, ReleaseIndex)
+        else ReleaseIndex.from_feed(data)
+    )
+    since = max(options.since or MINIMUM_VERSION, MINIMUM_VERSION)
+    releases = index.latest_per_minor(
+        index.select(versions=options.versions, since=since)
+    )
+    selected_systems = [
+        operating_system
+        for operating_system in _OPERATING_SYSTEMS
+        if options.operating_systems is None
+        or operating_system in options.operating_systems
+    ]
+    for release in reversed(releases):
+        for operating_system in selected_systems:
+            if (
+                operating_system == OperatingSystem.WINDOWS
+                and release.version < MINIMUM_WINDOWS_VERSION
+            ):
+                continue
+            install_url = release.installer(operating_system)
+            if not install_url:
+                continue
+            yield Dockerfile(
+                operating_system=operating_system,
+                nuke_version=release.version.minor_version,
+                nuke_source=install_url,
+                use_base_image=options.use_base_images,
+                use_cache_mounts=options.use_cache_mounts,
+                use_shared_sources=options.use_shared_sources,
+            )
@@ -2,53 +2,277 @@
 
 @maintainer: Gilles Vink
 """
+
 from __future__ import annotations
 
-import copy
+import hashlib
+import json
 import logging
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import TYPE_CHECKING
 
+from nukedockerbuild.creator.bake import (
+    BAKE_FILE,
+    BAKE_MATRIX_FILE,
+    BakeFile,
+)
+from nukedockerbuild.creator.manifest import (
+    BASE_DIRECTORY,
+    DOCKERFILES_DIRECTORY,
+    DockerfileManifest,
+    content_hash,
+)
+from nukedockerbuild.datamodel.docker_data import BaseDockerfile
+from nukedockerbuild.tracing import span
+
 if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
     from nukedockerbuild.datamodel.docker_data import Dockerfile
 
 logger = logging.getLogger(__name__)
 
+_PACKAGE_DIRECTORY = Path(__file__).resolve().parent.parent
+TEMPLATE_FILES: tuple[str, ...] = ("datamodel/*.py", "creator/bake.py")
+"""Modules that determine the rendered files, relative to the package."""
+
+
+@dataclass
+class PlannedDockerfile:
+    """Dockerfile together with its path and the hash of its content.
+
+    The rendered content itself is not kept, so the plan of a large tree
+    stays small. It is written as soon as it is rendered instead.
+    """
+
+    dockerfile: Dockerfile | BaseDockerfile
+    path: Path
+    """Path relative to the base level directory."""
+    content_hash: str
+    """Hash of the rendered dockerfile content."""
+
+
+@dataclass
+class RegenerationPlan:
+    """Changes needed to bring the dockerfiles tree up to date."""
+
+    added: list[PlannedDockerfile] = field(default_factory=list)
+    """Dockerfiles that do not exist yet."""
+    changed: list[PlannedDockerfile] = field(default_factory=list)
+    """Dockerfiles whose rendered content differs from the one on disk."""
+    unchanged: list[PlannedDockerfile] = field(default_factory=list)
+    """Dockerfiles that are already up to date."""
+    removed: list[Path] = field(default_factory=list)
+    """Dockerfiles on disk that are not part of the provided data."""
+
+    @property
+    def planned(self) -> list[PlannedDockerfile]:
+        """Return all dockerfiles that are part of the tree after writing."""
+        return self.added + self.changed + self.unchanged
+
+    @property
+    def to_write(self) -> list[PlannedDockerfile]:
+        """Return all dockerfiles that need to be written."""
+        return self.added + self.changed
+
+    def format(self) -> str:
+        """Return the plan as a human readable listing."""
+        lines = [f"+ {planned.path}" for planned in self.added]
+        lines.extend(f"~ {planned.path}" for planned in self.changed)
+        lines.extend(f"- {path}" for path in self.removed)
+        lines.append(
+            f"{len(self.added)} added, {len(self.changed)} changed, "
+            f"{len(self.removed)} removed, "
+            f"{len(self.unchanged)} unchanged."
+        )
+        return "\n".join(lines)
 
-def _keep_only_new_dockerfiles(
-    directory: Path, dockerfiles: list[Dockerfile]
-) -> None:
-    """Check provided dockerfiles if they already exists.
+
+def plan_dockerfiles(
+    directory: Path,
+    dockerfiles: Iterable[Dockerfile],
+    *,
+    include_removed: bool = True,
+) -> RegenerationPlan:
+    """Compare provided dockerfiles to the ones that exist in directory.
+
+    Every dockerfile is rendered once and compared against the content
+    hash of the existing file, so changed releases or templates are
+    picked up while untouched files are left alone. Base images used by
+    the dockerfiles are planned once each.
 
     Args:
-        directory: base level directory to start searching.
-        dockerfiles: dockerfiles list to modify and check.
+        directory: base level directory to compare against.
+        dockerfiles: dockerfiles to plan for, consumed one at a time.
+        include_removed: list dockerfiles on disk that are not provided as
+            removed. Disable this when only a selection is provided.
+
+    Returns:
+        plan with all added, changed, unchanged and removed dockerfiles.
     """
-    for dockerfile in copy.deepcopy(dockerfiles):
-        full_path: Path = directory / _get_dockerfile_path(dockerfile)
-        if not full_path.is_file():
-            continue
-        dockerfiles.remove(dockerfile)
+    plan = RegenerationPlan()
+    for _ in _iter_plan(directory, dockerfiles, plan, include_removed):
+        pass
+    return plan
 
 
-def write_dockerfiles(directory: Path, dockerfiles: list[Dockerfile]) -> None:
+def write_dockerfiles(
+    directory: Path,
+    dockerfiles: Iterable[Dockerfile],
+    *,
+    write_bake: bool = False,
+) -> RegenerationPlan:
     """Create dockerfiles from provided directory and dockerfiles.
 
+    Only dockerfiles that are new or whose content changed are written,
+    every other file is left untouched. Every dockerfile is written as
+    soon as it is rendered and compared, so dockerfiles can be provided
+    by a generator.
+
     Args:
         directory: base level directory to create folders and files.
-        dockerfiles: list of dockerfiles to process and create.
+        dockerfiles: dockerfiles to process and create.
+        write_bake: also write a bake file for all dockerfiles.
+
+    Returns:
+        the plan that has been applied.
     """
-    _keep_only_new_dockerfiles(directory, dockerfiles)
+    plan = RegenerationPlan()
+    for planned, content in _iter_plan(directory, dockerfiles, plan):
+        with span("write") as write_span:
+            write_path: Path = directory / planned.path
+            write_path.parent.mkdir(parents=True, exist_ok=True)
+            write_path.write_text(content)
+            write_span.add(byte_count=len(content), item_count=1)
+    msg = (
+        f"Created {len(plan.added)} new dockerfiles, "
+        f"updated {len(plan.changed)} dockerfiles."
+    )
+    logger.info(msg)
+    if write_bake:
+        write_bake_files(directory, plan)
+    return plan
 
+
+def _iter_plan(
+    directory: Path,
+    dockerfiles: Iterable[Dockerfile],
+    plan: RegenerationPlan,
+    include_removed: bool = True,
+) -> Iterator[tuple[PlannedDockerfile, str]]:
+    """Render and compare dockerfiles lazily, filling in the plan.
+
+    Args:
+        directory: base level directory to compare against.
+        dockerfiles: dockerfiles to plan for.
+        plan: plan to add every dockerfile to.
+        include_removed: list dockerfiles on disk that are not provided as
+            removed, once all dockerfiles are consumed.
+
+    Yields:
+        every added or changed dockerfile with its rendered content, which
+        needs to be written.
+    """
+    with span("plan", step="manifest") as plan_span:
+        manifest = DockerfileManifest.from_directory(directory)
+        plan_span.add(item_count=len(manifest.hashes))
+    planned_paths: set[Path] = set()
+    for planned, content in _iter_rendered(dockerfiles):
+        if planned.path in planned_paths:
+            continue
+        planned_paths.add(planned.path)
+        if planned.path not in manifest.hashes:
+            plan.added.append(planned)
+            yield planned, content
+        elif manifest.hashes[planned.path] != planned.content_hash:
+            plan.changed.append(planned)
+            yield planned, content
+        else:
+            plan.unchanged.append(planned)
+
+    with span("plan", step="removed") as plan_span:
+        if include_removed:
+            plan.removed = sorted(
+                path for path in manifest.hashes if path not in planned_paths
+            )
+        plan_span.add(item_count=len(planned_paths))
+
+
+def _iter_rendered(
+    dockerfiles: Iterable[Dockerfile],
+) -> Iterator[tuple[PlannedDockerfile, str]]:
+    """Render dockerfiles one at a time, each base image before its first use.
+
+    Args:
+        dockerfiles: dockerfiles to render.
+
+    Yields:
+        every dockerfile and base dockerfile with its rendered content.
+    """
+    base_names: set[str] = set()
     for dockerfile in dockerfiles:
-        write_path: Path = directory / _get_dockerfile_path(dockerfile)
-        write_path.parent.mkdir(parents=True, exist_ok=True)
-        write_path.write_text(dockerfile.to_dockerfile())
-    msg = f"Created {len(dockerfiles)} new dockerfiles."
+        base_dockerfile = dockerfile.base_dockerfile
+        if base_dockerfile and base_dockerfile.name not in base_names:
+            base_names.add(base_dockerfile.name)
+            yield _render(base_dockerfile)
+        yield _render(dockerfile)
+
+
+def _render(
+    dockerfile: Dockerfile | BaseDockerfile,
+) -> tuple[PlannedDockerfile, str]:
+    """Render a single dockerfile together with its path."""
+    with span("render") as render_span:
+        content = dockerfile.to_dockerfile()
+        render_span.add(byte_count=len(content), item_count=1)
+    planned = PlannedDockerfile(
+        dockerfile=dockerfile,
+        path=_get_dockerfile_path(dockerfile),
+        content_hash=content_hash(content),
+    )
+    return planned, content
+
+
+def generation_fingerprint(options: dict) -> str:
+    """Return a hash of everything the generated tree depends on.
+
+    Besides the release feed, the tree depends on the options it is
+    generated with and on the templates in the source code. A feed that
+    is not modified only allows skipping the generation if this did not
+    change either.
+
+    Args:
+        options: JSON serializable options of the generation.
+
+    Returns:
+        hex digest of the options and the template modules.
+    """
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode())
+    for pattern in TEMPLATE_FILES:
+        for path in sorted(_PACKAGE_DIRECTORY.glob(pattern)):
+            digest.update(
+                path.relative_to(_PACKAGE_DIRECTORY).as_posix().encode()
+            )
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def write_bake_files(directory: Path, plan: RegenerationPlan) -> None:
+    """Write the bake file in HCL and JSON for all planned dockerfiles.
+
+    Args:
+        directory: base level directory to write the bake files to.
+        plan: plan containing all dockerfiles of the tree.
+    """
+    bake_file = BakeFile.from_planned(plan.planned)
+    Path(directory, BAKE_FILE).write_text(bake_file.to_hcl())
+    Path(directory, BAKE_MATRIX_FILE).write_text(bake_file.to_json())
+    msg = f"Wrote bake file with {len(bake_file.targets)} targets."
     logger.info(msg)
 
 
-def _get_dockerfile_path(dockerfile: Dockerfile) -> Path:
+def _get_dockerfile_path(dockerfile: Dockerfile | BaseDockerfile) -> Path:
     """Get relative path where dockerfile should be written to.
 
     Args:
@@ -57,7 +281,12 @@ def _get_dockerfile_path(dockerfile: Dockerfile) -> Path:
     Returns:
         string containing relative path to dockerfile.
     """
+    if isinstance(dockerfile, BaseDockerfile):
+        return Path(
+            f"{DOCKERFILES_DIRECTORY}/{BASE_DIRECTORY}/{dockerfile.name}"
+            "/Dockerfile"
+        )
     return Path(
-        f"dockerfiles/{dockerfile.nuke_version}/{dockerfile.operating_system.value}"
-        "/Dockerfile"
+        f"{DOCKERFILES_DIRECTORY}/{dockerfile.nuke_version}/"
+        f"{dockerfile.operating_system.value}/Dockerfile"
     )
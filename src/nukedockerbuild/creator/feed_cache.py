@@ -0,0 +1,224 @@
+"""On-disk cache for the release feed with its HTTP validators.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.datamodel.constants import JSON_DATA_SOURCE
+from nukedockerbuild.files import CHUNK_SIZE, write_atomic
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeedCache:
+    """Cache storing the last good release feed and its validators.
+
+    A fetched feed is staged first and only committed once the dockerfiles
+    are written from it. A failed run therefore never leaves validators
+    behind that make the next run skip the dockerfiles it did not write.
+
+    Validators are stored per mirror, as an ETag or modification date of
+    one mirror means nothing to another. Validators of other mirrors are
+    only kept if a mirror responds with the same feed as the snapshot.
+    """
+
+    directory: Path
+    """Directory to store the snapshot and its metadata in."""
+    _staged: bool = field(default=False, init=False, repr=False)
+
+    @property
+    def snapshot_path(self) -> Path:
+        """Return path to the cached feed body."""
+        return self.directory / "releases.json"
+
+    @property
+    def metadata_path(self) -> Path:
+        """Return path to the cached ETag and Last-Modified values."""
+        return self.directory / "releases.meta.json"
+
+    @property
+    def fingerprint(self) -> str | None:
+        """Return the fingerprint of the last generation, if recorded."""
+        return self._metadata().get("fingerprint")
+
+    def load(self) -> dict | None:
+        """Return the cached feed, or None if there is no valid snapshot."""
+        try:
+            return json.loads(self.snapshot_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def conditional_headers(
+        self, source: str = JSON_DATA_SOURCE
+    ) -> dict[str, str]:
+        """Return headers to make the next request to a mirror conditional.
+
+        Headers are only returned if a snapshot exists to fall back to,
+        otherwise a 304 response could not be served from the cache.
+
+        Args:
+            source: URL or path of the mirror to make the request to.
+
+        Returns:
+            the validators of that mirror as request headers.
+        """
+        if not self.snapshot_path.is_file():
+            return {}
+        validators = _validators(self._metadata()).get(source, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def stage(
+        self,
+        data: dict,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        source: str = JSON_DATA_SOURCE,
+    ) -> None:
+        """Stage the feed and its validators, to be committed later.
+
+        Args:
+            data: the parsed feed to stage.
+            etag: ETag header of the response, if any.
+            last_modified: Last-Modified header of the response, if any.
+            source: URL or path of the mirror that responded.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_atomic(self._staged_path(self.snapshot_path), json.dumps(data))
+        self._stage_metadata(source, etag, last_modified)
+
+    def stage_file(
+        self,
+        path: Path,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        source: str = JSON_DATA_SOURCE,
+    ) -> None:
+        """Stage a feed that is written to a file, by moving the file.
+
+        The file needs to be on the same file system as the cache, like a
+        response body that is written to the cache directory.
+
+        Args:
+            path: file containing the feed to stage.
+            etag: ETag header of the response, if any.
+            last_modified: Last-Modified header of the response, if any.
+            source: URL or path of the mirror that responded.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path.replace(self._staged_path(self.snapshot_path))
+        self._stage_metadata(source, etag, last_modified)
+
+    def commit(self, fingerprint: str | None = None) -> None:
+        """Move the staged feed in place and record the fingerprint.
+
+        Without a staged feed, only the fingerprint is recorded with the
+        current snapshot, as the dockerfiles were written from it.
+
+        Args:
+            fingerprint: hash of the options and templates the dockerfiles
+                were generated with.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        metadata = self._metadata()
+        if self._staged:
+            staged_snapshot = self._staged_path(self.snapshot_path)
+            staged_metadata = self._staged_path(self.metadata_path)
+            validators = _validators(json.loads(staged_metadata.read_text()))
+            if _file_digest(staged_snapshot) == _file_digest(
+                self.snapshot_path
+            ):
+                validators = {**_validators(metadata), **validators}
+            metadata = {"validators": validators}
+            # Validators of the old snapshot must never outlive it.
+            write_atomic(self.metadata_path, json.dumps({}))
+            staged_snapshot.replace(self.snapshot_path)
+            staged_metadata.unlink()
+            self._staged = False
+            msg = f"Stored release data snapshot in '{self.directory}'."
+            logger.info(msg)
+        metadata["fingerprint"] = fingerprint
+        write_atomic(self.metadata_path, json.dumps(metadata))
+
+    def store(
+        self,
+        data: dict,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        fingerprint: str | None = None,
+        source: str = JSON_DATA_SOURCE,
+    ) -> None:
+        """Store the feed and its validators in the cache right away.
+
+        Files are replaced atomically so an interrupted run never leaves
+        a partially written snapshot behind.
+
+        Args:
+            data: the parsed feed to store.
+            etag: ETag header of the response, if any.
+            last_modified: Last-Modified header of the response, if any.
+            fingerprint: hash of the options and templates, if any.
+            source: URL or path of the mirror that responded.
+        """
+        self.stage(
+            data, etag=etag, last_modified=last_modified, source=source
+        )
+        self.commit(fingerprint)
+
+    def _stage_metadata(
+        self, source: str, etag: str | None, last_modified: str | None
+    ) -> None:
+        """Stage the validators of the mirror that sent the staged feed."""
+        validators = {"etag": etag, "last_modified": last_modified}
+        write_atomic(
+            self._staged_path(self.metadata_path),
+            json.dumps({"validators": {source: validators}}),
+        )
+        self._staged = True
+
+    def _metadata(self) -> dict:
+        """Return the stored metadata, empty if there is none."""
+        try:
+            metadata = json.loads(self.metadata_path.read_text())
+        except (OSError, ValueError):
+            return {}
+        return metadata if isinstance(metadata, dict) else {}
+
+    @staticmethod
+    def _staged_path(path: Path) -> Path:
+        """Return the path a file is staged at before it is committed."""
+        return path.with_suffix(f"{path.suffix}.staged")
+
+
+def _validators(metadata: dict) -> dict[str, dict]:
+    """Return the validators by mirror from the metadata."""
+    validators = metadata.get("validators")
+    return validators if isinstance(validators, dict) else {}
+
+
+def _file_digest(path: Path) -> str | None:
+    """Return the SHA-256 of a file, or None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with path.open("rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
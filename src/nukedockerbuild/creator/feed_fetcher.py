@@ -0,0 +1,349 @@
+"""Fetch of the release feed from multiple mirrors with hedged requests.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from http import HTTPStatus
+from pathlib import Path
+from typing import IO, TYPE_CHECKING
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from nukedockerbuild.creator.feed_stream import (
+    CHUNK_SIZE,
+    iter_releases,
+    read_chunks,
+    validate_release,
+)
+from nukedockerbuild.datamodel.constants import JSON_DATA_SOURCE
+from nukedockerbuild.tracing import span
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from nukedockerbuild.creator.release_index import Release
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEDGE_DELAY = 2.0
+"""Seconds to wait for a response before also asking the next mirror."""
+
+DEFAULT_RETRY_BUDGET = 2
+"""Attempts allowed on top of a single attempt per mirror."""
+
+
+@dataclass
+class FeedResponse:
+    """Valid response of a single mirror.
+
+    The body is streamed to a file while it is parsed, so the feed itself
+    is never held in memory. The file belongs to whoever received the
+    response, to be moved into a cache or discarded.
+    """
+
+    source: str
+    """URL or path of the mirror that responded first."""
+    releases: list[Release] | None
+    """Releases in the order of the feed, or None if it is not modified."""
+    path: Path | None = None
+    """File containing the body of the response, if it is modified."""
+    etag: str | None = None
+    last_modified: str | None = None
+    seconds: float = 0.0
+    """Time from starting the fetch until this response."""
+
+    @property
+    def not_modified(self) -> bool:
+        """Return if the mirror reported the cached feed is current."""
+        return self.releases is None
+
+    @property
+    def data(self) -> dict | None:
+        """Return the decoded feed read from its file, if it is modified."""
+        if self.path is None:
+            return None
+        return json.loads(self.path.read_bytes())
+
+    def discard(self) -> None:
+        """Remove the file containing the body, if any."""
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+
+def validate_feed(data: object) -> int:
+    """Validate the release feed against the expected schema.
+
+    The feed contains releases by version, grouped by major version:
+    {"15": {"15.1v5": {"installer": {"linux_x86_64": "https://..."}}}}.
+
+    Args:
+        data: the decoded JSON of the feed.
+
+    Raises:
+        ValueError: if the feed does not match the schema.
+
+    Returns:
+        amount of releases in the feed.
+    """
+    if not isinstance(data, dict) or not data:
+        msg = "Release feed needs to be a non empty object of majors."
+        raise ValueError(msg)
+    releases = 0
+    for major, major_releases in data.items():
+        if not str(major).isdigit() or not isinstance(major_releases, dict):
+            msg = f"Release feed has an invalid major version '{major}'."
+            raise ValueError(msg)
+        for version, release_data in major_releases.items():
+            validate_release(major, version, release_data)
+            releases += 1
+    return releases
+
+
+@dataclass
+class FeedFetcher:
+    """Fetch the release feed from the first mirror with a valid response.
+
+    Mirrors are tried in order. If a mirror did not respond within the
+    hedge delay, the next mirror is asked as well, without cancelling the
+    first. A failed mirror is replaced by the next one right away. Once
+    every mirror is tried, the retry budget allows trying them again.
+    """
+
+    mirrors: list[str] = field(default_factory=lambda: [JSON_DATA_SOURCE])
+    """URLs, file URLs or paths of the feed, in order of preference."""
+    hedge_delay: float = DEFAULT_HEDGE_DELAY
+    retry_budget: int = DEFAULT_RETRY_BUDGET
+    timeout: float = 10.0
+    """Timeout for connecting and reading in seconds, per attempt."""
+    pool_size: int = 4
+    """Maximum amount of concurrent attempts and pooled connections."""
+    _session: requests.Session = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Create the pooled session shared by all attempts."""
+        if not self.mirrors:
+            msg = "Provide at least one mirror to fetch the feed from."
+            raise ValueError(msg)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size, pool_maxsize=self.pool_size
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def fetch(
+        self,
+        headers: dict[str, dict[str, str]] | None = None,
+        directory: Path | None = None,
+    ) -> FeedResponse:
+        """Fetch the feed, blocking until a mirror responded validly.
+
+        Args:
+            headers: conditional headers of the cached feed by mirror,
+                every mirror only gets its own validators.
+            directory: directory to write the body to, like the cache,
+                defaults to the temporary directory.
+
+        Raises:
+            ValueError: if every attempt failed.
+
+        Returns:
+            the first valid response.
+        """
+        return asyncio.run(self.fetch_async(headers, directory))
+
+    async def fetch_async(
+        self,
+        headers: dict[str, dict[str, str]] | None = None,
+        directory: Path | None = None,
+    ) -> FeedResponse:
+        """Fetch the feed with hedged requests to the mirrors.
+
+        Args:
+            headers: conditional headers of the cached feed by mirror,
+                every mirror only gets its own validators.
+            directory: directory to write the body to, like the cache,
+                defaults to the temporary directory.
+
+        Raises:
+            ValueError: if every attempt failed.
+
+        Returns:
+            the first valid response.
+        """
+        attempts = list(self.mirrors)
+        attempts.extend(
+            self.mirrors[index % len(self.mirrors)]
+            for index in range(self.retry_budget)
+        )
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        errors: list[str] = []
+        pending: set[asyncio.Future] = set()
+        started: list[Future] = []
+        response: FeedResponse | None = None
+        # Attempts that lost the race keep running until their timeout, so
+        # the executor is not waited for once a response is valid.
+        executor = ThreadPoolExecutor(
+            max_workers=self.pool_size, thread_name_prefix="feed"
+        )
+        try:
+            while attempts or pending:
+                if attempts and len(pending) < self.pool_size:
+                    source = attempts.pop(0)
+                    started.append(
+                        executor.submit(
+                            self._fetch_source,
+                            source,
+                            (headers or {}).get(source),
+                            directory,
+                        )
+                    )
+                    pending.add(asyncio.wrap_future(started[-1], loop=loop))
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay if attempts else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for future in done:
+                    try:
+                        response = future.result()
+                    except (OSError, ValueError) as exception:
+                        msg = str(exception)
+                        logger.warning(msg)
+                        errors.append(msg)
+                        continue
+                    response.seconds = time.perf_counter() - start
+                    msg = (
+                        f"Fetched release feed from '{response.source}' "
+                        f"in {response.seconds:.2f}s."
+                    )
+                    logger.info(msg)
+                    return response
+        finally:
+            for future in pending:
+                future.cancel()
+            # Attempts that lost the race remove their body once finished.
+            for future in started:
+                future.add_done_callback(
+                    partial(_discard_lost, winner=response)
+                )
+            executor.shutdown(wait=False, cancel_futures=True)
+        msg = f"Fetching the release feed failed: {'; '.join(errors)}"
+        raise ValueError(msg)
+
+    def _fetch_source(
+        self,
+        source: str,
+        headers: dict[str, str] | None,
+        directory: Path | None,
+    ) -> FeedResponse:
+        """Fetch and validate the feed from a single mirror.
+
+        Raises:
+            ValueError: if the mirror failed or returned an invalid feed.
+        """
+        path = _local_path(source)
+        if path is not None:
+            with path.open("rb") as file:
+                body_path, releases = _store_feed(
+                    source, read_chunks(file), directory
+                )
+            return FeedResponse(source, releases, body_path)
+
+        try:
+            with self._session.get(
+                source,
+                headers=headers or {},
+                timeout=self.timeout,
+                stream=True,
+            ) as response:
+                if response.status_code == HTTPStatus.NOT_MODIFIED and headers:
+                    return FeedResponse(source, None)
+                if response.status_code != HTTPStatus.OK:
+                    msg = f"Mirror '{source}' returned {response.status_code}."
+                    raise ValueError(msg)
+                body_path, releases = _store_feed(
+                    source, response.iter_content(CHUNK_SIZE), directory
+                )
+        except requests.RequestException as exception:
+            msg = f"Mirror '{source}' failed: {exception}"
+            raise ValueError(msg) from exception
+        return FeedResponse(
+            source,
+            releases,
+            body_path,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
+
+def _store_feed(
+    source: str, chunks: Iterable[bytes], directory: Path | None
+) -> tuple[Path, list[Release]]:
+    """Write the feed of a mirror to a file while parsing it.
+
+    Raises:
+        ValueError: if the content is not a valid feed.
+
+    Returns:
+        path of the written feed and its releases.
+    """
+    with (
+        span("fetch", source=source) as fetch_span,
+        tempfile.NamedTemporaryFile(
+            dir=directory, prefix="releases.", suffix=".tmp", delete=False
+        ) as file,
+    ):
+        path = Path(file.name)
+        try:
+            releases = list(iter_releases(_written(chunks, file)))
+            if not releases:
+                msg = "Release feed needs to be a non empty object of majors."
+                raise ValueError(msg)
+        except ValueError as exception:
+            path.unlink()
+            msg = f"Mirror '{source}' returned an invalid feed: {exception}"
+            raise ValueError(msg) from exception
+        except BaseException:
+            path.unlink()
+            raise
+        fetch_span.add(byte_count=file.tell(), item_count=len(releases))
+    return path, releases
+
+
+def _written(chunks: Iterable[bytes], file: IO[bytes]) -> Iterator[bytes]:
+    """Yield every chunk after writing it to the file."""
+    for chunk in chunks:
+        file.write(chunk)
+        yield chunk
+
+
+def _discard_lost(future: Future, winner: FeedResponse | None) -> None:
+    """Remove the body of an attempt that did not return the response."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    if future.result() is not winner:
+        future.result().discard()
+
+
+def _local_path(source: str) -> Path | None:
+    """Return the path of a file URL or local path, None for HTTP."""
+    parsed = urlparse(source)
+    if parsed.scheme in ("http", "https"):
+        return None
+    if parsed.scheme == "file":
+        return Path(unquote(parsed.path))
+    return Path(source)
@@ -0,0 +1,200 @@
+"""Incremental parsing of the release feed from a stream of bytes.
+
+The feed is parsed one release at a time, so it never needs to be held
+in memory as a whole, regardless of its size.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+from typing import IO, TYPE_CHECKING
+
+from nukedockerbuild.creator.release_index import Release
+from nukedockerbuild.datamodel.version import NukeVersion
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+CHUNK_SIZE = 64 * 1024
+"""Amount of bytes to read from the stream at once."""
+
+_WHITESPACE = " \t\n\r"
+
+
+def read_chunks(
+    file: IO[bytes], chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Yield the content of a binary file in chunks.
+
+    Args:
+        file: file opened in binary mode.
+        chunk_size: amount of bytes per chunk.
+
+    Yields:
+        chunks of the file until its end.
+    """
+    while chunk := file.read(chunk_size):
+        yield chunk
+
+
+def validate_release(major: str, version: str, release_data: object) -> None:
+    """Validate a single release of the feed against the schema.
+
+    Args:
+        major: the major version the release is listed under.
+        version: the version of the release, like 15.1v5.
+        release_data: the release, containing its installers.
+
+    Raises:
+        ValueError: if the release does not match the schema.
+    """
+    if NukeVersion.from_string(version).major != int(major):
+        msg = f"Release '{version}' is listed under major {major}."
+        raise ValueError(msg)
+    installers = (
+        release_data.get("installer", {})
+        if isinstance(release_data, dict)
+        else None
+    )
+    if not isinstance(installers, dict) or not all(
+        isinstance(url, str | None) for url in installers.values()
+    ):
+        msg = f"Release '{version}' has invalid installers."
+        raise ValueError(msg)
+
+
+def iter_feed(chunks: Iterable[bytes]) -> Iterator[tuple[str, str, dict]]:
+    """Parse the feed incrementally, yielding every release in order.
+
+    Only a single release is decoded at once, the majors and versions
+    around it are parsed as the stream is read.
+
+    Args:
+        chunks: the JSON feed in chunks of bytes.
+
+    Raises:
+        ValueError: if the stream is not a valid feed.
+
+    Yields:
+        the major, version and data of every release.
+    """
+    reader = _StreamReader(chunks)
+    reader.expect("{")
+    for major in reader.members():
+        if not major.isdigit():
+            msg = f"Release feed has an invalid major version '{major}'."
+            raise ValueError(msg)
+        reader.expect("{")
+        for version in reader.members():
+            release_data = reader.value()
+            validate_release(major, version, release_data)
+            yield major, version, release_data
+    if reader.peek():
+        msg = "Release feed has trailing data after its end."
+        raise ValueError(msg)
+
+
+def iter_releases(chunks: Iterable[bytes]) -> Iterator[Release]:
+    """Parse the feed incrementally into releases.
+
+    Args:
+        chunks: the JSON feed in chunks of bytes.
+
+    Raises:
+        ValueError: if the stream is not a valid feed.
+
+    Yields:
+        every release in the order of the feed.
+    """
+    for _, version, release_data in iter_feed(chunks):
+        yield Release(
+            NukeVersion.from_string(version),
+            release_data.get("installer") or {},
+        )
+
+
+class _StreamReader:
+    """Text buffer over the chunks, refilled when it runs out."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+
+    def _fill(self) -> bool:
+        """Append the next chunk to the buffer, False at the end."""
+        chunk = next(self._chunks, None)
+        text = (
+            self._decoder.decode(b"", final=True)
+            if chunk is None
+            else self._decoder.decode(chunk)
+        )
+        self._buffer = self._buffer[self._position :] + text
+        self._position = 0
+        return chunk is not None
+
+    def peek(self) -> str:
+        """Return the next character that is not whitespace, if any."""
+        while True:
+            while (
+                self._position < len(self._buffer)
+                and self._buffer[self._position] in _WHITESPACE
+            ):
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                return ""
+
+    def expect(self, character: str) -> None:
+        """Consume the character, raising if it is not next."""
+        found = self.peek()
+        if found != character:
+            msg = (
+                f"Release feed is invalid, expected '{character}' but "
+                f"found '{found or 'the end'}'."
+            )
+            raise ValueError(msg)
+        self._position += 1
+
+    def value(self) -> object:
+        """Decode the next JSON value, reading more until it is whole."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(
+                    self._buffer, self._position
+                )
+            except json.JSONDecodeError as exception:
+                if not self._fill():
+                    msg = f"Release feed is invalid: {exception}"
+                    raise ValueError(msg) from exception
+                continue
+            self._position = end
+            return value
+
+    def members(self) -> Iterator[str]:
+        """Yield the keys of the current object, after an opening brace.
+
+        The value of each key is consumed by the caller before the next
+        key is read.
+        """
+        if self.peek() == "}":
+            self._position += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                msg = f"Release feed is invalid, found key {key!r}."
+                raise ValueError(msg)
+            self.expect(":")
+            yield key
+            if self.peek() == "}":
+                self._position += 1
+                return
+            self.expect(",")
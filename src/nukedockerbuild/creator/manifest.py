@@ -0,0 +1,109 @@
+"""Manifest of content hashes for the dockerfiles tree.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+DOCKERFILES_DIRECTORY = "dockerfiles"
+"""Name of the directory that contains all generated dockerfiles."""
+
+BASE_DIRECTORY = "base"
+"""Folder in the dockerfiles tree that contains the shared base images."""
+
+_VOLATILE_LABELS = ("LABEL 'org.opencontainers.image.created'",)
+"""Labels that change on every render and do not count as a change."""
+
+
+def content_hash(content: str) -> str:
+    """Return the hash of rendered dockerfile content.
+
+    Lines containing volatile labels are skipped, so rendering the same
+    inputs on another day results in the same hash.
+
+    Args:
+        content: the rendered dockerfile.
+
+    Returns:
+        hex digest of the content.
+    """
+    digest = hashlib.sha256()
+    for line in content.splitlines(keepends=True):
+        if line.startswith(_VOLATILE_LABELS):
+            continue
+        digest.update(line.encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class DockerfileManifest:
+    """Content hash per (version, operating system) dockerfile on disk."""
+
+    hashes: dict[Path, str] = field(default_factory=dict)
+    """Hash by dockerfile path, relative to the base directory."""
+
+    @classmethod
+    def from_directory(cls, directory: Path) -> DockerfileManifest:
+        """Build the manifest from a single pass over the dockerfiles tree.
+
+        Args:
+            directory: base level directory containing the dockerfiles.
+
+        Returns:
+            manifest of all dockerfiles found.
+        """
+        hashes = {
+            relative_path: content_hash(
+                Path(directory, relative_path).read_text()
+            )
+            for relative_path in find_dockerfiles(directory)
+        }
+        return cls(hashes)
+
+    def has_changed(self, path: Path, content: str) -> bool:
+        """Return if content differs from the manifest entry at path."""
+        return self.hashes.get(path) != content_hash(content)
+
+
+def find_dockerfiles(directory: Path) -> list[Path]:
+    """Return all dockerfiles in a single pass over the dockerfiles tree.
+
+    Args:
+        directory: base level directory containing the dockerfiles.
+
+    Returns:
+        paths relative to directory, like dockerfiles/15.1/linux/Dockerfile.
+    """
+    dockerfiles = []
+    root = Path(directory) / DOCKERFILES_DIRECTORY
+    for version_entry in _scandir_directories(root):
+        for os_entry in _scandir_directories(version_entry.path):
+            with os.scandir(os_entry.path) as entries:
+                if not any(
+                    entry.name == "Dockerfile" and entry.is_file()
+                    for entry in entries
+                ):
+                    continue
+            dockerfiles.append(
+                Path(
+                    DOCKERFILES_DIRECTORY,
+                    version_entry.name,
+                    os_entry.name,
+                    "Dockerfile",
+                )
+            )
+    return dockerfiles
+
+
+def _scandir_directories(path: str | Path) -> list[os.DirEntry]:
+    """Return all directory entries in path, or nothing if it is missing."""
+    try:
+        with os.scandir(path) as entries:
+            return [entry for entry in entries if entry.is_dir()]
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,193 @@
+"""Sorted index of the releases in the release feed.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.datamodel.version import NukeVersion
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from nukedockerbuild.datamodel.constants import OperatingSystem
+
+
+@dataclass(frozen=True)
+class Release:
+    """Single release in the feed with its installers."""
+
+    version: NukeVersion
+    installers: dict[str, str | None] = field(
+        default_factory=dict, compare=False, hash=False
+    )
+    """Installer URL by name, like linux_x86_64."""
+
+    def installer(self, operating_system: OperatingSystem) -> str | None:
+        """Return the installer URL for the operating system, if any."""
+        return self.installers.get(operating_system.mapped_name)
+
+
+@dataclass
+class ReleaseIndex:
+    """Releases sorted by version, queried with bisection."""
+
+    releases: list[Release] = field(default_factory=list)
+    """Releases sorted by version."""
+    _versions: list[NukeVersion] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Sort the releases and index their versions."""
+        self.releases = sorted(
+            self.releases, key=lambda release: release.version
+        )
+        self._versions = [release.version for release in self.releases]
+
+    @classmethod
+    def from_releases(cls, releases: Iterable[Release]) -> ReleaseIndex:
+        """Build the index from releases in any order, like a parsed stream.
+
+        Args:
+            releases: the releases to index, consumed once.
+
+        Returns:
+            index of the releases.
+        """
+        index = cls()
+        index.releases = sorted(
+            releases, key=lambda release: release.version
+        )
+        index._versions = [release.version for release in index.releases]
+        return index
+
+    @classmethod
+    def from_feed(cls, data: dict) -> ReleaseIndex:
+        """Build the index from the release feed.
+
+        Args:
+            data: releases by version, grouped by major version.
+
+        Raises:
+            ValueError: if the feed contains an invalid version.
+
+        Returns:
+            index of all releases in the feed.
+        """
+        return cls(
+            [
+                Release(
+                    NukeVersion.from_string(version),
+                    release_data.get("installer") or {},
+                )
+                for major_releases in data.values()
+                for version, release_data in major_releases.items()
+            ]
+        )
+
+    def __len__(self) -> int:
+        """Return the amount of releases."""
+        return len(self.releases)
+
+    def __iter__(self) -> Iterator[Release]:
+        """Iterate over the releases from oldest to newest."""
+        return iter(self.releases)
+
+    def between(
+        self,
+        start: NukeVersion | None = None,
+        end: NukeVersion | None = None,
+    ) -> list[Release]:
+        """Return releases from start up to, but not including, end.
+
+        Args:
+            start: first version to include, or from the oldest release.
+            end: first version to exclude, or up to the newest release.
+
+        Returns:
+            matching releases sorted by version.
+        """
+        start_index = bisect_left(self._versions, start) if start else 0
+        end_index = (
+            bisect_left(self._versions, end) if end else len(self._versions)
+        )
+        return self.releases[start_index:end_index]
+
+    def since(self, version: NukeVersion) -> list[Release]:
+        """Return all releases from version onwards."""
+        return self.between(version)
+
+    def matching(self, version: str) -> list[Release]:
+        """Return releases matching a version like 15, 15.1 or 15.1v7."""
+        return self.between(*NukeVersion.range_from_string(version))
+
+    def select(
+        self,
+        versions: Iterable[str] | None = None,
+        since: NukeVersion | None = None,
+    ) -> list[Release]:
+        """Return releases matching any of the versions, from since.
+
+        Args:
+            versions: versions like 15, 15.1 or 15.1v7, or all releases.
+            since: first version to include, if any.
+
+        Returns:
+            matching releases sorted by version.
+        """
+        releases = self.since(since) if since else self.releases
+        if versions is None:
+            return list(releases)
+        selected = {
+            release.version: release
+            for version in versions
+            for release in self.matching(version)
+        }
+        return [
+            release for release in releases if release.version in selected
+        ]
+
+    def latest_per_minor(
+        self, releases: list[Release] | None = None
+    ) -> list[Release]:
+        """Return the newest patch release of every minor version.
+
+        Args:
+            releases: sorted releases to pick from, defaults to all.
+
+        Returns:
+            newest release per minor version, sorted by version.
+        """
+        latest: list[Release] = []
+        for release in self.releases if releases is None else releases:
+            if latest and (
+                latest[-1].version.major,
+                latest[-1].version.minor,
+            ) == (release.version.major, release.version.minor):
+                latest[-1] = release
+            else:
+                latest.append(release)
+        return latest
+
+    def for_operating_system(
+        self,
+        operating_system: OperatingSystem,
+        releases: list[Release] | None = None,
+    ) -> list[Release]:
+        """Return releases that have an installer for the system.
+
+        Args:
+            operating_system: the operating system to filter on.
+            releases: releases to filter, defaults to all.
+
+        Returns:
+            releases with an installer, in the same order.
+        """
+        return [
+            release
+            for release in (self.releases if releases is None else releases)
+            if release.installer(operating_system)
+        ]
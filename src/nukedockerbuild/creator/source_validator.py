@@ -0,0 +1,185 @@
+"""Validation of the installer URLs before dockerfiles are written.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import TYPE_CHECKING
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from nukedockerbuild.tracing import span
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from nukedockerbuild.datamodel.docker_data import Dockerfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 16
+"""Amount of URLs that are validated at the same time."""
+
+_HEAD_NOT_SUPPORTED = (403, 405, 501)
+"""Statuses of servers that refuse HEAD, like presigned S3 URLs."""
+
+
+@dataclass
+class SourceStatus:
+    """Result of validating a single installer URL."""
+
+    url: str
+    status: int | None = None
+    """Final HTTP status, or None if no response was received."""
+    content_length: int | None = None
+    """Size of the installer in bytes, if announced."""
+    etag: str | None = None
+    error: str | None = None
+    """Reason the URL is broken, if it is."""
+
+    @property
+    def ok(self) -> bool:
+        """Return if the installer can be downloaded."""
+        return self.error is None
+
+    def to_dict(self) -> dict:
+        """Return the status as a JSON serializable dict."""
+        return {
+            "url": self.url,
+            "status": self.status,
+            "content_length": self.content_length,
+            "etag": self.etag,
+            "error": self.error,
+        }
+
+
+@dataclass
+class SourceValidator:
+    """Check that installer URLs respond, with pooled concurrent requests.
+
+    Every URL is asked with a HEAD request. Servers that refuse HEAD are
+    asked for the first byte with a Range request instead, so the
+    installer itself is never downloaded.
+    """
+
+    concurrency: int = DEFAULT_CONCURRENCY
+    timeout: float = 10.0
+    """Timeout for connecting and reading in seconds, per request."""
+    _session: requests.Session = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        """Create the pooled session shared by all requests."""
+        if self.concurrency < 1:
+            msg = "Validating sources needs a concurrency of at least 1."
+            raise ValueError(msg)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.concurrency, pool_maxsize=self.concurrency
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def validate(self, urls: Iterable[str]) -> dict[str, SourceStatus]:
+        """Validate every unique URL concurrently.
+
+        Args:
+            urls: the installer URLs to validate.
+
+        Returns:
+            the status per URL.
+        """
+        unique_urls = list(dict.fromkeys(urls))
+        with (
+            span("validate") as validate_span,
+            ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="validate"
+            ) as executor,
+        ):
+            statuses = list(executor.map(self._check, unique_urls))
+            validate_span.add(item_count=len(statuses))
+        broken = sum(not status.ok for status in statuses)
+        msg = f"Validated {len(statuses)} sources, {broken} broken."
+        logger.info(msg)
+        return {status.url: status for status in statuses}
+
+    def _check(self, url: str) -> SourceStatus:
+        """Return the status of a single URL."""
+        try:
+            response = self._session.head(
+                url, allow_redirects=True, timeout=self.timeout
+            )
+            if response.status_code in _HEAD_NOT_SUPPORTED:
+                with self._session.get(
+                    url,
+                    headers={"Range": "bytes=0-0"},
+                    stream=True,
+                    timeout=self.timeout,
+                ) as response:
+                    return _to_status(url, response)
+            return _to_status(url, response)
+        except requests.RequestException as exception:
+            return SourceStatus(url, error=str(exception))
+
+
+def _to_status(url: str, response: requests.Response) -> SourceStatus:
+    """Return the status of URL from its response."""
+    status = SourceStatus(
+        url,
+        status=response.status_code,
+        etag=response.headers.get("ETag"),
+    )
+    content_range = response.headers.get("Content-Range", "")
+    length = (
+        content_range.rpartition("/")[2]
+        if response.status_code == HTTPStatus.PARTIAL_CONTENT
+        else response.headers.get("Content-Length")
+    )
+    if length and length.isdigit():
+        status.content_length = int(length)
+    if response.status_code not in (HTTPStatus.OK, HTTPStatus.PARTIAL_CONTENT):
+        status.error = f"Returned {response.status_code}."
+    elif not status.content_length:
+        status.error = "Returned an empty installer."
+    return status
+
+
+def validate_sources(
+    dockerfiles: list[Dockerfile],
+    validator: SourceValidator,
+    *,
+    drop: bool = True,
+) -> tuple[list[Dockerfile], dict[str, SourceStatus]]:
+    """Validate the installers of the dockerfiles before they are written.
+
+    Args:
+        dockerfiles: the dockerfiles to validate the sources of.
+        validator: validator to check the URLs with.
+        drop: leave out dockerfiles with a broken source, otherwise only
+            log them as warning.
+
+    Returns:
+        the dockerfiles to write and the status per URL.
+    """
+    statuses = validator.validate(
+        dockerfile.nuke_source for dockerfile in dockerfiles
+    )
+    valid_dockerfiles = []
+    for dockerfile in dockerfiles:
+        status = statuses[dockerfile.nuke_source]
+        if not status.ok:
+            action = "Dropping" if drop else "Keeping"
+            msg = (
+                f"{action} {dockerfile.tag}, source '{status.url}' is "
+                f"broken: {status.error}"
+            )
+            logger.warning(msg)
+            if drop:
+                continue
+        valid_dockerfiles.append(dockerfile)
+    return valid_dockerfiles, statuses
@@ -24,11 +24,37 @@ class DockerCommand:
     """Minimum version it needs to run this command."""
     maximum_version: float | None = None
     """Maximum version that is allowed to run this command."""
-
-    def to_docker_format(self) -> str:
-        """Return the object as a string in the docker RUN format."""
-        commands_formatted = " \\\n  && ".join(self.commands)
-        return f"RUN {commands_formatted}"
+    cache_mounts: list[str] = field(default_factory=list)
+    """Directories to mount as BuildKit cache when cache mounts are used."""
+    cached_commands: list[str] | None = None
+    """Commands to run instead when cache mounts are used.
+
+    Cleaning the mounted directories would empty the cache, so these
+    leave out the cleanup and keep downloaded packages instead.
+    """
+
+    @property
+    def is_version_independent(self) -> bool:
+        """Return if the command runs for every Nuke version."""
+        return self.minimum_version is None and self.maximum_version is None
+
+    def to_docker_format(self, *, use_cache_mounts: bool = False) -> str:
+        """Return the object as a string in the docker RUN format.
+
+        Args:
+            use_cache_mounts: mount the cache directories with BuildKit.
+        """
+        if not use_cache_mounts or not self.cache_mounts:
+            commands_formatted = " \\\n  && ".join(self.commands)
+            return f"RUN {commands_formatted}"
+        mounts = " ".join(
+            f"--mount=type=cache,target={target},sharing=locked"
+            for target in self.cache_mounts
+        )
+        commands_formatted = " \\\n  && ".join(
+            self.cached_commands or self.commands
+        )
+        return f"RUN {mounts} \\\n  {commands_formatted}"
 
 
 @dataclass
@@ -57,7 +83,15 @@ IMAGE_COMMANDS: dict[UpstreamImage, list[DockerCommand]] = {
                 "ln -s /opt/rh/gcc-toolset-{toolset}/root/bin/g++ /usr/bin/g++",
                 "dnf clean all",
                 "rm -rf /var/cache/dnf",
-            ]
+            ],
+            cache_mounts=["/var/cache/dnf"],
+            cached_commands=[
+                "dnf install --setopt=keepcache=1 gcc-toolset-{toolset}-gcc gcc-toolset-{toolset}-gcc-c++ -y",
+                "dnf install --setopt=keepcache=1 cmake3 git -y",
+                "dnf install --setopt=keepcache=1 mesa-libGLU-devel -y",
+                "ln -s /opt/rh/gcc-toolset-{toolset}/root/bin/gcc /usr/bin/gcc",
+                "ln -s /opt/rh/gcc-toolset-{toolset}/root/bin/g++ /usr/bin/g++",
+            ],
         ),
     ],
     UpstreamImage.MANYLINUX_2014: [
@@ -66,12 +100,34 @@ IMAGE_COMMANDS: dict[UpstreamImage, list[DockerCommand]] = {
                 "yum install mesa-libGLU-devel -y",
                 "yum clean all",
                 "rm -rf /var/cache/yum",
-            ]
+            ],
+            cache_mounts=["/var/cache/yum"],
+            cached_commands=[
+                "yum install --setopt=keepcache=1 mesa-libGLU-devel -y",
+            ],
         ),
     ],
 }
 """Commands related to each image."""
 
+_MSVC_INSTALL_COMMANDS: list[str] = [
+    "./install.sh /opt/msvc",
+    "mv ./msvcenv-native.sh /opt/msvc",
+    "cd ../ && rm -rf ./msvc-wine",
+    "bash -c 'export BIN=/opt/msvc/bin/x64/",
+    ". /opt/msvc/msvcenv-native.sh",
+    'MSVCDIR=$(. "${{BIN}}msvcenv.sh" && echo $MSVCDIR)',
+    r"MSVCDIR=${{MSVCDIR//\\\\//}}",
+    r"MSVCDIR=${{MSVCDIR#z:}}",
+    'echo "export BIN=${{BIN}}" >> /etc/bashrc',
+    'echo "export MSVCDIR=$MSVCDIR" >> /etc/bashrc',
+    'echo "export CC=${{BIN}}cl" >> /etc/basbashrc',
+    'echo "export CXX=${{BIN}}cl" >> /etc/bashrc',
+    'echo "export RC=${{BIN}}rc" >> /etc/bashrc',
+    'echo "source /opt/msvc/msvcenv-native.sh" >> /etc/bashrc\'',
+]
+"""Commands that install msvc-wine after the Visual Studio download."""
+
 OS_COMMANDS: dict[OperatingSystem, list[DockerCommand]] = {
     OperatingSystem.LINUX: [],
     OperatingSystem.WINDOWS: [
@@ -85,7 +141,21 @@ OS_COMMANDS: dict[OperatingSystem, list[DockerCommand]] = {
                 "chmod +x cmake-3.29.3-linux-x86_64.sh",
                 "./cmake-3.29.3-linux-x86_64.sh --prefix=/usr/local --skip-license",
                 "rm cmake-3.29.3-linux-x86_64.sh",
-            ]
+            ],
+            cache_mounts=[
+                "/var/cache/apt",
+                "/var/lib/apt/lists",
+                "/var/cache/cmake",
+            ],
+            cached_commands=[
+                "rm -f /etc/apt/apt.conf.d/docker-clean",
+                "apt-get update",
+                "apt-get install wine64 python3 msitools ca-certificates git curl ninja-build winbind -y ",
+                # Grouped, so the || does not skip over a failing command
+                # earlier in the RUN chain. Braces are doubled for format.
+                "{{ test -f /var/cache/cmake/cmake-3.29.3-linux-x86_64.sh || {{ curl -fL -o /var/cache/cmake/cmake.part https://github.com/Kitware/CMake/releases/download/v3.29.3/cmake-3.29.3-linux-x86_64.sh && mv /var/cache/cmake/cmake.part /var/cache/cmake/cmake-3.29.3-linux-x86_64.sh; }}; }}",
+                "sh /var/cache/cmake/cmake-3.29.3-linux-x86_64.sh --prefix=/usr/local --skip-license",
+            ],
         ),
         DockerCommand(
             [
@@ -101,21 +171,17 @@ OS_COMMANDS: dict[OperatingSystem, list[DockerCommand]] = {
                 "cd msvc-wine",
                 "git checkout 44dc13b5e62ecc2373fbe7e4727a525001f403f4",
                 "PYTHONUNBUFFERED=1 ./vsdownload.py --major {toolset} --accept-license --dest /opt/msvc",
-                "./install.sh /opt/msvc",
-                "mv ./msvcenv-native.sh /opt/msvc",
-                "cd ../ && rm -rf ./msvc-wine",
-                "bash -c 'export BIN=/opt/msvc/bin/x64/",
-                ". /opt/msvc/msvcenv-native.sh",
-                'MSVCDIR=$(. "${{BIN}}msvcenv.sh" && echo $MSVCDIR)',
-                r"MSVCDIR=${{MSVCDIR//\\\\//}}",
-                r"MSVCDIR=${{MSVCDIR#z:}}",
-                'echo "export BIN=${{BIN}}" >> /etc/bashrc',
-                'echo "export MSVCDIR=$MSVCDIR" >> /etc/bashrc',
-                'echo "export CC=${{BIN}}cl" >> /etc/basbashrc',
-                'echo "export CXX=${{BIN}}cl" >> /etc/bashrc',
-                'echo "export RC=${{BIN}}rc" >> /etc/bashrc',
-                'echo "source /opt/msvc/msvcenv-native.sh" >> /etc/bashrc\'',
-            ]
+                *_MSVC_INSTALL_COMMANDS,
+            ],
+            cache_mounts=["/var/cache/vsdownload"],
+            cached_commands=[
+                "cd ~/",
+                "git clone https://github.com/mstorsjo/msvc-wine.git",
+                "cd msvc-wine",
+                "git checkout 44dc13b5e62ecc2373fbe7e4727a525001f403f4",
+                "PYTHONUNBUFFERED=1 ./vsdownload.py --major {toolset} --accept-license --cache /var/cache/vsdownload --dest /opt/msvc",
+                *_MSVC_INSTALL_COMMANDS,
+            ],
         ),
     ],
 }
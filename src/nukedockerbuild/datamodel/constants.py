@@ -47,6 +47,11 @@ class OperatingSystem(str, Enum):
             return cls.WINDOWS
         return cls.LINUX
 
+    @property
+    def mapped_name(self) -> str:
+        """Return name of the installer in the version parser data."""
+        return f"{self.value}_x86_64"
+
 
 class UpstreamImage(str, Enum):
     """Enumeration for possible upstream images."""
@@ -55,6 +60,12 @@ class UpstreamImage(str, Enum):
     MANYLINUX_2014: str = "quay.io/pypa/manylinux2014_x86_64"
     DEBIAN_BOOKWORM: str = "docker.io/debian:bookworm"
 
+    @property
+    def short_name(self) -> str:
+        """Return image name without registry, like rockylinux8."""
+        name = self.value.rsplit("/", 1)[-1]
+        return name.removesuffix("_x86_64").replace(":", "")
+
 
 JSON_DATA_SOURCE = (
     "https://codeberg.org/gillesvink/NukeVersionParser/"
@@ -74,6 +85,17 @@ DEVTOOLSETS = {
 }
 """Matched devtoolset to Nuke major version."""
 
+CPP_VERSIONS = {
+    16: 17,
+    15: 17,
+    14: 17,
+    13: 14,
+    12: 14,
+    11: 11,
+    10: 11,
+}
+"""Matched C++ standard to Nuke major version."""
+
 VISUALSTUDIO_BUILDTOOLS = {
     16: "17",
     15: "17",
@@ -84,6 +106,12 @@ VISUALSTUDIO_BUILDTOOLS = {
 """Matched Visual Studio build toolset to Nuke major version."""
 
 
+IMAGE_REPOSITORY: str = "nukedockerbuild"
+"""Repository of the Nuke images."""
+
+BASE_IMAGE_REPOSITORY: str = "nukedockerbuild-base"
+"""Repository of the shared toolchain images the Nuke images start from."""
+
 NUKE_INSTALL_DIRECTORY: str = "/usr/local/nuke_install"
 """Install directory for Nuke."""
 
@@ -5,12 +5,11 @@
 
 from __future__ import annotations
 
-import os
-from copy import copy
-from dataclasses import dataclass
-from datetime import datetime
+from dataclasses import dataclass, field
+from datetime import date
 from itertools import chain
 from math import floor
+from pathlib import PurePosixPath
 
 from nukedockerbuild.datamodel.commands import (
     IMAGE_COMMANDS,
@@ -20,12 +19,141 @@ from nukedockerbuild.datamodel.commands import (
     DockerEnvironments,
 )
 from nukedockerbuild.datamodel.constants import (
+    BASE_IMAGE_REPOSITORY,
+    CPP_VERSIONS,
     DEVTOOLSETS,
+    IMAGE_REPOSITORY,
     NUKE_INSTALL_DIRECTORY,
     VISUALSTUDIO_BUILDTOOLS,
     OperatingSystem,
     UpstreamImage,
 )
+from nukedockerbuild.datamodel.render_plan import RenderField, RenderPlan
+
+_RENDER_PLANS: dict[tuple, RenderPlan] = {}
+"""Compiled render plans by the inputs that do not differ per version."""
+
+
+def clear_render_plans() -> None:
+    """Remove all compiled render plans, so they are compiled again."""
+    _RENDER_PLANS.clear()
+
+
+def _general_labels(
+    created: str | RenderField | None = None,
+) -> dict[str, str | float | RenderField]:
+    """Return labels that are shared by every image.
+
+    Args:
+        created: creation date, defaults to today.
+    """
+    label_prefix = "org.opencontainers"
+    return {
+        f"{label_prefix}.version": 1.0,
+        f"{label_prefix}.image.created": created or date.today().isoformat(),
+        f"{label_prefix}.image.description": "Ready to use image for building Nuke plugins.",
+        f"{label_prefix}.license": "MIT",
+        f"{label_prefix}.url": "https://codeberg.org/gillesvink/NukeDockerBuild",
+    }
+
+
+def _format_labels(labels: dict[str, str | float | RenderField]) -> str:
+    """Return labels in the docker LABEL format."""
+    return "\n".join(
+        [
+            f"LABEL '{key}'='{value}'"
+            if isinstance(value, str)
+            else f"LABEL '{key}'={value}"
+            for key, value in labels.items()
+        ]
+    )
+
+
+BUILDKIT_SYNTAX = "# syntax=docker/dockerfile:1"
+"""Parser directive needed for BuildKit features like cache mounts."""
+
+
+def _format_commands(
+    commands: list[DockerCommand], *, use_cache_mounts: bool, **values: str
+) -> str:
+    """Return commands in the docker RUN format with values filled in."""
+    formatted_commands = "\n\n".join(
+        [
+            command.to_docker_format(use_cache_mounts=use_cache_mounts)
+            for command in commands
+        ]
+    )
+    return formatted_commands.format(**values)
+
+
+@dataclass(frozen=True)
+class BaseDockerfile:
+    """Dataclass to store a toolchain image shared by many Nuke versions."""
+
+    operating_system: OperatingSystem
+    upstream_image: UpstreamImage
+    toolset: str
+    use_cache_mounts: bool = field(default=False, kw_only=True)
+    """Mount package manager and download caches with BuildKit."""
+
+    @property
+    def name(self) -> str:
+        """Return name of the base image, for example rockylinux8-gcc11.
+
+        Windows images only differ by their Visual Studio toolset, so
+        these are named after it, for example msvc-17.
+        """
+        if self.operating_system == OperatingSystem.WINDOWS:
+            return f"msvc-{self.toolset}"
+        if not self.toolset:
+            return self.upstream_image.short_name
+        return f"{self.upstream_image.short_name}-gcc{self.toolset}"
+
+    @property
+    def tag(self) -> str:
+        """Return the tag that the base image is built as."""
+        return f"{BASE_IMAGE_REPOSITORY}:{self.name}"
+
+    @property
+    def labels(self) -> str:
+        """Return image labels as a string."""
+        labels = _general_labels()
+        label_prefix = "com.nukedockerbuild"
+        labels.update(
+            {
+                f"{label_prefix}.based_on": self.upstream_image.value,
+                f"{label_prefix}.operating_system": self.operating_system.value,
+                f"{label_prefix}.toolset": self.toolset,
+            }
+        )
+        return _format_labels(labels)
+
+    @property
+    def run_commands(self) -> str:
+        """Return all commands that do not depend on the Nuke version."""
+        commands = [
+            command
+            for command in chain(
+                IMAGE_COMMANDS.get(self.upstream_image, []),
+                OS_COMMANDS.get(self.operating_system, []),
+            )
+            if command.is_version_independent
+        ]
+        return _format_commands(
+            commands,
+            use_cache_mounts=self.use_cache_mounts,
+            toolset=self.toolset,
+        )
+
+    def to_dockerfile(self) -> str:
+        """Convert current instance to a dockerfile string."""
+        sections = [
+            BUILDKIT_SYNTAX if self.use_cache_mounts else "",
+            f"FROM {self.upstream_image.value}",
+            self.labels,
+            self.run_commands,
+        ]
+        return "\n\n".join(section for section in sections if section)
 
 
 @dataclass
@@ -35,6 +163,20 @@ class Dockerfile:
     operating_system: OperatingSystem
     nuke_version: float
     nuke_source: str
+    use_base_image: bool = field(default=False, kw_only=True)
+    """Start from the shared toolchain image instead of the upstream image."""
+    use_cache_mounts: bool = field(default=False, kw_only=True)
+    """Mount package manager and download caches with BuildKit."""
+    use_shared_sources: bool = field(default=False, kw_only=True)
+    """Copy the Nuke files shared by the major in a layer of their own."""
+
+    @property
+    def tag(self) -> str:
+        """Return the tag that the image is built as."""
+        return (
+            f"{IMAGE_REPOSITORY}:{self.nuke_version}-"
+            f"{self.operating_system.value}"
+        )
 
     @property
     def work_dir(self) -> str:
@@ -43,65 +185,46 @@ class Dockerfile:
 
     @property
     def run_commands(self) -> str:
-        """Return all run commands as a string."""
-        commands = list(
-            chain(
-                IMAGE_COMMANDS.get(self.upstream_image, []),
-                OS_COMMANDS.get(self.operating_system, []),
-            )
-        )
-        self._remove_invalid_commands_for_version(commands)
-
-        formatted_commands = "\n\n".join(
-            [command.to_docker_format() for command in commands]
-        )
+        """Return all run commands as a string.
 
-        return formatted_commands.format(
-            toolset=self._get_toolset(),
-            filename=os.path.splitext(os.path.basename(self.nuke_source))[0],
+        If a base image is used, commands that are already part of the
+        base image are left out.
+        """
+        return self._format_run_commands(
+            self._version_commands(),
+            filename=self._filename,
             url=self.nuke_source,
         )
 
     @property
     def labels(self) -> str:
         """Return image labels as a string."""
-        label_prefix = "org.opencontainers"
-        labels = {
-            f"{label_prefix}.version": 1.0,
-            f"{label_prefix}.image.created": datetime.now().strftime("%Y-%m-%d"),
-            f"{label_prefix}.image.description": "Ready to use image for building Nuke plugins.",
-            f"{label_prefix}.license": "MIT",
-            f"{label_prefix}.url": "https://codeberg.org/gillesvink/NukeDockerBuild",
-        }
-        label_prefix = "com.nukedockerbuild"
-        additional_labels = {
-            f"{label_prefix}.based_on": self.upstream_image.value,
-            f"{label_prefix}.operating_system": self.operating_system.value,
-            f"{label_prefix}.nuke_version": self.nuke_version,
-            f"{label_prefix}.nuke_source": self.nuke_source,
-        }
-        labels.update(additional_labels)
-        return "\n".join(
-            [
-                f"LABEL '{key}'='{value}'"
-                if isinstance(value, str)
-                else f"LABEL '{key}'={value}"
-                for key, value in labels.items()
-            ]
-        )
+        return self._format_labels(self.nuke_version, self.nuke_source)
 
     @property
     def args(self) -> str:
         """Return all arguments necessary."""
         all_args = ["NUKE_SOURCE_FILES"]
+        if self._has_shared_sources:
+            all_args.append("NUKE_SHARED_SOURCE_FILES")
         if self.operating_system == OperatingSystem.WINDOWS:
             all_args.append("TOOLCHAIN")
         return "\n".join(f"ARG {argument}" for argument in all_args)
 
     @property
     def copy(self) -> str:
-        """Additional copy statements to include."""
+        """Additional copy statements to include.
+
+        With shared sources, the files that all minor versions of the major
+        have in common are copied first, so their layer is identical for
+        every minor. The Nuke sources then only contain the delta.
+        """
         nuke_sources = f"COPY $NUKE_SOURCE_FILES {NUKE_INSTALL_DIRECTORY}"
+        if self._has_shared_sources:
+            nuke_sources = (
+                f"COPY $NUKE_SHARED_SOURCE_FILES {NUKE_INSTALL_DIRECTORY}\n"
+                f"{nuke_sources}"
+            )
         if self.operating_system == OperatingSystem.WINDOWS:
             return f"{nuke_sources}\nCOPY $TOOLCHAIN /nukedockerbuild/"
         return f"{nuke_sources}"
@@ -109,27 +232,11 @@ class Dockerfile:
     @property
     def environments(self) -> str:
         """Return all environments as a string."""
-        os_environments: DockerEnvironments = OS_ENVIRONMENTS[self.operating_system]
-        general_environments = DockerEnvironments({"NUKE_VERSION": self.nuke_version})
-
-        return "\n".join(
-            environments.to_docker_format().format(cpp_version=self.cpp_version)
-            for environments in [os_environments, general_environments]
-        )
+        return self._format_environments(self.nuke_version)
 
     @property
     def cpp_version(self) -> int:
-        matched_cpp_version = {
-            16: 17,
-            15: 17,
-            14: 17,
-            13: 14,
-            12: 14,
-            11: 11,
-            10: 11,
-        }
-
-        return matched_cpp_version[int(self.nuke_version)]
+        return CPP_VERSIONS[int(self.nuke_version)]
 
     @property
     def upstream_image(self) -> UpstreamImage:
@@ -140,16 +247,165 @@ class Dockerfile:
             return UpstreamImage.MANYLINUX_2014
         return UpstreamImage.ROCKYLINUX_8
 
+    @property
+    def base_dockerfile(self) -> BaseDockerfile | None:
+        """Return the shared toolchain image, if one is used."""
+        if not self.use_base_image:
+            return None
+        return BaseDockerfile(
+            operating_system=self.operating_system,
+            upstream_image=self.upstream_image,
+            toolset=self._get_toolset(),
+            use_cache_mounts=self.use_cache_mounts,
+        )
+
     def to_dockerfile(self) -> str:
-        """Convert current instance to a dockerfile string."""
+        """Convert current instance to a dockerfile string.
+
+        Everything that does not depend on the exact version or source is
+        compiled once into a render plan, shared by all dockerfiles with
+        the same system, image, toolset and commands. Rendering only
+        fills in the version specific values.
+        """
+        plan = self.render_plan()
+        values = {
+            "created": date.today().isoformat(),
+            "nuke_version": str(self.nuke_version),
+            "nuke_source": self.nuke_source,
+        }
+        if "filename" in plan.fields:
+            values["filename"] = self._filename
+        if "url" in plan.fields:
+            values["url"] = self.nuke_source
+        return plan.render(values)
+
+    def render_plan(self) -> RenderPlan:
+        """Return the compiled render plan for this dockerfile.
+
+        Returns:
+            plan shared by all dockerfiles with the same static content.
+        """
+        commands = tuple(self._version_commands())
+        key = (
+            self.operating_system,
+            self.upstream_image,
+            self._get_toolset(),
+            self.cpp_version,
+            self.use_base_image,
+            self.use_cache_mounts,
+            self.use_shared_sources,
+            tuple(id(command) for command in commands),
+        )
+        plan = _RENDER_PLANS.get(key)
+        if plan is None:
+            plan = RenderPlan.compile(
+                self._render_template(commands), commands
+            )
+            _RENDER_PLANS[key] = plan
+        return plan
+
+    def _render_template(self, commands: tuple[DockerCommand, ...]) -> str:
+        """Return the dockerfile with fields for version specific values."""
+        nuke_version = RenderField("nuke_version")
+        base_dockerfile = self.base_dockerfile
+        from_image = (
+            base_dockerfile.tag
+            if base_dockerfile
+            else self.upstream_image.value
+        )
+        sections = [
+            BUILDKIT_SYNTAX if self.use_cache_mounts else "",
+            f"FROM {from_image}",
+            self._format_labels(
+                nuke_version,
+                str(RenderField("nuke_source")),
+                created=str(RenderField("created")),
+            ),
+            self.args,
+            self.copy,
+            self._format_run_commands(
+                list(commands),
+                filename=str(RenderField("filename")),
+                url=str(RenderField("url")),
+            ),
+            self.work_dir,
+            self._format_environments(nuke_version),
+        ]
+        return "\n\n".join(section for section in sections if section)
+
+    @property
+    def _has_shared_sources(self) -> bool:
+        """Return if shared sources are copied, only prepared for Linux."""
         return (
-            f"FROM {self.upstream_image.value}\n\n"
-            f"{self.labels}\n\n"
-            f"{self.args}\n\n"
-            f"{self.copy}\n\n"
-            f"{self.run_commands}\n\n"
-            f"{self.work_dir}\n\n"
-            f"{self.environments}"
+            self.use_shared_sources
+            and self.operating_system == OperatingSystem.LINUX
+        )
+
+    @property
+    def _filename(self) -> str:
+        """Return the filename of the Nuke source without extension."""
+        return PurePosixPath(self.nuke_source).stem
+
+    def _version_commands(self) -> list[DockerCommand]:
+        """Return all commands that apply to the Nuke version."""
+        commands = list(
+            chain(
+                IMAGE_COMMANDS.get(self.upstream_image, []),
+                OS_COMMANDS.get(self.operating_system, []),
+            )
+        )
+        self._remove_invalid_commands_for_version(commands)
+        return commands
+
+    def _format_run_commands(
+        self, commands: list[DockerCommand], *, filename: str, url: str
+    ) -> str:
+        """Return commands in the RUN format, without the base commands."""
+        if self.use_base_image:
+            commands = [
+                command
+                for command in commands
+                if not command.is_version_independent
+            ]
+        return _format_commands(
+            commands,
+            use_cache_mounts=self.use_cache_mounts,
+            toolset=self._get_toolset(),
+            filename=filename,
+            url=url,
+        )
+
+    def _format_labels(
+        self,
+        nuke_version: float | RenderField,
+        nuke_source: str,
+        created: str | None = None,
+    ) -> str:
+        """Return image labels for the provided values."""
+        labels = _general_labels(created)
+        label_prefix = "com.nukedockerbuild"
+        additional_labels = {
+            f"{label_prefix}.based_on": self.upstream_image.value,
+            f"{label_prefix}.operating_system": self.operating_system.value,
+            f"{label_prefix}.nuke_version": nuke_version,
+            f"{label_prefix}.nuke_source": nuke_source,
+        }
+        labels.update(additional_labels)
+        return _format_labels(labels)
+
+    def _format_environments(self, nuke_version: float | RenderField) -> str:
+        """Return all environments for the provided Nuke version."""
+        os_environments: DockerEnvironments = OS_ENVIRONMENTS[
+            self.operating_system
+        ]
+        general_environments = DockerEnvironments(
+            {"NUKE_VERSION": nuke_version}
+        )
+        return "\n".join(
+            environments.to_docker_format().format(
+                cpp_version=self.cpp_version
+            )
+            for environments in [os_environments, general_environments]
         )
 
     def _get_toolset(self) -> str:
@@ -168,14 +424,15 @@ class Dockerfile:
         Args:
             commands: commands to check for Nuke version requirements
         """
-        for command in copy(commands):
+        commands[:] = [
+            command
+            for command in commands
             if (
-                command.maximum_version is not None
-                and command.maximum_version < self.nuke_version
-            ):
-                commands.remove(command)
-            if (
-                command.minimum_version is not None
-                and command.minimum_version > self.nuke_version
-            ):
-                commands.remove(command)
+                command.maximum_version is None
+                or command.maximum_version >= self.nuke_version
+            )
+            and (
+                command.minimum_version is None
+                or command.minimum_version <= self.nuke_version
+            )
+        ]
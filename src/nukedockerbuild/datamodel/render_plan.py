@@ -0,0 +1,72 @@
+"""Precompiled dockerfile templates that only need version values filled in.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+FIELD_MARKER = "\x00"
+"""Character surrounding field names in a template, never in a dockerfile."""
+
+
+@dataclass(frozen=True)
+class RenderField:
+    """Placeholder for a value that differs per dockerfile.
+
+    Formatting the placeholder results in its marked name, so it can be
+    passed to the same formatting code as the real values. As it is not a
+    string, labels format it without quotes, like numeric values.
+    """
+
+    name: str
+
+    def __str__(self) -> str:
+        """Return the marked field name."""
+        return f"{FIELD_MARKER}{self.name}{FIELD_MARKER}"
+
+    def __format__(self, format_spec: str) -> str:
+        """Return the marked field name."""
+        return str(self)
+
+
+@dataclass(frozen=True)
+class RenderPlan:
+    """Dockerfile split in static text and the fields in between."""
+
+    parts: tuple[str, ...]
+    """Static text at even and field names at odd indices."""
+    fields: frozenset[str] = frozenset()
+    """Names of all fields in the plan."""
+    references: tuple[object, ...] = field(default=(), compare=False)
+    """Objects the plan is compiled from, kept alive while it is cached."""
+
+    @classmethod
+    def compile(
+        cls, template: str, references: tuple[object, ...] = ()
+    ) -> RenderPlan:
+        """Compile a template containing marked fields.
+
+        Args:
+            template: rendered dockerfile with fields in place of values.
+            references: objects the plan is compiled from.
+
+        Returns:
+            the compiled plan.
+        """
+        parts = tuple(template.split(FIELD_MARKER))
+        return cls(parts, frozenset(parts[1::2]), references)
+
+    def render(self, values: dict[str, str]) -> str:
+        """Return the dockerfile with the fields filled in.
+
+        Args:
+            values: value by field name.
+
+        Returns:
+            the rendered dockerfile.
+        """
+        parts = list(self.parts)
+        parts[1::2] = [values[name] for name in parts[1::2]]
+        return "".join(parts)
@@ -0,0 +1,77 @@
+"""Structured Nuke release versions.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, replace
+
+_RELEASE_REGEX = re.compile(r"^(\d+)\.(\d+)v(\d+)")
+_PREFIX_REGEX = re.compile(r"^(\d+)(?:\.(\d+))?$")
+
+
+@dataclass(frozen=True, order=True)
+class NukeVersion:
+    """Nuke release version, ordered by major, minor and patch release."""
+
+    major: int
+    minor: int = 0
+    patch: int = 0
+    """Patch release, the number after the v in 15.1v7."""
+
+    @classmethod
+    def from_string(cls, version: str) -> NukeVersion:
+        """Parse a release version like 15.1v7.
+
+        Args:
+            version: the version as used by Foundry.
+
+        Raises:
+            ValueError: if the version is not a valid release version.
+
+        Returns:
+            the parsed version.
+        """
+        match = _RELEASE_REGEX.match(version)
+        if not match:
+            msg = f"Provided data is not a valid version. '{version}'"
+            raise ValueError(msg)
+        return cls(*(int(group) for group in match.groups()))
+
+    @classmethod
+    def range_from_string(
+        cls, version: str
+    ) -> tuple[NukeVersion, NukeVersion]:
+        """Return the range of releases a version or version prefix matches.
+
+        Args:
+            version: like 15, 15.1 or 15.1v7.
+
+        Raises:
+            ValueError: if the version is not valid.
+
+        Returns:
+            inclusive start and exclusive end of the range.
+        """
+        match = _PREFIX_REGEX.match(version)
+        if not match:
+            release = cls.from_string(version)
+            return release, replace(release, patch=release.patch + 1)
+        major, minor = match.groups()
+        if minor is None:
+            return cls(int(major)), cls(int(major) + 1)
+        return cls(int(major), int(minor)), cls(int(major), int(minor) + 1)
+
+    @property
+    def minor_version(self) -> float:
+        """Return the minor version as float, like 15.1.
+
+        This is the version the dockerfiles tree and images are keyed on.
+        """
+        return float(f"{self.major}.{self.minor}")
+
+    def __str__(self) -> str:
+        """Return the version as used by Foundry, like 15.1v7."""
+        return f"{self.major}.{self.minor}v{self.patch}"
@@ -0,0 +1,54 @@
+"""Helpers to read and write files shared by the caches and stores.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import IO, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+"""Amount of bytes read, hashed or copied at once."""
+
+
+@contextmanager
+def open_atomic(path: Path, mode: str = "w") -> Iterator[IO]:
+    """Open a temporary file that is moved to path once it is complete.
+
+    The temporary file is hidden next to path, so the move is atomic and
+    readers never see a partially written file. It is removed instead if
+    writing fails.
+
+    Args:
+        path: path to write to.
+        mode: mode to open the temporary file with, "w" or "wb".
+
+    Yields:
+        the opened temporary file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        with temp_path.open(mode) as file:
+            yield file
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    temp_path.replace(path)
+
+
+def write_atomic(path: Path, content: str | bytes) -> None:
+    """Write content to a temporary file and move it to path.
+
+    Args:
+        path: path to write to.
+        content: text or bytes to write.
+    """
+    mode = "wb" if isinstance(content, bytes) else "w"
+    with open_atomic(path, mode) as file:
+        file.write(content)
@@ -3,31 +3,679 @@
 @maintainer: Gilles Vink
 """
 
+from __future__ import annotations
+
 import argparse
+import json
 import logging
 import sys
+from dataclasses import dataclass, field
 from pathlib import Path
 
+from nukedockerbuild.builder.build_cache import BuildCache
+from nukedockerbuild.builder.export import Codec, ImageExporter
+from nukedockerbuild.builder.image_size import (
+    DEFAULT_DEPTH,
+    DEFAULT_LIMIT,
+    DEFAULT_TOLERANCE,
+    analyze_image,
+    find_regressions,
+)
+from nukedockerbuild.builder.layer_store import (
+    LAYER_STORE_DIRECTORY,
+    LayerStore,
+)
+from nukedockerbuild.builder.runner import ScriptRunner
+from nukedockerbuild.builder.scheduler import BuildScheduler, BuildSummary
+from nukedockerbuild.builder.targets import find_build_targets
 from nukedockerbuild.creator.collector import (
-    fetch_json_data,
-    get_dockerfiles,
+    DockerfileOptions,
+    fetch_release_index,
+    iter_dockerfiles,
+)
+from nukedockerbuild.creator.create_dockerfiles import (
+    generation_fingerprint,
+    plan_dockerfiles,
+    write_dockerfiles,
+)
+from nukedockerbuild.creator.feed_cache import FeedCache
+from nukedockerbuild.creator.feed_fetcher import (
+    DEFAULT_HEDGE_DELAY,
+    FeedFetcher,
+)
+from nukedockerbuild.creator.source_validator import (
+    DEFAULT_CONCURRENCY,
+    SourceValidator,
+    validate_sources,
+)
+from nukedockerbuild.datamodel.constants import (
+    JSON_DATA_SOURCE,
+    OperatingSystem,
+)
+from nukedockerbuild.datamodel.docker_data import Dockerfile
+from nukedockerbuild.datamodel.version import NukeVersion
+from nukedockerbuild.sources.downloader import (
+    INSTALLER_CACHE_DIRECTORY,
+    DownloadCache,
+)
+from nukedockerbuild.sources.file_store import (
+    FILE_STORE_DIRECTORY,
+    FileStore,
+)
+from nukedockerbuild.sources.lockfile import LOCK_FILE, SourcesLock
+from nukedockerbuild.sources.prefetch import (
+    DEFAULT_CONCURRENCY as DEFAULT_PREFETCH_CONCURRENCY,
 )
-from nukedockerbuild.creator.create_dockerfiles import write_dockerfiles
+from nukedockerbuild.sources.prefetch import (
+    Prefetcher,
+    PrefetchSummary,
+    find_sources,
+)
+from nukedockerbuild.tracing import TRACER
 
 FORMAT = "[%(asctime)s] %(message)s"
 logging.basicConfig(level=logging.INFO, format=FORMAT)
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GenerationOptions:
+    """Options of the dockerfile generation, parsed from the CLI."""
+
+    dockerfiles: DockerfileOptions = field(default_factory=DockerfileOptions)
+    """Options of the dockerfiles and the releases to select."""
+    offline: bool = False
+    """Render from the cached release data without fetching."""
+    plan_only: bool = False
+    """Only print the changes that would be made."""
+    write_bake: bool = False
+    """Also write a bake file to build all images at once."""
+    fetcher: FeedFetcher | None = None
+    """Fetcher of the release feed, defaults to the primary."""
+    validator: SourceValidator | None = None
+    """Validate the installer URLs before writing, if given."""
+    drop_broken_sources: bool = True
+    """Leave out dockerfiles with a broken installer URL, or only log."""
+    sources_lock: SourcesLock | None = None
+    """Lock to pin the installers of all dockerfiles in, if given."""
+    lock_workers: int = 4
+    """Amount of installers to hash at the same time."""
+
+    @classmethod
+    def from_arguments(
+        cls, arguments: argparse.Namespace, directory: Path
+    ) -> GenerationOptions:
+        """Return the options of the parsed arguments.
+
+        Args:
+            arguments: parsed arguments of the generation.
+            directory: directory the dockerfiles are written to.
+
+        Returns:
+            the options to generate with.
+        """
+        return cls(
+            dockerfiles=DockerfileOptions(
+                use_base_images=arguments.base_images,
+                use_cache_mounts=arguments.cache_mounts,
+                use_shared_sources=arguments.shared_sources,
+                versions=arguments.versions,
+                operating_systems=(
+                    [OperatingSystem(name) for name in arguments.os]
+                    if arguments.os
+                    else None
+                ),
+                since=(
+                    NukeVersion.range_from_string(arguments.since)[0]
+                    if arguments.since
+                    else None
+                ),
+            ),
+            offline=arguments.offline,
+            plan_only=arguments.plan,
+            write_bake=arguments.bake,
+            fetcher=FeedFetcher(
+                arguments.mirrors, hedge_delay=arguments.hedge_delay
+            ),
+            validator=(
+                SourceValidator(arguments.validation_concurrency)
+                if arguments.validate_sources
+                else None
+            ),
+            drop_broken_sources=arguments.validate_sources == "drop",
+            sources_lock=(
+                SourcesLock.load(directory / LOCK_FILE)
+                if arguments.lock_sources
+                else None
+            ),
+            lock_workers=arguments.lock_workers,
+        )
+
+    def fingerprint(self) -> str:
+        """Return the fingerprint of the options and the templates."""
+        return generation_fingerprint(
+            {
+                **self.dockerfiles.to_dict(),
+                "bake": self.write_bake,
+                "validate_sources": self.validator is not None,
+                "drop_broken_sources": self.drop_broken_sources,
+                "lock_sources": self.sources_lock is not None,
+            }
+        )
 
-def _generate_dockerfiles(dockerfiles_directory: Path) -> None:
+
+def _generate_dockerfiles(
+    dockerfiles_directory: Path,
+    options: GenerationOptions,
+    cache: FeedCache | None = None,
+) -> None:
     """Generate dockerfiles in directory.
 
     Args:
         dockerfiles_directory: directory to write dockerfiles to.
+        options: options to generate the dockerfiles with.
+        cache: cache to store and conditionally fetch release data with.
+
+    Raises:
+        ValueError: if a bake file is requested for a selection only.
+    """
+    is_selection = options.dockerfiles.is_selection
+    if options.write_bake and is_selection:
+        msg = "The bake file needs all dockerfiles, remove the filters."
+        raise ValueError(msg)
+    # A plan must not update the cache, otherwise the next run is skipped.
+    fetch_cache = (
+        cache if options.offline or not options.plan_only else None
+    )
+    fingerprint = options.fingerprint()
+    index = fetch_release_index(
+        cache=fetch_cache,
+        offline=options.offline,
+        fetcher=options.fetcher,
+        fingerprint=fingerprint,
+    )
+    if index is None:
+        logger.info("No new release data, skipping dockerfile generation.")
+        return
+    dockerfiles = iter_dockerfiles(index, options.dockerfiles)
+    if options.validator:
+        dockerfiles, _ = validate_sources(
+            list(dockerfiles),
+            options.validator,
+            drop=options.drop_broken_sources,
+        )
+    if options.plan_only:
+        plan = plan_dockerfiles(
+            Path(dockerfiles_directory),
+            dockerfiles,
+            include_removed=not is_selection,
+        )
+        sys.stdout.write(f"{plan.format()}\n")
+        return
+    plan = write_dockerfiles(
+        directory=Path(dockerfiles_directory),
+        dockerfiles=dockerfiles,
+        write_bake=options.write_bake,
+    )
+    if options.sources_lock:
+        options.sources_lock.update(
+            (
+                (
+                    str(planned.dockerfile.nuke_version),
+                    planned.dockerfile.operating_system.value,
+                    planned.dockerfile.nuke_source,
+                )
+                for planned in plan.planned
+                if isinstance(planned.dockerfile, Dockerfile)
+            ),
+            workers=options.lock_workers,
+            download_cache=DownloadCache(
+                Path(dockerfiles_directory) / INSTALLER_CACHE_DIRECTORY
+            ),
+            prune=not is_selection,
+        )
+        options.sources_lock.write()
+    # Only now the tree is complete, a later 304 may skip the generation.
+    if fetch_cache:
+        fetch_cache.commit(fingerprint)
+
+
+def _build_images(arguments: argparse.Namespace) -> BuildSummary:
+    """Build all images found in the dockerfiles tree.
+
+    Args:
+        arguments: parsed arguments of the build command.
+
+    Returns:
+        summary of all builds.
+    """
+    directory = Path(arguments.directory).resolve()
+    if (arguments.export or arguments.layer_store) and arguments.podman:
+        msg = "Podman builds in its own storage, export is docker only."
+        raise ValueError(msg)
+    if arguments.export and arguments.layer_store:
+        msg = "Export either to tarballs or to the layer store, not both."
+        raise ValueError(msg)
+    if arguments.shared_sources and arguments.skip_prepare_sources:
+        msg = "Shared sources are split from sources prepared on the host."
+        raise ValueError(msg)
+    targets = find_build_targets(directory)
+    msg = f"Found {len(targets)} images to build."
+    logger.info(msg)
+    download_cache = (
+        None
+        if arguments.skip_installer_cache
+        else DownloadCache(directory / INSTALLER_CACHE_DIRECTORY)
+    )
+    sources_lock = SourcesLock.load(directory / LOCK_FILE)
+    file_store = (
+        FileStore(directory / FILE_STORE_DIRECTORY)
+        if arguments.file_store
+        else None
+    )
+    runner = ScriptRunner(
+        directory,
+        use_podman=arguments.podman,
+        load=not arguments.skip_load,
+        download_cache=download_cache,
+        prepare_sources=not arguments.skip_prepare_sources,
+        exporter=(
+            ImageExporter(
+                codec=Codec(arguments.export),
+                level=arguments.export_level,
+                threads=arguments.export_threads,
+            )
+            if arguments.export
+            else None
+        ),
+        layer_store=(
+            LayerStore(directory / LAYER_STORE_DIRECTORY)
+            if arguments.layer_store
+            else None
+        ),
+        sources_lock=sources_lock,
+        scan_includes=arguments.scan_includes,
+        file_store=file_store,
+    )
+    if arguments.shared_sources:
+        runner.prepare_shared_sources(targets, sys.stdout)
+    scheduler = BuildScheduler(
+        runner=runner,
+        log_directory=(
+            Path(arguments.log_dir)
+            if arguments.log_dir
+            else directory / "build" / "logs"
+        ),
+        max_workers={
+            OperatingSystem.LINUX: arguments.linux_workers,
+            OperatingSystem.WINDOWS: arguments.windows_workers,
+        },
+        build_cache=(
+            None
+            if arguments.skip_build_cache
+            else BuildCache(
+                directory,
+                download_cache=download_cache,
+                sources_lock=sources_lock,
+            )
+        ),
+    )
+    summary = scheduler.run(targets)
+    if arguments.summary:
+        Path(arguments.summary).write_text(
+            json.dumps(summary.to_dict(), indent=2)
+        )
+    msg = (
+        f"Built {len(summary.succeeded) - len(summary.cached)} images, "
+        f"{len(summary.cached)} unchanged, {len(summary.failed)} failed."
+    )
+    logger.info(msg)
+    if file_store:
+        report = file_store.report()
+        msg = (
+            f"File store holds {report.objects} files "
+            f"({report.stored_bytes} bytes) linked {report.linked_files} "
+            f"times ({report.logical_bytes} bytes), a deduplication ratio "
+            f"of {report.ratio:.2f}."
+        )
+        logger.info(msg)
+    for result in summary.failed:
+        msg = f"Failed: '{result.target.name}', see '{result.log_path}'."
+        logger.error(msg)
+    return summary
+
+
+def _prefetch_installers(arguments: argparse.Namespace) -> PrefetchSummary:
+    """Download every installer of the dockerfiles tree into the cache.
+
+    Args:
+        arguments: parsed arguments of the prefetch command.
+
+    Returns:
+        summary of all downloads.
+    """
+    directory = Path(arguments.directory).resolve()
+    sources = find_sources(directory, SourcesLock.load(directory / LOCK_FILE))
+    msg = f"Found {len(sources)} installers to prefetch."
+    logger.info(msg)
+    prefetcher = Prefetcher(
+        DownloadCache(directory / INSTALLER_CACHE_DIRECTORY),
+        concurrency=arguments.concurrency,
+        max_bytes_per_second=(
+            arguments.max_rate * 1024 * 1024 if arguments.max_rate else None
+        ),
+    )
+    summary = prefetcher.prefetch(sources)
+    if arguments.summary:
+        Path(arguments.summary).write_text(
+            json.dumps(summary.to_dict(), indent=2)
+        )
+    for result in summary.failed:
+        msg = f"Failed: '{result.url}': {result.error}"
+        logger.error(msg)
+    return summary
+
+
+def _export_images(arguments: argparse.Namespace) -> None:
+    """Export images from the container engine as compressed tarballs.
+
+    Args:
+        arguments: parsed arguments of the export command.
     """
-    json_data = fetch_json_data()
-    dockerfiles = get_dockerfiles(data=json_data)
-    write_dockerfiles(
-        directory=Path(dockerfiles_directory), dockerfiles=dockerfiles
+    exporter = ImageExporter(
+        codec=Codec(arguments.codec),
+        level=arguments.level,
+        threads=arguments.threads,
+        engine=arguments.engine,
+    )
+    results = {
+        tag: exporter.export(tag, Path(arguments.output_dir)).to_dict()
+        for tag in arguments.tags
+    }
+    if arguments.summary:
+        Path(arguments.summary).write_text(json.dumps(results, indent=2))
+
+
+def _analyze_image_size(arguments: argparse.Namespace) -> list[str]:
+    """Report the size of a saved image and compare it to a baseline.
+
+    Args:
+        arguments: parsed arguments of the size command.
+
+    Returns:
+        the size regressions compared to the baseline and maximum.
+    """
+    report = analyze_image(
+        Path(arguments.image),
+        arguments.tag,
+        depth=arguments.depth,
+        limit=arguments.limit,
+    )
+    sys.stdout.write(f"{report.format()}\n")
+    if arguments.report:
+        Path(arguments.report).write_text(
+            json.dumps(report.to_dict(), indent=2)
+        )
+    regressions = find_regressions(
+        report,
+        (
+            json.loads(Path(arguments.baseline).read_text())
+            if arguments.baseline
+            else {}
+        ),
+        tolerance=arguments.tolerance,
+        max_bytes=(
+            int(arguments.max_size * 1024 * 1024)
+            if arguments.max_size
+            else None
+        ),
+    )
+    for regression in regressions:
+        logger.error(regression)
+    return regressions
+
+
+def _run_layer_store(arguments: argparse.Namespace) -> None:
+    """Import, export, report or prune images of the layer store.
+
+    Args:
+        arguments: parsed arguments of the store command.
+    """
+    store = LayerStore(Path(arguments.store_dir), engine=arguments.engine)
+    if arguments.store_command == "import":
+        for tag in arguments.tags:
+            store.import_image(tag)
+    elif arguments.store_command == "export":
+        for tag in arguments.tags:
+            codec = Codec(arguments.codec) if arguments.codec else None
+            name = tag.replace(":", "-")
+            path = store.export(
+                tag,
+                Path(arguments.output_dir)
+                / f"{name}{codec.extension if codec else '.tar'}",
+                codec,
+            )
+            msg = f"Exported '{tag}' to '{path}'."
+            logger.info(msg)
+    elif arguments.store_command == "prune":
+        msg = f"Removed {store.prune()} bytes of unused blobs."
+        logger.info(msg)
+    report = store.report()
+    msg = (
+        f"Layer store has {report.images} images in {report.blobs} blobs, "
+        f"{report.stored_bytes} bytes stored for {report.logical_bytes} "
+        f"bytes of images (ratio {report.ratio:.2f})."
+    )
+    logger.info(msg)
+    if arguments.store_command == "report":
+        sys.stdout.write(f"{json.dumps(report.to_dict(), indent=2)}\n")
+
+
+def _add_compression_arguments(
+    parser: argparse.ArgumentParser, prefix: str = ""
+) -> None:
+    """Add the level and threads arguments of the export compression."""
+    parser.add_argument(
+        f"--{prefix}level",
+        type=int,
+        help="Compression level, defaults to 6 for gzip and 3 for zstd.",
+    )
+    parser.add_argument(
+        f"--{prefix}threads",
+        type=int,
+        help="Compression threads, defaults to the amount of CPUs.",
+    )
+
+
+def _add_export_parser(subparsers: argparse._SubParsersAction) -> None:
+    """Add the parser for the export command."""
+    export_parser = subparsers.add_parser(
+        "export", help="Export images as compressed tarballs."
+    )
+    export_parser.add_argument("tags", nargs="+", help="Images to export.")
+    export_parser.add_argument("--output_dir", default="build")
+    export_parser.add_argument(
+        "--codec",
+        choices=[codec.value for codec in Codec],
+        default=Codec.GZIP.value,
+    )
+    _add_compression_arguments(export_parser)
+    export_parser.add_argument(
+        "--engine", choices=["docker", "podman"], default="docker"
+    )
+    export_parser.add_argument(
+        "--summary", help="Path to write the compression results to."
+    )
+
+
+def _add_store_parser(subparsers: argparse._SubParsersAction) -> None:
+    """Add the parser for the layer store command."""
+    store_parser = subparsers.add_parser(
+        "store",
+        help="Keep every image layer once and rebuild tarballs per tag.",
+    )
+    store_parser.add_argument(
+        "--store_dir", default=str(LAYER_STORE_DIRECTORY)
+    )
+    store_parser.add_argument(
+        "--engine", choices=["docker", "podman"], default="docker"
+    )
+    store_commands = store_parser.add_subparsers(
+        dest="store_command", required=True
+    )
+    import_parser = store_commands.add_parser(
+        "import", help="Save images into the layer store."
+    )
+    import_parser.add_argument("tags", nargs="+", help="Images to store.")
+    export_parser = store_commands.add_parser(
+        "export", help="Rebuild loadable tarballs of stored images."
+    )
+    export_parser.add_argument("tags", nargs="+", help="Images to export.")
+    export_parser.add_argument("--output_dir", default="build")
+    export_parser.add_argument(
+        "--codec",
+        choices=[codec.value for codec in Codec],
+        help="Compress the tarballs, uncompressed by default.",
+    )
+    store_commands.add_parser(
+        "report", help="Write the stored and logical size as JSON."
+    )
+    store_commands.add_parser(
+        "prune", help="Remove blobs no stored image references."
+    )
+
+
+def _add_size_parser(subparsers: argparse._SubParsersAction) -> None:
+    """Add the parser for the image size command."""
+    size_parser = subparsers.add_parser(
+        "size",
+        help="Report the size of a saved image per layer and path.",
+    )
+    size_parser.add_argument(
+        "image",
+        help="Tarball of docker save or directory of an OCI image layout.",
+    )
+    size_parser.add_argument(
+        "--tag", help="Image to analyze, defaults to the first image."
+    )
+    size_parser.add_argument(
+        "--report", help="Path to write the size report as JSON to."
+    )
+    size_parser.add_argument(
+        "--baseline",
+        help="Report of an earlier build, growth beyond the tolerance "
+        "fails the command.",
+    )
+    size_parser.add_argument(
+        "--tolerance", type=float, default=DEFAULT_TOLERANCE
+    )
+    size_parser.add_argument(
+        "--max_size",
+        type=float,
+        help="Maximum uncompressed size of the image in MB.",
+    )
+    size_parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+    size_parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+
+
+def _add_prefetch_parser(subparsers: argparse._SubParsersAction) -> None:
+    """Add the parser for the prefetch command."""
+    prefetch_parser = subparsers.add_parser(
+        "prefetch",
+        help="Download the installers of all dockerfiles into the cache.",
+    )
+    prefetch_parser.add_argument(
+        "--directory",
+        default=".",
+        help="Directory containing build.sh and the dockerfiles folder.",
+    )
+    prefetch_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_PREFETCH_CONCURRENCY,
+        help="Amount of installers to download at the same time.",
+    )
+    prefetch_parser.add_argument(
+        "--max_rate",
+        type=float,
+        help="Bandwidth cap in MB/s shared by all downloads.",
+    )
+    prefetch_parser.add_argument(
+        "--summary", help="Path to write a JSON summary of all downloads to."
+    )
+
+
+def _add_build_parser(subparsers: argparse._SubParsersAction) -> None:
+    """Add the parser for the build command."""
+    build_parser = subparsers.add_parser(
+        "build", help="Build all images in the dockerfiles tree."
+    )
+    build_parser.add_argument(
+        "--directory",
+        default=".",
+        help="Directory containing build.sh and the dockerfiles folder.",
+    )
+    build_parser.add_argument("--linux_workers", type=int, default=2)
+    build_parser.add_argument("--windows_workers", type=int, default=1)
+    build_parser.add_argument("--podman", action="store_true")
+    build_parser.add_argument("--skip_load", action="store_true")
+    build_parser.add_argument(
+        "--skip_installer_cache",
+        action="store_true",
+        help="Download installers in the build container on every build.",
+    )
+    build_parser.add_argument(
+        "--skip_prepare_sources",
+        action="store_true",
+        help="Install Nuke in the build container instead of extracting "
+        "only the needed files on the host.",
+    )
+    build_parser.add_argument(
+        "--scan_includes",
+        action="store_true",
+        help="Reduce the prepared Nuke sources to the headers the NDK "
+        "examples include and the libraries cmake links, recorded in a "
+        "retain manifest next to each dockerfile.",
+    )
+    build_parser.add_argument(
+        "--shared_sources",
+        action="store_true",
+        help="Split the prepared Nuke sources of every major in files that "
+        "all its minor versions share and a per-minor delta, for "
+        "dockerfiles generated with --shared_sources.",
+    )
+    build_parser.add_argument(
+        "--file_store",
+        action="store_true",
+        help="Hard link identical prepared Nuke files of all versions from "
+        "a single copy in build/cache/sources.",
+    )
+    build_parser.add_argument(
+        "--skip_build_cache",
+        action="store_true",
+        help="Build all images, also those whose inputs did not change "
+        "since their last successful build.",
+    )
+    build_parser.add_argument(
+        "--export",
+        choices=[codec.value for codec in Codec],
+        help="Export images on the host with multi-threaded compression "
+        "instead of gzip in the build container. Docker only.",
+    )
+    _add_compression_arguments(build_parser, prefix="export_")
+    build_parser.add_argument(
+        "--layer_store",
+        action="store_true",
+        help="Store the layers of built images once in build/layers "
+        "instead of a tarball per image. Docker only.",
+    )
+    build_parser.add_argument(
+        "--log_dir",
+        help="Directory to write build logs to. Defaults to build/logs.",
+    )
+    build_parser.add_argument(
+        "--summary", help="Path to write a JSON summary of all builds to."
     )
 
 
@@ -37,21 +685,175 @@ def _parse_args(args: list[str]) -> argparse.Namespace:
         prog="NukeVersionParser",
         description=("CLI to create dockerfiles for all Nuke versions."),
     )
-    parser.add_argument("--write_dir", required=True)
+    parser.add_argument("--write_dir")
+    parser.add_argument(
+        "--cache_dir",
+        help="Directory to cache release data in. Defaults to .cache in "
+        "the write directory.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Render from the last cached release data without fetching.",
+    )
+    parser.add_argument(
+        "--mirrors",
+        nargs="+",
+        default=[JSON_DATA_SOURCE],
+        help="URLs, file URLs or paths of the release feed, in order of "
+        "preference. Defaults to the Codeberg feed.",
+    )
+    parser.add_argument(
+        "--hedge_delay",
+        type=float,
+        default=DEFAULT_HEDGE_DELAY,
+        help="Seconds to wait for a mirror before also asking the next.",
+    )
+    parser.add_argument(
+        "--validate_sources",
+        choices=["drop", "flag"],
+        help="Check every installer URL before writing, and drop or only "
+        "flag dockerfiles with a broken URL.",
+    )
+    parser.add_argument(
+        "--validation_concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Amount of installer URLs to check at the same time.",
+    )
+    parser.add_argument(
+        "--lock_sources",
+        action="store_true",
+        help="Pin the size, sha256 and ETag of every installer in "
+        "sources.lock, hashing installers that are not pinned yet.",
+    )
+    parser.add_argument(
+        "--lock_workers",
+        type=int,
+        default=4,
+        help="Amount of installers to hash at the same time.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="List added, changed and removed dockerfiles without writing.",
+    )
+    parser.add_argument(
+        "--base_images",
+        action="store_true",
+        help="Generate shared toolchain images that dockerfiles start from.",
+    )
+    parser.add_argument(
+        "--cache_mounts",
+        action="store_true",
+        help="Use BuildKit cache mounts for package managers and downloads.",
+    )
+    parser.add_argument(
+        "--shared_sources",
+        action="store_true",
+        help="Copy the Nuke files that all minor versions of a major have "
+        "in common in a layer of their own, before the per-minor files.",
+    )
+    parser.add_argument(
+        "--bake",
+        action="store_true",
+        help="Also write docker-bake.hcl and docker-bake.json to build all "
+        "images with a single docker buildx bake.",
+    )
+    parser.add_argument(
+        "--versions",
+        nargs="+",
+        help="Only generate these versions, like 15, 15.1 or 15.1v7.",
+    )
+    parser.add_argument(
+        "--os",
+        nargs="+",
+        choices=[
+            operating_system.value for operating_system in OperatingSystem
+        ],
+        help="Only generate for these operating systems.",
+    )
+    parser.add_argument(
+        "--since",
+        help="Only generate versions from this version onwards, like 14.0.",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write a JSON trace with a span per phase to this path.",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write the time, bytes and items per phase as Prometheus "
+        "textfile to this path.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    _add_build_parser(subparsers)
+    _add_export_parser(subparsers)
+    _add_store_parser(subparsers)
+    _add_prefetch_parser(subparsers)
+    _add_size_parser(subparsers)
     return parser.parse_args(args)
 
 
-def main() -> None:
-    """Main pytest bootstrap entrypoint"""
-    parsed_arguments = _parse_args(sys.argv[1:])
+def _write_tracing(parsed_arguments: argparse.Namespace) -> None:
+    """Write the recorded spans, if tracing is requested."""
+    if parsed_arguments.trace:
+        TRACER.write_trace(Path(parsed_arguments.trace))
+    if parsed_arguments.metrics:
+        TRACER.write_prometheus(Path(parsed_arguments.metrics))
+    for phase, summary in TRACER.summary().items():
+        if summary.spans:
+            msg = (
+                f"Phase '{phase}': {summary.seconds:.3f}s, "
+                f"{summary.byte_count} bytes, {summary.item_count} items."
+            )
+            logger.info(msg)
+
+
+def _run_command(parsed_arguments: argparse.Namespace) -> None:
+    """Run the command selected by the parsed arguments."""
+    if parsed_arguments.command == "build":
+        summary = _build_images(parsed_arguments)
+        sys.exit(1 if summary.failed else 0)
+    if parsed_arguments.command == "prefetch":
+        summary = _prefetch_installers(parsed_arguments)
+        sys.exit(1 if summary.failed else 0)
+    if parsed_arguments.command == "size":
+        sys.exit(1 if _analyze_image_size(parsed_arguments) else 0)
+    if parsed_arguments.command == "export":
+        _export_images(parsed_arguments)
+        return
+    if parsed_arguments.command == "store":
+        _run_layer_store(parsed_arguments)
+        return
     if parsed_arguments.write_dir is None:
         msg = (
             "Provide the path to write to. For example: "
-            "nuke-dockerbuild ./ for the current directory."
+            "nuke-dockerbuild --write_dir ./ for the current directory."
         )
         raise ValueError(msg)
     json_directory = Path(parsed_arguments.write_dir)
-    _generate_dockerfiles(json_directory)
+    cache_directory = (
+        Path(parsed_arguments.cache_dir)
+        if parsed_arguments.cache_dir
+        else json_directory / ".cache"
+    )
+    _generate_dockerfiles(
+        json_directory,
+        GenerationOptions.from_arguments(parsed_arguments, json_directory),
+        cache=FeedCache(cache_directory),
+    )
+
+
+def main() -> None:
+    """Main pytest bootstrap entrypoint"""
+    parsed_arguments = _parse_args(sys.argv[1:])
+    if parsed_arguments.trace or parsed_arguments.metrics:
+        TRACER.enable()
+    try:
+        _run_command(parsed_arguments)
+    finally:
+        _write_tracing(parsed_arguments)
 
 
 if __name__ == "__main__":
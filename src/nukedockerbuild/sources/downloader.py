@@ -0,0 +1,440 @@
+"""Content-addressed cache for downloaded Nuke installers.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import requests
+
+from nukedockerbuild.files import CHUNK_SIZE, write_atomic
+from nukedockerbuild.tracing import span
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+logger = logging.getLogger(__name__)
+
+INSTALLER_CACHE_DIRECTORY = Path("build/cache/installers")
+"""Installer cache relative to the base level directory.
+
+This is inside the build directory, so it is available to the build
+scripts in the dind or podman container as well.
+"""
+
+_CONTENT_RANGE = re.compile(
+    r"^bytes (?:(?P<start>\d+)-\d+|\*)/(?:(?P<total>\d+)|\*)$"
+)
+
+
+def url_key(url: str) -> str:
+    """Return the key an URL is stored under in the cache.
+
+    Args:
+        url: the URL to get the key for.
+
+    Returns:
+        sha256 hex digest of the URL.
+    """
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+@dataclass
+class CachedDownload:
+    """Artifact stored in the cache."""
+
+    url: str
+    sha256: str
+    size: int
+    path: Path
+    """Path to the content addressed blob."""
+    etag: str | None = None
+
+
+@dataclass
+class _PartialDownload:
+    """Download that has not finished yet, with the hash of its bytes."""
+
+    url: str
+    path: Path
+    digest: hashlib._Hash = field(default_factory=hashlib.sha256)
+    offset: int = 0
+    """Amount of bytes that are downloaded already."""
+
+    def restart(self) -> None:
+        """Forget the downloaded bytes, to download from the first byte."""
+        self.digest = hashlib.sha256()
+        self.offset = 0
+
+
+@dataclass
+class DownloadCache:
+    """Cache storing downloads by their content, indexed by URL.
+
+    Layout of the cache directory:
+        blobs/sha256/<digest>: downloaded content.
+        urls/<url key>: relative symlink to the blob, for the shell scripts.
+        urls/<url key>.json: metadata of the download.
+        partial/<url key>: download that has not finished yet.
+    """
+
+    directory: Path
+    timeout: int = 30
+    """Timeout for connecting and reading in seconds."""
+    _url_locks: dict[str, threading.Lock] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def lookup(self, url: str) -> CachedDownload | None:
+        """Return the cached download for URL, if it is complete.
+
+        Args:
+            url: the URL to look up.
+
+        Returns:
+            the cached download, or None if it is not cached.
+        """
+        try:
+            metadata = json.loads(self._metadata_path(url).read_text())
+        except (OSError, ValueError):
+            return None
+        blob_path = self._blob_path(metadata["sha256"])
+        if not blob_path.is_file():
+            return None
+        return CachedDownload(
+            url=url,
+            sha256=metadata["sha256"],
+            size=metadata["size"],
+            path=blob_path,
+            etag=metadata.get("etag"),
+        )
+
+    def fetch(
+        self,
+        url: str,
+        expected_sha256: str | None = None,
+        on_chunk: Callable[[int], None] | None = None,
+    ) -> CachedDownload:
+        """Return the download for URL, downloading it if not cached yet.
+
+        Concurrent calls for the same URL are deduplicated, so only the
+        first call downloads while the others wait for it to finish. If
+        the expected hash is known and its content is cached already, for
+        example under another URL, it is reused without downloading.
+
+        Args:
+            url: the URL to download.
+            expected_sha256: hash the content needs to match, if known.
+            on_chunk: called with the size of every downloaded chunk, for
+                progress or throttling.
+
+        Raises:
+            ValueError: if the content does not match the expected hash or
+                the size the server announced.
+
+        Returns:
+            the cached download.
+        """
+        with self._url_lock(url):
+            cached = self.lookup(url)
+            if cached and expected_sha256 in (None, cached.sha256):
+                msg = f"Using cached download for '{url}'."
+                logger.info(msg)
+                return cached
+            blob_path = (
+                self._blob_path(expected_sha256) if expected_sha256 else None
+            )
+            if blob_path and blob_path.is_file():
+                msg = f"Using cached content '{expected_sha256}' for '{url}'."
+                logger.info(msg)
+                return self._index(
+                    url, expected_sha256, blob_path.stat().st_size, None
+                )
+            return self._download(url, expected_sha256, on_chunk)
+
+    def _url_lock(self, url: str) -> threading.Lock:
+        """Return the lock that guards downloading URL."""
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def _download(
+        self,
+        url: str,
+        expected_sha256: str | None,
+        on_chunk: Callable[[int], None] | None = None,
+    ) -> CachedDownload:
+        """Download URL into the cache, resuming a partial download.
+
+        Args:
+            url: the URL to download.
+            expected_sha256: hash the content needs to match, if known.
+            on_chunk: called with the size of every downloaded chunk.
+
+        Raises:
+            ValueError: if the download failed or did not match.
+
+        Returns:
+            the cached download.
+        """
+        partial = _PartialDownload(
+            url, self.directory / "partial" / url_key(url)
+        )
+        partial.path.parent.mkdir(parents=True, exist_ok=True)
+        partial_etag_path = partial.path.with_suffix(".json")
+        partial.offset = _hash_existing(partial.path, partial.digest)
+        etag = _read_etag(partial_etag_path)
+        while True:
+            headers = {}
+            if partial.offset:
+                headers["Range"] = f"bytes={partial.offset}-"
+                if etag:
+                    headers["If-Range"] = etag
+            with requests.get(
+                url, headers=headers, stream=True, timeout=self.timeout
+            ) as response:
+                if response.status_code == HTTPStatus.OK and partial.offset:
+                    msg = f"Server does not resume '{url}', starting over."
+                    logger.info(msg)
+                    partial.restart()
+                restart_reason = _restart_reason(
+                    response,
+                    partial.offset,
+                    partial.digest.hexdigest(),
+                    expected_sha256,
+                )
+                if (
+                    restart_reason is None
+                    and response.status_code
+                    == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+                ):
+                    msg = f"Partial download of '{url}' is complete."
+                    logger.info(msg)
+                    expected_size = partial.offset
+                    break
+                if restart_reason is None:
+                    etag = response.headers.get("ETag")
+                    expected_size = self._write_body(
+                        response, partial, on_chunk
+                    )
+                    break
+            msg = f"{restart_reason.format(url=url)}, starting over."
+            logger.info(msg)
+            partial.path.unlink(missing_ok=True)
+            partial.restart()
+            etag = None
+
+        size = partial.path.stat().st_size
+        if expected_size is not None and size != expected_size:
+            msg = (
+                f"Download of '{url}' is incomplete, received {size} of "
+                f"{expected_size} bytes."
+            )
+            raise ValueError(msg)
+        sha256 = partial.digest.hexdigest()
+        if expected_sha256 and sha256 != expected_sha256:
+            partial.path.unlink()
+            partial_etag_path.unlink(missing_ok=True)
+            msg = (
+                f"Download of '{url}' does not match the expected hash, "
+                f"expected '{expected_sha256}' but got '{sha256}'."
+            )
+            raise ValueError(msg)
+
+        return self._store(url, partial.path, sha256, size, etag)
+
+    def _write_body(
+        self,
+        response: requests.Response,
+        partial: _PartialDownload,
+        on_chunk: Callable[[int], None] | None,
+    ) -> int | None:
+        """Append the body of a response to the partial download.
+
+        Raises:
+            ValueError: if the server returned an error.
+
+        Returns:
+            total size of the download announced by the server, if any.
+        """
+        if response.status_code not in (
+            HTTPStatus.OK,
+            HTTPStatus.PARTIAL_CONTENT,
+        ):
+            msg = (
+                f"Download of '{partial.url}' returned "
+                f"{response.status_code}."
+            )
+            raise ValueError(msg)
+        etag = response.headers.get("ETag")
+        partial_etag_path = partial.path.with_suffix(".json")
+        partial_etag_path.write_text(json.dumps({"etag": etag}))
+        expected_size = _expected_size(response, partial.offset)
+
+        msg = f"Downloading '{partial.url}' from byte {partial.offset}."
+        logger.info(msg)
+        with (
+            span("download", url=partial.url) as download_span,
+            partial.path.open("ab" if partial.offset else "wb") as file,
+        ):
+            for chunk in response.iter_content(CHUNK_SIZE):
+                file.write(chunk)
+                partial.digest.update(chunk)
+                download_span.add(byte_count=len(chunk))
+                if on_chunk:
+                    on_chunk(len(chunk))
+            download_span.add(item_count=1)
+        return expected_size
+
+    def _store(
+        self,
+        url: str,
+        partial_path: Path,
+        sha256: str,
+        size: int,
+        etag: str | None,
+    ) -> CachedDownload:
+        """Move a finished download to its blob and index it by URL."""
+        blob_path = self._blob_path(sha256)
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        if blob_path.is_file():
+            partial_path.unlink()
+        else:
+            partial_path.replace(blob_path)
+        partial_path.with_suffix(".json").unlink(missing_ok=True)
+        return self._index(url, sha256, size, etag)
+
+    def _index(
+        self, url: str, sha256: str, size: int, etag: str | None
+    ) -> CachedDownload:
+        """Index the blob with the provided hash by URL."""
+        blob_path = self._blob_path(sha256)
+        metadata_path = self._metadata_path(url)
+        metadata_path.parent.mkdir(parents=True, exist_ok=True)
+        link_path = metadata_path.with_suffix("")
+        link_path.unlink(missing_ok=True)
+        link_path.symlink_to(os.path.relpath(blob_path, link_path.parent))
+        write_atomic(
+            metadata_path,
+            json.dumps(
+                {"url": url, "sha256": sha256, "size": size, "etag": etag}
+            ),
+        )
+        return CachedDownload(
+            url=url, sha256=sha256, size=size, path=blob_path, etag=etag
+        )
+
+    def _blob_path(self, sha256: str) -> Path:
+        """Return path of the blob with the provided hash."""
+        return self.directory / "blobs" / "sha256" / sha256
+
+    def _metadata_path(self, url: str) -> Path:
+        """Return path of the metadata of the provided URL."""
+        return self.directory / "urls" / f"{url_key(url)}.json"
+
+
+def _hash_existing(path: Path, digest: hashlib._Hash) -> int:
+    """Feed an existing partial download to digest.
+
+    Args:
+        path: the partial download.
+        digest: digest to update.
+
+    Returns:
+        amount of bytes that are already downloaded.
+    """
+    if not path.is_file():
+        return 0
+    offset = 0
+    with path.open("rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+            offset += len(chunk)
+    return offset
+
+
+def _read_etag(path: Path) -> str | None:
+    """Return the ETag stored for a partial download, if any."""
+    try:
+        return json.loads(path.read_text()).get("etag")
+    except (OSError, ValueError):
+        return None
+
+
+def _restart_reason(
+    response: requests.Response,
+    offset: int,
+    partial_sha256: str,
+    expected_sha256: str | None,
+) -> str | None:
+    """Return why a resumed download needs to start over, if it does.
+
+    Args:
+        response: response of the download request.
+        offset: amount of bytes that are resumed from.
+        partial_sha256: hash of the bytes that are resumed from.
+        expected_sha256: hash the content needs to match, if known.
+
+    Returns:
+        reason with a {url} placeholder, or None to use the response.
+    """
+    if not offset:
+        return None
+    if (
+        response.status_code == HTTPStatus.PARTIAL_CONTENT
+        and _range_start(response) != offset
+    ):
+        return "Server resumes '{url}' from another byte"
+    if response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+        # The partial download can be complete already, if the connection
+        # dropped after the last byte. Only then there is no range left.
+        total = _range_total(response)
+        if total == offset or (
+            total is None and partial_sha256 == expected_sha256
+        ):
+            return None
+        return "Server can not resume '{url}'"
+    return None
+
+
+def _range_start(response: requests.Response) -> int | None:
+    """Return the first byte of a partial response, from Content-Range."""
+    match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+    return int(match["start"]) if match and match["start"] else None
+
+
+def _range_total(response: requests.Response) -> int | None:
+    """Return the total size announced in Content-Range, if any."""
+    match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+    return int(match["total"]) if match and match["total"] else None
+
+
+def _expected_size(response: requests.Response, offset: int) -> int | None:
+    """Return the total size of the download announced by the server.
+
+    Args:
+        response: response of the download request.
+        offset: amount of bytes that are resumed from.
+
+    Returns:
+        total size in bytes, or None if the server did not announce it.
+    """
+    content_length = response.headers.get("Content-Length")
+    if content_length is None:
+        return None
+    if response.status_code == HTTPStatus.PARTIAL_CONTENT:
+        return offset + int(content_length)
+    return int(content_length)
@@ -0,0 +1,396 @@
+"""Streaming extraction of only the Nuke files needed to build plugins.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import logging
+import shutil
+import stat
+import tarfile
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from functools import partial
+from http import HTTPStatus
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, BinaryIO
+
+import requests
+
+from nukedockerbuild.files import CHUNK_SIZE
+from nukedockerbuild.sources.include_graph import (
+    RETAIN_MANIFEST,
+    RetainManifest,
+    compute_retain_manifest,
+    prune_to_manifest,
+)
+from nukedockerbuild.sources.lockfile import VerifyingReader
+from nukedockerbuild.tracing import span
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from nukedockerbuild.sources.downloader import DownloadCache
+    from nukedockerbuild.sources.file_store import FileStore
+    from nukedockerbuild.sources.lockfile import LockedSource
+
+logger = logging.getLogger(__name__)
+
+SOURCES_DIRECTORY = "_nuke_sources"
+"""Folder next to the dockerfile that the Nuke files are prepared in."""
+
+SHARED_SOURCES_DIRECTORY = f"{SOURCES_DIRECTORY}_shared"
+"""Folder next to the dockerfile with the files shared by its major."""
+
+RETAIN_PATTERNS: tuple[str, ...] = (
+    "tests",
+    "cmake",
+    "include",
+    "source",
+    "*Fdk*",
+    "*Fn*",
+    "*Ndk*",
+    "*DDI*",
+)
+"""Top level entries of a Nuke install that are needed to build plugins."""
+
+_NDK_EXAMPLES_RENAMED = 12.0
+"""First Nuke version with the examples in Documentation/NDKExamples."""
+
+
+@dataclass(frozen=True)
+class RetainSpec:
+    """Specification of the members to extract from a Nuke installer."""
+
+    patterns: tuple[str, ...]
+    """Patterns matching top level entries to keep."""
+    examples_directory: str
+    """Directory containing the NDK examples, extracted to tests."""
+    manifest: frozenset[str] | None = None
+    """Target paths to keep of the members matching the spec, if known."""
+
+    def target_path(self, member_name: str) -> PurePosixPath | None:
+        """Return where a member should be extracted to, if retained.
+
+        Args:
+            member_name: name of the member in the installer.
+
+        Returns:
+            path relative to the target folder, or None to skip it.
+        """
+        target_path = self._match(PurePosixPath(member_name))
+        if (
+            self.manifest is not None
+            and target_path is not None
+            and target_path.as_posix() not in self.manifest
+        ):
+            return None
+        return target_path
+
+    def _match(self, member_path: PurePosixPath) -> PurePosixPath | None:
+        """Return the target path of a member matching the patterns."""
+        if member_path.is_absolute() or ".." in member_path.parts:
+            return None
+        examples_path = PurePosixPath(self.examples_directory)
+        if member_path.is_relative_to(examples_path):
+            relative_path = member_path.relative_to(examples_path)
+            if relative_path.parts:
+                return PurePosixPath("tests", relative_path)
+            return None
+        if any(
+            fnmatch.fnmatchcase(member_path.parts[0], pattern)
+            for pattern in self.patterns
+        ):
+            return member_path
+        return None
+
+
+def retain_spec_for_version(nuke_version: float) -> RetainSpec:
+    """Return the retain spec for the Nuke version.
+
+    Args:
+        nuke_version: the Nuke version to extract.
+
+    Returns:
+        matching retain spec.
+    """
+    if nuke_version < _NDK_EXAMPLES_RENAMED:
+        return RetainSpec(RETAIN_PATTERNS, "Documentation/NDK/examples")
+    return RetainSpec(RETAIN_PATTERNS, "Documentation/NDKExamples/examples")
+
+
+@dataclass
+class ExtractionResult:
+    """Statistics of a single extraction."""
+
+    files_written: int = 0
+    bytes_written: int = 0
+    members_skipped: int = 0
+    bytes_skipped: int = 0
+    files_deduplicated: int = 0
+    """Written files whose content was in the file store already."""
+    bytes_deduplicated: int = 0
+
+
+@contextmanager
+def open_nuke_source(
+    url: str, download_cache: DownloadCache | None = None
+) -> Iterator[BinaryIO]:
+    """Open the Nuke source from the cache, or stream it from the network.
+
+    Args:
+        url: the Nuke source URL.
+        download_cache: cache to read the source from, if it is cached.
+
+    Raises:
+        ValueError: if the source could not be downloaded.
+
+    Yields:
+        binary stream of the archive.
+    """
+    cached = download_cache.lookup(url) if download_cache else None
+    if cached:
+        with cached.path.open("rb") as file:
+            yield file
+        return
+    with requests.get(url, stream=True, timeout=30) as response:
+        if response.status_code != HTTPStatus.OK:
+            msg = f"Download of '{url}' returned {response.status_code}."
+            raise ValueError(msg)
+        yield response.raw
+
+
+def extract_nuke_sources(
+    archive: BinaryIO,
+    target_folder: Path,
+    spec: RetainSpec,
+    file_store: FileStore | None = None,
+) -> ExtractionResult:
+    """Extract retained Nuke files from a streamed Linux archive.
+
+    The archive is decompressed while it is read. Only the installer
+    inside it is written to a temporary file, as it is a zip that needs
+    random access. From the installer only members that match the spec
+    are written, so unused Nuke binaries never touch the disk.
+
+    Args:
+        archive: stream of the .tgz archive provided by Foundry.
+        target_folder: folder to extract the Nuke files to.
+        spec: specification of the members to extract.
+        file_store: store to link files from instead of writing them.
+
+    Raises:
+        ValueError: if the archive does not contain an installer.
+
+    Returns:
+        statistics of the extraction.
+    """
+    target_folder.mkdir(parents=True, exist_ok=True)
+    with tarfile.open(fileobj=archive, mode="r|gz") as tar:
+        for member in tar:
+            if not member.isfile() or not _is_installer(member.name):
+                continue
+            with tempfile.TemporaryFile(dir=target_folder.parent) as installer:
+                shutil.copyfileobj(
+                    tar.extractfile(member), installer, CHUNK_SIZE
+                )
+                installer.seek(0)
+                return extract_installer(
+                    installer, target_folder, spec, file_store
+                )
+    msg = "Provided archive does not contain a Nuke installer."
+    raise ValueError(msg)
+
+
+def extract_installer(
+    installer: BinaryIO,
+    target_folder: Path,
+    spec: RetainSpec,
+    file_store: FileStore | None = None,
+) -> ExtractionResult:
+    """Extract retained members of a zip based Nuke installer.
+
+    This handles both the .run installers and the pre-12 -installer
+    files, as they are both zip archives. With a file store, regular
+    files are hard linked from it. A member with the same name, CRC-32,
+    size and mode as one stored before is only hashed to verify it, not
+    written again.
+
+    Args:
+        installer: seekable stream of the installer.
+        target_folder: folder to extract the Nuke files to.
+        spec: specification of the members to extract.
+        file_store: store to link files from instead of writing them.
+
+    Returns:
+        statistics of the extraction.
+    """
+    result = ExtractionResult()
+    with zipfile.ZipFile(installer) as zip_file:
+        for info in zip_file.infolist():
+            if info.is_dir():
+                continue
+            relative_path = spec.target_path(info.filename)
+            if relative_path is None:
+                result.members_skipped += 1
+                result.bytes_skipped += info.file_size
+                continue
+            destination = target_folder.joinpath(*relative_path.parts)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            mode = info.external_attr >> 16
+            if stat.S_ISLNK(mode):
+                link_target = PurePosixPath(zip_file.read(info).decode())
+                if link_target.is_absolute() or ".." in link_target.parts:
+                    result.members_skipped += 1
+                    continue
+                destination.unlink(missing_ok=True)
+                destination.symlink_to(link_target)
+            elif file_store:
+                key = (
+                    f"{PurePosixPath(info.filename).name}:{info.CRC:08x}:"
+                    f"{info.file_size}:{stat.S_IMODE(mode):o}"
+                )
+                if file_store.link_or_store(
+                    destination,
+                    stat.S_IMODE(mode),
+                    partial(zip_file.open, info),
+                    key,
+                ):
+                    result.files_deduplicated += 1
+                    result.bytes_deduplicated += info.file_size
+            else:
+                with (
+                    zip_file.open(info) as source,
+                    destination.open("wb") as file,
+                ):
+                    shutil.copyfileobj(source, file, CHUNK_SIZE)
+                if mode:
+                    destination.chmod(stat.S_IMODE(mode))
+            result.files_written += 1
+            result.bytes_written += info.file_size
+    msg = (
+        f"Extracted {result.files_written} files "
+        f"({result.bytes_written} bytes), skipped "
+        f"{result.members_skipped} files ({result.bytes_skipped} bytes)."
+    )
+    if file_store:
+        msg += (
+            f" {result.files_deduplicated} files "
+            f"({result.bytes_deduplicated} bytes) were in the file store."
+        )
+    logger.info(msg)
+    return result
+
+
+@dataclass(frozen=True)
+class PrepareOptions:
+    """Caches and options to prepare the Nuke sources with."""
+
+    download_cache: DownloadCache | None = None
+    """Cache to read the source from, if it is cached."""
+    scan_includes: bool = False
+    """Without a retain manifest for the installer, compute it from the
+    includes of the NDK examples after extracting, write it and remove the
+    files it does not list."""
+    file_store: FileStore | None = None
+    """Store to hard link the files from, so identical files of other
+    versions share their disk space."""
+
+
+def prepare_nuke_sources(
+    url: str,
+    nuke_version: float,
+    dockerfile_directory: Path,
+    locked: LockedSource | None = None,
+    options: PrepareOptions | None = None,
+) -> ExtractionResult:
+    """Prepare the Nuke sources next to a Linux dockerfile.
+
+    A marker containing the URL is written next to the sources once they
+    are complete, so build.sh knows it does not need to fetch them again.
+    If a retain manifest of the same installer is next to the dockerfile,
+    only the files it lists are extracted. A manifest of another installer
+    or without files is ignored, so nothing is pruned.
+
+    Args:
+        url: the Nuke source URL.
+        nuke_version: the Nuke version of the source.
+        dockerfile_directory: directory containing the dockerfile.
+        locked: pinned source to verify the archive against while it is
+            extracted, if any.
+        options: caches and options to prepare with, defaults to
+            extracting from the source URL without any cache.
+
+    Raises:
+        ValueError: if the archive does not match the pinned source.
+
+    Returns:
+        statistics of the extraction.
+    """
+    options = options or PrepareOptions()
+    target_folder = dockerfile_directory / SOURCES_DIRECTORY
+    marker = dockerfile_directory / f"{SOURCES_DIRECTORY}.prepared"
+    marker.unlink(missing_ok=True)
+    shutil.rmtree(target_folder, ignore_errors=True)
+    # Files split off by an earlier run would otherwise be merged back,
+    # also those that the new installer no longer contains.
+    shutil.rmtree(
+        dockerfile_directory / SHARED_SOURCES_DIRECTORY, ignore_errors=True
+    )
+    manifest_path = dockerfile_directory / RETAIN_MANIFEST
+    manifest = RetainManifest.load(manifest_path)
+    if manifest is not None and not manifest.applies_to(url):
+        msg = (
+            f"Ignoring retain manifest '{manifest_path}', it lists no files "
+            f"or is not computed from '{url}'."
+        )
+        logger.warning(msg)
+        manifest = None
+    spec = retain_spec_for_version(nuke_version)
+    if manifest is not None:
+        spec = replace(spec, manifest=manifest.paths)
+    with (
+        span("extract", url=url) as extract_span,
+        open_nuke_source(url, options.download_cache) as archive,
+    ):
+        reader = VerifyingReader(archive, locked) if locked else archive
+        result = extract_nuke_sources(
+            reader, target_folder, spec, options.file_store
+        )
+        if locked:
+            try:
+                reader.verify()
+            except ValueError:
+                shutil.rmtree(target_folder, ignore_errors=True)
+                raise
+        if manifest is None and options.scan_includes:
+            manifest = replace(
+                compute_retain_manifest(target_folder), nuke_source=url
+            )
+            if manifest.paths:
+                files_removed, bytes_removed = prune_to_manifest(
+                    target_folder, manifest
+                )
+                manifest.write(manifest_path)
+                result.files_written -= files_removed
+                result.bytes_written -= bytes_removed
+                result.members_skipped += files_removed
+                result.bytes_skipped += bytes_removed
+            else:
+                msg = f"Found no files to retain in '{url}', keeping all."
+                logger.warning(msg)
+        extract_span.add(
+            byte_count=result.bytes_written, item_count=result.files_written
+        )
+    marker.write_text(url)
+    return result
+
+
+def _is_installer(member_name: str) -> bool:
+    """Return if the archive member is the Nuke installer."""
+    name = PurePosixPath(member_name).name
+    return name.endswith((".run", "-installer"))
@@ -0,0 +1,249 @@
+"""Content-addressed store for the files of extracted Nuke sources.
+
+Most headers and cmake files are identical between minor versions. The
+store keeps every unique file once and hard links it into the prepared
+sources of each version, so the matrix takes the disk space of a single
+version plus its differences.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, TYPE_CHECKING
+
+from nukedockerbuild.files import CHUNK_SIZE
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from contextlib import AbstractContextManager
+
+logger = logging.getLogger(__name__)
+
+FILE_STORE_DIRECTORY = Path("build/cache/sources")
+"""File store relative to the base level directory."""
+
+DEFAULT_MODE = 0o644
+"""Mode of files whose installer member has no mode."""
+
+_COPY_ERRORS = (errno.EXDEV, errno.EMLINK, errno.EPERM)
+"""Errors of hard links that fall back to a copy, like another device."""
+
+
+@dataclass
+class FileStoreReport:
+    """Sizes of the store compared to a copy per prepared tree."""
+
+    objects: int
+    stored_bytes: int
+    """Size of all files in the store, every file counted once."""
+    linked_files: int
+    """Amount of files in prepared trees that link to the store."""
+    logical_bytes: int
+    """Size of all linked files, as if every tree had its own copy."""
+
+    @property
+    def ratio(self) -> float:
+        """Return the logical size relative to the stored size."""
+        if not self.stored_bytes:
+            return 0.0
+        return self.logical_bytes / self.stored_bytes
+
+    def to_dict(self) -> dict:
+        """Return the report as a JSON serializable dict."""
+        return {
+            "objects": self.objects,
+            "stored_bytes": self.stored_bytes,
+            "linked_files": self.linked_files,
+            "logical_bytes": self.logical_bytes,
+            "ratio": round(self.ratio, 2),
+        }
+
+
+@dataclass
+class FileStore:
+    """Files stored by content and mode, hard linked into prepared trees.
+
+    Layout of the store directory:
+        objects/<sha256>-<mode>: stored file, read by every link to it.
+        members/<key digest>: name of the object an installer member was
+            stored as, a candidate that is verified before linking.
+        tmp/: files that are being written.
+        lock: shared while storing, exclusive while pruning.
+
+    Objects are created with a hard link that fails if the object exists,
+    so concurrent extractions of the same file end up with a single
+    object without further locking. Files in prepared trees share their
+    inode with the object, so they need to be removed before they are
+    replaced, never written to.
+    """
+
+    directory: Path
+
+    def __post_init__(self) -> None:
+        """Create the directories of the store."""
+        for name in ("objects", "members", "tmp"):
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+
+    def link_or_store(
+        self,
+        destination: Path,
+        mode: int,
+        open_source: Callable[[], AbstractContextManager[IO[bytes]]],
+        key: str | None = None,
+    ) -> bool:
+        """Link the file to destination, storing its content if it is new.
+
+        Args:
+            destination: path in the prepared tree to link the file to.
+            mode: permission bits of the file, part of its identity.
+            open_source: opens the content, only called if it is needed.
+            key: identity of the source known without reading it, like
+                the name, CRC-32 and size of an installer member. A file
+                stored under the same key is only hashed, not written,
+                and linked if its SHA-256 matches. Keys can collide, so
+                they never decide on their own.
+
+        Returns:
+            True if the content was in the store already.
+        """
+        mode = mode or DEFAULT_MODE
+        with self._locked(fcntl.LOCK_SH):
+            object_path = self._member_object(key) if key else None
+            if object_path is not None:
+                with open_source() as source:
+                    name = f"{_sha256(source)}-{mode:o}"
+                if name == object_path.name:
+                    self._link(object_path, destination)
+                    return True
+            with open_source() as source:
+                object_path, existed = self._store(source, mode)
+            if key:
+                self._record_member(key, object_path)
+            self._link(object_path, destination)
+            return existed
+
+    def report(self) -> FileStoreReport:
+        """Return the size of the store and of the trees linking to it.
+
+        Returns:
+            sizes of the store compared to a copy per prepared tree.
+        """
+        report = FileStoreReport(0, 0, 0, 0)
+        for path in (self.directory / "objects").iterdir():
+            status = path.lstat()
+            links = status.st_nlink - 1
+            report.objects += 1
+            report.stored_bytes += status.st_size
+            report.linked_files += links
+            report.logical_bytes += status.st_size * links
+        return report
+
+    def prune(self) -> int:
+        """Remove objects that no prepared tree links to anymore.
+
+        Returns:
+            amount of bytes removed.
+        """
+        removed = 0
+        with self._locked(fcntl.LOCK_EX):
+            for path in (self.directory / "objects").iterdir():
+                status = path.lstat()
+                if status.st_nlink == 1:
+                    removed += status.st_size
+                    path.unlink()
+            objects = self.directory / "objects"
+            for path in (self.directory / "members").iterdir():
+                if not (objects / path.read_text()).is_file():
+                    path.unlink()
+        return removed
+
+    @contextmanager
+    def _locked(self, operation: int) -> Iterator[None]:
+        """Hold the lock of the store, shared or exclusive."""
+        with (self.directory / "lock").open("a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _store(self, source: IO[bytes], mode: int) -> tuple[Path, bool]:
+        """Hash and store the content, unless it is stored already.
+
+        Returns:
+            path of the object and if it existed already.
+        """
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(
+            dir=self.directory / "tmp", delete=False
+        ) as file:
+            while chunk := source.read(CHUNK_SIZE):
+                file.write(chunk)
+                digest.update(chunk)
+        temp_path = Path(file.name)
+        object_path = (
+            self.directory / "objects" / f"{digest.hexdigest()}-{mode:o}"
+        )
+        try:
+            temp_path.chmod(mode)
+            os.link(temp_path, object_path)
+        except FileExistsError:
+            return object_path, True
+        finally:
+            temp_path.unlink()
+        return object_path, False
+
+    def _member_object(self, key: str) -> Path | None:
+        """Return the object stored for the key, if it still exists."""
+        try:
+            name = self._member_path(key).read_text()
+        except FileNotFoundError:
+            return None
+        object_path = self.directory / "objects" / name
+        return object_path if object_path.is_file() else None
+
+    def _record_member(self, key: str, object_path: Path) -> None:
+        """Remember the object of the key, replacing the file atomically."""
+        member_path = self._member_path(key)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.directory / "tmp", delete=False
+        ) as file:
+            file.write(object_path.name)
+        Path(file.name).replace(member_path)
+
+    def _member_path(self, key: str) -> Path:
+        """Return the path remembering the object of a key."""
+        return (
+            self.directory
+            / "members"
+            / hashlib.sha256(key.encode()).hexdigest()
+        )
+
+    def _link(self, object_path: Path, destination: Path) -> None:
+        """Hard link the object to destination, copying if not possible."""
+        destination.unlink(missing_ok=True)
+        try:
+            os.link(object_path, destination)
+        except OSError as exception:
+            if exception.errno not in _COPY_ERRORS:
+                raise
+            shutil.copy2(object_path, destination)
+
+
+def _sha256(source: IO[bytes]) -> str:
+    """Return the SHA-256 of the content, reading it in chunks."""
+    digest = hashlib.sha256()
+    while chunk := source.read(CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,321 @@
+"""Include graph of the NDK examples, to retain only the files they need.
+
+The headers and libraries of a Nuke install are reduced to the headers
+the NDK examples include, directly or through other headers, and the
+libraries the shipped cmake config links. The result is written as a
+retain manifest next to the dockerfile, which the extraction uses to skip
+everything else.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.files import write_atomic
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+logger = logging.getLogger(__name__)
+
+RETAIN_MANIFEST = "_nuke_sources.retain"
+"""Manifest next to the dockerfile, listing the Nuke files to keep."""
+
+INCLUDE_DIRECTORY = "include"
+EXAMPLES_DIRECTORY = "tests"
+"""Folder the NDK examples are extracted to, the roots of the graph."""
+CMAKE_DIRECTORY = "cmake"
+
+SOURCE_SUFFIXES = (".c", ".cc", ".cpp", ".cxx", ".h", ".hh", ".hpp", ".hxx")
+"""Files in the examples that are scanned for includes."""
+
+_HEADER = (
+    "# Nuke files retained by nuke-dockerbuild, do not edit.\n"
+    "# Remove this file to extract and scan the sources again.\n"
+)
+_NUKE_SOURCE = "# nuke_source: "
+"""Comment with the installer URL the manifest is computed from."""
+_INCLUDE = re.compile(
+    rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\n]+)[>"]', re.MULTILINE
+)
+_CMAKE_TOKEN = re.compile(r"[\w.+-]+")
+_LIBRARY_NAME = re.compile(r"^lib(.+?)\.(?:so|a)(?:\.[\d.]+)?$")
+
+
+@dataclass(frozen=True)
+class RetainManifest:
+    """Files of a Nuke install that are needed to build plugins."""
+
+    paths: frozenset[str]
+    """Paths relative to the Nuke sources folder."""
+    nuke_source: str | None = None
+    """URL of the installer the manifest is computed from."""
+
+    @classmethod
+    def load(cls, path: Path) -> RetainManifest | None:
+        """Read the manifest, if it exists.
+
+        Args:
+            path: path of the manifest.
+
+        Returns:
+            the manifest, or None if it does not exist.
+        """
+        if not path.is_file():
+            return None
+        lines = path.read_text().splitlines()
+        return cls(
+            frozenset(
+                line for line in lines if line and not line.startswith("#")
+            ),
+            next(
+                (
+                    line.removeprefix(_NUKE_SOURCE)
+                    for line in lines
+                    if line.startswith(_NUKE_SOURCE)
+                ),
+                None,
+            ),
+        )
+
+    def applies_to(self, nuke_source: str) -> bool:
+        """Return if the manifest can be used to prune the installer.
+
+        A manifest of another installer could miss files this one needs,
+        and a manifest without files would remove every file.
+
+        Args:
+            nuke_source: URL of the installer to prune.
+
+        Returns:
+            True if the manifest lists files and is computed from it.
+        """
+        return bool(self.paths) and self.nuke_source == nuke_source
+
+    def write(self, path: Path) -> None:
+        """Write the manifest atomically, sorted by path.
+
+        Raises:
+            ValueError: if the manifest does not list any file.
+        """
+        if not self.paths:
+            msg = f"Refusing to write retain manifest '{path}' without files."
+            raise ValueError(msg)
+        header = _HEADER
+        if self.nuke_source:
+            header += f"{_NUKE_SOURCE}{self.nuke_source}\n"
+        write_atomic(
+            path, header + "".join(f"{line}\n" for line in sorted(self.paths))
+        )
+
+
+def find_includes(source: Path) -> list[tuple[str, bool]]:
+    """Return the includes of a source file in order.
+
+    Args:
+        source: the C or C++ file to scan.
+
+    Returns:
+        the included name and if it is quoted instead of angled.
+    """
+    return [
+        (name.decode(errors="replace").strip(), bracket == b'"')
+        for bracket, name in _INCLUDE.findall(source.read_bytes())
+    ]
+
+
+def resolve_include(
+    name: str,
+    *,
+    quoted: bool,
+    including_file: Path,
+    include_directories: list[Path],
+) -> Path | None:
+    """Return the header an include refers to, like the compiler would.
+
+    Args:
+        name: the included name, like DDImage/Iop.h.
+        quoted: quoted includes are looked up next to the including file
+            first.
+        including_file: the file containing the include.
+        include_directories: directories to look the header up in.
+
+    Returns:
+        path of the header, or None for headers outside of the install,
+        like the standard library.
+    """
+    directories = [including_file.parent] if quoted else []
+    directories.extend(include_directories)
+    for directory in directories:
+        candidate = directory / name
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def scan_includes(
+    sources: Iterable[Path], include_directories: list[Path]
+) -> set[Path]:
+    """Return every header that the sources include, transitively.
+
+    Args:
+        sources: the files to start from.
+        include_directories: directories to look headers up in.
+
+    Returns:
+        the resolved headers, without the sources themselves.
+    """
+    # Paths are normalized without resolving symbolic links, so a header
+    # included through a link is found under the name it is included by.
+    sources = [_normalize(source) for source in sources]
+    include_directories = [_normalize(path) for path in include_directories]
+    seen = set(sources)
+    queue = deque(sources)
+    while queue:
+        current = queue.popleft()
+        for name, quoted in find_includes(current):
+            header = resolve_include(
+                name,
+                quoted=quoted,
+                including_file=current,
+                include_directories=include_directories,
+            )
+            if header is None:
+                continue
+            header = _normalize(header)
+            if header not in seen:
+                seen.add(header)
+                queue.append(header)
+    return seen.difference(sources)
+
+
+def find_link_libraries(root: Path) -> set[Path]:
+    """Return the libraries of the install that its cmake config links.
+
+    A library is linked if its name without lib prefix and suffix is
+    referenced in any of the cmake files, by itself or as file name. All
+    versions of the library are kept, and symbolic links are followed so
+    the libraries they point to are kept as well.
+
+    Args:
+        root: the Nuke sources folder.
+
+    Returns:
+        paths of the libraries in the root of the install.
+    """
+    tokens: set[str] = set()
+    for cmake_file in sorted((root / CMAKE_DIRECTORY).rglob("*")):
+        if cmake_file.is_file():
+            tokens.update(
+                _CMAKE_TOKEN.findall(cmake_file.read_text(errors="replace"))
+            )
+    tokens.update(
+        match.group(1)
+        for match in map(_LIBRARY_NAME.match, list(tokens))
+        if match
+    )
+    libraries = set()
+    for path in root.iterdir():
+        match = _LIBRARY_NAME.match(path.name)
+        if not match or match.group(1) not in tokens:
+            continue
+        library = path
+        libraries.add(library)
+        while library.is_symlink():
+            library = library.parent / library.readlink()
+            if library.parent != root:
+                break
+            libraries.add(library)
+    return libraries
+
+
+def compute_retain_manifest(root: Path) -> RetainManifest:
+    """Compute the files of an extracted install that plugins need.
+
+    Headers and libraries are reduced to the headers the examples include
+    and the libraries the cmake config links. Other folders, like the
+    examples and cmake config themselves, are kept completely.
+
+    Args:
+        root: the Nuke sources folder, extracted with the retain spec.
+
+    Returns:
+        the manifest of files to keep.
+    """
+    include_directory = root / INCLUDE_DIRECTORY
+    sources = [
+        path
+        for path in sorted((root / EXAMPLES_DIRECTORY).rglob("*"))
+        if path.is_file() and path.suffix in SOURCE_SUFFIXES
+    ]
+    headers = scan_includes(sources, [include_directory])
+    root = _normalize(root)
+    paths = set()
+    for header in headers:
+        # A linked header needs the header it links to as well.
+        for path in (header, _normalize(header.resolve())):
+            if path.is_relative_to(root):
+                paths.add(path.relative_to(root).as_posix())
+    paths.update(
+        library.relative_to(root).as_posix()
+        for library in find_link_libraries(root)
+    )
+    for directory in root.iterdir():
+        if directory.name == INCLUDE_DIRECTORY or not directory.is_dir():
+            continue
+        paths.update(
+            path.relative_to(root).as_posix()
+            for path in directory.rglob("*")
+            if not path.is_dir()
+        )
+    msg = (
+        f"Retaining {len(headers)} headers included by {len(sources)} "
+        f"example files, {len(paths)} files in total."
+    )
+    logger.info(msg)
+    return RetainManifest(frozenset(paths))
+
+
+def _normalize(path: Path) -> Path:
+    """Return the absolute path without . and .. parts."""
+    return Path(os.path.normpath(path.absolute()))
+
+
+def prune_to_manifest(
+    root: Path, manifest: RetainManifest
+) -> tuple[int, int]:
+    """Remove every file that is not in the manifest, and empty folders.
+
+    Args:
+        root: the Nuke sources folder.
+        manifest: the files to keep.
+
+    Raises:
+        ValueError: if the manifest does not list any file.
+
+    Returns:
+        amount of files and bytes removed.
+    """
+    if not manifest.paths:
+        msg = f"Refusing to remove every file in '{root}', no files retained."
+        raise ValueError(msg)
+    files_removed = 0
+    bytes_removed = 0
+    # Reversed, the files in a folder come before the folder itself.
+    for path in sorted(root.rglob("*"), reverse=True):
+        if path.is_dir() and not path.is_symlink():
+            if not any(path.iterdir()):
+                path.rmdir()
+        elif path.relative_to(root).as_posix() not in manifest.paths:
+            files_removed += 1
+            bytes_removed += path.lstat().st_size
+            path.unlink()
+    return files_removed, bytes_removed
@@ -0,0 +1,333 @@
+"""Lock file pinning the size and checksum of every Nuke installer.
+
+The lock is a plain text file with a line per version and operating
+system, so the download scripts can read it with awk:
+
+    # version system sha256 size etag url
+    15.1 linux 3b5d...e1 1890317245 "a1b2" https://.../Nuke15.1v7.tgz
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO
+
+import requests
+
+from nukedockerbuild.files import CHUNK_SIZE, write_atomic
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from nukedockerbuild.sources.downloader import DownloadCache
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = Path("sources.lock")
+"""Lock file relative to the base level directory, next to dockerfiles."""
+
+_HEADER = (
+    "# Nuke installers pinned by nuke-dockerbuild, do not edit.\n"
+    "# version system sha256 size etag url\n"
+)
+_MISSING = "-"
+"""Placeholder for a missing ETag, as columns are split on whitespace."""
+_COLUMNS = 6
+"""Columns of a line, the URL is last as the only one with spaces."""
+
+
+@dataclass(frozen=True)
+class LockedSource:
+    """Installer pinned for a single version and operating system."""
+
+    nuke_version: str
+    """Nuke version as used in the dockerfiles tree, for example 15.1."""
+    operating_system: str
+    url: str
+    sha256: str
+    size: int
+    etag: str | None = None
+
+    @property
+    def key(self) -> tuple[str, str]:
+        """Return the version and operating system the source is for."""
+        return self.nuke_version, self.operating_system
+
+    def to_line(self) -> str:
+        """Return the source as a line of the lock file."""
+        return " ".join(
+            (
+                self.nuke_version,
+                self.operating_system,
+                self.sha256,
+                str(self.size),
+                self.etag or _MISSING,
+                self.url,
+            )
+        )
+
+    @classmethod
+    def from_line(cls, line: str) -> LockedSource:
+        """Parse a line of the lock file.
+
+        Args:
+            line: line containing the six columns.
+
+        Raises:
+            ValueError: if the line does not contain a valid source.
+
+        Returns:
+            the parsed source.
+        """
+        columns = line.split(maxsplit=_COLUMNS - 1)
+        if len(columns) != _COLUMNS or not columns[3].isdigit():
+            msg = f"Invalid line in sources lock: '{line}'."
+            raise ValueError(msg)
+        nuke_version, operating_system, sha256, size, etag, url = columns
+        return cls(
+            nuke_version=nuke_version,
+            operating_system=operating_system,
+            url=url,
+            sha256=sha256,
+            size=int(size),
+            etag=None if etag == _MISSING else etag,
+        )
+
+
+@dataclass
+class SourcesLock:
+    """Pinned installers of the dockerfiles tree, by version and system."""
+
+    path: Path
+    sources: dict[tuple[str, str], LockedSource] = field(
+        default_factory=dict
+    )
+
+    @classmethod
+    def load(cls, path: Path) -> SourcesLock:
+        """Read the lock file, or return an empty lock if it is missing.
+
+        Args:
+            path: path of the lock file.
+
+        Raises:
+            ValueError: if the lock file contains an invalid line.
+
+        Returns:
+            the lock with all pinned sources.
+        """
+        lock = cls(path)
+        if not path.is_file():
+            return lock
+        for line in path.read_text().splitlines():
+            if not line.strip() or line.startswith("#"):
+                continue
+            source = LockedSource.from_line(line)
+            lock.sources[source.key] = source
+        return lock
+
+    def get(
+        self, nuke_version: str, operating_system: str, url: str
+    ) -> LockedSource | None:
+        """Return the pinned source, if it is pinned for this URL.
+
+        Args:
+            nuke_version: Nuke version, for example 15.1.
+            operating_system: operating system, for example linux.
+            url: the URL the dockerfile installs from.
+
+        Returns:
+            the pinned source, or None if it is not pinned or the URL
+            changed since it was pinned.
+        """
+        source = self.sources.get((nuke_version, operating_system))
+        if source is None or source.url != url:
+            return None
+        return source
+
+    def update(
+        self,
+        wanted: Iterable[tuple[str, str, str]],
+        *,
+        workers: int = 4,
+        download_cache: DownloadCache | None = None,
+        prune: bool = False,
+        timeout: int = 30,
+    ) -> list[LockedSource]:
+        """Pin every wanted source that is not pinned for its URL yet.
+
+        A URL that is pinned already, for any version, is reused. Other
+        URLs are read from the download cache if available, otherwise they
+        are downloaded and hashed as a stream in parallel, without storing
+        them.
+
+        Args:
+            wanted: the version, operating system and URL of each source.
+            workers: amount of URLs to hash at the same time.
+            download_cache: cache to read hashes of downloads from.
+            prune: remove pinned sources that are not wanted anymore.
+            timeout: timeout for connecting and reading in seconds.
+
+        Raises:
+            ValueError: if a source could not be downloaded completely.
+
+        Returns:
+            the sources that were pinned by this update.
+        """
+        wanted = list(wanted)
+        known = {source.url: source for source in self.sources.values()}
+        added: list[LockedSource] = []
+        to_hash: list[str] = []
+        for nuke_version, operating_system, url in wanted:
+            if self.get(nuke_version, operating_system, url):
+                continue
+            known_source = known.get(url)
+            if known_source is None and download_cache:
+                known_source = download_cache.lookup(url)
+            if known_source is None:
+                to_hash.append(url)
+                continue
+            added.append(
+                self._pin(
+                    LockedSource(
+                        nuke_version,
+                        operating_system,
+                        url,
+                        known_source.sha256,
+                        known_source.size,
+                        known_source.etag,
+                    )
+                )
+            )
+
+        unique_urls = list(dict.fromkeys(to_hash))
+        with ThreadPoolExecutor(
+            max_workers=max(workers, 1), thread_name_prefix="lock"
+        ) as executor:
+            hashes = dict(
+                zip(
+                    unique_urls,
+                    executor.map(
+                        partial(hash_url, timeout=timeout), unique_urls
+                    ),
+                    strict=True,
+                )
+            )
+        added.extend(
+            self._pin(
+                LockedSource(
+                    nuke_version, operating_system, url, *hashes[url]
+                )
+            )
+            for nuke_version, operating_system, url in wanted
+            if url in hashes
+        )
+        if prune:
+            keys = {(version, system) for version, system, _ in wanted}
+            self.sources = {
+                key: source
+                for key, source in self.sources.items()
+                if key in keys
+            }
+        msg = f"Pinned {len(added)} new sources, {len(self.sources)} total."
+        logger.info(msg)
+        return added
+
+    def _pin(self, source: LockedSource) -> LockedSource:
+        """Pin a single source, replacing the one pinned before."""
+        self.sources[source.key] = source
+        return source
+
+    def write(self) -> None:
+        """Write the lock file atomically, sorted by version and system."""
+        lines = [
+            source.to_line()
+            for _, source in sorted(
+                self.sources.items(),
+                key=lambda item: (float(item[0][0]), item[0][1]),
+            )
+        ]
+        write_atomic(
+            self.path, _HEADER + "".join(f"{line}\n" for line in lines)
+        )
+
+
+def hash_url(url: str, timeout: int = 30) -> tuple[str, int, str | None]:
+    """Download URL as a stream and hash it, without storing it.
+
+    Args:
+        url: the URL to hash.
+        timeout: timeout for connecting and reading in seconds.
+
+    Raises:
+        ValueError: if the download failed or is incomplete.
+
+    Returns:
+        sha256 hex digest, size in bytes and ETag of the content.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        if response.status_code != HTTPStatus.OK:
+            msg = f"Download of '{url}' returned {response.status_code}."
+            raise ValueError(msg)
+        for chunk in response.iter_content(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+        expected_size = response.headers.get("Content-Length")
+        etag = response.headers.get("ETag")
+    if expected_size is not None and size != int(expected_size):
+        msg = (
+            f"Download of '{url}' is incomplete, received {size} of "
+            f"{expected_size} bytes."
+        )
+        raise ValueError(msg)
+    msg = f"Hashed '{url}' ({size} bytes)."
+    logger.info(msg)
+    return digest.hexdigest(), size, etag
+
+
+class VerifyingReader:
+    """Binary stream that hashes everything read through it.
+
+    Wrap the stream of an installer in it to verify the installer against
+    its pinned source while it is being extracted.
+    """
+
+    def __init__(self, stream: BinaryIO, source: LockedSource) -> None:
+        self._stream = stream
+        self._source = source
+        self._digest = hashlib.sha256()
+        self._size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from the stream, hashing the data that is read."""
+        data = self._stream.read(size)
+        self._digest.update(data)
+        self._size += len(data)
+        return data
+
+    def verify(self) -> None:
+        """Read the rest of the stream and compare it to the pinned source.
+
+        Raises:
+            ValueError: if the content does not match the pinned source.
+        """
+        while self.read(CHUNK_SIZE):
+            pass
+        sha256 = self._digest.hexdigest()
+        if (sha256, self._size) != (self._source.sha256, self._source.size):
+            msg = (
+                f"Installer '{self._source.url}' does not match the sources "
+                f"lock, expected '{self._source.sha256}' ({self._source.size} "
+                f"bytes) but got '{sha256}' ({self._size} bytes)."
+            )
+            raise ValueError(msg)
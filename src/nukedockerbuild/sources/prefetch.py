@@ -0,0 +1,299 @@
+"""Prefetch of every installer in the dockerfiles tree into the cache.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.builder.targets import (
+    find_build_targets,
+    read_nuke_source,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from nukedockerbuild.sources.downloader import (
+        CachedDownload,
+        DownloadCache,
+    )
+    from nukedockerbuild.sources.lockfile import SourcesLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+"""Amount of installers that are downloaded at the same time."""
+
+
+@dataclass(frozen=True)
+class PrefetchSource:
+    """Installer referenced by at least one dockerfile."""
+
+    url: str
+    sha256: str | None = None
+    """Pinned hash of the installer, if it is in the sources lock."""
+    size: int | None = None
+    """Pinned size of the installer, if it is in the sources lock."""
+
+
+def find_sources(
+    directory: Path, sources_lock: SourcesLock | None = None
+) -> list[PrefetchSource]:
+    """Return every unique installer of the dockerfiles tree.
+
+    Args:
+        directory: base level directory containing the dockerfiles.
+        sources_lock: lock to read the pinned hash and size from, if any.
+
+    Returns:
+        the installers in the order of the build targets.
+    """
+    sources: dict[str, PrefetchSource] = {}
+    for target in find_build_targets(directory):
+        url = read_nuke_source(directory / target.dockerfile)
+        if url is None or url in sources:
+            continue
+        locked = (
+            sources_lock.get(
+                target.nuke_version, target.operating_system.value, url
+            )
+            if sources_lock
+            else None
+        )
+        sources[url] = PrefetchSource(
+            url,
+            sha256=locked.sha256 if locked else None,
+            size=locked.size if locked else None,
+        )
+    return list(sources.values())
+
+
+@dataclass
+class BandwidthLimiter:
+    """Token bucket limiting the bytes per second of all downloads.
+
+    Every chunk takes its size from the bucket, running into debt if it
+    is empty. The thread that took the chunk sleeps until the debt is
+    refilled, which spreads the bandwidth over all downloads.
+    """
+
+    bytes_per_second: float
+    burst: float | None = None
+    """Bytes that can be taken at once, defaults to a second of bandwidth."""
+    _tokens: float = field(init=False, repr=False)
+    _updated: float = field(init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        """Start with a full bucket."""
+        if self.bytes_per_second <= 0:
+            msg = "The bandwidth limit needs to be more than 0 bytes/s."
+            raise ValueError(msg)
+        if self.burst is None:
+            self.burst = self.bytes_per_second
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def acquire(self, byte_count: int) -> None:
+        """Take bytes from the bucket, sleeping until they are available.
+
+        Args:
+            byte_count: amount of bytes that were downloaded.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated) * self.bytes_per_second,
+            )
+            self._updated = now
+            self._tokens -= byte_count
+            wait = -self._tokens / self.bytes_per_second
+        if wait > 0:
+            time.sleep(wait)
+
+
+@dataclass
+class PrefetchProgress:
+    """Progress of all downloads together, logged at an interval."""
+
+    total_files: int
+    total_bytes: int = 0
+    """Bytes of all installers, as far as they are known from the lock."""
+    interval: float = 5.0
+    """Minimum seconds between two progress messages."""
+    done_files: int = 0
+    failed_files: int = 0
+    downloaded_bytes: int = 0
+    started: float = field(default_factory=time.monotonic)
+    _logged: float = field(default=0.0, init=False, repr=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def add(self, byte_count: int) -> None:
+        """Record downloaded bytes, logging progress if it is time to."""
+        with self._lock:
+            self.downloaded_bytes += byte_count
+            self._log_if_due()
+
+    def finish(self, *, failed: bool = False) -> None:
+        """Record a finished installer and log the progress."""
+        with self._lock:
+            if failed:
+                self.failed_files += 1
+            else:
+                self.done_files += 1
+            self._log_if_due(force=True)
+
+    @property
+    def seconds(self) -> float:
+        """Return seconds since the prefetch started."""
+        return time.monotonic() - self.started
+
+    def format(self) -> str:
+        """Return the progress as a single line."""
+        seconds = self.seconds
+        rate = self.downloaded_bytes / seconds if seconds else 0.0
+        size = _megabytes(self.downloaded_bytes)
+        if self.total_bytes:
+            size = f"{size} of {_megabytes(self.total_bytes)}"
+        return (
+            f"Prefetched {self.done_files}/{self.total_files} installers, "
+            f"{self.failed_files} failed, {size} MB downloaded at "
+            f"{_megabytes(rate)} MB/s."
+        )
+
+    def _log_if_due(self, *, force: bool = False) -> None:
+        """Log the progress if the interval passed, lock held by caller."""
+        now = time.monotonic()
+        if not force and now - self._logged < self.interval:
+            return
+        self._logged = now
+        msg = self.format()
+        logger.info(msg)
+
+
+@dataclass
+class PrefetchResult:
+    """Result of prefetching a single installer."""
+
+    url: str
+    cached: CachedDownload | None = None
+    error: str | None = None
+    """Reason the installer could not be prefetched, if it failed."""
+
+    def to_dict(self) -> dict:
+        """Return the result as a JSON serializable dict."""
+        return {
+            "url": self.url,
+            "sha256": self.cached.sha256 if self.cached else None,
+            "size": self.cached.size if self.cached else None,
+            "error": self.error,
+        }
+
+
+@dataclass
+class PrefetchSummary:
+    """Results of prefetching all installers."""
+
+    results: list[PrefetchResult]
+    seconds: float
+    downloaded_bytes: int
+    """Bytes downloaded by this prefetch, excluding cached installers."""
+
+    @property
+    def failed(self) -> list[PrefetchResult]:
+        """Return the installers that could not be prefetched."""
+        return [result for result in self.results if result.error]
+
+    def to_dict(self) -> dict:
+        """Return the summary as a JSON serializable dict."""
+        return {
+            "seconds": round(self.seconds, 3),
+            "downloaded_bytes": self.downloaded_bytes,
+            "results": [result.to_dict() for result in self.results],
+        }
+
+
+@dataclass
+class Prefetcher:
+    """Download installers into the download cache with a worker pool."""
+
+    download_cache: DownloadCache
+    concurrency: int = DEFAULT_CONCURRENCY
+    max_bytes_per_second: float | None = None
+    """Bandwidth cap shared by all downloads, unlimited if None."""
+    progress_interval: float = 5.0
+    """Minimum seconds between two progress messages."""
+
+    def __post_init__(self) -> None:
+        """Validate the amount of workers."""
+        if self.concurrency < 1:
+            msg = "Prefetching needs a concurrency of at least 1."
+            raise ValueError(msg)
+
+    def prefetch(self, sources: list[PrefetchSource]) -> PrefetchSummary:
+        """Download every source that is not cached yet.
+
+        A failed download does not stop the others, it is reported in the
+        summary instead.
+
+        Args:
+            sources: the installers to download.
+
+        Returns:
+            the result per installer, in the order of the sources.
+        """
+        limiter = (
+            BandwidthLimiter(self.max_bytes_per_second)
+            if self.max_bytes_per_second
+            else None
+        )
+        progress = PrefetchProgress(
+            len(sources),
+            total_bytes=sum(source.size or 0 for source in sources),
+            interval=self.progress_interval,
+        )
+
+        def on_chunk(byte_count: int) -> None:
+            progress.add(byte_count)
+            if limiter:
+                limiter.acquire(byte_count)
+
+        def fetch(source: PrefetchSource) -> PrefetchResult:
+            try:
+                cached = self.download_cache.fetch(
+                    source.url, source.sha256, on_chunk
+                )
+            except (OSError, ValueError) as exception:
+                msg = f"Prefetching '{source.url}' failed: {exception}"
+                logger.warning(msg)
+                progress.finish(failed=True)
+                return PrefetchResult(source.url, error=str(exception))
+            progress.finish()
+            return PrefetchResult(source.url, cached=cached)
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="prefetch"
+        ) as executor:
+            results = list(executor.map(fetch, sources))
+        return PrefetchSummary(
+            results,
+            seconds=progress.seconds,
+            downloaded_bytes=progress.downloaded_bytes,
+        )
+
+
+def _megabytes(byte_count: float) -> str:
+    """Return bytes as megabytes with a single decimal."""
+    return f"{byte_count / 1024 / 1024:.1f}"
@@ -0,0 +1,185 @@
+"""Split of prepared Nuke sources in files shared by a major and a delta.
+
+Minor versions of the same major ship mostly identical headers, cmake
+files and libraries. Files that every prepared minor of a major has in
+common are moved to a shared folder next to each dockerfile, which is
+copied in its own layer before the per-minor delta. The shared files get
+a fixed modification time, so every minor copies an identical layer and
+a runner pulling several minors fetches it once.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.files import CHUNK_SIZE
+from nukedockerbuild.sources.extractor import (
+    SHARED_SOURCES_DIRECTORY,
+    SOURCES_DIRECTORY,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SHARED_MTIME = 315532800
+"""Modification time of shared files and folders, 1980-01-01."""
+
+
+@dataclass
+class SharedSourcesResult:
+    """Statistics of splitting the sources of a single major."""
+
+    versions: int
+    shared_files: int = 0
+    """Files in the shared folder of every version."""
+    shared_bytes: int = 0
+    delta_files: int = 0
+    """Files left in the sources folders of all versions together."""
+    delta_bytes: int = 0
+
+
+def split_shared_sources(
+    dockerfile_directories: list[Path],
+) -> SharedSourcesResult:
+    """Move the files that all versions have in common to shared folders.
+
+    Files count as common if they have the same path, mode and content,
+    or for symbolic links the same target. Earlier splits are merged back
+    first, so adding a version to the major recomputes the shared files.
+
+    Args:
+        dockerfile_directories: directories of the dockerfiles of a
+            single major, each with prepared Nuke sources.
+
+    Returns:
+        statistics of the split.
+    """
+    result = SharedSourcesResult(len(dockerfile_directories))
+    if not dockerfile_directories:
+        return result
+    trees = [_merge_shared(directory) for directory in dockerfile_directories]
+    roots = [
+        directory / SOURCES_DIRECTORY for directory in dockerfile_directories
+    ]
+    candidates = set.intersection(
+        *(
+            {(path, _shallow_identity(root / path)) for path in tree}
+            for root, tree in zip(roots, trees, strict=True)
+        )
+    )
+    # Content is only read for files whose path, mode and size match.
+    hashes: dict[tuple[int, int], str] = {}
+    common = {
+        path
+        for path, _ in candidates
+        if len({_identity(root / path, hashes) for root in roots}) == 1
+    }
+    result.shared_files = len(common)
+    result.shared_bytes = sum(
+        (roots[0] / path).lstat().st_size for path in common
+    )
+    for directory, root, tree in zip(
+        dockerfile_directories, roots, trees, strict=True
+    ):
+        shared = directory / SHARED_SOURCES_DIRECTORY
+        shared.mkdir()
+        for path in tree:
+            if path not in common:
+                result.delta_files += 1
+                result.delta_bytes += (root / path).lstat().st_size
+                continue
+            destination = shared / path
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            (root / path).rename(destination)
+        _remove_empty_folders(root)
+        _set_shared_mtime(shared)
+    msg = (
+        f"Shared {result.shared_files} files ({result.shared_bytes} bytes) "
+        f"by {result.versions} versions, {result.delta_files} files "
+        f"({result.delta_bytes} bytes) differ."
+    )
+    logger.info(msg)
+    return result
+
+
+def _merge_shared(directory: Path) -> set[str]:
+    """Move an earlier split back into the sources folder.
+
+    Files in the sources folder take precedence, as they are newer than
+    the shared files if the sources were prepared again.
+
+    Returns:
+        paths of all files and links in the sources folder.
+    """
+    sources = directory / SOURCES_DIRECTORY
+    shared = directory / SHARED_SOURCES_DIRECTORY
+    if shared.is_dir():
+        for path in _files(shared):
+            destination = sources / path
+            if destination.exists() or destination.is_symlink():
+                continue
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            (shared / path).rename(destination)
+        shutil.rmtree(shared)
+    return _files(sources)
+
+
+def _files(root: Path) -> set[str]:
+    """Return the paths of all files and links below the root."""
+    return {
+        path.relative_to(root).as_posix()
+        for path in root.rglob("*")
+        if path.is_symlink() or not path.is_dir()
+    }
+
+
+def _shallow_identity(path: Path) -> tuple:
+    """Return the identity of a file without reading its content."""
+    if path.is_symlink():
+        return ("link", path.readlink().as_posix())
+    status = path.lstat()
+    return ("file", status.st_mode, status.st_size)
+
+
+def _identity(path: Path, hashes: dict[tuple[int, int], str]) -> tuple:
+    """Return the identity of a file including its content digest.
+
+    Digests are remembered per inode, so files that are hard linked from
+    the file store are read only once.
+    """
+    identity = _shallow_identity(path)
+    if identity[0] == "link":
+        return identity
+    status = path.lstat()
+    inode = (status.st_dev, status.st_ino)
+    if inode not in hashes:
+        digest = hashlib.sha256()
+        with path.open("rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+        hashes[inode] = digest.hexdigest()
+    return (*identity, hashes[inode])
+
+
+def _remove_empty_folders(root: Path) -> None:
+    """Remove folders below the root that no longer contain files."""
+    # Reversed, the contents of a folder come before the folder itself.
+    for path in sorted(root.rglob("*"), reverse=True):
+        if path.is_dir() and not path.is_symlink() and not any(path.iterdir()):
+            path.rmdir()
+
+
+def _set_shared_mtime(root: Path) -> None:
+    """Give every shared file and folder the same modification time."""
+    for path in sorted(root.rglob("*"), reverse=True):
+        os.utime(path, (SHARED_MTIME, SHARED_MTIME), follow_symlinks=False)
+    os.utime(root, (SHARED_MTIME, SHARED_MTIME))
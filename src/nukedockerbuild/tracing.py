@@ -0,0 +1,253 @@
+"""Timing spans per phase of the generator and build pipeline.
+
+Spans are recorded by the module level tracer once it is enabled, so the
+phases are instrumented without passing a tracer through every call. The
+recorded spans are exported as JSON trace and as Prometheus textfile.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from nukedockerbuild.files import write_atomic
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from contextlib import AbstractContextManager
+    from pathlib import Path
+
+PHASES: tuple[str, ...] = (
+    "fetch",
+    "parse",
+    "validate",
+    "render",
+    "plan",
+    "write",
+    "download",
+    "extract",
+    "build",
+    "export",
+)
+"""Phases of the pipeline, in the order they run."""
+
+METRIC_PREFIX = "nukedockerbuild"
+"""Prefix of all Prometheus metric names."""
+
+
+@dataclass
+class Span:
+    """Single timed run of a phase."""
+
+    phase: str
+    start: float
+    """Start as seconds since the epoch."""
+    duration: float = 0.0
+    """Duration in seconds, set once the span ends."""
+    byte_count: int = 0
+    """Amount of bytes fetched, written or processed in the span."""
+    item_count: int = 0
+    """Amount of releases, dockerfiles, files or images in the span."""
+    attributes: dict[str, str] = field(default_factory=dict)
+    thread: str = ""
+    """Name of the thread the span ran in."""
+
+    def add(self, byte_count: int = 0, item_count: int = 0) -> None:
+        """Add processed bytes and items to the span."""
+        self.byte_count += byte_count
+        self.item_count += item_count
+
+    def to_event(self) -> dict:
+        """Return the span as complete event of the trace event format.
+
+        Trace files in this format are opened by Perfetto and
+        chrome://tracing, showing every thread as its own track.
+        """
+        return {
+            "name": self.phase,
+            "cat": "phase",
+            "ph": "X",
+            "ts": round(self.start * 1_000_000),
+            "dur": round(self.duration * 1_000_000),
+            "pid": os.getpid(),
+            "tid": self.thread,
+            "args": {
+                "bytes": self.byte_count,
+                "items": self.item_count,
+                **self.attributes,
+            },
+        }
+
+
+@dataclass
+class PhaseSummary:
+    """Totals of all spans of a single phase."""
+
+    spans: int = 0
+    seconds: float = 0.0
+    byte_count: int = 0
+    item_count: int = 0
+
+    def to_dict(self) -> dict:
+        """Return the summary as a JSON serializable dict."""
+        return {
+            "spans": self.spans,
+            "seconds": round(self.seconds, 6),
+            "bytes": self.byte_count,
+            "items": self.item_count,
+        }
+
+
+@dataclass
+class Tracer:
+    """Collects the spans of a single run."""
+
+    enabled: bool = False
+    """Only record spans if enabled, so tracing costs nothing by default."""
+    spans: list[Span] = field(default_factory=list)
+    started: float = field(default_factory=time.time)
+    """Start of the run as seconds since the epoch."""
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def enable(self) -> None:
+        """Start recording spans, discarding any recorded before."""
+        with self._lock:
+            self.spans.clear()
+            self.started = time.time()
+            self.enabled = True
+
+    def disable(self) -> None:
+        """Stop recording spans."""
+        self.enabled = False
+
+    @contextmanager
+    def span(self, phase: str, **attributes: str) -> Iterator[Span]:
+        """Time the block as a span of the phase.
+
+        Args:
+            phase: the phase, one of PHASES.
+            attributes: extra information, like the target or URL.
+
+        Yields:
+            the span, to add processed bytes and items to.
+        """
+        current = Span(
+            phase=phase,
+            start=time.time(),
+            attributes=attributes,
+            thread=threading.current_thread().name,
+        )
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            current.duration = time.perf_counter() - start
+            if self.enabled:
+                with self._lock:
+                    self.spans.append(current)
+
+    def summary(self) -> dict[str, PhaseSummary]:
+        """Return the totals per phase, in the order of PHASES."""
+        summaries = {phase: PhaseSummary() for phase in PHASES}
+        with self._lock:
+            spans = list(self.spans)
+        for recorded in spans:
+            phase_summary = summaries.setdefault(
+                recorded.phase, PhaseSummary()
+            )
+            phase_summary.spans += 1
+            phase_summary.seconds += recorded.duration
+            phase_summary.byte_count += recorded.byte_count
+            phase_summary.item_count += recorded.item_count
+        return summaries
+
+    def to_trace(self) -> dict:
+        """Return all spans and the phase totals as JSON trace."""
+        with self._lock:
+            events = [recorded.to_event() for recorded in self.spans]
+        return {
+            "traceEvents": sorted(events, key=lambda event: event["ts"]),
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "started": self.started,
+                "phases": {
+                    phase: phase_summary.to_dict()
+                    for phase, phase_summary in self.summary().items()
+                },
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        """Return the phase totals in the Prometheus text format."""
+        summaries = self.summary()
+        lines = []
+        for name, help_text, value in (
+            ("phase_seconds", "Time spent per phase.", "seconds"),
+            ("phase_bytes", "Bytes processed per phase.", "byte_count"),
+            ("phase_items", "Items processed per phase.", "item_count"),
+            ("phase_spans", "Amount of spans per phase.", "spans"),
+        ):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.extend(
+                f'{metric}{{phase="{phase}"}} '
+                f"{getattr(phase_summary, value)}"
+                for phase, phase_summary in summaries.items()
+            )
+        for name, help_text, value in (
+            (
+                "run_timestamp_seconds",
+                "Start of the run as seconds since the epoch.",
+                self.started,
+            ),
+            (
+                "run_duration_seconds",
+                "Duration of the run.",
+                time.time() - self.started,
+            ),
+        ):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write_trace(self, path: Path) -> None:
+        """Write the JSON trace to path."""
+        write_atomic(path, json.dumps(self.to_trace(), indent=2))
+
+    def write_prometheus(self, path: Path) -> None:
+        """Write the Prometheus textfile to path.
+
+        The file is replaced atomically, as the node exporter textfile
+        collector may read it at any moment.
+        """
+        write_atomic(path, self.to_prometheus())
+
+
+TRACER = Tracer()
+"""Tracer that records the spans of the pipeline, once enabled."""
+
+
+def span(phase: str, **attributes: str) -> AbstractContextManager[Span]:
+    """Time the block as a span of the phase with the module tracer.
+
+    Args:
+        phase: the phase, one of PHASES.
+        attributes: extra information, like the target or URL.
+
+    Returns:
+        context manager yielding the span.
+    """
+    return TRACER.span(phase, **attributes)
+
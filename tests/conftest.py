@@ -0,0 +1,169 @@
+"""Shared fixtures for all tests.
+
+@maintainer: Gilles Vink
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING
+
+import pytest
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+
+@dataclass
+class ServedFile:
+    """File served by the local HTTP server."""
+
+    content: bytes
+    etag: str | None = None
+    supports_range: bool = True
+    truncate_after: int | None = None
+    """Drop the connection after sending this many bytes."""
+    status: int = HTTPStatus.OK
+    delay: float = 0.0
+    """Seconds to wait before responding."""
+    allow_head: bool = True
+    """Respond to HEAD requests, otherwise return 405."""
+    range_from_start: bool = False
+    """Answer range requests with a partial response from the first byte."""
+
+
+@dataclass
+class LocalHTTPServer:
+    """Local HTTP server that serves files from memory."""
+
+    url: str
+    files: dict[str, ServedFile] = field(default_factory=dict)
+    requests: list[tuple[str, str, dict[str, str]]] = field(
+        default_factory=list
+    )
+    """Method, path and headers of every request received."""
+
+    def add(self, path: str, served_file: ServedFile) -> str:
+        """Serve a file at path and return its URL."""
+        self.files[path] = served_file
+        return f"{self.url}{path}"
+
+
+def _make_handler(server: LocalHTTPServer) -> type[BaseHTTPRequestHandler]:
+    """Return a request handler serving the files of the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *_args: object) -> None:
+            """Keep the test output clean."""
+
+        def do_HEAD(self) -> None:
+            self._respond(send_body=False)
+
+        def do_GET(self) -> None:
+            self._respond(send_body=True)
+
+        def _respond(self, *, send_body: bool) -> None:
+            server.requests.append(
+                (self.command, self.path, dict(self.headers.items()))
+            )
+            served_file = server.files.get(self.path)
+            error = self._error_status(served_file, send_body=send_body)
+            if error is not None:
+                self.send_error(error)
+                return
+            if (
+                served_file.etag
+                and self.headers.get("If-None-Match") == served_file.etag
+            ):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.end_headers()
+                return
+            content = self._requested_content(served_file)
+            if content is None:
+                return
+            self.send_header("Content-Length", str(len(content)))
+            if served_file.supports_range:
+                self.send_header("Accept-Ranges", "bytes")
+            if served_file.etag:
+                self.send_header("ETag", served_file.etag)
+            self.end_headers()
+            if send_body:
+                self._send_body(served_file, content)
+
+        def _error_status(
+            self, served_file: ServedFile | None, *, send_body: bool
+        ) -> HTTPStatus | int | None:
+            """Return the error to respond with, if any."""
+            if served_file is None:
+                return HTTPStatus.NOT_FOUND
+            if served_file.delay:
+                threading.Event().wait(served_file.delay)
+            if not send_body and not served_file.allow_head:
+                return HTTPStatus.METHOD_NOT_ALLOWED
+            if served_file.status != HTTPStatus.OK:
+                return served_file.status
+            return None
+
+        def _requested_content(self, served_file: ServedFile) -> bytes | None:
+            """Send the status of the requested range and return its content.
+
+            Returns:
+                content to send, or None if the range is not satisfiable.
+            """
+            content = served_file.content
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if not (
+                range_header
+                and served_file.supports_range
+                and (if_range is None or if_range == served_file.etag)
+            ):
+                self.send_response(HTTPStatus.OK)
+                return content
+            start_text, _, end_text = range_header.removeprefix(
+                "bytes="
+            ).partition("-")
+            start = int(start_text)
+            if start >= len(content):
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            start = 0 if served_file.range_from_start else start
+            end = int(end_text) if end_text else len(content) - 1
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{end}/{len(content)}"
+            )
+            return content[start : end + 1]
+
+        def _send_body(self, served_file: ServedFile, content: bytes) -> None:
+            """Send the content, or drop the connection part way."""
+            if served_file.truncate_after is not None:
+                self.wfile.write(content[: served_file.truncate_after])
+                self.wfile.flush()
+                self.connection.close()
+                served_file.truncate_after = None
+                return
+            self.wfile.write(content)
+
+    return Handler
+
+
+@pytest.fixture
+def http_server() -> Iterator[LocalHTTPServer]:
+    """Run a local HTTP server for the duration of the test."""
+    local_server = LocalHTTPServer(url="")
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(local_server))
+    local_server.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    thread = threading.Thread(
+        target=httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield local_server
+    httpd.shutdown()
+    httpd.server_close()
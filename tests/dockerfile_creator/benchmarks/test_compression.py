@@ -0,0 +1,52 @@
+"""Tests for the export codec benchmark."""
+
+import json
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.benchmarks.compression import (
+    benchmark_codecs,
+    main,
+    write_synthetic_image,
+)
+
+
+def test_write_synthetic_image(tmp_path: Path) -> None:
+    """Test to write a docker save like tarball of about the size."""
+    path = tmp_path / "image.tar"
+
+    write_synthetic_image(path, 1024 * 1024)
+
+    with tarfile.open(path) as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))
+        assert manifest == [{"Layers": ["0000/layer.tar"]}]
+        assert tar.getmember("0000/layer.tar").size == 1024 * 1024
+
+
+def test_benchmark_codecs(tmp_path: Path) -> None:
+    """Test to benchmark every codec against single threaded gzip."""
+    path = tmp_path / "image.tar"
+    write_synthetic_image(path, 1024 * 1024)
+
+    results = benchmark_codecs(path, threads=2, levels=[1])
+
+    assert [result["name"] for result in results] == [
+        "gzip single thread",
+        "gzip level 1",
+        "zstd level 1",
+    ]
+    assert all(result["ratio"] > 1 for result in results)
+    assert all(result["speedup"] > 0 for result in results[1:])
+
+
+def test_main(capsys: pytest.CaptureFixture) -> None:
+    """Test to write the results as JSON."""
+    main(["--size", "1", "--threads", "1", "--codecs", "zstd"])
+
+    results = json.loads(capsys.readouterr().out)
+    assert [result["name"] for result in results] == [
+        "gzip single thread",
+        "zstd level 3",
+    ]
@@ -0,0 +1,116 @@
+"""Tests for the end-to-end pipeline benchmark."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.benchmarks.feeds import synthetic_feed
+from nukedockerbuild.benchmarks.pipeline import (
+    STAGES,
+    benchmark_pipeline,
+    find_regressions,
+    main,
+    run_benchmarks,
+)
+from nukedockerbuild.creator.collector import get_dockerfiles
+
+
+def test_synthetic_feed() -> None:
+    """Test every release to result in its own dockerfiles."""
+    amount = 100
+    feed = synthetic_feed(amount)
+
+    dockerfiles = get_dockerfiles(feed)
+
+    assert sum(len(releases) for releases in feed.values()) == amount
+    assert len(
+        {
+            (dockerfile.nuke_version, dockerfile.operating_system)
+            for dockerfile in dockerfiles
+        }
+    ) == len(dockerfiles)
+
+
+def test_benchmark_pipeline(tmp_path: Path) -> None:
+    """Test to measure every stage against the temporary tree."""
+    amount = 50
+    results = benchmark_pipeline(amount, tmp_path)
+
+    assert list(results) == list(STAGES)
+    assert results["parse"].items == amount
+    assert results["write"].items == results["render"].items
+    assert results["rewrite"].items == results["render"].items
+    assert all(result.peak_memory for result in results.values())
+
+
+def test_run_benchmarks_without_memory() -> None:
+    """Test to skip measuring memory when requested."""
+    results = run_benchmarks((10,), measure_memory=False)
+
+    assert set(results["results"]["10"]) == set(STAGES)
+    assert results["results"]["10"]["render"]["peak_memory"] is None
+
+
+def _results(seconds: float, peak_memory: int | None) -> dict:
+    """Return results of a single stage."""
+    return {
+        "results": {
+            "1000": {
+                "render": {"seconds": seconds, "peak_memory": peak_memory}
+            }
+        }
+    }
+
+
+@pytest.mark.parametrize(
+    ("current", "expected_metrics"),
+    [
+        (_results(1.1, 1000), []),
+        (_results(1.5, 1000), ["seconds"]),
+        (_results(1.0, 1500), ["peak_memory"]),
+        (_results(1.0, None), []),
+    ],
+)
+def test_find_regressions(current: dict, expected_metrics: list[str]) -> None:
+    """Test to only report metrics that increased beyond the threshold."""
+    regressions = find_regressions(_results(1.0, 1000), current, 0.2)
+
+    assert [regression.metric for regression in regressions] == (
+        expected_metrics
+    )
+
+
+def test_find_regressions_with_memory_threshold() -> None:
+    """Test the memory threshold to be configurable on its own."""
+    regressions = find_regressions(
+        _results(1.0, 1000), _results(1.0, 1500), 0.2, memory_threshold=1.0
+    )
+
+    assert regressions == []
+
+
+def test_main_exits_on_regression(tmp_path: Path) -> None:
+    """Test to write the results and fail when a stage regressed."""
+    baseline_path = tmp_path / "baseline.json"
+    baseline = run_benchmarks((10,), measure_memory=False)
+    for result in baseline["results"]["10"].values():
+        result["seconds"] = 1e-9
+    baseline_path.write_text(json.dumps(baseline))
+    output_path = tmp_path / "current.json"
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(
+            [
+                "--sizes",
+                "10",
+                "--skip_memory",
+                "--output",
+                str(output_path),
+                "--compare",
+                str(baseline_path),
+            ]
+        )
+
+    assert exit_info.value.code == 1
+    assert "10" in json.loads(output_path.read_text())["results"]
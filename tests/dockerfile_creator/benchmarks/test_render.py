@@ -0,0 +1,42 @@
+"""Tests for the dockerfile render benchmark."""
+
+from nukedockerbuild.benchmarks.render import (
+    benchmark_render,
+    render_uncompiled,
+    synthetic_dockerfiles,
+)
+from nukedockerbuild.creator.collector import MINIMUM_WINDOWS_VERSION
+from nukedockerbuild.datamodel.constants import OperatingSystem
+
+
+def test_synthetic_dockerfiles() -> None:
+    """Test to generate the amount of dockerfiles for supported systems."""
+    amount = 500
+    dockerfiles = synthetic_dockerfiles(amount)
+
+    assert len(dockerfiles) == amount
+    nuke_sources = {dockerfile.nuke_source for dockerfile in dockerfiles}
+    assert len(nuke_sources) == amount
+    assert not any(
+        dockerfile.operating_system == OperatingSystem.WINDOWS
+        and dockerfile.nuke_version < MINIMUM_WINDOWS_VERSION.major
+        for dockerfile in dockerfiles
+    )
+
+
+def test_render_uncompiled() -> None:
+    """Test the baseline to render the same as the render plan."""
+    for dockerfile in synthetic_dockerfiles(
+        300, use_base_images=True, use_cache_mounts=True
+    ):
+        assert render_uncompiled(dockerfile) == dockerfile.to_dockerfile()
+
+
+def test_benchmark_render() -> None:
+    """Test to report the durations of both ways of rendering."""
+    dockerfiles = synthetic_dockerfiles(200)
+
+    result = benchmark_render(dockerfiles)
+
+    assert result.dockerfiles == len(dockerfiles)
+    assert result.to_dict()["compiled_per_second"] > 0
@@ -0,0 +1,150 @@
+"""Tests for the input-hash build cache."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.builder.build_cache import BuildCache
+from nukedockerbuild.builder.targets import BuildTarget
+from nukedockerbuild.datamodel.constants import OperatingSystem
+from nukedockerbuild.sources.downloader import CachedDownload
+from nukedockerbuild.sources.lockfile import LockedSource, SourcesLock
+
+NUKE_SOURCE = "https://thefoundry.s3.amazonaws.com/Nuke15.1v5-linux.tgz"
+DOCKERFILE = (
+    "FROM nukedockerbuild-base:rockylinux8-gcc11\n"
+    f"LABEL 'com.nukedockerbuild.nuke_source'='{NUKE_SOURCE}'\n"
+    "LABEL 'org.opencontainers.image.created'='2024-01-01'\n"
+)
+
+
+@pytest.fixture
+def directory(tmp_path: Path) -> Path:
+    """Return a tree with a Linux and Windows dockerfile and a base image."""
+    for path, content in {
+        "dockerfiles/15.1/linux/Dockerfile": DOCKERFILE,
+        "dockerfiles/15.1/windows/Dockerfile": "FROM debian:bookworm\n",
+        "dockerfiles/base/rockylinux8-gcc11/Dockerfile": (
+            "FROM rockylinux:8\n"
+        ),
+        "dependencies/windows/toolchain.cmake": "set(CMAKE_SYSTEM_NAME x)",
+        "scripts/build.sh": "docker buildx build .",
+    }.items():
+        Path(tmp_path, path).parent.mkdir(parents=True, exist_ok=True)
+        Path(tmp_path, path).write_text(content)
+    return tmp_path
+
+
+def _target(operating_system: OperatingSystem) -> BuildTarget:
+    """Return the 15.1 target for the operating system."""
+    return BuildTarget(
+        nuke_version="15.1",
+        operating_system=operating_system,
+        dockerfile=Path(
+            f"dockerfiles/15.1/{operating_system.value}/Dockerfile"
+        ),
+    )
+
+
+LINUX = _target(OperatingSystem.LINUX)
+WINDOWS = _target(OperatingSystem.WINDOWS)
+
+
+@pytest.mark.parametrize(
+    ("path", "content", "target", "changes"),
+    [
+        (
+            "dockerfiles/15.1/linux/Dockerfile",
+            DOCKERFILE.replace("2024-01-01", "2024-02-01"),
+            LINUX,
+            False,
+        ),
+        (
+            "dockerfiles/15.1/linux/Dockerfile",
+            DOCKERFILE.replace("15.1v5", "15.1v6"),
+            LINUX,
+            True,
+        ),
+        (
+            "dockerfiles/base/rockylinux8-gcc11/Dockerfile",
+            "FROM rockylinux:8.9\n",
+            LINUX,
+            True,
+        ),
+        ("scripts/build.sh", "podman build .", LINUX, True),
+        ("dependencies/windows/toolchain.cmake", "changed", LINUX, False),
+        ("dependencies/windows/toolchain.cmake", "changed", WINDOWS, True),
+        ("dockerfiles/15.1/linux/tests/test.cpp", "int main;", LINUX, True),
+    ],
+)
+def test_input_key(
+    directory: Path,
+    path: str,
+    content: str,
+    target: BuildTarget,
+    changes: bool,
+) -> None:
+    """Test the key to change only if an input of the target changes."""
+    build_cache = BuildCache(directory)
+    key = build_cache.input_key(target)
+    Path(directory, path).parent.mkdir(parents=True, exist_ok=True)
+    Path(directory, path).write_text(content)
+
+    assert (build_cache.input_key(target) != key) is changes
+
+
+def test_input_key_installer_checksum(directory: Path) -> None:
+    """Test the key to include the installer checksum once downloaded."""
+    class FakeDownloadCache:
+        sha256 = "a" * 64
+
+        def lookup(self, url: str) -> CachedDownload:
+            return CachedDownload(url, self.sha256, 1, Path("blob"))
+
+    download_cache = FakeDownloadCache()
+    build_cache = BuildCache(directory, download_cache=download_cache)
+    key = build_cache.input_key(LINUX)
+
+    download_cache.sha256 = "b" * 64
+
+    assert build_cache.input_key(LINUX) != key
+    assert key != BuildCache(directory).input_key(LINUX)
+
+
+def test_input_key_locked_checksum(directory: Path) -> None:
+    """Test the pinned checksum to be used before anything is downloaded."""
+    sources_lock = SourcesLock(directory / "sources.lock")
+    sources_lock.sources[("15.1", "linux")] = LockedSource(
+        "15.1", "linux", NUKE_SOURCE, "a" * 64, 1
+    )
+    build_cache = BuildCache(directory, sources_lock=sources_lock)
+    key = build_cache.input_key(LINUX)
+
+    sources_lock.sources[("15.1", "linux")] = LockedSource(
+        "15.1", "linux", NUKE_SOURCE, "b" * 64, 1
+    )
+
+    assert build_cache.input_key(LINUX) != key
+    assert key != BuildCache(directory).input_key(LINUX)
+
+
+def test_record(directory: Path) -> None:
+    """Test to persist successful builds and read them back."""
+    BuildCache(directory).record(LINUX, "key")
+
+    build_cache = BuildCache(directory)
+    assert build_cache.is_current(LINUX, "key")
+    assert not build_cache.is_current(LINUX, "other")
+    assert not build_cache.is_current(WINDOWS, "key")
+    data = json.loads(build_cache.path.read_text())
+    assert data["15.1-linux"]["tag"] == "nukedockerbuild:15.1-linux"
+    assert build_cache.path == directory / "build/cache/builds.json"
+
+
+def test_invalid_cache_file(directory: Path) -> None:
+    """Test to ignore a corrupt cache file, building everything."""
+    build_cache = BuildCache(directory, path=directory / "builds.json")
+    build_cache.path.write_text("{")
+
+    assert build_cache.lookup(LINUX) is None
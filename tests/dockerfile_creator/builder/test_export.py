@@ -0,0 +1,133 @@
+"""Tests for exporting images with multi-threaded compression."""
+
+import gzip
+import io
+import random
+import tarfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+import zstandard
+
+from nukedockerbuild.builder.export import (
+    Codec,
+    CompressionOptions,
+    CompressionResult,
+    ImageExporter,
+    compress_stream,
+)
+
+
+@pytest.fixture
+def image_tarball() -> bytes:
+    """Return a small tarball with compressible and random content."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, content in [
+            ("layer/text.h", b"#include <DDImage/Iop.h>\n" * 5000),
+            ("layer/binary.so", random.Random(0).randbytes(100_000)),
+        ]:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def _decompress(codec: Codec, data: bytes) -> bytes:
+    """Return the decompressed data."""
+    if codec == Codec.ZSTD:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+@pytest.mark.parametrize("codec", list(Codec))
+@pytest.mark.parametrize("threads", [1, 4])
+def test_compress_stream_round_trip(
+    image_tarball: bytes, codec: Codec, threads: int
+) -> None:
+    """Test compressed blocks to decompress to the original tarball."""
+    output = io.BytesIO()
+
+    result = compress_stream(
+        io.BytesIO(image_tarball),
+        output,
+        CompressionOptions(codec, threads=threads, block_size=16 * 1024),
+    )
+
+    assert _decompress(codec, output.getvalue()) == image_tarball
+    assert result.input_bytes == len(image_tarball)
+    assert result.output_bytes == len(output.getvalue())
+    assert result.ratio > 1
+
+
+def test_parallel_gzip_is_a_single_tarball(image_tarball: bytes) -> None:
+    """Test gzip members per block to be read as one archive, like load."""
+    output = io.BytesIO()
+    compress_stream(
+        io.BytesIO(image_tarball),
+        output,
+        CompressionOptions(threads=4, block_size=1000),
+    )
+    output.seek(0)
+
+    with tarfile.open(fileobj=output, mode="r:gz") as tar:
+        assert tar.getnames() == ["layer/text.h", "layer/binary.so"]
+
+
+def test_compress_stream_without_zstandard() -> None:
+    """Test to raise a clear error if zstandard is not installed."""
+    with (
+        patch("nukedockerbuild.builder.export.zstandard", None),
+        pytest.raises(ValueError, match="needs the zstandard package"),
+    ):
+        compress_stream(
+            io.BytesIO(b"data"), io.BytesIO(), CompressionOptions(Codec.ZSTD)
+        )
+
+
+def test_compression_result() -> None:
+    """Test the ratio and throughput of a result."""
+    result = CompressionResult(
+        Codec.GZIP, input_bytes=4_000_000, output_bytes=1_000_000, seconds=2
+    )
+
+    assert (result.ratio, result.megabytes_per_second) == (4, 2)
+    assert result.to_dict()["codec"] == "gzip"
+
+
+@pytest.mark.parametrize("codec", list(Codec))
+def test_image_exporter_export(
+    tmp_path: Path, image_tarball: bytes, codec: Codec
+) -> None:
+    """Test to stream the saved image into the export path."""
+    saved_image = tmp_path / "saved.tar"
+    saved_image.write_bytes(image_tarball)
+    exporter = ImageExporter(codec=codec, threads=2)
+
+    with patch(
+        "nukedockerbuild.builder.export.save_command",
+        return_value=["cat", str(saved_image)],
+    ):
+        result = exporter.export("nukedockerbuild:15.1-linux", tmp_path)
+
+    export_path = tmp_path / f"nukedockerbuild-15.1-linux{codec.extension}"
+    assert _decompress(codec, export_path.read_bytes()) == image_tarball
+    assert result.input_bytes == len(image_tarball)
+    assert not list(tmp_path.glob("*.partial"))
+
+
+def test_image_exporter_export_failed(tmp_path: Path) -> None:
+    """Test to raise and leave nothing behind if saving failed."""
+    exporter = ImageExporter()
+
+    with (
+        patch(
+            "nukedockerbuild.builder.export.save_command",
+            return_value=["sh", "-c", "echo 'No such image' >&2; exit 1"],
+        ),
+        pytest.raises(ValueError, match="No such image"),
+    ):
+        exporter.export("nukedockerbuild:15.1-linux", tmp_path)
+
+    assert list(tmp_path.iterdir()) == []
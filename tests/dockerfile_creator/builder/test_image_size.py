@@ -0,0 +1,189 @@
+"""Tests related to the size analysis of saved images.
+
+@maintainer: Gilles Vink
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.builder.image_size import (
+    ImageSizeReport,
+    LayerSize,
+    PathSize,
+    analyze_image,
+    find_regressions,
+)
+from nukedockerbuild.builder.layer_store import LayerStore
+
+TAG = "nukedockerbuild:15.1-linux"
+HISTORY = [
+    {"created_by": "/bin/sh -c #(nop) ADD file:abc in / "},
+    {"created_by": "ENV NUKE_VERSION=15.1", "empty_layer": True},
+    {"created_by": "COPY _nuke_sources /usr/local/nuke_install # buildkit"},
+    {
+        "created_by": "RUN |1 NUKE_SOURCE_FILES=_nuke_sources /bin/sh -c "
+        "rm -rf /usr/local/nuke_install/plugins && ./vsdownload.py "
+        "# buildkit"
+    },
+]
+
+
+def _layer(files: dict[str, int], *, compress: bool = False) -> bytes:
+    """Return a layer tarball with files of the given sizes."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, size in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = size
+            tar.addfile(info, io.BytesIO(b"x" * size))
+    content = buffer.getvalue()
+    return gzip.compress(content) if compress else content
+
+
+LAYER_FILES = [
+    {"usr/bin/bash": 100},
+    {
+        "usr/local/nuke_install/lib/libA.so": 5000,
+        "usr/local/nuke_install/lib/libB.so": 3000,
+        "usr/local/nuke_install/include/DDImage/Op.h": 200,
+        "usr/local/nuke_install/plugins/foo.so": 1000,
+    },
+    {
+        "usr/local/nuke_install/.wh.plugins": 0,
+        "opt/msvc/bin/x64/cl.exe": 4000,
+    },
+]
+LAYERS = [
+    _layer(files, compress=index == 1)
+    for index, files in enumerate(LAYER_FILES)
+]
+UNCOMPRESSED_SIZE = sum(sum(files.values()) for files in LAYER_FILES)
+# The last layer removes the plugins of the Nuke install.
+NUKE_INSTALL_SIZE = 5000 + 3000 + 200
+
+
+def _saved_image(path: Path, history: list[dict]) -> Path:
+    """Write a tarball in the legacy docker save format."""
+    config = json.dumps(
+        {
+            "history": history,
+            "rootfs": {
+                "diff_ids": [
+                    f"sha256:{hashlib.sha256(layer).hexdigest()}"
+                    for layer in LAYERS
+                ]
+            },
+        }
+    ).encode()
+    files = {
+        f"{index:064x}/layer.tar": layer for index, layer in enumerate(LAYERS)
+    }
+    files["config.json"] = config
+    files["manifest.json"] = json.dumps(
+        [
+            {
+                "Config": "config.json",
+                "RepoTags": [TAG],
+                "Layers": list(files)[:-1],
+            }
+        ]
+    ).encode()
+    with tarfile.open(path, mode="w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+def test_analyze_saved_tarball(tmp_path: Path) -> None:
+    """Test to map layers to instructions and list the largest paths."""
+    report = analyze_image(_saved_image(tmp_path / "image.tar", HISTORY))
+
+    assert report.tag == TAG
+    assert [layer.instruction for layer in report.layers] == [
+        "ADD file:abc in /",
+        "COPY _nuke_sources /usr/local/nuke_install",
+        "RUN rm -rf /usr/local/nuke_install/plugins && ./vsdownload.py",
+    ]
+    assert [layer.uncompressed_size for layer in report.layers] == [
+        100,
+        9200,
+        4000,
+    ]
+    assert report.layers[1].size == len(LAYERS[1])
+    assert report.layers[1].files == len(LAYER_FILES[1])
+    nuke_install = report.paths["/usr/local/nuke_install"]
+    assert (nuke_install.size, nuke_install.files) == (NUKE_INSTALL_SIZE, 3)
+    assert nuke_install.largest == [
+        PathSize("/usr/local/nuke_install/lib/libA.so", 5000, 1),
+        PathSize("/usr/local/nuke_install/lib/libB.so", 3000, 1),
+        PathSize("/usr/local/nuke_install/include/DDImage", 200, 1),
+    ]
+    assert report.paths["/opt/msvc"].largest == [
+        PathSize("/opt/msvc/bin/x64", 4000, 1)
+    ]
+    report_data = json.loads(json.dumps(report.to_dict()))
+    assert report_data["uncompressed_size"] == UNCOMPRESSED_SIZE
+    assert "COPY _nuke_sources" in report.format()
+
+
+def test_analyze_without_history(tmp_path: Path) -> None:
+    """Test layers without matching history to have no instruction."""
+    report = analyze_image(_saved_image(tmp_path / "image.tar", []))
+
+    assert [layer.instruction for layer in report.layers] == [None] * 3
+
+
+def test_analyze_oci_layout(tmp_path: Path) -> None:
+    """Test to analyze an image in the layer store."""
+    store = LayerStore(tmp_path / "layers")
+    with _saved_image(tmp_path / "image.tar", HISTORY).open("rb") as file:
+        store.import_tarball(file)
+
+    report = analyze_image(store.directory, TAG)
+
+    assert report.tag == TAG
+    assert report.uncompressed_size == UNCOMPRESSED_SIZE
+    assert report.paths["/usr/local/nuke_install"].size == NUKE_INSTALL_SIZE
+
+
+def test_analyze_missing_tag(tmp_path: Path) -> None:
+    """Test to raise for a tag that is not in the image."""
+    store = LayerStore(tmp_path / "layers")
+    with _saved_image(tmp_path / "image.tar", HISTORY).open("rb") as file:
+        store.import_tarball(file)
+
+    with pytest.raises(ValueError, match="is not in the saved tarball"):
+        analyze_image(tmp_path / "image.tar", "missing:tag")
+    with pytest.raises(ValueError, match="is not in the OCI layout"):
+        analyze_image(store.directory, "missing:tag")
+
+
+def test_find_regressions() -> None:
+    """Test to report sizes that grew beyond the tolerance or maximum."""
+    report = ImageSizeReport(
+        TAG,
+        [LayerSize(0, "sha256:a", 500, 1100)],
+        {"/opt/msvc": PathSize("/opt/msvc", 1000)},
+    )
+    baseline = {
+        "uncompressed_size": 1000,
+        "paths": {"/opt/msvc": {"size": 990}},
+    }
+
+    regressions = find_regressions(
+        report, baseline, tolerance=0.05, max_bytes=1050
+    )
+
+    image_regression, maximum_regression = regressions
+    assert "'image'" in image_regression
+    assert "maximum of 1050 bytes" in maximum_regression
+    assert not find_regressions(report, baseline, tolerance=0.2)
+    assert not find_regressions(report, {})
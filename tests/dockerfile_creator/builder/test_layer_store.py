@@ -0,0 +1,278 @@
+"""Tests for the content-addressed layer store."""
+
+import gzip
+import hashlib
+import io
+import json
+import tarfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from nukedockerbuild.builder.export import Codec
+from nukedockerbuild.builder.layer_store import (
+    CONFIG_MEDIA_TYPE,
+    TAR_MEDIA_TYPE,
+    LayerStore,
+)
+
+BASE_LAYER = b"rockylinux" * 200_000
+TOOLCHAIN_LAYER = b"gcc-toolset-11" * 100_000
+
+
+def _add(tar: tarfile.TarFile, name: str, content: bytes) -> None:
+    """Add a file to the tarball."""
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+
+
+def _sha256(content: bytes) -> str:
+    """Return the hex digest of content."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def _referenced_blobs(store: LayerStore) -> set[str]:
+    """Return the digests of the manifests, configs and layers of all tags."""
+    digests = set()
+    for manifest in store.tags().values():
+        content = json.loads(store.blob_path(manifest).read_bytes())
+        digests.add(manifest.digest)
+        digests.add(content["config"]["digest"])
+        digests.update(layer["digest"] for layer in content["layers"])
+    return digests
+
+
+def saved_image(tag: str, layers: list[bytes]) -> bytes:
+    """Return a tarball in the legacy docker save format.
+
+    Like docker save, a layer that is in the tarball already is added as
+    symbolic link to the first one.
+    """
+    config = json.dumps(
+        {"rootfs": {"diff_ids": [f"sha256:{_sha256(c)}" for c in layers]}}
+    ).encode()
+    buffer = io.BytesIO()
+    layer_paths = []
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        seen: dict[bytes, str] = {}
+        for index, layer in enumerate(layers):
+            path = f"{index:064x}/layer.tar"
+            if layer in seen:
+                link = tarfile.TarInfo(path)
+                link.type = tarfile.SYMTYPE
+                link.linkname = f"../{seen[layer]}"
+                tar.addfile(link)
+            else:
+                _add(tar, path, layer)
+                seen[layer] = path
+            layer_paths.append(path)
+        _add(tar, f"{_sha256(config)}.json", config)
+        _add(
+            tar,
+            "manifest.json",
+            json.dumps(
+                [
+                    {
+                        "Config": f"{_sha256(config)}.json",
+                        "RepoTags": [tag],
+                        "Layers": layer_paths,
+                    }
+                ]
+            ).encode(),
+        )
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> LayerStore:
+    """Return a store with two images sharing their base layers."""
+    store = LayerStore(tmp_path / "layers")
+    for version in ("15.0", "15.1"):
+        store.import_tarball(
+            io.BytesIO(
+                saved_image(
+                    f"nukedockerbuild:{version}-linux",
+                    [BASE_LAYER, TOOLCHAIN_LAYER, version.encode() * 1000],
+                )
+            )
+        )
+    return store
+
+
+def test_import_tarball(store: LayerStore) -> None:
+    """Test to store the shared layers once, in an OCI layout."""
+    tags = store.tags()
+
+    assert sorted(tags) == [
+        "nukedockerbuild:15.0-linux",
+        "nukedockerbuild:15.1-linux",
+    ]
+    assert json.loads((store.directory / "oci-layout").read_text()) == {
+        "imageLayoutVersion": "1.0.0"
+    }
+    manifest = json.loads(
+        store.blob_path(tags["nukedockerbuild:15.1-linux"]).read_bytes()
+    )
+    assert manifest["config"]["mediaType"] == CONFIG_MEDIA_TYPE
+    assert [layer["digest"] for layer in manifest["layers"]] == [
+        f"sha256:{_sha256(BASE_LAYER)}",
+        f"sha256:{_sha256(TOOLCHAIN_LAYER)}",
+        f"sha256:{_sha256(b'15.1' * 1000)}",
+    ]
+    assert {layer["mediaType"] for layer in manifest["layers"]} == {
+        TAR_MEDIA_TYPE
+    }
+    # A manifest, config and version layer per tag and 2 shared layers.
+    assert store.report().blobs == len(_referenced_blobs(store))
+
+
+def test_import_tarball_linked_layer(tmp_path: Path) -> None:
+    """Test to resolve layers that docker save adds as symbolic link."""
+    store = LayerStore(tmp_path)
+
+    manifests = store.import_tarball(
+        io.BytesIO(saved_image("image:latest", [BASE_LAYER, BASE_LAYER]))
+    )
+
+    manifest = json.loads(
+        store.blob_path(manifests["image:latest"]).read_bytes()
+    )
+    assert [layer["size"] for layer in manifest["layers"]] == [
+        len(BASE_LAYER),
+        len(BASE_LAYER),
+    ]
+
+
+def test_import_tarball_compressed_layer(tmp_path: Path) -> None:
+    """Test to detect the media type of compressed layers."""
+    store = LayerStore(tmp_path)
+
+    manifests = store.import_tarball(
+        io.BytesIO(saved_image("image:latest", [gzip.compress(b"layer")])),
+        tags=["image:retagged"],
+    )
+
+    manifest = json.loads(
+        store.blob_path(manifests["image:retagged"]).read_bytes()
+    )
+    assert manifest["layers"][0]["mediaType"].endswith("tar+gzip")
+
+
+def test_import_tarball_invalid(tmp_path: Path) -> None:
+    """Test to raise if the tarball is not saved by docker."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        _add(tar, "file.txt", b"content")
+    buffer.seek(0)
+
+    with pytest.raises(ValueError, match=r"no manifest\.json"):
+        LayerStore(tmp_path).import_tarball(buffer)
+
+
+def test_report(store: LayerStore) -> None:
+    """Test the logical size to count the shared layers per image."""
+    report = store.report()
+
+    shared = len(BASE_LAYER) + len(TOOLCHAIN_LAYER)
+    assert report.images == len(store.tags())
+    assert report.logical_bytes - report.stored_bytes == shared
+    assert report.ratio == report.logical_bytes / report.stored_bytes
+    assert report.to_dict()["ratio"] == round(report.ratio, 2)
+
+
+def test_write_tarball_round_trip(store: LayerStore, tmp_path: Path) -> None:
+    """Test the rebuilt tarball to contain the image and import again."""
+    buffer = io.BytesIO()
+
+    written = store.write_tarball("nukedockerbuild:15.1-linux", buffer)
+
+    assert written == len(buffer.getvalue())
+    buffer.seek(0)
+    with tarfile.open(fileobj=buffer) as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))
+        assert manifest[0]["RepoTags"] == ["nukedockerbuild:15.1-linux"]
+        layers = [
+            tar.extractfile(layer).read() for layer in manifest[0]["Layers"]
+        ]
+        assert layers == [BASE_LAYER, TOOLCHAIN_LAYER, b"15.1" * 1000]
+        assert "oci-layout" in tar.getnames()
+        index = json.load(tar.extractfile("index.json"))
+        assert len(index["manifests"]) == 1
+
+    buffer.seek(0)
+    other_store = LayerStore(tmp_path / "other")
+    manifests = other_store.import_tarball(buffer)
+    assert manifests == {
+        "nukedockerbuild:15.1-linux": store.tags()[
+            "nukedockerbuild:15.1-linux"
+        ]
+    }
+
+
+def test_write_tarball_unknown_tag(store: LayerStore) -> None:
+    """Test to raise for tags that are not stored."""
+    with pytest.raises(ValueError, match="not in the layer store"):
+        store.write_tarball("nukedockerbuild:16.0-linux", io.BytesIO())
+
+
+@pytest.mark.parametrize("codec", [None, Codec.GZIP])
+def test_export(store: LayerStore, tmp_path: Path, codec: Codec) -> None:
+    """Test to write the tarball of a tag, optionally compressed."""
+    path = store.export(
+        "nukedockerbuild:15.0-linux", tmp_path / "out" / "image", codec
+    )
+
+    with tarfile.open(path) as tar:
+        assert "manifest.json" in tar.getnames()
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_prune(store: LayerStore) -> None:
+    """Test to remove blobs of images that are replaced."""
+    store.import_tarball(
+        io.BytesIO(
+            saved_image(
+                "nukedockerbuild:15.1-linux", [BASE_LAYER, b"rebuilt"]
+            )
+        )
+    )
+
+    removed = store.prune()
+
+    # Manifest, config and version layer of the old 15.1 are removed.
+    assert removed > len(b"15.1" * 1000)
+    assert store.report().blobs == len(_referenced_blobs(store))
+    store.write_tarball("nukedockerbuild:15.0-linux", io.BytesIO())
+
+
+def test_import_image(tmp_path: Path) -> None:
+    """Test to store the output of the save command."""
+    saved_path = tmp_path / "saved.tar"
+    saved_path.write_bytes(saved_image("other:tag", [BASE_LAYER]))
+    store = LayerStore(tmp_path / "layers")
+
+    with patch(
+        "nukedockerbuild.builder.layer_store.save_command",
+        return_value=["cat", str(saved_path)],
+    ):
+        manifest = store.import_image("nukedockerbuild:15.1-linux")
+
+    assert store.tags() == {"nukedockerbuild:15.1-linux": manifest}
+
+
+def test_import_image_failed(tmp_path: Path) -> None:
+    """Test to raise with the output of a failed save command."""
+    store = LayerStore(tmp_path / "layers")
+
+    with (
+        patch(
+            "nukedockerbuild.builder.layer_store.save_command",
+            return_value=["sh", "-c", "echo 'No such image' >&2; exit 1"],
+        ),
+        pytest.raises(ValueError, match="No such image"),
+    ):
+        store.import_image("nukedockerbuild:15.1-linux")
+
+    assert store.tags() == {}
@@ -0,0 +1,329 @@
+"""Tests related to the build runners.
+
+@maintainer: Gilles Vink
+"""
+
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from nukedockerbuild.builder.export import Codec, CompressionResult
+from nukedockerbuild.builder.runner import ScriptRunner
+from nukedockerbuild.builder.targets import BuildTarget
+from nukedockerbuild.datamodel.constants import OperatingSystem
+from nukedockerbuild.sources.extractor import PrepareOptions
+from nukedockerbuild.sources.lockfile import LockedSource, SourcesLock
+
+
+@pytest.mark.parametrize(
+    ("test_use_podman", "test_load", "expected_flags"),
+    [
+        (False, True, []),
+        (True, True, ["--podman"]),
+        (False, False, ["--skip-load"]),
+    ],
+)
+def test_script_runner_build(
+    tmp_path: Path,
+    test_use_podman: bool,
+    test_load: bool,
+    expected_flags: list[str],
+) -> None:
+    """Test to call build.sh with the target and stream into the log."""
+    dockerfile = tmp_path / "dockerfiles" / "15.1" / "windows" / "Dockerfile"
+    dockerfile.parent.mkdir(parents=True)
+    dockerfile.write_text("FROM docker.io/debian:bookworm")
+    target = BuildTarget(
+        nuke_version="15.1",
+        operating_system=OperatingSystem.WINDOWS,
+        dockerfile=Path("dockerfiles/15.1/windows/Dockerfile"),
+    )
+    log_file = MagicMock()
+    runner = ScriptRunner(
+        tmp_path, use_podman=test_use_podman, load=test_load
+    )
+    with patch(
+        "nukedockerbuild.builder.runner.subprocess.run",
+        return_value=MagicMock(returncode=3),
+    ) as run_mock:
+        returncode = runner.build(target, log_file)
+
+    run_mock.assert_called_once_with(
+        [str(tmp_path / "build.sh"), "15.1", "windows", *expected_flags],
+        cwd=tmp_path,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+        check=False,
+    )
+    assert returncode == run_mock.return_value.returncode
+
+
+@pytest.mark.parametrize(
+    ("test_locked_url", "expected_sha256"),
+    [
+        (None, None),
+        ("https://foundry/Nuke.tgz", "abc"),
+        ("https://foundry/Nuke15.1v1.tgz", None),
+    ],
+)
+def test_script_runner_fetches_installer_first(
+    tmp_path: Path, test_locked_url: str | None, expected_sha256: str | None
+) -> None:
+    """Test the installer to be fetched and verified before building."""
+    dockerfile = tmp_path / "dockerfiles" / "15.1" / "linux" / "Dockerfile"
+    dockerfile.parent.mkdir(parents=True)
+    dockerfile.write_text(
+        "LABEL 'com.nukedockerbuild.nuke_source'='https://foundry/Nuke.tgz'"
+    )
+    target = BuildTarget(
+        nuke_version="15.1",
+        operating_system=OperatingSystem.LINUX,
+        dockerfile=Path("dockerfiles/15.1/linux/Dockerfile"),
+    )
+    download_cache = MagicMock()
+    sources_lock = SourcesLock(tmp_path / "sources.lock")
+    if test_locked_url:
+        sources_lock.sources[("15.1", "linux")] = LockedSource(
+            "15.1", "linux", test_locked_url, "abc", 3
+        )
+    runner = ScriptRunner(
+        tmp_path, download_cache=download_cache, sources_lock=sources_lock
+    )
+    with patch(
+        "nukedockerbuild.builder.runner.subprocess.run",
+        return_value=MagicMock(returncode=0),
+    ):
+        runner.build(target, MagicMock())
+
+    download_cache.fetch.assert_called_once_with(
+        "https://foundry/Nuke.tgz", expected_sha256
+    )
+
+
+@pytest.mark.parametrize(
+    ("test_operating_system", "expected_prepared"),
+    [(OperatingSystem.LINUX, True), (OperatingSystem.WINDOWS, False)],
+)
+def test_script_runner_prepares_linux_sources(
+    tmp_path: Path,
+    test_operating_system: OperatingSystem,
+    expected_prepared: bool,
+) -> None:
+    """Test Linux sources to be extracted on the host before building."""
+    relative_path = Path(
+        f"dockerfiles/15.1/{test_operating_system.value}/Dockerfile"
+    )
+    dockerfile = tmp_path / relative_path
+    dockerfile.parent.mkdir(parents=True)
+    dockerfile.write_text(
+        "LABEL 'com.nukedockerbuild.nuke_source'='https://foundry/Nuke.tgz'"
+    )
+    target = BuildTarget(
+        nuke_version="15.1",
+        operating_system=test_operating_system,
+        dockerfile=relative_path,
+    )
+    runner = ScriptRunner(tmp_path, prepare_sources=True)
+    with (
+        patch(
+            "nukedockerbuild.builder.runner.subprocess.run",
+            return_value=MagicMock(returncode=0),
+        ),
+        patch(
+            "nukedockerbuild.builder.runner.prepare_nuke_sources"
+        ) as prepare_mock,
+    ):
+        runner.build(target, MagicMock())
+
+    if expected_prepared:
+        prepare_mock.assert_called_once_with(
+            "https://foundry/Nuke.tgz",
+            15.1,
+            dockerfile.parent,
+            None,
+            PrepareOptions(),
+        )
+    else:
+        prepare_mock.assert_not_called()
+
+
+def test_script_runner_prepares_shared_sources(tmp_path: Path) -> None:
+    """Test to prepare missing sources and split them once per major."""
+    targets = []
+    for version in ["15.0", "15.1", "16.0"]:
+        relative_path = Path(f"dockerfiles/{version}/linux/Dockerfile")
+        dockerfile = tmp_path / relative_path
+        dockerfile.parent.mkdir(parents=True)
+        dockerfile.write_text(
+            "LABEL 'com.nukedockerbuild.nuke_source'="
+            f"'https://foundry/Nuke{version}.tgz'"
+        )
+        targets.append(
+            BuildTarget(version, OperatingSystem.LINUX, relative_path)
+        )
+    (tmp_path / "dockerfiles/15.0/linux/_nuke_sources.prepared").write_text(
+        "https://foundry/Nuke15.0.tgz"
+    )
+    runner = ScriptRunner(tmp_path, prepare_sources=True)
+    with (
+        patch(
+            "nukedockerbuild.builder.runner.prepare_nuke_sources"
+        ) as prepare_mock,
+        patch(
+            "nukedockerbuild.builder.runner.split_shared_sources"
+        ) as split_mock,
+        patch(
+            "nukedockerbuild.builder.runner.subprocess.run",
+            return_value=MagicMock(returncode=0),
+        ),
+    ):
+        runner.prepare_shared_sources(targets, MagicMock())
+        runner.build(targets[1], MagicMock())
+
+    assert [call.args[0] for call in prepare_mock.call_args_list] == [
+        "https://foundry/Nuke15.1.tgz",
+        "https://foundry/Nuke16.0.tgz",
+    ]
+    assert [call.args[0] for call in split_mock.call_args_list] == [
+        [
+            tmp_path / "dockerfiles/15.0/linux",
+            tmp_path / "dockerfiles/15.1/linux",
+        ],
+        [tmp_path / "dockerfiles/16.0/linux"],
+    ]
+
+
+def _base_image_targets(tmp_path: Path) -> list[BuildTarget]:
+    """Return targets of three versions that share a base image."""
+    targets = []
+    for version in ["15.0", "15.1", "16.0"]:
+        dockerfile = tmp_path / "dockerfiles" / version / "linux"
+        dockerfile.mkdir(parents=True)
+        (dockerfile / "Dockerfile").write_text(
+            "FROM nukedockerbuild-base:rockylinux8-gcc11"
+        )
+        targets.append(
+            BuildTarget(
+                nuke_version=version,
+                operating_system=OperatingSystem.LINUX,
+                dockerfile=Path(f"dockerfiles/{version}/linux/Dockerfile"),
+            )
+        )
+    return targets
+
+
+def test_script_runner_builds_base_image_once(tmp_path: Path) -> None:
+    """Test the first target of a base image to be built on its own."""
+    targets = _base_image_targets(tmp_path)
+    running = []
+    concurrent_with_first = []
+
+    def _run(command: list[str], **_kwargs: object) -> MagicMock:
+        running.append(command[1])
+        if command[1] != "15.0":
+            concurrent_with_first.append("15.0" in running)
+        time.sleep(0.02)
+        running.remove(command[1])
+        return MagicMock(returncode=0)
+
+    runner = ScriptRunner(tmp_path)
+    with (
+        patch("nukedockerbuild.builder.runner.subprocess.run", _run),
+        ThreadPoolExecutor(max_workers=3) as executor,
+    ):
+        first = executor.submit(runner.build, targets[0], MagicMock())
+        time.sleep(0.005)
+        others = [
+            executor.submit(runner.build, target, MagicMock())
+            for target in targets[1:]
+        ]
+        results = [first.result()] + [other.result() for other in others]
+
+    assert results == [0, 0, 0]
+    assert concurrent_with_first == [False, False]
+
+
+def test_script_runner_reuses_base_image_concurrently(tmp_path: Path) -> None:
+    """Test targets that waited for the base image to build together."""
+    targets = _base_image_targets(tmp_path)
+    first_started = threading.Event()
+    both_running = threading.Barrier(2, timeout=5)
+
+    def _run(command: list[str], **_kwargs: object) -> MagicMock:
+        if command[1] == "15.0":
+            first_started.set()
+            time.sleep(0.05)
+        else:
+            both_running.wait()
+        return MagicMock(returncode=0)
+
+    runner = ScriptRunner(tmp_path)
+    with (
+        patch("nukedockerbuild.builder.runner.subprocess.run", _run),
+        ThreadPoolExecutor(max_workers=3) as executor,
+    ):
+        first = executor.submit(runner.build, targets[0], MagicMock())
+        first_started.wait(timeout=5)
+        others = [
+            executor.submit(runner.build, target, MagicMock())
+            for target in targets[1:]
+        ]
+        results = [first.result()] + [other.result() for other in others]
+
+    assert results == [0, 0, 0]
+
+
+def test_script_runner_exports_on_host(tmp_path: Path) -> None:
+    """Test to skip the export in build.sh and export the image after."""
+    dockerfile = tmp_path / "dockerfiles" / "15.1" / "linux" / "Dockerfile"
+    dockerfile.parent.mkdir(parents=True)
+    dockerfile.write_text("FROM rockylinux:8")
+    target = BuildTarget(
+        nuke_version="15.1",
+        operating_system=OperatingSystem.LINUX,
+        dockerfile=Path("dockerfiles/15.1/linux/Dockerfile"),
+    )
+    exporter = MagicMock()
+    exporter.export.return_value = CompressionResult(
+        Codec.ZSTD, input_bytes=100, output_bytes=50, seconds=1
+    )
+    runner = ScriptRunner(tmp_path, exporter=exporter)
+    with patch(
+        "nukedockerbuild.builder.runner.subprocess.run",
+        return_value=MagicMock(returncode=0),
+    ) as run_mock:
+        runner.build(target, MagicMock())
+
+    assert run_mock.call_args.args[0][-1] == "--skip-export"
+    exporter.export.assert_called_once_with(
+        "nukedockerbuild:15.1-linux", tmp_path / "build"
+    )
+
+
+def test_script_runner_stores_layers(tmp_path: Path) -> None:
+    """Test to skip the export in build.sh and store the layers after."""
+    dockerfile = tmp_path / "dockerfiles" / "15.1" / "linux" / "Dockerfile"
+    dockerfile.parent.mkdir(parents=True)
+    dockerfile.write_text("FROM rockylinux:8")
+    target = BuildTarget(
+        nuke_version="15.1",
+        operating_system=OperatingSystem.LINUX,
+        dockerfile=Path("dockerfiles/15.1/linux/Dockerfile"),
+    )
+    layer_store = MagicMock()
+    runner = ScriptRunner(tmp_path, layer_store=layer_store)
+    with patch(
+        "nukedockerbuild.builder.runner.subprocess.run",
+        return_value=MagicMock(returncode=0),
+    ) as run_mock:
+        runner.build(target, MagicMock())
+
+    assert run_mock.call_args.args[0][-1] == "--skip-export"
+    layer_store.import_image.assert_called_once_with(
+        "nukedockerbuild:15.1-linux"
+    )
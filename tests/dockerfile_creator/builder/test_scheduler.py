@@ -0,0 +1,178 @@
+"""Tests related to the build scheduler.
+
+@maintainer: Gilles Vink
+"""
+
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import TextIO
+
+from nukedockerbuild.builder.build_cache import BuildCache
+from nukedockerbuild.builder.runner import BuildRunner
+from nukedockerbuild.builder.scheduler import BuildScheduler
+from nukedockerbuild.builder.targets import BuildTarget
+from nukedockerbuild.datamodel.constants import OperatingSystem
+
+
+class FakeRunner(BuildRunner):
+    """Runner that pretends to build and tracks concurrency."""
+
+    def __init__(self, failing: set[str] | None = None) -> None:
+        self.failing = failing or set()
+        self.running: dict[OperatingSystem, int] = defaultdict(int)
+        self.peak: dict[OperatingSystem, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def build(self, target: BuildTarget, log_file: TextIO) -> int:
+        """Pretend to build, failing for configured targets."""
+        with self._lock:
+            self.running[target.operating_system] += 1
+            self.peak[target.operating_system] = max(
+                self.peak[target.operating_system],
+                self.running[target.operating_system],
+            )
+        log_file.write(f"building {target.name}\n")
+        time.sleep(0.02)
+        with self._lock:
+            self.running[target.operating_system] -= 1
+        if target.name in self.failing:
+            return 1
+        return 0
+
+
+def _targets(operating_system: OperatingSystem) -> list[BuildTarget]:
+    """Return some targets for the operating system."""
+    return [
+        BuildTarget(
+            nuke_version=version,
+            operating_system=operating_system,
+            dockerfile=Path(
+                f"dockerfiles/{version}/{operating_system.value}/Dockerfile"
+            ),
+        )
+        for version in ["14.0", "14.1", "15.0", "15.1", "16.0"]
+    ]
+
+
+def test_run_respects_worker_limits(tmp_path: Path) -> None:
+    """Test to never exceed the worker limit per operating system."""
+    runner = FakeRunner()
+    max_workers = {OperatingSystem.LINUX: 3, OperatingSystem.WINDOWS: 1}
+    scheduler = BuildScheduler(
+        runner=runner, log_directory=tmp_path, max_workers=max_workers
+    )
+    targets = _targets(OperatingSystem.LINUX) + _targets(
+        OperatingSystem.WINDOWS
+    )
+
+    summary = scheduler.run(targets)
+
+    assert runner.peak == max_workers
+    assert [result.target for result in summary.results] == targets
+    assert len(summary.succeeded) == len(targets)
+
+
+def test_run_collects_failures_and_logs(tmp_path: Path) -> None:
+    """Test to report failures and write a log per target."""
+    runner = FakeRunner(failing={"15.0-linux"})
+    scheduler = BuildScheduler(runner=runner, log_directory=tmp_path)
+    targets = _targets(OperatingSystem.LINUX)
+
+    summary = scheduler.run(targets)
+
+    assert [result.target.name for result in summary.failed] == [
+        "15.0-linux"
+    ]
+    assert (tmp_path / "15.0-linux.log").read_text() == (
+        "building 15.0-linux\n"
+    )
+    summary_data = summary.to_dict()
+    assert summary_data["total"] == len(targets)
+    assert summary_data["failed"] == 1
+    assert summary_data["results"][2]["returncode"] == 1
+
+
+def test_run_records_runner_errors(tmp_path: Path) -> None:
+    """Test an engine that can not be started to mark the build failed."""
+
+    class MissingEngineRunner(BuildRunner):
+        def build(self, target: BuildTarget, log_file: TextIO) -> int:
+            msg = "No such file or directory: 'docker'"
+            raise FileNotFoundError(msg)
+
+    scheduler = BuildScheduler(
+        runner=MissingEngineRunner(), log_directory=tmp_path
+    )
+
+    summary = scheduler.run(_targets(OperatingSystem.WINDOWS)[:1])
+
+    assert summary.results[0].returncode == -1
+    assert "docker" in summary.results[0].error
+
+
+class ArtifactRunner(FakeRunner):
+    """Runner that counts builds and keeps the built images."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.built: list[str] = []
+
+    def build(self, target: BuildTarget, log_file: TextIO) -> int:
+        """Pretend to build and remember the target."""
+        self.built.append(target.name)
+        return super().build(target, log_file)
+
+    def has_artifact(self, target: BuildTarget) -> bool:
+        """Return if the target was built by this runner."""
+        return target.name in self.built
+
+
+def test_run_skips_unchanged_targets(tmp_path: Path) -> None:
+    """Test to only build targets whose inputs changed."""
+    targets = _targets(OperatingSystem.LINUX)
+    for target in targets:
+        dockerfile = tmp_path / target.dockerfile
+        dockerfile.parent.mkdir(parents=True)
+        dockerfile.write_text(f"FROM rockylinux:8\n# {target.name}\n")
+    runner = ArtifactRunner()
+    scheduler = BuildScheduler(
+        runner=runner,
+        log_directory=tmp_path / "logs",
+        build_cache=BuildCache(tmp_path),
+    )
+    scheduler.run(targets)
+    (tmp_path / targets[-1].dockerfile).write_text("FROM rockylinux:9\n")
+
+    summary = scheduler.run(targets)
+
+    assert len(runner.built) == len(targets) + 1
+    assert runner.built[-1] == "16.0-linux"
+    assert [result.target.name for result in summary.cached] == [
+        "14.0-linux",
+        "14.1-linux",
+        "15.0-linux",
+        "15.1-linux",
+    ]
+    assert summary.to_dict()["cached"] == len(summary.cached)
+    assert not summary.failed
+
+
+def test_run_rebuilds_missing_artifacts(tmp_path: Path) -> None:
+    """Test to build again if the image of the last build is gone."""
+    target = _targets(OperatingSystem.LINUX)[0]
+    dockerfile = tmp_path / target.dockerfile
+    dockerfile.parent.mkdir(parents=True)
+    dockerfile.write_text("FROM rockylinux:8\n")
+    build_cache = BuildCache(tmp_path)
+    build_cache.record(target, build_cache.input_key(target))
+    runner = ArtifactRunner()
+    scheduler = BuildScheduler(
+        runner=runner, log_directory=tmp_path, build_cache=build_cache
+    )
+
+    summary = scheduler.run([target])
+
+    assert runner.built == ["14.0-linux"]
+    assert not summary.cached
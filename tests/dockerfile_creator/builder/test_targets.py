@@ -0,0 +1,66 @@
+"""Tests related to the discovery of build targets.
+
+@maintainer: Gilles Vink
+"""
+
+from pathlib import Path
+
+from nukedockerbuild.builder.targets import (
+    BuildTarget,
+    find_build_targets,
+    read_nuke_source,
+)
+from nukedockerbuild.datamodel.constants import OperatingSystem
+
+
+def test_find_build_targets(tmp_path: Path) -> None:
+    """Test to find all targets sorted by version and operating system."""
+    for relative_path in [
+        "dockerfiles/15.1/windows/Dockerfile",
+        "dockerfiles/15.1/linux/Dockerfile",
+        "dockerfiles/9.0/linux/Dockerfile",
+        "dockerfiles/10.0/linux/Dockerfile",
+        "dockerfiles/10.0/mac/Dockerfile",
+    ]:
+        path = tmp_path / relative_path
+        path.parent.mkdir(parents=True)
+        path.write_text("FROM image")
+    (tmp_path / "dockerfiles" / "13.0" / "linux").mkdir(parents=True)
+
+    targets = find_build_targets(tmp_path)
+
+    assert [target.name for target in targets] == [
+        "9.0-linux",
+        "10.0-linux",
+        "15.1-linux",
+        "15.1-windows",
+    ]
+    assert targets[-1] == BuildTarget(
+        nuke_version="15.1",
+        operating_system=OperatingSystem.WINDOWS,
+        dockerfile=Path("dockerfiles/15.1/windows/Dockerfile"),
+    )
+
+
+def test_build_target_tag() -> None:
+    """Test to return the tag of the image built for the target."""
+    target = BuildTarget(
+        nuke_version="15.1",
+        operating_system=OperatingSystem.LINUX,
+        dockerfile=Path("dockerfiles/15.1/linux/Dockerfile"),
+    )
+    assert target.tag == "nukedockerbuild:15.1-linux"
+
+
+def test_read_nuke_source(tmp_path: Path) -> None:
+    """Test to read the Nuke source from the dockerfile label."""
+    dockerfile = tmp_path / "Dockerfile"
+    dockerfile.write_text(
+        "FROM image\n"
+        "LABEL 'com.nukedockerbuild.nuke_version'=15.1\n"
+        "LABEL 'com.nukedockerbuild.nuke_source'='https://foundry/Nuke.tgz'\n"
+    )
+    assert read_nuke_source(dockerfile) == "https://foundry/Nuke.tgz"
+
+    dockerfile.write_text("FROM image\n")
+    assert read_nuke_source(dockerfile) is None
@@ -0,0 +1,83 @@
+group "base" {
+  targets = ["base-manylinux2014", "base-msvc-17", "base-rockylinux8-gcc11"]
+}
+
+group "default" {
+  targets = ["nuke-14-0-linux", "nuke-15-1-linux", "nuke-15-1-windows"]
+}
+
+group "linux" {
+  targets = ["nuke-14-0-linux", "nuke-15-1-linux"]
+}
+
+group "nuke-14" {
+  targets = ["nuke-14-0-linux"]
+}
+
+group "nuke-15" {
+  targets = ["nuke-15-1-linux", "nuke-15-1-windows"]
+}
+
+group "windows" {
+  targets = ["nuke-15-1-windows"]
+}
+
+target "base-manylinux2014" {
+  context    = "dockerfiles/base/manylinux2014"
+  dockerfile = "Dockerfile"
+  tags       = ["nukedockerbuild-base:manylinux2014"]
+  platforms  = ["linux/amd64"]
+  cache-from = ["type=local,src=build/cache/buildkit/base-manylinux2014"]
+  cache-to   = ["type=local,dest=build/cache/buildkit/base-manylinux2014,mode=max"]
+}
+
+target "base-msvc-17" {
+  context    = "dockerfiles/base/msvc-17"
+  dockerfile = "Dockerfile"
+  tags       = ["nukedockerbuild-base:msvc-17"]
+  platforms  = ["linux/amd64"]
+  cache-from = ["type=local,src=build/cache/buildkit/base-msvc-17"]
+  cache-to   = ["type=local,dest=build/cache/buildkit/base-msvc-17,mode=max"]
+}
+
+target "base-rockylinux8-gcc11" {
+  context    = "dockerfiles/base/rockylinux8-gcc11"
+  dockerfile = "Dockerfile"
+  tags       = ["nukedockerbuild-base:rockylinux8-gcc11"]
+  platforms  = ["linux/amd64"]
+  cache-from = ["type=local,src=build/cache/buildkit/base-rockylinux8-gcc11"]
+  cache-to   = ["type=local,dest=build/cache/buildkit/base-rockylinux8-gcc11,mode=max"]
+}
+
+target "nuke-14-0-linux" {
+  context    = "dockerfiles/14.0/linux"
+  dockerfile = "Dockerfile"
+  tags       = ["nukedockerbuild:14.0-linux"]
+  platforms  = ["linux/amd64"]
+  args       = { "NUKE_SOURCE_FILES" = "_nuke_sources" }
+  contexts   = { "nukedockerbuild-base:manylinux2014" = "target:base-manylinux2014" }
+  cache-from = ["type=local,src=build/cache/buildkit/nuke-14-0-linux", "type=local,src=build/cache/buildkit/base-manylinux2014"]
+  cache-to   = ["type=local,dest=build/cache/buildkit/nuke-14-0-linux,mode=max"]
+}
+
+target "nuke-15-1-linux" {
+  context    = "dockerfiles/15.1/linux"
+  dockerfile = "Dockerfile"
+  tags       = ["nukedockerbuild:15.1-linux"]
+  platforms  = ["linux/amd64"]
+  args       = { "NUKE_SOURCE_FILES" = "_nuke_sources" }
+  contexts   = { "nukedockerbuild-base:rockylinux8-gcc11" = "target:base-rockylinux8-gcc11" }
+  cache-from = ["type=local,src=build/cache/buildkit/nuke-15-1-linux", "type=local,src=build/cache/buildkit/base-rockylinux8-gcc11"]
+  cache-to   = ["type=local,dest=build/cache/buildkit/nuke-15-1-linux,mode=max"]
+}
+
+target "nuke-15-1-windows" {
+  context    = "dockerfiles/15.1/windows"
+  dockerfile = "Dockerfile"
+  tags       = ["nukedockerbuild:15.1-windows"]
+  platforms  = ["linux/amd64"]
+  args       = { "NUKE_SOURCE_FILES" = "_nuke_sources", "TOOLCHAIN" = "toolchain.cmake" }
+  contexts   = { "nukedockerbuild-base:msvc-17" = "target:base-msvc-17" }
+  cache-from = ["type=local,src=build/cache/buildkit/nuke-15-1-windows", "type=local,src=build/cache/buildkit/base-msvc-17"]
+  cache-to   = ["type=local,dest=build/cache/buildkit/nuke-15-1-windows,mode=max"]
+}
@@ -0,0 +1,161 @@
+"""Tests for the bake file of the dockerfiles tree."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.creator.bake import BakeFile, target_name
+from nukedockerbuild.creator.create_dockerfiles import (
+    plan_dockerfiles,
+    write_dockerfiles,
+)
+from nukedockerbuild.datamodel.constants import OperatingSystem
+from nukedockerbuild.datamodel.docker_data import Dockerfile
+
+GOLDEN_DIRECTORY = Path(__file__).parent / "golden"
+
+
+@pytest.fixture
+def dockerfiles() -> list[Dockerfile]:
+    """Return dockerfiles covering both systems and two majors."""
+    return [
+        Dockerfile(
+            operating_system=OperatingSystem.WINDOWS,
+            nuke_version=15.1,
+            nuke_source="https://example.com/Nuke15.1v1-win-x86_64.zip",
+            use_base_image=True,
+        ),
+        Dockerfile(
+            operating_system=OperatingSystem.LINUX,
+            nuke_version=15.1,
+            nuke_source="https://example.com/Nuke15.1v1-linux-x86_64.tgz",
+            use_base_image=True,
+        ),
+        Dockerfile(
+            operating_system=OperatingSystem.LINUX,
+            nuke_version=14.0,
+            nuke_source="https://example.com/Nuke14.0v5-linux-x86_64.tgz",
+            use_base_image=True,
+        ),
+    ]
+
+
+def _bake_file(tmp_path: Path, dockerfiles: list[Dockerfile]) -> BakeFile:
+    """Return the bake file for dockerfiles."""
+    return BakeFile.from_planned(
+        plan_dockerfiles(tmp_path, dockerfiles).planned
+    )
+
+
+def test_target_name() -> None:
+    """Test to replace dots, as bake does not allow them in names."""
+    assert target_name("15.1-linux") == "nuke-15-1-linux"
+
+
+@pytest.mark.parametrize(
+    ("golden_file", "render"),
+    [
+        ("docker-bake.hcl", BakeFile.to_hcl),
+        ("docker-bake.json", BakeFile.to_json),
+    ],
+)
+def test_bake_file_matches_golden_file(
+    tmp_path: Path,
+    dockerfiles: list[Dockerfile],
+    golden_file: str,
+    render: callable,
+) -> None:
+    """Test the rendered bake file against the golden file."""
+    bake_file = _bake_file(tmp_path, dockerfiles)
+
+    assert render(bake_file) == (GOLDEN_DIRECTORY / golden_file).read_text()
+
+
+def test_bake_file_is_deterministic(
+    tmp_path: Path, dockerfiles: list[Dockerfile]
+) -> None:
+    """Test the order of the dockerfiles to not change the bake file."""
+    bake_file = _bake_file(tmp_path, dockerfiles)
+    reversed_bake_file = _bake_file(tmp_path, dockerfiles[::-1])
+
+    assert bake_file.to_hcl() == reversed_bake_file.to_hcl()
+    assert bake_file.to_json() == reversed_bake_file.to_json()
+
+
+def test_bake_file_without_base_images(tmp_path: Path) -> None:
+    """Test targets to build from the upstream image without a base."""
+    dockerfile = Dockerfile(
+        operating_system=OperatingSystem.LINUX,
+        nuke_version=15.1,
+        nuke_source="15.1_url",
+    )
+
+    bake_file = _bake_file(tmp_path, [dockerfile])
+
+    assert bake_file.to_dict() == {
+        "group": {
+            "default": {"targets": ["nuke-15-1-linux"]},
+            "linux": {"targets": ["nuke-15-1-linux"]},
+            "nuke-15": {"targets": ["nuke-15-1-linux"]},
+        },
+        "target": {
+            "nuke-15-1-linux": {
+                "context": "dockerfiles/15.1/linux",
+                "dockerfile": "Dockerfile",
+                "tags": ["nukedockerbuild:15.1-linux"],
+                "platforms": ["linux/amd64"],
+                "args": {"NUKE_SOURCE_FILES": "_nuke_sources"},
+                "cache-from": [
+                    "type=local,src=build/cache/buildkit/nuke-15-1-linux"
+                ],
+                "cache-to": [
+                    (
+                        "type=local,dest=build/cache/buildkit/"
+                        "nuke-15-1-linux,mode=max"
+                    )
+                ],
+            }
+        },
+    }
+
+
+def test_bake_file_with_shared_sources(tmp_path: Path) -> None:
+    """Test Linux targets to pass the shared sources as argument."""
+    dockerfile = Dockerfile(
+        operating_system=OperatingSystem.LINUX,
+        nuke_version=15.1,
+        nuke_source="15.1_url",
+        use_shared_sources=True,
+    )
+
+    bake_file = _bake_file(tmp_path, [dockerfile])
+
+    assert bake_file.to_dict()["target"]["nuke-15-1-linux"]["args"] == {
+        "NUKE_SOURCE_FILES": "_nuke_sources",
+        "NUKE_SHARED_SOURCE_FILES": "_nuke_sources_shared",
+    }
+
+
+def test_write_dockerfiles_with_bake(
+    tmp_path: Path, dockerfiles: list[Dockerfile]
+) -> None:
+    """Test to write the bake files next to the dockerfiles folder."""
+    write_dockerfiles(tmp_path, dockerfiles, write_bake=True)
+
+    assert (tmp_path / "docker-bake.hcl").read_text() == (
+        GOLDEN_DIRECTORY / "docker-bake.hcl"
+    ).read_text()
+    bake_data = json.loads((tmp_path / "docker-bake.json").read_text())
+    for target in bake_data["target"].values():
+        assert (tmp_path / target["context"] / "Dockerfile").is_file()
+
+
+def test_write_dockerfiles_without_bake(
+    tmp_path: Path, dockerfiles: list[Dockerfile]
+) -> None:
+    """Test to not write bake files by default."""
+    write_dockerfiles(tmp_path, dockerfiles)
+
+    assert not (tmp_path / "docker-bake.hcl").exists()
+    assert not (tmp_path / "docker-bake.json").exists()
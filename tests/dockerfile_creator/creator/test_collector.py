@@ -3,27 +3,27 @@
 @maintainer: Gilles Vink
 """
 
-from unittest.mock import MagicMock, patch
+import json
+from pathlib import Path
+from unittest.mock import patch
 
 import pytest
+
 from nukedockerbuild.creator.collector import (
+    DockerfileOptions,
     _nuke_version_to_float,
     fetch_json_data,
+    fetch_release_index,
     get_dockerfiles,
+    iter_dockerfiles,
 )
-from nukedockerbuild.datamodel.constants import (
-    JSON_DATA_SOURCE,
-    OperatingSystem,
-)
+from nukedockerbuild.creator.feed_cache import FeedCache
+from nukedockerbuild.creator.feed_fetcher import FeedFetcher
+from nukedockerbuild.creator.release_index import ReleaseIndex
+from nukedockerbuild.datamodel.constants import OperatingSystem
 from nukedockerbuild.datamodel.docker_data import Dockerfile
-from requests import Response
-
-
-@pytest.fixture(autouse=True)
-def _mock_requests():
-    """Automatically patch every test to prevent actual calls."""
-    with patch("nukedockerbuild.creator.collector.requests.get"):
-        yield
+from nukedockerbuild.datamodel.version import NukeVersion
+from tests.conftest import LocalHTTPServer, ServedFile
 
 
 @pytest.fixture()
@@ -58,36 +58,160 @@ def dummy_data() -> dict:
     }
 
 
-def test_fetch_json_data(dummy_data: dict) -> None:
-    """Test to make requests to Github and collect JSON."""
-    response_mock = MagicMock(spec=Response)
-    response_mock.json.return_value = dummy_data
-    response_mock.status_code = 200
+def test_fetch_json_data(
+    http_server: LocalHTTPServer, dummy_data: dict
+) -> None:
+    """Test to fetch the release feed from the mirror."""
+    url = http_server.add(
+        "/releases.json", ServedFile(json.dumps(dummy_data).encode())
+    )
+
+    collected_data = fetch_json_data(fetcher=FeedFetcher([url]))
+
+    assert collected_data == dummy_data
+    assert [request[:2] for request in http_server.requests] == [
+        ("GET", "/releases.json")
+    ]
+
+
+def test_fetch_json_data_stores_snapshot_in_cache(
+    tmp_path: Path, http_server: LocalHTTPServer, dummy_data: dict
+) -> None:
+    """Test a response to be stored with its validators once committed."""
+    url = http_server.add(
+        "/releases.json",
+        ServedFile(json.dumps(dummy_data).encode(), etag='"abc"'),
+    )
+    cache = FeedCache(tmp_path)
+
+    fetch_json_data(cache=cache, fetcher=FeedFetcher([url]))
+    staged_data = cache.load()
+    cache.commit()
+
+    assert staged_data is None
+    assert cache.load() == dummy_data
+    assert cache.conditional_headers(url) == {"If-None-Match": '"abc"'}
+    assert cache.conditional_headers() == {}
+
+
+def test_fetch_json_data_not_modified(
+    tmp_path: Path, http_server: LocalHTTPServer, dummy_data: dict
+) -> None:
+    """Test a 304 response to return None and send conditional headers."""
+    url = http_server.add(
+        "/releases.json",
+        ServedFile(json.dumps(dummy_data).encode(), etag='"abc"'),
+    )
+    cache = FeedCache(tmp_path)
+    cache.store(dummy_data, etag='"abc"', source=url)
+
+    collected_data = fetch_json_data(cache=cache, fetcher=FeedFetcher([url]))
+
+    assert http_server.requests[0][2]["If-None-Match"] == '"abc"'
+    assert collected_data is None
+
+
+def test_fetch_json_data_offline(tmp_path: Path, dummy_data: dict) -> None:
+    """Test offline mode to return the snapshot without any request."""
+    cache = FeedCache(tmp_path)
+    cache.store(dummy_data)
     with patch(
-        "nukedockerbuild.creator.collector.requests.get",
-        return_value=response_mock,
-    ) as requests_get_mock:
-        collected_data = fetch_json_data()
-    requests_get_mock.assert_called_once_with(JSON_DATA_SOURCE, timeout=10)
+        "nukedockerbuild.creator.collector.FeedFetcher"
+    ) as fetcher_mock:
+        collected_data = fetch_json_data(cache=cache, offline=True)
+
+    fetcher_mock.assert_not_called()
     assert collected_data == dummy_data
 
 
+def test_fetch_json_data_offline_without_snapshot(tmp_path: Path) -> None:
+    """Test offline mode to raise an exception if nothing is cached."""
+    with pytest.raises(
+        ValueError, match=r"No cached release data available to use offline\."
+    ):
+        fetch_json_data(cache=FeedCache(tmp_path), offline=True)
+
+
+def test_fetch_release_index_offline(
+    tmp_path: Path, dummy_data: dict
+) -> None:
+    """Test offline mode to stream the releases from the snapshot."""
+    cache = FeedCache(tmp_path)
+    cache.store(dummy_data)
+    with patch(
+        "nukedockerbuild.creator.collector.FeedFetcher"
+    ) as fetcher_mock:
+        index = fetch_release_index(cache=cache, offline=True)
+
+    fetcher_mock.assert_not_called()
+    assert index.releases == ReleaseIndex.from_feed(dummy_data).releases
+
+
+def test_fetch_release_index_offline_without_snapshot(tmp_path: Path) -> None:
+    """Test offline mode to raise an exception if nothing is cached."""
+    with pytest.raises(
+        ValueError, match=r"No cached release data available to use offline\."
+    ):
+        fetch_release_index(cache=FeedCache(tmp_path), offline=True)
+
+
+def test_fetch_release_index(
+    http_server: LocalHTTPServer, tmp_path: Path, dummy_data: dict
+) -> None:
+    """Test to index the fetched feed, or None if it is not modified."""
+    url = http_server.add(
+        "/releases.json",
+        ServedFile(json.dumps(dummy_data).encode(), etag='"abc"'),
+    )
+    cache = FeedCache(tmp_path)
+
+    index = fetch_release_index(cache=cache, fetcher=FeedFetcher([url]))
+    cache.commit("fingerprint")
+
+    assert len(index) == sum(len(releases) for releases in dummy_data.values())
+    assert (
+        fetch_release_index(
+            cache=cache,
+            fetcher=FeedFetcher([url]),
+            fingerprint="fingerprint",
+        )
+        is None
+    )
+
+
+def test_fetch_release_index_with_other_fingerprint(
+    http_server: LocalHTTPServer, tmp_path: Path, dummy_data: dict
+) -> None:
+    """Test a feed that is not modified to be used if options changed."""
+    url = http_server.add(
+        "/releases.json",
+        ServedFile(json.dumps(dummy_data).encode(), etag='"abc"'),
+    )
+    cache = FeedCache(tmp_path)
+    cache.store(dummy_data, etag='"abc"', fingerprint="old", source=url)
+
+    index = fetch_release_index(
+        cache=cache, fetcher=FeedFetcher([url]), fingerprint="new"
+    )
+
+    assert http_server.requests[0][2]["If-None-Match"] == '"abc"'
+    assert [str(release.version) for release in index] == [
+        "14.1v2",
+        "15.0v2",
+        "15.1v5",
+    ]
+
+
 @pytest.mark.parametrize("test_status_code", [403, 404])
-def test_fetch_json_data_but_no_data_found(test_status_code: int) -> None:
+def test_fetch_json_data_but_no_data_found(
+    http_server: LocalHTTPServer, test_status_code: int
+) -> None:
     """Test to make sure we raise an exception when data is not found."""
-    requests_get_mock = MagicMock(spec=Response)
-    requests_get_mock.status_code = test_status_code
-    with (
-        patch(
-            "nukedockerbuild.creator.collector.requests.get",
-            return_value=requests_get_mock,
-        ),
-        pytest.raises(
-            ValueError,
-            match="Request returned 404. Please check the URL and try again.",
-        ),
-    ):
-        fetch_json_data()
+    url = http_server.add(
+        "/releases.json", ServedFile(b"", status=test_status_code)
+    )
+    with pytest.raises(ValueError, match=f"returned {test_status_code}"):
+        fetch_json_data(fetcher=FeedFetcher([url], retry_budget=0))
 
 
 @pytest.mark.parametrize(
@@ -138,6 +262,18 @@ def test_get_dockerfiles(dummy_data: dict) -> None:
     assert get_dockerfiles(dummy_data) == expected_dockerfiles
 
 
+def test_iter_dockerfiles_is_lazy(dummy_data: dict) -> None:
+    """Test dockerfiles to be created one at a time from an index."""
+    dockerfiles = iter_dockerfiles(ReleaseIndex.from_feed(dummy_data))
+
+    assert next(dockerfiles) == Dockerfile(
+        operating_system=OperatingSystem.LINUX,
+        nuke_version=15.0,
+        nuke_source="linux_url",
+    )
+    assert len(list(dockerfiles)) == len(get_dockerfiles(dummy_data)) - 1
+
+
 def test_get_dockerfiles_but_skip_11_only_on_windows() -> None:
     """Test to not include version 12 as this is not valid for images."""
     dummy_data = {
@@ -164,3 +300,54 @@ def test_get_dockerfiles_but_skip_11_only_on_windows() -> None:
         ),
     ]
     assert get_dockerfiles(dummy_data) == expected_dockerfiles
+
+
+@pytest.mark.parametrize(
+    ("filters", "expected_dockerfiles"),
+    [
+        ({"versions": ["15"]}, [(15.0, "linux"), (15.0, "windows")]),
+        ({"versions": ["14.1v2"]}, [(14.1, "linux"), (14.1, "windows")]),
+        ({"since": NukeVersion(15)}, [(15.0, "linux"), (15.0, "windows")]),
+        (
+            {"operating_systems": [OperatingSystem.WINDOWS]},
+            [(15.0, "windows"), (14.1, "windows")],
+        ),
+        (
+            {
+                "versions": ["14", "15.0"],
+                "operating_systems": [OperatingSystem.LINUX],
+            },
+            [(15.0, "linux"), (14.1, "linux")],
+        ),
+        ({"versions": ["13"]}, []),
+    ],
+)
+def test_get_dockerfiles_with_filters(
+    dummy_data: dict,
+    filters: dict,
+    expected_dockerfiles: list[tuple[float, str]],
+) -> None:
+    """Test to only create dockerfiles for the selected releases."""
+    dockerfiles = get_dockerfiles(dummy_data, DockerfileOptions(**filters))
+
+    assert [
+        (dockerfile.nuke_version, dockerfile.operating_system.value)
+        for dockerfile in dockerfiles
+    ] == expected_dockerfiles
+
+
+def test_get_dockerfiles_uses_latest_patch_release() -> None:
+    """Test patch releases of the same minor to result in one dockerfile."""
+    dummy_data = {
+        "15": {
+            "15.1v10": {"installer": {"linux_x86_64": "15.1v10_url"}},
+            "15.1v9": {"installer": {"linux_x86_64": "15.1v9_url"}},
+        },
+        "9": {"9.0v1": {"installer": {"linux_x86_64": "9.0v1_url"}}},
+    }
+
+    dockerfiles = get_dockerfiles(dummy_data)
+
+    assert [dockerfile.nuke_source for dockerfile in dockerfiles] == [
+        "15.1v10_url"
+    ]
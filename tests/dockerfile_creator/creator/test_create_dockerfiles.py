@@ -1,39 +1,102 @@
 """Tests for the script that creates the dockerfiles."""
+from collections.abc import Iterator
 from pathlib import Path
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 
 from nukedockerbuild.creator.create_dockerfiles import (
     _get_dockerfile_path,
-    _keep_only_new_dockerfiles,
+    generation_fingerprint,
+    plan_dockerfiles,
     write_dockerfiles,
 )
+from nukedockerbuild.creator.manifest import content_hash
 from nukedockerbuild.datamodel.constants import OperatingSystem
 from nukedockerbuild.datamodel.docker_data import Dockerfile
 
 
-def test__keep_only_new_dockerfiles(tmp_path: Path) -> None:
-    """Test to remove any dockerfiles that already exist from the list."""
-    existing_file = tmp_path / "dockerfiles" / "13.2" / "linux" / "Dockerfile"
-    existing_file.parent.mkdir(parents=True)
-    existing_file.write_text("dummy content")
+def _write_existing(tmp_path: Path, relative_path: str, content: str) -> Path:
+    """Write an existing dockerfile to the temporary directory."""
+    existing_file = tmp_path / relative_path
+    existing_file.parent.mkdir(parents=True, exist_ok=True)
+    existing_file.write_text(content)
+    return existing_file
 
-    to_be_removed_dockerfile = Dockerfile(
+
+def test_plan_dockerfiles(tmp_path: Path) -> None:
+    """Test to sort dockerfiles by the changes needed to the tree."""
+    unchanged_dockerfile = Dockerfile(
         operating_system=OperatingSystem.LINUX,
         nuke_version=13.2,
-        nuke_source=None,
+        nuke_source="13.2_url",
+    )
+    changed_dockerfile = Dockerfile(
+        operating_system=OperatingSystem.LINUX,
+        nuke_version=15.1,
+        nuke_source="15.1v7_url",
     )
     new_dockerfile = Dockerfile(
         operating_system=OperatingSystem.LINUX,
         nuke_version=13.1,
-        nuke_source=None,
+        nuke_source="13.1_url",
+    )
+    _write_existing(
+        tmp_path,
+        "dockerfiles/13.2/linux/Dockerfile",
+        unchanged_dockerfile.to_dockerfile(),
+    )
+    _write_existing(
+        tmp_path,
+        "dockerfiles/15.1/linux/Dockerfile",
+        Dockerfile(
+            operating_system=OperatingSystem.LINUX,
+            nuke_version=15.1,
+            nuke_source="15.1v6_url",
+        ).to_dockerfile(),
+    )
+    _write_existing(
+        tmp_path, "dockerfiles/9.0/linux/Dockerfile", "dummy content"
     )
-    test_dockerfiles = [to_be_removed_dockerfile, new_dockerfile]
 
-    _keep_only_new_dockerfiles(tmp_path, test_dockerfiles)
+    plan = plan_dockerfiles(
+        tmp_path, [unchanged_dockerfile, changed_dockerfile, new_dockerfile]
+    )
 
-    assert test_dockerfiles == [new_dockerfile]
+    assert [planned.dockerfile for planned in plan.added] == [new_dockerfile]
+    assert [planned.dockerfile for planned in plan.changed] == [
+        changed_dockerfile
+    ]
+    assert [planned.dockerfile for planned in plan.unchanged] == [
+        unchanged_dockerfile
+    ]
+    assert plan.unchanged[0].content_hash == content_hash(
+        unchanged_dockerfile.to_dockerfile()
+    )
+    assert plan.removed == [Path("dockerfiles/9.0/linux/Dockerfile")]
+    assert plan.format().splitlines() == [
+        "+ dockerfiles/13.1/linux/Dockerfile",
+        "~ dockerfiles/15.1/linux/Dockerfile",
+        "- dockerfiles/9.0/linux/Dockerfile",
+        "1 added, 1 changed, 1 removed, 1 unchanged.",
+    ]
+
+
+def test_plan_dockerfiles_without_removed(tmp_path: Path) -> None:
+    """Test a selection of dockerfiles to not list the others as removed."""
+    _write_existing(
+        tmp_path, "dockerfiles/13.2/linux/Dockerfile", "dummy content"
+    )
+    dockerfile = Dockerfile(
+        operating_system=OperatingSystem.LINUX,
+        nuke_version=15.1,
+        nuke_source="15.1_url",
+    )
+
+    plan = plan_dockerfiles(tmp_path, [dockerfile], include_removed=False)
+
+    assert plan.removed == []
+    assert [planned.dockerfile for planned in plan.added] == [dockerfile]
 
 
 def test_write_dockerfiles(tmp_path) -> None:
@@ -52,6 +115,90 @@ def test_write_dockerfiles(tmp_path) -> None:
     assert expected_path.read_text() == test_dockerfile.to_dockerfile()
 
 
+def test_write_dockerfiles_only_writes_changes(tmp_path: Path) -> None:
+    """Test to rewrite changed dockerfiles and leave the others untouched."""
+    unchanged_dockerfile = Dockerfile(
+        operating_system=OperatingSystem.LINUX,
+        nuke_version=13.2,
+        nuke_source="13.2_url",
+    )
+    changed_dockerfile = Dockerfile(
+        operating_system=OperatingSystem.WINDOWS,
+        nuke_version=15.1,
+        nuke_source="15.1v7_url",
+    )
+    # Only the created date differs, which is not considered a change.
+    unchanged_content = unchanged_dockerfile.to_dockerfile().replace(
+        "image.created'='", "image.created'='1999-"
+    )
+    unchanged_file = _write_existing(
+        tmp_path, "dockerfiles/13.2/linux/Dockerfile", unchanged_content
+    )
+    changed_file = _write_existing(
+        tmp_path, "dockerfiles/15.1/windows/Dockerfile", "outdated content"
+    )
+    removed_file = _write_existing(
+        tmp_path, "dockerfiles/9.0/linux/Dockerfile", "dummy content"
+    )
+
+    plan = write_dockerfiles(
+        tmp_path, [unchanged_dockerfile, changed_dockerfile]
+    )
+
+    assert unchanged_file.read_text() == unchanged_content
+    assert changed_file.read_text() == changed_dockerfile.to_dockerfile()
+    assert removed_file.read_text() == "dummy content"
+    assert len(plan.to_write) == 1
+
+
+def test_write_dockerfiles_from_generator(tmp_path: Path) -> None:
+    """Test every dockerfile to be written before the next is created."""
+    versions = [15.1, 15.0, 14.1]
+
+    def dockerfiles() -> Iterator[Dockerfile]:
+        for index, version in enumerate(versions):
+            written = sorted(tmp_path.glob("dockerfiles/*/linux/Dockerfile"))
+            assert len(written) == index
+            yield Dockerfile(
+                operating_system=OperatingSystem.LINUX,
+                nuke_version=version,
+                nuke_source=f"{version}_url",
+            )
+
+    plan = write_dockerfiles(tmp_path, dockerfiles())
+
+    assert len(plan.added) == len(versions)
+
+
+def test_write_dockerfiles_with_base_images(tmp_path: Path) -> None:
+    """Test to write every shared base image once."""
+    dockerfiles = [
+        Dockerfile(
+            operating_system=operating_system,
+            nuke_version=version,
+            nuke_source="url",
+            use_base_image=True,
+        )
+        for version in [15.0, 15.1, 16.0]
+        for operating_system in OperatingSystem
+    ]
+
+    plan = write_dockerfiles(tmp_path, dockerfiles)
+
+    base_path = tmp_path / "dockerfiles/base/rockylinux8-gcc11/Dockerfile"
+    linux_dockerfile = next(
+        dockerfile
+        for dockerfile in dockerfiles
+        if dockerfile.operating_system == OperatingSystem.LINUX
+    )
+    assert base_path.read_text() == (
+        linux_dockerfile.base_dockerfile.to_dockerfile()
+    )
+    windows_base_path = tmp_path / "dockerfiles/base/msvc-17/Dockerfile"
+    assert windows_base_path.is_file()
+    assert len(plan.added) == len(dockerfiles) + 2
+
+
 @pytest.mark.parametrize(
     ("test_operating_system", "test_nuke_version", "expected_path"),
     [
@@ -77,3 +224,22 @@ def test__get_dockerfile_path(
     dockerfile_mock.operating_system = test_operating_system
     dockerfile_mock.nuke_version = test_nuke_version
     assert _get_dockerfile_path(dockerfile_mock) == expected_path
+
+
+def test_generation_fingerprint(tmp_path: Path) -> None:
+    """Test the fingerprint to change with the options and templates."""
+    template = tmp_path / "datamodel" / "docker_data.py"
+    template.parent.mkdir()
+    template.write_text("TEMPLATE = 1")
+    with patch(
+        "nukedockerbuild.creator.create_dockerfiles._PACKAGE_DIRECTORY",
+        tmp_path,
+    ):
+        fingerprint = generation_fingerprint({"bake": False})
+        other_options = generation_fingerprint({"bake": True})
+        template.write_text("TEMPLATE = 2")
+        other_template = generation_fingerprint({"bake": False})
+
+    assert fingerprint != other_options
+    assert fingerprint != other_template
+    assert other_options != other_template
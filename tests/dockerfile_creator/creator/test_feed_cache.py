@@ -0,0 +1,121 @@
+"""Tests related to the feed cache.
+
+@maintainer: Gilles Vink
+"""
+
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.creator.feed_cache import FeedCache
+
+
+@pytest.fixture
+def feed_cache(tmp_path: Path) -> FeedCache:
+    """Return a feed cache in a temporary directory."""
+    return FeedCache(tmp_path / "cache")
+
+
+def test_load_without_snapshot(feed_cache: FeedCache) -> None:
+    """Test to return None if nothing has been cached yet."""
+    assert feed_cache.load() is None
+
+
+def test_load_with_corrupt_snapshot(feed_cache: FeedCache) -> None:
+    """Test to ignore a snapshot that can not be parsed."""
+    feed_cache.directory.mkdir()
+    feed_cache.snapshot_path.write_text("{not json")
+
+    assert feed_cache.load() is None
+
+
+def test_store_and_load(feed_cache: FeedCache) -> None:
+    """Test to store a snapshot and load it back."""
+    feed_cache.store({"15": {"15.1v5": {}}}, etag='"tag"')
+
+    assert feed_cache.load() == {"15": {"15.1v5": {}}}
+    assert not list(feed_cache.directory.glob("*.tmp"))
+
+
+@pytest.mark.parametrize(
+    ("test_etag", "test_last_modified", "expected_headers"),
+    [
+        (None, None, {}),
+        ('"tag"', None, {"If-None-Match": '"tag"'}),
+        (
+            None,
+            "Wed, 21 Oct 2015 07:28:00 GMT",
+            {"If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"},
+        ),
+    ],
+)
+def test_conditional_headers(
+    feed_cache: FeedCache,
+    test_etag: str | None,
+    test_last_modified: str | None,
+    expected_headers: dict[str, str],
+) -> None:
+    """Test to return validators stored with the snapshot as headers."""
+    feed_cache.store({}, etag=test_etag, last_modified=test_last_modified)
+
+    assert feed_cache.conditional_headers() == expected_headers
+
+
+def test_conditional_headers_without_snapshot(feed_cache: FeedCache) -> None:
+    """Test to not send validators if there is no snapshot to fall back to."""
+    feed_cache.store({}, etag='"tag"')
+    feed_cache.snapshot_path.unlink()
+
+    assert feed_cache.conditional_headers() == {}
+
+
+def test_commit_staged_feed(feed_cache: FeedCache) -> None:
+    """Test a staged feed to only be used once it is committed."""
+    feed_cache.store({"15": {}}, etag='"old"', fingerprint="old")
+    feed_cache.stage({"16": {}}, etag='"new"')
+
+    assert feed_cache.load() == {"15": {}}
+    assert feed_cache.conditional_headers() == {"If-None-Match": '"old"'}
+
+    feed_cache.commit("new")
+
+    assert feed_cache.load() == {"16": {}}
+    assert feed_cache.conditional_headers() == {"If-None-Match": '"new"'}
+    assert feed_cache.fingerprint == "new"
+
+
+def test_commit_without_staged_feed(feed_cache: FeedCache) -> None:
+    """Test to only record the fingerprint if nothing is staged."""
+    feed_cache.store({"15": {}}, etag='"tag"')
+    FeedCache(feed_cache.directory).commit("fingerprint")
+
+    assert feed_cache.load() == {"15": {}}
+    assert feed_cache.conditional_headers() == {"If-None-Match": '"tag"'}
+    assert feed_cache.fingerprint == "fingerprint"
+
+
+def test_conditional_headers_per_mirror(feed_cache: FeedCache) -> None:
+    """Test validators to only be returned for the mirror that sent them."""
+    feed_cache.store({"15": {}}, etag='"primary"', source="primary")
+
+    assert feed_cache.conditional_headers("primary") == {
+        "If-None-Match": '"primary"'
+    }
+    assert feed_cache.conditional_headers("secondary") == {}
+
+
+def test_commit_keeps_validators_of_same_feed(feed_cache: FeedCache) -> None:
+    """Test validators of other mirrors to be kept for the same feed only."""
+    feed_cache.store({"15": {}}, etag='"primary"', source="primary")
+    feed_cache.store({"15": {}}, etag='"secondary"', source="secondary")
+
+    assert feed_cache.conditional_headers("primary") == {
+        "If-None-Match": '"primary"'
+    }
+
+    feed_cache.store({"16": {}}, etag='"new"', source="secondary")
+
+    assert feed_cache.conditional_headers("primary") == {}
+    assert feed_cache.conditional_headers("secondary") == {
+        "If-None-Match": '"new"'
+    }
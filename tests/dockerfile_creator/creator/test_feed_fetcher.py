@@ -0,0 +1,191 @@
+"""Tests for fetching the release feed from multiple mirrors."""
+
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.creator.feed_fetcher import FeedFetcher, validate_feed
+from tests.conftest import LocalHTTPServer, ServedFile
+
+FEED = {
+    "15": {
+        "15.1v5": {
+            "installer": {
+                "linux_x86_64": "https://example.com/Nuke15.1v5.tgz",
+                "mac_arm": None,
+            }
+        },
+        "15.0v2": {},
+    },
+    "14": {"14.1v2": {"installer": {}}},
+}
+
+
+def _feed_file(feed: object = FEED, **kwargs: object) -> ServedFile:
+    """Return the feed as served file."""
+    return ServedFile(json.dumps(feed).encode(), **kwargs)
+
+
+def test_validate_feed() -> None:
+    """Test a valid feed to return the amount of releases."""
+    releases = sum(len(major) for major in FEED.values())
+
+    assert validate_feed(FEED) == releases
+
+
+@pytest.mark.parametrize(
+    "test_feed",
+    [
+        [],
+        {},
+        {"latest": {}},
+        {"15": []},
+        {"15": {"nightly": {}}},
+        {"15": {"14.1v2": {}}},
+        {"15": {"15.1v5": []}},
+        {"15": {"15.1v5": {"installer": ["url"]}}},
+        {"15": {"15.1v5": {"installer": {"linux_x86_64": 1}}}},
+    ],
+)
+def test_validate_feed_invalid(test_feed: object) -> None:
+    """Test to raise for feeds that do not match the schema."""
+    with pytest.raises(ValueError, match=r"[Rr]elease|version"):
+        validate_feed(test_feed)
+
+
+def test_fetch_from_primary(http_server: LocalHTTPServer) -> None:
+    """Test a fast primary mirror to be the only one asked."""
+    primary = http_server.add("/primary.json", _feed_file(etag='"v1"'))
+    secondary = http_server.add("/secondary.json", _feed_file())
+
+    response = FeedFetcher([primary, secondary]).fetch()
+
+    assert response.data == FEED
+    assert response.source == primary
+    assert response.etag == '"v1"'
+    assert [path for _, path, _ in http_server.requests] == ["/primary.json"]
+
+
+def test_fetch_writes_body(
+    http_server: LocalHTTPServer, tmp_path: Path
+) -> None:
+    """Test the body to be written to the directory while it is parsed."""
+    primary = http_server.add("/primary.json", ServedFile(b"", status=500))
+    invalid = http_server.add("/invalid.json", _feed_file({"15": []}))
+    secondary = http_server.add("/secondary.json", _feed_file())
+
+    response = FeedFetcher([primary, invalid, secondary]).fetch(
+        directory=tmp_path
+    )
+
+    assert [str(release.version) for release in response.releases] == [
+        "15.1v5",
+        "15.0v2",
+        "14.1v2",
+    ]
+    assert list(tmp_path.iterdir()) == [response.path]
+    assert json.loads(response.path.read_text()) == FEED
+    response.discard()
+    assert not any(tmp_path.iterdir())
+
+
+def test_fetch_hedges_slow_primary(http_server: LocalHTTPServer) -> None:
+    """Test to ask the next mirror once the primary is slow."""
+    primary = http_server.add("/primary.json", _feed_file(delay=2))
+    secondary = http_server.add("/secondary.json", _feed_file())
+    start = time.perf_counter()
+
+    response = FeedFetcher([primary, secondary], hedge_delay=0.1).fetch()
+
+    assert response.source == secondary
+    assert time.perf_counter() - start < 1
+
+
+@pytest.mark.parametrize(
+    "test_primary",
+    [
+        ServedFile(b"", status=500),
+        ServedFile(b"<html>maintenance</html>"),
+        _feed_file({"15": {"nightly": {}}}),
+    ],
+)
+def test_fetch_falls_back_on_failure(
+    http_server: LocalHTTPServer, test_primary: ServedFile
+) -> None:
+    """Test a failing or invalid primary to fall back right away."""
+    primary = http_server.add("/primary.json", test_primary)
+    secondary = http_server.add("/secondary.json", _feed_file())
+    start = time.perf_counter()
+
+    response = FeedFetcher([primary, secondary], hedge_delay=5).fetch()
+
+    assert response.source == secondary
+    assert response.data == FEED
+    assert time.perf_counter() - start < 1
+
+
+@pytest.mark.parametrize("test_file_url", [True, False])
+def test_fetch_falls_back_to_local_file(
+    http_server: LocalHTTPServer, tmp_path: Path, test_file_url: bool
+) -> None:
+    """Test a local file or file URL to be used as last mirror."""
+    primary = http_server.add("/primary.json", ServedFile(b"", status=503))
+    local_path = tmp_path / "nuke-minor-releases.json"
+    local_path.write_text(json.dumps(FEED))
+    local = local_path.as_uri() if test_file_url else str(local_path)
+
+    response = FeedFetcher([primary, local]).fetch()
+
+    assert response.source == local
+    assert response.data == FEED
+
+
+def test_fetch_retry_budget(http_server: LocalHTTPServer) -> None:
+    """Test to retry the mirrors until the retry budget is spent."""
+    primary = http_server.add("/primary.json", ServedFile(b"", status=502))
+    secondary = http_server.add("/secondary.json", ServedFile(b"", status=404))
+
+    with pytest.raises(ValueError, match=r"returned 502.*returned 404"):
+        FeedFetcher([primary, secondary], retry_budget=3).fetch()
+
+    assert [path for _, path, _ in http_server.requests] == [
+        "/primary.json",
+        "/secondary.json",
+        "/primary.json",
+        "/secondary.json",
+        "/primary.json",
+    ]
+
+
+def test_fetch_not_modified(http_server: LocalHTTPServer) -> None:
+    """Test a 304 of a mirror to report the cached feed is current."""
+    url = http_server.add("/releases.json", _feed_file(etag='"v1"'))
+
+    response = FeedFetcher([url]).fetch({url: {"If-None-Match": '"v1"'}})
+
+    assert response.not_modified
+    assert response.data is None
+
+
+def test_fetch_sends_validators_per_mirror(
+    http_server: LocalHTTPServer,
+) -> None:
+    """Test every mirror to only get the validators it sent itself."""
+    primary = http_server.add("/primary.json", ServedFile(b"", status=503))
+    secondary = http_server.add("/secondary.json", _feed_file(etag='"v2"'))
+
+    response = FeedFetcher([primary, secondary]).fetch(
+        {primary: {"If-None-Match": '"v1"'}}
+    )
+
+    assert not response.not_modified
+    assert http_server.requests[0][2]["If-None-Match"] == '"v1"'
+    assert "If-None-Match" not in http_server.requests[1][2]
+
+
+def test_fetcher_needs_mirrors() -> None:
+    """Test to raise if no mirror is provided."""
+    with pytest.raises(ValueError, match="at least one mirror"):
+        FeedFetcher([])
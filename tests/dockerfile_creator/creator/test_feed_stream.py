@@ -0,0 +1,112 @@
+"""Tests for parsing the release feed incrementally."""
+
+import io
+import json
+import tracemalloc
+from collections.abc import Iterator
+
+import pytest
+
+from nukedockerbuild.benchmarks.feeds import synthetic_feed
+from nukedockerbuild.creator.feed_stream import (
+    iter_feed,
+    iter_releases,
+    read_chunks,
+)
+from nukedockerbuild.creator.release_index import ReleaseIndex
+
+FEED = {
+    "15": {
+        "15.1v5": {
+            "installer": {
+                "linux_x86_64": "https://example.com/Nuke15.1v5-ü.tgz",
+                "mac_arm": None,
+            },
+            "date": "2024-01-01",
+        },
+        "15.0v2": {},
+    },
+    "14": {},
+    "13": {"13.2v9": {"installer": {"windows_x86_64": "13.2v9_win"}}},
+}
+
+
+def _chunks(content: bytes, size: int) -> Iterator[bytes]:
+    """Split content in chunks of size."""
+    return read_chunks(io.BytesIO(content), size)
+
+
+@pytest.mark.parametrize("test_chunk_size", [1, 7, 64 * 1024])
+def test_iter_feed(test_chunk_size: int) -> None:
+    """Test the feed to be parsed the same, regardless of chunk size."""
+    content = json.dumps(FEED, indent=2).encode()
+
+    releases = list(iter_feed(_chunks(content, test_chunk_size)))
+
+    assert releases == [
+        (major, version, release_data)
+        for major, major_releases in FEED.items()
+        for version, release_data in major_releases.items()
+    ]
+
+
+def test_iter_releases() -> None:
+    """Test the streamed releases to match the index of the whole feed."""
+    content = json.dumps(FEED).encode()
+
+    releases = list(iter_releases(_chunks(content, 16)))
+
+    assert ReleaseIndex(releases).releases == (
+        ReleaseIndex.from_feed(FEED).releases
+    )
+    assert releases[0].installers["mac_arm"] is None
+
+
+def test_iter_feed_is_lazy() -> None:
+    """Test a release to be yielded before the rest is read."""
+
+    def chunks() -> Iterator[bytes]:
+        yield b'{"15": {"15.1v5": {"installer": {}}, '
+        msg = "Read too far."
+        raise AssertionError(msg)
+
+    major, version, _ = next(iter_feed(chunks()))
+
+    assert (major, version) == ("15", "15.1v5")
+
+
+@pytest.mark.parametrize(
+    ("test_content", "expected_error"),
+    [
+        (b"", "expected '{' but found 'the end'"),
+        (b"[]", "expected '{' but found '\\['"),
+        (b'{"15": {"15.1v5": {}', "expected ',' but found 'the end'"),
+        (b'{"15": {"15.1v5": {"installer"', "Release feed is invalid"),
+        (b'{"latest": {}}', "invalid major version 'latest'"),
+        (b'{"15": []}', "expected '{' but found '\\['"),
+        (b'{"15": {"14.1v2": {}}}', "listed under major 15"),
+        (b'{"15": {"15.1v5": {"installer": [1]}}}', "invalid installers"),
+        (b'{"15": {}} {}', "trailing data"),
+    ],
+)
+def test_iter_feed_invalid(test_content: bytes, expected_error: str) -> None:
+    """Test to raise for streams that are not a valid feed."""
+    with pytest.raises(ValueError, match=expected_error):
+        list(iter_feed(_chunks(test_content, 4)))
+
+
+def test_iter_feed_memory_is_flat() -> None:
+    """Test the memory to not grow with the size of the feed."""
+    amount = 20000
+    content = json.dumps(synthetic_feed(amount)).encode()
+    file = io.BytesIO(content)
+
+    tracemalloc.start()
+    try:
+        releases = sum(1 for _ in iter_releases(read_chunks(file)))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert releases == amount
+    assert peak < len(content) / 10
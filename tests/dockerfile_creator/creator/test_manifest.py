@@ -0,0 +1,68 @@
+"""Tests related to the dockerfiles manifest.
+
+@maintainer: Gilles Vink
+"""
+
+from pathlib import Path
+
+from nukedockerbuild.creator.manifest import (
+    DockerfileManifest,
+    content_hash,
+)
+
+
+def test_content_hash_ignores_created_label() -> None:
+    """Test the created date to not influence the content hash."""
+    first_render = (
+        "FROM image\nLABEL 'org.opencontainers.image.created'='2025-01-01'\n"
+    )
+    second_render = (
+        "FROM image\nLABEL 'org.opencontainers.image.created'='2025-05-18'\n"
+    )
+
+    assert content_hash(first_render) == content_hash(second_render)
+    assert content_hash(first_render) != content_hash("FROM other_image\n")
+
+
+def test_from_directory(tmp_path: Path) -> None:
+    """Test to collect a hash for every dockerfile in the tree."""
+    for relative_path in [
+        "dockerfiles/15.1/linux/Dockerfile",
+        "dockerfiles/15.1/windows/Dockerfile",
+        "dockerfiles/13.0/linux/Dockerfile",
+    ]:
+        path = tmp_path / relative_path
+        path.parent.mkdir(parents=True)
+        path.write_text(relative_path)
+    (tmp_path / "dockerfiles" / "13.0" / "linux" / "cmake").mkdir()
+    (tmp_path / "dockerfiles" / "13.0" / "windows").mkdir()
+    (tmp_path / "dockerfiles" / "README.md").write_text("not a version")
+
+    manifest = DockerfileManifest.from_directory(tmp_path)
+
+    assert manifest.hashes == {
+        Path("dockerfiles/15.1/linux/Dockerfile"): content_hash(
+            "dockerfiles/15.1/linux/Dockerfile"
+        ),
+        Path("dockerfiles/15.1/windows/Dockerfile"): content_hash(
+            "dockerfiles/15.1/windows/Dockerfile"
+        ),
+        Path("dockerfiles/13.0/linux/Dockerfile"): content_hash(
+            "dockerfiles/13.0/linux/Dockerfile"
+        ),
+    }
+
+
+def test_from_directory_without_dockerfiles(tmp_path: Path) -> None:
+    """Test to return an empty manifest if nothing has been written yet."""
+    assert DockerfileManifest.from_directory(tmp_path).hashes == {}
+
+
+def test_has_changed() -> None:
+    """Test to compare content against the stored hash."""
+    path = Path("dockerfiles/15.1/linux/Dockerfile")
+    manifest = DockerfileManifest({path: content_hash("FROM image")})
+
+    assert not manifest.has_changed(path, "FROM image")
+    assert manifest.has_changed(path, "FROM other_image")
+    assert manifest.has_changed(Path("unknown"), "FROM image")
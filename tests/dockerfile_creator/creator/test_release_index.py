@@ -0,0 +1,117 @@
+"""Tests for the sorted index of releases."""
+
+import pytest
+
+from nukedockerbuild.creator.release_index import Release, ReleaseIndex
+from nukedockerbuild.datamodel.constants import OperatingSystem
+from nukedockerbuild.datamodel.version import NukeVersion
+
+
+@pytest.fixture
+def release_index() -> ReleaseIndex:
+    """Return an index of a feed that is not sorted."""
+    return ReleaseIndex.from_feed(
+        {
+            "15": {
+                "15.1v2": {"installer": {"linux_x86_64": "15.1v2_linux"}},
+                "15.0v4": {
+                    "installer": {
+                        "linux_x86_64": "15.0v4_linux",
+                        "windows_x86_64": "15.0v4_windows",
+                    }
+                },
+                "15.1v10": {"installer": {"windows_x86_64": "15.1v10_win"}},
+            },
+            "13": {
+                "13.2v9": {"installer": {"windows_x86_64": "13.2v9_win"}},
+                "13.2v1": {"installer": {}},
+            },
+            "14": {"14.0v1": {}},
+        }
+    )
+
+
+def _versions(releases: list[Release]) -> list[str]:
+    """Return the versions of releases as strings."""
+    return [str(release.version) for release in releases]
+
+
+def test_from_feed_sorts_releases(release_index: ReleaseIndex) -> None:
+    """Test the index to be sorted by structured version."""
+    assert _versions(release_index) == [
+        "13.2v1",
+        "13.2v9",
+        "14.0v1",
+        "15.0v4",
+        "15.1v2",
+        "15.1v10",
+    ]
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "expected_versions"),
+    [
+        (NukeVersion(14), None, ["14.0v1", "15.0v4", "15.1v2", "15.1v10"]),
+        (None, NukeVersion(14), ["13.2v1", "13.2v9"]),
+        (
+            NukeVersion(13, 2, 5),
+            NukeVersion(15, 1),
+            ["13.2v9", "14.0v1", "15.0v4"],
+        ),
+        (NukeVersion(16), None, []),
+    ],
+)
+def test_between(
+    release_index: ReleaseIndex,
+    start: NukeVersion | None,
+    end: NukeVersion | None,
+    expected_versions: list[str],
+) -> None:
+    """Test to return the releases within the range."""
+    assert _versions(release_index.between(start, end)) == expected_versions
+
+
+@pytest.mark.parametrize(
+    ("version", "expected_versions"),
+    [
+        ("15", ["15.0v4", "15.1v2", "15.1v10"]),
+        ("15.1", ["15.1v2", "15.1v10"]),
+        ("15.1v2", ["15.1v2"]),
+        ("12", []),
+    ],
+)
+def test_matching(
+    release_index: ReleaseIndex, version: str, expected_versions: list[str]
+) -> None:
+    """Test to match major, minor and exact versions."""
+    assert _versions(release_index.matching(version)) == expected_versions
+
+
+def test_select(release_index: ReleaseIndex) -> None:
+    """Test to combine versions and since without duplicates."""
+    selected = release_index.select(
+        versions=["13", "15.1", "15.1v2"], since=NukeVersion(13, 2, 5)
+    )
+
+    assert _versions(selected) == ["13.2v9", "15.1v2", "15.1v10"]
+
+
+def test_latest_per_minor(release_index: ReleaseIndex) -> None:
+    """Test to only keep the newest patch release per minor version."""
+    assert _versions(release_index.latest_per_minor()) == [
+        "13.2v9",
+        "14.0v1",
+        "15.0v4",
+        "15.1v10",
+    ]
+
+
+def test_for_operating_system(release_index: ReleaseIndex) -> None:
+    """Test to answer queries like all windows releases from 14.0."""
+    releases = release_index.for_operating_system(
+        OperatingSystem.WINDOWS, release_index.since(NukeVersion(14))
+    )
+
+    assert _versions(releases) == ["15.0v4", "15.1v10"]
+    assert releases[-1].installer(OperatingSystem.WINDOWS) == "15.1v10_win"
+    assert releases[-1].installer(OperatingSystem.LINUX) is None
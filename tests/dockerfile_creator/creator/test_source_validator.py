@@ -0,0 +1,136 @@
+"""Tests for validating the installer URLs before writing."""
+
+import time
+from http import HTTPStatus
+
+import pytest
+
+from nukedockerbuild.creator.source_validator import (
+    SourceValidator,
+    validate_sources,
+)
+from nukedockerbuild.datamodel.constants import OperatingSystem
+from nukedockerbuild.datamodel.docker_data import Dockerfile
+from tests.conftest import LocalHTTPServer, ServedFile
+
+
+def test_validate_records_size_and_etag(http_server: LocalHTTPServer) -> None:
+    """Test a valid URL to be checked without downloading it."""
+    url = http_server.add(
+        "/Nuke15.1v5.tgz", ServedFile(b"installer", etag='"abc"')
+    )
+
+    status = SourceValidator().validate([url])[url]
+
+    assert status.ok
+    assert status.status == HTTPStatus.OK
+    assert status.content_length == len(b"installer")
+    assert status.etag == '"abc"'
+    assert [method for method, _, _ in http_server.requests] == ["HEAD"]
+
+
+def test_validate_falls_back_to_range(http_server: LocalHTTPServer) -> None:
+    """Test a server refusing HEAD to be asked for a single byte."""
+    url = http_server.add(
+        "/Nuke15.1v5.tgz", ServedFile(b"installer", allow_head=False)
+    )
+
+    status = SourceValidator().validate([url])[url]
+
+    assert status.ok
+    assert status.status == HTTPStatus.PARTIAL_CONTENT
+    assert status.content_length == len(b"installer")
+    method, _, headers = http_server.requests[-1]
+    assert method == "GET"
+    assert headers["Range"] == "bytes=0-0"
+
+
+@pytest.mark.parametrize(
+    ("test_file", "expected_error"),
+    [
+        (None, "Returned 404."),
+        (ServedFile(b"", status=403), "Returned 403."),
+        (ServedFile(b"", status=500), "Returned 500."),
+        (ServedFile(b""), "Returned an empty installer."),
+    ],
+)
+def test_validate_broken(
+    http_server: LocalHTTPServer,
+    test_file: ServedFile | None,
+    expected_error: str,
+) -> None:
+    """Test broken URLs to be reported with their error."""
+    url = f"{http_server.url}/Nuke15.1v5.tgz"
+    if test_file:
+        http_server.add("/Nuke15.1v5.tgz", test_file)
+
+    status = SourceValidator().validate([url])[url]
+
+    assert not status.ok
+    assert status.error == expected_error
+
+
+def test_validate_unreachable() -> None:
+    """Test an unreachable host to be reported as broken."""
+    url = "http://127.0.0.1:9/Nuke15.1v5.tgz"
+
+    status = SourceValidator(timeout=1).validate([url])[url]
+
+    assert not status.ok
+    assert status.status is None
+
+
+def test_validate_concurrently(http_server: LocalHTTPServer) -> None:
+    """Test URLs to be validated concurrently and only once each."""
+    delay = 0.2
+    urls = [
+        http_server.add(f"/{index}.tgz", ServedFile(b"data", delay=delay))
+        for index in range(20)
+    ]
+    start = time.perf_counter()
+
+    statuses = SourceValidator(concurrency=len(urls)).validate(urls + urls)
+
+    # Validating one after the other takes the delay for every URL.
+    assert time.perf_counter() - start < delay * len(urls) / 2
+    assert len(statuses) == len(urls)
+    assert all(status.ok for status in statuses.values())
+    assert len(http_server.requests) == len(urls)
+
+
+def test_validator_needs_concurrency() -> None:
+    """Test to raise for a concurrency below 1."""
+    with pytest.raises(ValueError, match="concurrency of at least 1"):
+        SourceValidator(concurrency=0)
+
+
+@pytest.mark.parametrize(
+    ("test_drop", "expected_tags"),
+    [
+        (True, ["nukedockerbuild:15.1-linux"]),
+        (False, ["nukedockerbuild:15.1-linux", "nukedockerbuild:15.0-linux"]),
+    ],
+)
+def test_validate_sources(
+    http_server: LocalHTTPServer, test_drop: bool, expected_tags: list[str]
+) -> None:
+    """Test dockerfiles with a broken source to be dropped or kept."""
+    dockerfiles = [
+        Dockerfile(
+            OperatingSystem.LINUX,
+            15.1,
+            http_server.add("/Nuke15.1v5.tgz", ServedFile(b"installer")),
+        ),
+        Dockerfile(
+            OperatingSystem.LINUX, 15.0, f"{http_server.url}/Nuke15.0v4.tgz"
+        ),
+    ]
+
+    valid_dockerfiles, statuses = validate_sources(
+        dockerfiles, SourceValidator(), drop=test_drop
+    )
+
+    assert [dockerfile.tag for dockerfile in valid_dockerfiles] == (
+        expected_tags
+    )
+    assert len(statuses) == len(dockerfiles)
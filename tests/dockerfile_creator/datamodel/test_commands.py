@@ -30,6 +30,56 @@ class TestDockerCommand:
         """Test to return a string in the docker file format."""
         assert test_docker_command.to_docker_format() == expected_result
 
+    @pytest.mark.parametrize(
+        ("test_docker_command", "expected_result"),
+        [
+            (DockerCommand(["echo hi"]), "RUN echo hi"),
+            (
+                DockerCommand(
+                    ["dnf install git -y", "rm -rf /var/cache/dnf"],
+                    cache_mounts=["/var/cache/dnf"],
+                    cached_commands=["dnf install git -y"],
+                ),
+                (
+                    "RUN --mount=type=cache,target=/var/cache/dnf,"
+                    "sharing=locked \\\n  dnf install git -y"
+                ),
+            ),
+            (
+                DockerCommand(
+                    ["apt-get update", "curl -O cmake.sh"],
+                    cache_mounts=["/var/lib/apt/lists", "/var/cache/cmake"],
+                ),
+                (
+                    "RUN --mount=type=cache,target=/var/lib/apt/lists,"
+                    "sharing=locked "
+                    "--mount=type=cache,target=/var/cache/cmake,"
+                    "sharing=locked \\\n  apt-get update \\\n"
+                    "  && curl -O cmake.sh"
+                ),
+            ),
+        ],
+    )
+    def test_to_docker_format_with_cache_mounts(
+        self, test_docker_command: DockerCommand, expected_result: str
+    ) -> None:
+        """Test to mount caches and run the cached commands instead."""
+        assert (
+            test_docker_command.to_docker_format(use_cache_mounts=True)
+            == expected_result
+        )
+
+    def test_to_docker_format_without_cache_mounts(self) -> None:
+        """Test the cached commands to not be used by default."""
+        docker_command = DockerCommand(
+            ["dnf install git -y", "rm -rf /var/cache/dnf"],
+            cache_mounts=["/var/cache/dnf"],
+            cached_commands=["dnf install git -y"],
+        )
+        assert docker_command.to_docker_format() == (
+            "RUN dnf install git -y \\\n  && rm -rf /var/cache/dnf"
+        )
+
 
 class TestDockerEnvironments:
     """Tests related to the DockerEnvironments object."""
@@ -3,6 +3,9 @@
 @maintainer: Gilles Vink
 """
 
+import shutil
+import subprocess
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -14,6 +17,7 @@ from nukedockerbuild.datamodel.commands import (
     DockerEnvironments,
 )
 from nukedockerbuild.datamodel.docker_data import (
+    BaseDockerfile,
     Dockerfile,
     OperatingSystem,
     UpstreamImage,
@@ -292,6 +296,29 @@ class TestDockerfile:
         dummy_dockerfile.operating_system = test_operating_system
         assert dummy_dockerfile.copy == expected_result
 
+    @pytest.mark.parametrize(
+        ("test_operating_system", "expected_shared"),
+        [(OperatingSystem.LINUX, True), (OperatingSystem.WINDOWS, False)],
+    )
+    def test_copy_with_shared_sources(
+        self,
+        dummy_dockerfile: Dockerfile,
+        test_operating_system: OperatingSystem,
+        expected_shared: bool,
+    ) -> None:
+        """Test shared Linux sources to be copied before the delta."""
+        dummy_dockerfile.operating_system = test_operating_system
+        dummy_dockerfile.use_shared_sources = True
+
+        assert (
+            "ARG NUKE_SHARED_SOURCE_FILES" in dummy_dockerfile.args
+        ) is expected_shared
+        assert dummy_dockerfile.copy.startswith(
+            "COPY $NUKE_SHARED_SOURCE_FILES /usr/local/nuke_install\n"
+            "COPY $NUKE_SOURCE_FILES /usr/local/nuke_install"
+        ) is expected_shared
+        assert dummy_dockerfile.copy in dummy_dockerfile.to_dockerfile()
+
     @pytest.mark.parametrize(
         ("test_operating_system", "test_nuke_version"),
         [
@@ -321,3 +348,249 @@ class TestDockerfile:
             f"{dummy_dockerfile.environments}"
         )
         assert dummy_dockerfile.to_dockerfile() == expected_dockerfile
+
+    def test_render_plan_shared_by_versions(
+        self, dummy_dockerfile: Dockerfile
+    ) -> None:
+        """Test versions with the same static content to share a plan."""
+        other_dockerfile = Dockerfile(
+            operating_system=OperatingSystem.LINUX,
+            nuke_source="https://example.com/Nuke15.1v3-linux-x86_64.tgz",
+            nuke_version=15.1,
+        )
+        older_dockerfile = Dockerfile(
+            operating_system=OperatingSystem.LINUX,
+            nuke_source="https://example.com/Nuke13.2v8-linux-x86_64.tgz",
+            nuke_version=13.2,
+        )
+
+        assert dummy_dockerfile.render_plan() is other_dockerfile.render_plan()
+        assert (
+            dummy_dockerfile.render_plan()
+            is not older_dockerfile.render_plan()
+        )
+        assert "LABEL 'com.nukedockerbuild.nuke_version'=15.1" in (
+            other_dockerfile.to_dockerfile()
+        )
+
+    @pytest.mark.parametrize("use_base_image", [False, True])
+    @pytest.mark.parametrize("use_cache_mounts", [False, True])
+    def test_to_dockerfile_with_version_command(
+        self,
+        dummy_dockerfile: Dockerfile,
+        use_base_image: bool,
+        use_cache_mounts: bool,
+    ) -> None:
+        """Test version specific values in commands to be filled in."""
+        dummy_dockerfile.use_base_image = use_base_image
+        dummy_dockerfile.use_cache_mounts = use_cache_mounts
+        image_commands = {
+            UpstreamImage.ROCKYLINUX_8: [
+                DockerCommand(["curl -o {filename} {url}"], maximum_version=16.0)
+            ]
+        }
+        with patch(
+            "nukedockerbuild.datamodel.docker_data.IMAGE_COMMANDS",
+            image_commands,
+        ):
+            rendered = dummy_dockerfile.to_dockerfile()
+
+        assert (
+            "RUN curl -o Nuke15.0v2-linux-x86_64 "
+            f"{dummy_dockerfile.nuke_source}"
+        ) in rendered
+
+    def test_to_dockerfile_with_base_image(
+        self, dummy_dockerfile: Dockerfile
+    ) -> None:
+        """Test to start from the base image and leave out its commands."""
+        dummy_dockerfile.use_base_image = True
+
+        rendered = dummy_dockerfile.to_dockerfile()
+
+        assert rendered.startswith(
+            "FROM nukedockerbuild-base:rockylinux8-gcc11\n\n"
+        )
+        assert "RUN " not in rendered
+        assert "COPY $NUKE_SOURCE_FILES /usr/local/nuke_install" in rendered
+        assert "CXXFLAGS=-std=c++17" in rendered
+
+    def test_to_dockerfile_with_windows_base_image(
+        self, dummy_dockerfile: Dockerfile
+    ) -> None:
+        """Test Windows to only layer the sources and toolchain on msvc."""
+        dummy_dockerfile.operating_system = OperatingSystem.WINDOWS
+        dummy_dockerfile.nuke_version = 16.0
+        dummy_dockerfile.use_base_image = True
+
+        rendered = dummy_dockerfile.to_dockerfile()
+
+        assert rendered.startswith("FROM nukedockerbuild-base:msvc-17\n\n")
+        assert "RUN " not in rendered
+        assert "COPY $TOOLCHAIN /nukedockerbuild/" in rendered
+        assert "GLOBAL_TOOLCHAIN=/nukedockerbuild/toolchain.cmake" in rendered
+
+    def test_to_dockerfile_with_base_image_keeps_version_commands(
+        self, dummy_dockerfile: Dockerfile
+    ) -> None:
+        """Test commands for specific versions to stay in the dockerfile."""
+        dummy_dockerfile.use_base_image = True
+        version_command = DockerCommand(["echo 15"], minimum_version=15.0)
+        image_commands = {
+            UpstreamImage.ROCKYLINUX_8: [
+                DockerCommand(["echo shared"]),
+                version_command,
+            ]
+        }
+        with patch(
+            "nukedockerbuild.datamodel.docker_data.IMAGE_COMMANDS",
+            image_commands,
+        ):
+            assert dummy_dockerfile.run_commands == "RUN echo 15"
+            assert (
+                dummy_dockerfile.base_dockerfile.run_commands
+                == "RUN echo shared"
+            )
+
+    @pytest.mark.parametrize(
+        ("test_operating_system", "test_nuke_version", "expected_name"),
+        [
+            (OperatingSystem.LINUX, 15.1, "rockylinux8-gcc11"),
+            (OperatingSystem.LINUX, 16.0, "rockylinux8-gcc11"),
+            (OperatingSystem.LINUX, 13.2, "manylinux2014"),
+            (OperatingSystem.WINDOWS, 15.1, "msvc-17"),
+            (OperatingSystem.WINDOWS, 16.0, "msvc-17"),
+            (OperatingSystem.WINDOWS, 14.1, "msvc-16"),
+        ],
+    )
+    def test_base_dockerfile(
+        self,
+        dummy_dockerfile: Dockerfile,
+        test_operating_system: OperatingSystem,
+        test_nuke_version: float,
+        expected_name: str,
+    ) -> None:
+        """Test versions with the same image and toolset to share a base."""
+        dummy_dockerfile.operating_system = test_operating_system
+        dummy_dockerfile.nuke_version = test_nuke_version
+        dummy_dockerfile.use_base_image = True
+
+        assert dummy_dockerfile.base_dockerfile.name == expected_name
+
+    def test_base_dockerfile_without_base_image(
+        self, dummy_dockerfile: Dockerfile
+    ) -> None:
+        """Test no base image to be used by default."""
+        assert dummy_dockerfile.base_dockerfile is None
+
+
+    @pytest.mark.parametrize(
+        ("test_operating_system", "test_nuke_version", "expected_mount"),
+        [
+            (OperatingSystem.LINUX, 15.0, "target=/var/cache/dnf"),
+            (OperatingSystem.LINUX, 13.0, "target=/var/cache/yum"),
+            (OperatingSystem.WINDOWS, 15.0, "target=/var/cache/vsdownload"),
+        ],
+    )
+    def test_to_dockerfile_with_cache_mounts(
+        self,
+        dummy_dockerfile: Dockerfile,
+        test_operating_system: OperatingSystem,
+        test_nuke_version: float,
+        expected_mount: str,
+    ) -> None:
+        """Test to enable BuildKit and keep caches out of the image."""
+        dummy_dockerfile.operating_system = test_operating_system
+        dummy_dockerfile.nuke_version = test_nuke_version
+        dummy_dockerfile.use_cache_mounts = True
+
+        rendered = dummy_dockerfile.to_dockerfile()
+
+        assert rendered.startswith("# syntax=docker/dockerfile:1\n\nFROM ")
+        assert f"--mount=type=cache,{expected_mount}" in rendered
+        assert "rm -rf /var/cache" not in rendered
+        assert "clean all" not in rendered
+
+    def test_base_dockerfile_with_cache_mounts(
+        self, dummy_dockerfile: Dockerfile
+    ) -> None:
+        """Test cache mounts to be used by the base image as well."""
+        dummy_dockerfile.use_base_image = True
+        dummy_dockerfile.use_cache_mounts = True
+
+        rendered = dummy_dockerfile.base_dockerfile.to_dockerfile()
+
+        assert rendered.startswith("# syntax=docker/dockerfile:1\n\nFROM ")
+        assert "--mount=type=cache,target=/var/cache/dnf" in rendered
+
+
+class TestBaseDockerfile:
+    """Tests related to the BaseDockerfile object."""
+
+    def test_to_dockerfile(self) -> None:
+        """Test to render the upstream image with the toolchain commands."""
+        base_dockerfile = BaseDockerfile(
+            operating_system=OperatingSystem.LINUX,
+            upstream_image=UpstreamImage.ROCKYLINUX_8,
+            toolset="11",
+        )
+
+        rendered = base_dockerfile.to_dockerfile()
+
+        assert rendered.startswith("FROM docker.io/rockylinux:8\n\n")
+        assert "LABEL 'com.nukedockerbuild.toolset'='11'" in rendered
+        assert "dnf install gcc-toolset-11-gcc" in rendered
+        assert "NUKE" not in rendered.split("LABEL")[-1]
+        assert base_dockerfile.tag == "nukedockerbuild-base:rockylinux8-gcc11"
+
+    def test_to_dockerfile_for_windows(self) -> None:
+        """Test to render Wine and the Visual Studio toolset once."""
+        base_dockerfile = BaseDockerfile(
+            operating_system=OperatingSystem.WINDOWS,
+            upstream_image=UpstreamImage.DEBIAN_BOOKWORM,
+            toolset="17",
+        )
+
+        rendered = base_dockerfile.to_dockerfile()
+
+        assert rendered.startswith("FROM docker.io/debian:bookworm\n\n")
+        assert "wineboot --init" in rendered
+        assert "./vsdownload.py --major 17 " in rendered
+        assert 'MSVCDIR=$(. "${BIN}msvcenv.sh"' in rendered
+        assert base_dockerfile.tag == "nukedockerbuild-base:msvc-17"
+
+    @pytest.mark.skipif(shutil.which("sh") is None, reason="requires sh")
+    def test_cached_cmake_download_keeps_earlier_failures(
+        self, tmp_path: Path
+    ) -> None:
+        """Test a failing command before the CMake download to fail the RUN."""
+        base_dockerfile = BaseDockerfile(
+            operating_system=OperatingSystem.WINDOWS,
+            upstream_image=UpstreamImage.DEBIAN_BOOKWORM,
+            toolset="17",
+            use_cache_mounts=True,
+        )
+        run_command = next(
+            section
+            for section in base_dockerfile.to_dockerfile().split("\n\n")
+            if "cmake.part" in section
+        )
+        commands = run_command.split(" \\\n  ", 1)[1].split(" \\\n  && ")
+        commands[0] = "false"
+        script = " && ".join(commands).replace(
+            "/var/cache/cmake", str(tmp_path)
+        )
+        fake_curl = tmp_path / "bin" / "curl"
+        fake_curl.parent.mkdir()
+        fake_curl.write_text('#!/bin/sh\ntouch "$3"\n')
+        fake_curl.chmod(0o755)
+
+        process = subprocess.run(
+            ["sh", "-c", script],
+            env={"PATH": f"{fake_curl.parent}:/usr/bin:/bin"},
+            capture_output=True,
+            check=False,
+        )
+
+        assert process.returncode != 0
+        assert not list(tmp_path.glob("cmake*"))
@@ -0,0 +1,54 @@
+"""Tests for the precompiled dockerfile render plans."""
+
+import pytest
+
+from nukedockerbuild.datamodel.render_plan import (
+    FIELD_MARKER,
+    RenderField,
+    RenderPlan,
+)
+
+
+def test_render_field_format() -> None:
+    """Test the field to format to its marked name."""
+    render_field = RenderField("nuke_version")
+
+    assert f"NUKE_VERSION={render_field}" == (
+        f"NUKE_VERSION={FIELD_MARKER}nuke_version{FIELD_MARKER}"
+    )
+
+
+def test_render_plan_compile() -> None:
+    """Test to split the template in static text and fields."""
+    template = f"FROM image\nENV NUKE_VERSION={RenderField('version')}"
+
+    plan = RenderPlan.compile(template)
+
+    assert plan.parts == ("FROM image\nENV NUKE_VERSION=", "version", "")
+    assert plan.fields == frozenset({"version"})
+
+
+@pytest.mark.parametrize(
+    ("template", "values", "expected_result"),
+    [
+        ("FROM image", {}, "FROM image"),
+        (
+            (
+                f"LABEL 'version'={RenderField('version')}\n"
+                f"ENV NUKE_VERSION={RenderField('version')}"
+            ),
+            {"version": "15.1"},
+            "LABEL 'version'=15.1\nENV NUKE_VERSION=15.1",
+        ),
+        (
+            f"RUN echo ${{BIN}} {RenderField('url')}",
+            {"url": "https://example.com/{file}"},
+            "RUN echo ${BIN} https://example.com/{file}",
+        ),
+    ],
+)
+def test_render_plan_render(
+    template: str, values: dict[str, str], expected_result: str
+) -> None:
+    """Test to fill in values without formatting the static text."""
+    assert RenderPlan.compile(template).render(values) == expected_result
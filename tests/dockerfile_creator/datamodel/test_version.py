@@ -0,0 +1,65 @@
+"""Tests for the structured Nuke versions."""
+
+import pytest
+
+from nukedockerbuild.datamodel.version import NukeVersion
+
+
+@pytest.mark.parametrize(
+    ("test_version", "expected_version"),
+    [
+        ("15.1v7", NukeVersion(15, 1, 7)),
+        ("10.0v2", NukeVersion(10, 0, 2)),
+        ("15.5v51", NukeVersion(15, 5, 51)),
+        ("13.2v1b", NukeVersion(13, 2, 1)),
+    ],
+)
+def test_from_string(test_version: str, expected_version: NukeVersion) -> None:
+    """Test to parse major, minor and patch release."""
+    assert NukeVersion.from_string(test_version) == expected_version
+
+
+@pytest.mark.parametrize("test_version", ["10.0b1", "15", "latest"])
+def test_from_string_raise_exception(test_version: str) -> None:
+    """Test to raise an exception for invalid versions."""
+    with pytest.raises(ValueError, match="is not a valid version"):
+        NukeVersion.from_string(test_version)
+
+
+def test_ordering() -> None:
+    """Test patch releases to be ordered numerically."""
+    versions = [
+        NukeVersion(15, 1, 10),
+        NukeVersion(14, 0, 5),
+        NukeVersion(15, 1, 9),
+        NukeVersion(15, 0, 2),
+    ]
+
+    assert sorted(versions) == [
+        NukeVersion(14, 0, 5),
+        NukeVersion(15, 0, 2),
+        NukeVersion(15, 1, 9),
+        NukeVersion(15, 1, 10),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("test_version", "expected_range"),
+    [
+        ("15", (NukeVersion(15), NukeVersion(16))),
+        ("15.1", (NukeVersion(15, 1), NukeVersion(15, 2))),
+        ("15.1v7", (NukeVersion(15, 1, 7), NukeVersion(15, 1, 8))),
+    ],
+)
+def test_range_from_string(
+    test_version: str, expected_range: tuple[NukeVersion, NukeVersion]
+) -> None:
+    """Test to return the range of releases a version matches."""
+    assert NukeVersion.range_from_string(test_version) == expected_range
+
+
+def test_minor_version_and_str() -> None:
+    """Test to return the float used for paths and the Foundry notation."""
+    version = NukeVersion(15, 1, 7)
+
+    assert (version.minor_version, str(version)) == (15.1, "15.1v7")
@@ -0,0 +1,223 @@
+"""Tests related to the installer download cache.
+
+@maintainer: Gilles Vink
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+import requests
+
+from nukedockerbuild.sources.downloader import DownloadCache, url_key
+from tests.conftest import LocalHTTPServer, ServedFile
+
+INSTALLER_CONTENT = os.urandom(3 * 1024 * 1024 + 123)
+INSTALLER_SHA256 = hashlib.sha256(INSTALLER_CONTENT).hexdigest()
+
+
+@pytest.fixture
+def download_cache(tmp_path: Path) -> DownloadCache:
+    """Return an empty download cache."""
+    return DownloadCache(tmp_path / "installers")
+
+
+def _get_requests(http_server: LocalHTTPServer) -> list[dict[str, str]]:
+    """Return headers of all GET requests the server received."""
+    return [
+        headers for method, _, headers in http_server.requests
+        if method == "GET"
+    ]
+
+
+def test_fetch_downloads_once(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test to download into a content addressed blob only once."""
+    url = http_server.add(
+        "/Nuke15.1v5-linux-x86_64.tgz",
+        ServedFile(INSTALLER_CONTENT, etag='"v5"'),
+    )
+
+    first_download = download_cache.fetch(url)
+    second_download = download_cache.fetch(url)
+
+    assert first_download == second_download
+    assert first_download.sha256 == INSTALLER_SHA256
+    assert first_download.path == (
+        download_cache.directory / "blobs" / "sha256" / INSTALLER_SHA256
+    )
+    assert first_download.path.read_bytes() == INSTALLER_CONTENT
+    assert len(_get_requests(http_server)) == 1
+    url_link = download_cache.directory / "urls" / url_key(url)
+    assert url_link.is_symlink()
+    assert url_link.read_bytes() == INSTALLER_CONTENT
+
+
+def test_fetch_resumes_partial_download(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test a dropped connection to be resumed with a range request."""
+    url = http_server.add(
+        "/Nuke15.1v5-linux-x86_64.tgz",
+        ServedFile(
+            INSTALLER_CONTENT, etag='"v5"', truncate_after=1024 * 1024
+        ),
+    )
+
+    with pytest.raises((ValueError, requests.RequestException)):
+        download_cache.fetch(url)
+    download = download_cache.fetch(url)
+
+    assert download.sha256 == INSTALLER_SHA256
+    resumed_request = _get_requests(http_server)[-1]
+    assert resumed_request["Range"].startswith("bytes=")
+    assert resumed_request["Range"] != "bytes=0-"
+    assert resumed_request["If-Range"] == '"v5"'
+
+
+def test_fetch_restarts_if_server_does_not_resume(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test to start over if the server ignores the range request."""
+    url = http_server.add(
+        "/Nuke15.1v5-linux-x86_64.tgz",
+        ServedFile(
+            INSTALLER_CONTENT,
+            supports_range=False,
+            truncate_after=1024 * 1024,
+        ),
+    )
+
+    with pytest.raises((ValueError, requests.RequestException)):
+        download_cache.fetch(url)
+    download = download_cache.fetch(url)
+
+    assert download.sha256 == INSTALLER_SHA256
+    assert download.path.read_bytes() == INSTALLER_CONTENT
+
+
+@pytest.mark.parametrize("test_expected_sha256", [None, INSTALLER_SHA256])
+def test_fetch_finishes_complete_partial_download(
+    download_cache: DownloadCache,
+    http_server: LocalHTTPServer,
+    test_expected_sha256: str | None,
+) -> None:
+    """Test a partial download with every byte to finish on a 416."""
+    url = http_server.add("/Nuke.tgz", ServedFile(INSTALLER_CONTENT))
+    partial_path = download_cache.directory / "partial" / url_key(url)
+    partial_path.parent.mkdir(parents=True)
+    partial_path.write_bytes(INSTALLER_CONTENT)
+
+    download = download_cache.fetch(url, test_expected_sha256)
+
+    assert download.sha256 == INSTALLER_SHA256
+    assert download.path.read_bytes() == INSTALLER_CONTENT
+    assert _get_requests(http_server)[-1]["Range"] == (
+        f"bytes={len(INSTALLER_CONTENT)}-"
+    )
+    assert len(_get_requests(http_server)) == 1
+
+
+def test_fetch_restarts_oversized_partial_download(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test a partial download larger than the file to start over."""
+    url = http_server.add("/Nuke.tgz", ServedFile(INSTALLER_CONTENT))
+    partial_path = download_cache.directory / "partial" / url_key(url)
+    partial_path.parent.mkdir(parents=True)
+    partial_path.write_bytes(INSTALLER_CONTENT + b"garbage")
+
+    download = download_cache.fetch(url)
+
+    assert download.sha256 == INSTALLER_SHA256
+    assert "Range" not in _get_requests(http_server)[-1]
+
+
+def test_fetch_restarts_on_other_content_range(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test a partial response from another byte to start over."""
+    url = http_server.add(
+        "/Nuke.tgz", ServedFile(INSTALLER_CONTENT, range_from_start=True)
+    )
+    partial_path = download_cache.directory / "partial" / url_key(url)
+    partial_path.parent.mkdir(parents=True)
+    partial_path.write_bytes(INSTALLER_CONTENT[:1024])
+
+    download = download_cache.fetch(url)
+
+    assert download.sha256 == INSTALLER_SHA256
+    assert download.path.read_bytes() == INSTALLER_CONTENT
+    assert [
+        request.get("Range") for request in _get_requests(http_server)
+    ] == ["bytes=1024-", None]
+
+
+def test_fetch_with_mismatching_hash(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test to raise and discard content that does not match."""
+    url = http_server.add("/Nuke.tgz", ServedFile(INSTALLER_CONTENT))
+
+    with pytest.raises(ValueError, match="does not match the expected hash"):
+        download_cache.fetch(url, expected_sha256="0" * 64)
+
+    assert download_cache.lookup(url) is None
+    assert not list((download_cache.directory / "partial").iterdir())
+
+
+def test_fetch_with_missing_file(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test to raise if the server does not return the file."""
+    with pytest.raises(ValueError, match="returned 404"):
+        download_cache.fetch(f"{http_server.url}/missing.tgz")
+
+
+def test_fetch_deduplicates_concurrent_requests(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test concurrent fetches of one URL to download it only once."""
+    url = http_server.add(
+        "/Nuke.tgz", ServedFile(INSTALLER_CONTENT, delay=0.1)
+    )
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        downloads = list(executor.map(download_cache.fetch, [url] * 4))
+
+    assert {download.sha256 for download in downloads} == {INSTALLER_SHA256}
+    assert len(_get_requests(http_server)) == 1
+
+
+def test_fetch_deduplicates_identical_content(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test identical content from different URLs to share one blob."""
+    first_url = http_server.add("/a/Nuke.tgz", ServedFile(INSTALLER_CONTENT))
+    second_url = http_server.add("/b/Nuke.tgz", ServedFile(INSTALLER_CONTENT))
+
+    first_download = download_cache.fetch(first_url)
+    second_download = download_cache.fetch(second_url)
+
+    assert first_download.path == second_download.path
+    blobs = list((download_cache.directory / "blobs" / "sha256").iterdir())
+    assert len(blobs) == 1
+
+
+def test_fetch_reuses_content_by_hash(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test known content to be reused for a new URL without downloading."""
+    first_url = http_server.add("/a/Nuke.tgz", ServedFile(INSTALLER_CONTENT))
+    second_url = f"{http_server.url}/b/Nuke.tgz"
+    download_cache.fetch(first_url)
+
+    second_download = download_cache.fetch(second_url, INSTALLER_SHA256)
+
+    assert second_download.sha256 == INSTALLER_SHA256
+    assert second_download.size == len(INSTALLER_CONTENT)
+    assert download_cache.lookup(second_url) == second_download
+    assert len(_get_requests(http_server)) == 1
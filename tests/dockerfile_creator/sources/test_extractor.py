@@ -0,0 +1,375 @@
+"""Tests related to the streaming extraction of Nuke sources.
+
+@maintainer: Gilles Vink
+"""
+
+import hashlib
+import io
+import stat
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+
+import pytest
+
+from nukedockerbuild.sources.downloader import DownloadCache
+from nukedockerbuild.sources.extractor import (
+    PrepareOptions,
+    extract_installer,
+    extract_nuke_sources,
+    prepare_nuke_sources,
+    retain_spec_for_version,
+)
+from nukedockerbuild.sources.file_store import FileStore
+from nukedockerbuild.sources.lockfile import LockedSource
+from tests.conftest import LocalHTTPServer, ServedFile
+
+INSTALLER_MEMBERS = {
+    "include/DDImage/Op.h": b"class Op;",
+    "libDDImage.so": b"ddimage",
+    "libFdkBase.so": b"fdk",
+    "cmake/NukeConfig.cmake": b"config",
+    "Documentation/NDKExamples/examples/Blur.cpp": b"blur",
+    "Documentation/NDKExamples/examples/CMakeLists.txt": b"cmake",
+    "Documentation/index.html": b"docs" * 100,
+    "plugins/huge_plugin.so": b"plugin" * 1000,
+    "Nuke15.1": b"binary" * 1000,
+    "../escape.txt": b"escape",
+}
+SKIPPED_MEMBERS = (
+    "Documentation/index.html",
+    "plugins/huge_plugin.so",
+    "Nuke15.1",
+    "../escape.txt",
+)
+"""Members of the installer that are not retained."""
+
+
+def _zip_installer(members: dict[str, bytes]) -> bytes:
+    """Return a zip installer containing the members."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for name, content in members.items():
+            zip_file.writestr(name, content)
+        link = zipfile.ZipInfo("libDDImage.so.1")
+        link.external_attr = (stat.S_IFLNK | 0o777) << 16
+        zip_file.writestr(link, "libDDImage.so")
+    return buffer.getvalue()
+
+
+def _tgz_archive(installer_name: str, installer: bytes) -> bytes:
+    """Return a tgz archive containing the installer."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        readme = tarfile.TarInfo("README")
+        readme.size = 6
+        tar.addfile(readme, io.BytesIO(b"readme"))
+        info = tarfile.TarInfo(installer_name)
+        info.size = len(installer)
+        tar.addfile(info, io.BytesIO(installer))
+    return buffer.getvalue()
+
+
+def _extracted_files(folder: Path) -> set[str]:
+    """Return all files in folder relative to it."""
+    return {
+        path.relative_to(folder).as_posix()
+        for path in folder.rglob("*")
+        if not path.is_dir()
+    }
+
+
+@pytest.mark.parametrize(
+    ("test_member", "expected_path"),
+    [
+        ("include/DDImage/Op.h", "include/DDImage/Op.h"),
+        ("libDDImage.so", "libDDImage.so"),
+        ("libNdkBase.so", "libNdkBase.so"),
+        ("Documentation/NDKExamples/examples/Blur.cpp", "tests/Blur.cpp"),
+        ("Documentation/NDKExamples/examples", None),
+        ("Documentation/index.html", None),
+        ("Nuke15.1", None),
+        ("/include/absolute.h", None),
+        ("include/../../escape.h", None),
+    ],
+)
+def test_retain_spec_target_path(
+    test_member: str, expected_path: str | None
+) -> None:
+    """Test to map retained members to their path in the target."""
+    spec = retain_spec_for_version(15.1)
+    expected = PurePosixPath(expected_path) if expected_path else None
+    assert spec.target_path(test_member) == expected
+
+
+def test_retain_spec_before_12() -> None:
+    """Test examples to be taken from the old NDK folder before Nuke 12."""
+    spec = retain_spec_for_version(11.3)
+    assert spec.target_path("Documentation/NDK/examples/Blur.cpp") == (
+        PurePosixPath("tests/Blur.cpp")
+    )
+
+
+@pytest.mark.parametrize(
+    ("test_installer_name", "test_version", "test_examples_folder"),
+    [
+        ("Nuke15.1v5-linux-x86_64.run", 15.1, "NDKExamples"),
+        ("Nuke11.3v5-linux-x86_64-installer", 11.3, "NDK"),
+    ],
+)
+def test_extract_nuke_sources(
+    tmp_path: Path,
+    test_installer_name: str,
+    test_version: float,
+    test_examples_folder: str,
+) -> None:
+    """Test to extract only the retained files from a streamed archive."""
+    members = {
+        name.replace("NDKExamples", test_examples_folder): content
+        for name, content in INSTALLER_MEMBERS.items()
+    }
+    archive = io.BytesIO(
+        _tgz_archive(test_installer_name, _zip_installer(members))
+    )
+    target_folder = tmp_path / "_nuke_sources"
+
+    result = extract_nuke_sources(
+        archive, target_folder, retain_spec_for_version(test_version)
+    )
+
+    expected_files = {
+        "include/DDImage/Op.h",
+        "libDDImage.so",
+        "libDDImage.so.1",
+        "libFdkBase.so",
+        "cmake/NukeConfig.cmake",
+        "tests/Blur.cpp",
+        "tests/CMakeLists.txt",
+    }
+    assert _extracted_files(target_folder) == expected_files
+    assert (target_folder / "libDDImage.so.1").is_symlink()
+    assert (target_folder / "tests" / "Blur.cpp").read_bytes() == b"blur"
+    assert result.files_written == len(expected_files)
+    assert result.members_skipped == len(SKIPPED_MEMBERS)
+    assert not (tmp_path / "escape.txt").exists()
+    assert list(tmp_path.iterdir()) == [target_folder]
+
+
+def test_extract_nuke_sources_without_installer(tmp_path: Path) -> None:
+    """Test to raise if the archive contains no installer."""
+    archive = io.BytesIO(_tgz_archive("README.txt", b"readme"))
+    with pytest.raises(ValueError, match="does not contain a Nuke installer"):
+        extract_nuke_sources(
+            archive, tmp_path / "target", retain_spec_for_version(15.1)
+        )
+
+
+def test_extract_installer_keeps_permissions(tmp_path: Path) -> None:
+    """Test file modes stored in the installer to be restored."""
+    mode = 0o755
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        info = zipfile.ZipInfo("libDDImage.so")
+        info.external_attr = (stat.S_IFREG | mode) << 16
+        zip_file.writestr(info, b"ddimage")
+    buffer.seek(0)
+
+    extract_installer(buffer, tmp_path, retain_spec_for_version(15.1))
+
+    assert stat.S_IMODE((tmp_path / "libDDImage.so").stat().st_mode) == mode
+
+
+@pytest.mark.parametrize("test_cached", [True, False])
+def test_prepare_nuke_sources(
+    tmp_path: Path, http_server: LocalHTTPServer, test_cached: bool
+) -> None:
+    """Test to prepare sources from the network or the cache."""
+    url = http_server.add(
+        "/Nuke15.1v5-linux-x86_64.tgz",
+        ServedFile(
+            _tgz_archive(
+                "Nuke15.1v5-linux-x86_64.run",
+                _zip_installer(INSTALLER_MEMBERS),
+            )
+        ),
+    )
+    download_cache = DownloadCache(tmp_path / "cache")
+    if test_cached:
+        download_cache.fetch(url)
+    dockerfile_directory = tmp_path / "dockerfiles" / "15.1" / "linux"
+    stale_file = dockerfile_directory / "_nuke_sources" / "stale.h"
+    stale_file.parent.mkdir(parents=True)
+    stale_file.write_text("stale")
+
+    prepare_nuke_sources(
+        url,
+        15.1,
+        dockerfile_directory,
+        options=PrepareOptions(download_cache=download_cache),
+    )
+
+    assert not stale_file.exists()
+    assert (dockerfile_directory / "_nuke_sources" / "libDDImage.so").is_file()
+    assert (dockerfile_directory / "_nuke_sources.prepared").read_text() == url
+    assert len(http_server.requests) == 1
+
+
+@pytest.mark.parametrize("test_matches", [True, False])
+def test_prepare_nuke_sources_verifies_lock(
+    tmp_path: Path, http_server: LocalHTTPServer, test_matches: bool
+) -> None:
+    """Test the archive to be verified against the lock while extracting."""
+    archive = _tgz_archive(
+        "Nuke15.1v5-linux-x86_64.run", _zip_installer(INSTALLER_MEMBERS)
+    )
+    # Trailing data after the installer is read and hashed as well.
+    archive += b"\0" * 4096
+    url = http_server.add("/Nuke15.1v5-linux-x86_64.tgz", ServedFile(archive))
+    locked = LockedSource(
+        "15.1",
+        "linux",
+        url,
+        hashlib.sha256(archive if test_matches else b"other").hexdigest(),
+        len(archive),
+    )
+    dockerfile_directory = tmp_path / "dockerfiles" / "15.1" / "linux"
+
+    if test_matches:
+        prepare_nuke_sources(url, 15.1, dockerfile_directory, locked=locked)
+    else:
+        with pytest.raises(ValueError, match="does not match the sources"):
+            prepare_nuke_sources(
+                url, 15.1, dockerfile_directory, locked=locked
+            )
+
+    assert (dockerfile_directory / "_nuke_sources").is_dir() is test_matches
+    assert (
+        dockerfile_directory / "_nuke_sources.prepared"
+    ).is_file() is test_matches
+
+
+def test_prepare_nuke_sources_scans_includes(
+    tmp_path: Path, http_server: LocalHTTPServer
+) -> None:
+    """Test to reduce the sources to the manifest and extract only it."""
+    members = dict(INSTALLER_MEMBERS)
+    members.update(
+        {
+            "Documentation/NDKExamples/examples/Blur.cpp": (
+                b'#include "DDImage/Op.h"'
+            ),
+            "include/DDImage/Unused.h": b"class Unused;",
+            "cmake/NukeConfig.cmake": b'IMPORTED_LOCATION "libDDImage.so"',
+        }
+    )
+    url = http_server.add(
+        "/Nuke15.1v5-linux-x86_64.tgz",
+        ServedFile(
+            _tgz_archive(
+                "Nuke15.1v5-linux-x86_64.run", _zip_installer(members)
+            )
+        ),
+    )
+    dockerfile_directory = tmp_path / "dockerfiles" / "15.1" / "linux"
+    target_folder = dockerfile_directory / "_nuke_sources"
+    expected_files = {
+        "include/DDImage/Op.h",
+        "libDDImage.so",
+        "libDDImage.so.1",
+        "cmake/NukeConfig.cmake",
+        "tests/Blur.cpp",
+        "tests/CMakeLists.txt",
+    }
+
+    scanned = prepare_nuke_sources(
+        url,
+        15.1,
+        dockerfile_directory,
+        options=PrepareOptions(scan_includes=True),
+    )
+    scanned_files = _extracted_files(target_folder)
+    extracted = prepare_nuke_sources(url, 15.1, dockerfile_directory)
+
+    assert scanned_files == expected_files
+    assert _extracted_files(target_folder) == expected_files
+    assert f"# nuke_source: {url}\n" in (
+        dockerfile_directory / "_nuke_sources.retain"
+    ).read_text()
+    assert scanned.files_written == extracted.files_written == len(
+        expected_files
+    )
+    # The installer holds the libDDImage.so.1 symlink besides the members.
+    assert scanned.members_skipped == extracted.members_skipped == (
+        len(members) + 1 - len(expected_files)
+    )
+
+
+@pytest.mark.parametrize(
+    "test_manifest",
+    [
+        "# nuke_source: {url}\n",
+        "# nuke_source: https://example.com/Nuke15.1v4.tgz\ninclude/Op.h\n",
+        "include/Op.h\n",
+    ],
+)
+def test_prepare_nuke_sources_ignores_manifest(
+    tmp_path: Path, http_server: LocalHTTPServer, test_manifest: str
+) -> None:
+    """Test an empty manifest or one of another installer to keep all."""
+    url = http_server.add(
+        "/Nuke15.1v5-linux-x86_64.tgz",
+        ServedFile(
+            _tgz_archive(
+                "Nuke15.1v5-linux-x86_64.run",
+                _zip_installer(INSTALLER_MEMBERS),
+            )
+        ),
+    )
+    dockerfile_directory = tmp_path / "dockerfiles" / "15.1" / "linux"
+    dockerfile_directory.mkdir(parents=True)
+    (dockerfile_directory / "_nuke_sources.retain").write_text(
+        test_manifest.format(url=url)
+    )
+    expected = prepare_nuke_sources(url, 15.1, tmp_path / "unpruned")
+
+    result = prepare_nuke_sources(url, 15.1, dockerfile_directory)
+
+    assert result.files_written == expected.files_written
+    assert _extracted_files(
+        dockerfile_directory / "_nuke_sources"
+    ) == _extracted_files(tmp_path / "unpruned" / "_nuke_sources")
+
+
+def test_extract_installer_with_file_store(tmp_path: Path) -> None:
+    """Test two versions to share the stored files they have in common."""
+    file_store = FileStore(tmp_path / "store")
+    members = dict(INSTALLER_MEMBERS)
+    spec = retain_spec_for_version(15.1)
+    first = extract_installer(
+        io.BytesIO(_zip_installer(members)),
+        tmp_path / "15.0" / "_nuke_sources",
+        spec,
+        file_store,
+    )
+    members["libDDImage.so"] = b"ddimage 15.1"
+    second = extract_installer(
+        io.BytesIO(_zip_installer(members)),
+        tmp_path / "15.1" / "_nuke_sources",
+        spec,
+        file_store,
+    )
+
+    assert first.files_deduplicated == 0
+    assert second.files_written == first.files_written
+    # All but the changed library and the symlink are linked.
+    assert second.files_deduplicated == first.files_written - 2
+    assert (
+        tmp_path / "15.1" / "_nuke_sources" / "libDDImage.so"
+    ).read_bytes() == b"ddimage 15.1"
+    assert (
+        tmp_path / "15.1" / "_nuke_sources" / "include" / "DDImage" / "Op.h"
+    ).samefile(
+        tmp_path / "15.0" / "_nuke_sources" / "include" / "DDImage" / "Op.h"
+    )
+    # The changed library is stored besides the files, the symlink is not.
+    assert file_store.report().objects == first.files_written
@@ -0,0 +1,147 @@
+"""Tests related to the content-addressed store of Nuke files.
+
+@maintainer: Gilles Vink
+"""
+
+import errno
+import io
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from nukedockerbuild.sources.file_store import FileStore
+
+
+def _opener(content: bytes) -> MagicMock:
+    """Return a mocked opener of the content."""
+    return MagicMock(side_effect=lambda: io.BytesIO(content))
+
+
+@pytest.fixture
+def file_store(tmp_path: Path) -> FileStore:
+    """Return an empty file store."""
+    return FileStore(tmp_path / "store")
+
+
+def test_link_or_store(file_store: FileStore, tmp_path: Path) -> None:
+    """Test identical files to share a single stored object."""
+    first = tmp_path / "15.0" / "Op.h"
+    second = tmp_path / "15.1" / "Op.h"
+    other = tmp_path / "15.1" / "Iop.h"
+    for path in (first, second, other):
+        path.parent.mkdir(exist_ok=True)
+    shared, unique = b"class Op;", b"class Iop;"
+
+    assert not file_store.link_or_store(first, 0o644, _opener(shared))
+    assert file_store.link_or_store(second, 0o644, _opener(shared))
+    assert not file_store.link_or_store(other, 0o644, _opener(unique))
+
+    assert second.read_bytes() == b"class Op;"
+    assert first.stat().st_ino == second.stat().st_ino
+    report = file_store.report()
+    assert (report.objects, report.linked_files) == (2, 3)
+    assert report.stored_bytes == len(shared) + len(unique)
+    assert report.logical_bytes == len(shared) * 2 + len(unique)
+    assert report.to_dict()["ratio"] == round(
+        report.logical_bytes / report.stored_bytes, 2
+    )
+
+
+def test_link_or_store_mode(file_store: FileStore, tmp_path: Path) -> None:
+    """Test the mode to be part of the identity of a file."""
+    modes = {"a": 0o755, "b": 0o644}
+    for name, mode in modes.items():
+        file_store.link_or_store(tmp_path / name, mode, _opener(b"run"))
+
+    assert {
+        name: stat.S_IMODE((tmp_path / name).stat().st_mode) for name in modes
+    } == modes
+    assert file_store.report().objects == len(modes)
+
+
+def test_link_or_store_key(file_store: FileStore, tmp_path: Path) -> None:
+    """Test a known key to be linked once its content is verified."""
+    key = "Op.h:1234abcd:9:644"
+    file_store.link_or_store(tmp_path / "a", 0o644, _opener(b"class Op;"), key)
+    opener = _opener(b"class Op;")
+
+    assert file_store.link_or_store(tmp_path / "b", 0o644, opener, key)
+    opener.assert_called_once()
+    assert (tmp_path / "b").read_bytes() == b"class Op;"
+    assert (tmp_path / "a").stat().st_ino == (tmp_path / "b").stat().st_ino
+
+
+def test_link_or_store_colliding_key(
+    file_store: FileStore, tmp_path: Path
+) -> None:
+    """Test a key of other content, like a CRC-32 collision, to not link."""
+    key = "Op.h:1234abcd:9:644"
+    contents = {"a": b"class Op;", "b": b"class Oq;"}
+
+    assert [
+        file_store.link_or_store(tmp_path / name, 0o644, _opener(content), key)
+        for name, content in contents.items()
+    ] == [False, False]
+    assert {
+        name: (tmp_path / name).read_bytes() for name in contents
+    } == contents
+    assert file_store.report().objects == len(contents)
+
+
+def test_link_or_store_concurrently(
+    file_store: FileStore, tmp_path: Path
+) -> None:
+    """Test concurrent extractions of a file to store it only once."""
+    destinations = [tmp_path / f"file_{index}" for index in range(16)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        existed = list(
+            executor.map(
+                lambda path: file_store.link_or_store(
+                    path, 0o644, _opener(b"shared" * 1000)
+                ),
+                destinations,
+            )
+        )
+
+    assert existed.count(False) == 1
+    assert file_store.report().objects == 1
+    assert file_store.report().linked_files == len(destinations)
+    assert not any((file_store.directory / "tmp").iterdir())
+
+
+def test_link_falls_back_to_copy(
+    file_store: FileStore, tmp_path: Path
+) -> None:
+    """Test to copy the object if it can not be linked, like across disks."""
+    link = os.link
+
+    def cross_device_link(source: Path, destination: Path) -> None:
+        if Path(destination).is_relative_to(file_store.directory):
+            link(source, destination)
+            return
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    with patch(
+        "nukedockerbuild.sources.file_store.os.link",
+        side_effect=cross_device_link,
+    ):
+        file_store.link_or_store(tmp_path / "a", 0o644, _opener(b"copied"))
+
+    assert (tmp_path / "a").read_bytes() == b"copied"
+    assert file_store.report().linked_files == 0
+
+
+def test_prune(file_store: FileStore, tmp_path: Path) -> None:
+    """Test to remove objects and keys that are no longer linked."""
+    file_store.link_or_store(tmp_path / "a", 0o644, _opener(b"kept"), "a")
+    file_store.link_or_store(tmp_path / "b", 0o644, _opener(b"removed"), "b")
+    (tmp_path / "b").unlink()
+
+    assert file_store.prune() == len(b"removed")
+    assert file_store.report().objects == 1
+    assert len(list((file_store.directory / "members").iterdir())) == 1
+    assert (tmp_path / "a").read_bytes() == b"kept"
@@ -0,0 +1,163 @@
+"""Tests related to the include graph of the NDK examples.
+
+@maintainer: Gilles Vink
+"""
+
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.sources.include_graph import (
+    RetainManifest,
+    compute_retain_manifest,
+    find_includes,
+    find_link_libraries,
+    prune_to_manifest,
+    scan_includes,
+)
+
+FIXTURE_FILES = {
+    "include/DDImage/Iop.h": '#include "Op.h"\n#include <vector>\n',
+    "include/DDImage/Op.h": "#pragma once\n#include <DDImage/Knobs.h>\n",
+    "include/DDImage/Knobs.h": '#include "DDImage/Op.h"\n',
+    "include/DDImage/Unused.h": "class Unused;\n",
+    "include/FnPlatform/Unused.h": "class Unused;\n",
+    "tests/Blur.cpp": (
+        '#include "DDImage/Iop.h"\n'
+        "  #  include <Linked.h>\n"
+        '#include "local.h"\n'
+        "// #include <DDImage/Unused.h> is not an include.\n"
+    ),
+    "tests/local.h": "#include <string>\n",
+    "tests/CMakeLists.txt": "add_nuke_plugin(Blur Blur.cpp)\n",
+    "cmake/NukeConfig.cmake": (
+        "set_target_properties(Nuke::NDK PROPERTIES\n"
+        '    IMPORTED_LOCATION "${Nuke_ROOT}/libDDImage.so"\n'
+        "    INTERFACE_LINK_LIBRARIES FdkBase)\n"
+    ),
+    "libDDImage.so.15": "ddimage",
+    "libFdkBase.so": "fdk",
+    "libFnUnused.so": "unused" * 100,
+    "source/README": "source",
+}
+
+
+@pytest.fixture
+def nuke_sources(tmp_path: Path) -> Path:
+    """Return a fixture tree of extracted Nuke sources."""
+    root = tmp_path / "_nuke_sources"
+    for name, content in FIXTURE_FILES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    (root / "include" / "Linked.h").symlink_to("DDImage/Knobs.h")
+    (root / "libDDImage.so").symlink_to("libDDImage.so.15")
+    return root
+
+
+def test_find_includes(nuke_sources: Path) -> None:
+    """Test to find quoted and angled includes, also indented ones."""
+    assert find_includes(nuke_sources / "tests" / "Blur.cpp") == [
+        ("DDImage/Iop.h", True),
+        ("Linked.h", False),
+        ("local.h", True),
+    ]
+
+
+def test_scan_includes(nuke_sources: Path) -> None:
+    """Test to follow includes transitively, skipping unresolved ones."""
+    headers = scan_includes(
+        [nuke_sources / "tests" / "Blur.cpp"], [nuke_sources / "include"]
+    )
+
+    assert {
+        header.relative_to(nuke_sources).as_posix() for header in headers
+    } == {
+        "include/DDImage/Iop.h",
+        "include/DDImage/Op.h",
+        "include/DDImage/Knobs.h",
+        "include/Linked.h",
+        "tests/local.h",
+    }
+
+
+def test_find_link_libraries(nuke_sources: Path) -> None:
+    """Test to find libraries by file name or name, following links."""
+    libraries = find_link_libraries(nuke_sources)
+
+    assert {library.name for library in libraries} == {
+        "libDDImage.so",
+        "libDDImage.so.15",
+        "libFdkBase.so",
+    }
+
+
+def test_compute_retain_manifest(nuke_sources: Path) -> None:
+    """Test to keep needed headers and libraries and all other folders."""
+    manifest = compute_retain_manifest(nuke_sources)
+
+    assert manifest.paths == {
+        "include/DDImage/Iop.h",
+        "include/DDImage/Op.h",
+        "include/DDImage/Knobs.h",
+        "include/Linked.h",
+        "tests/Blur.cpp",
+        "tests/local.h",
+        "tests/CMakeLists.txt",
+        "cmake/NukeConfig.cmake",
+        "libDDImage.so",
+        "libDDImage.so.15",
+        "libFdkBase.so",
+        "source/README",
+    }
+
+
+def test_prune_to_manifest(nuke_sources: Path, tmp_path: Path) -> None:
+    """Test to write and read the manifest and prune the tree to it."""
+    manifest_path = tmp_path / "_nuke_sources.retain"
+    compute_retain_manifest(nuke_sources).write(manifest_path)
+    manifest = RetainManifest.load(manifest_path)
+
+    files_removed, bytes_removed = prune_to_manifest(nuke_sources, manifest)
+
+    assert manifest_path.read_text().startswith("# Nuke files retained")
+    assert files_removed == len(FIXTURE_FILES.keys() - manifest.paths)
+    assert bytes_removed == len("class Unused;\n") * 2 + 600
+    assert not (nuke_sources / "include" / "FnPlatform").exists()
+    assert {
+        path.relative_to(nuke_sources).as_posix()
+        for path in nuke_sources.rglob("*")
+        if not path.is_dir()
+    } == manifest.paths
+
+
+def test_manifest_applies_to(tmp_path: Path) -> None:
+    """Test a manifest to only apply to its installer, if it lists files."""
+    manifest_path = tmp_path / "_nuke_sources.retain"
+    RetainManifest(frozenset({"include/Op.h"}), "Nuke15.1v5.tgz").write(
+        manifest_path
+    )
+    manifest = RetainManifest.load(manifest_path)
+
+    assert manifest.nuke_source == "Nuke15.1v5.tgz"
+    assert manifest.applies_to("Nuke15.1v5.tgz")
+    assert not manifest.applies_to("Nuke15.1v6.tgz")
+    assert not RetainManifest(frozenset(), "Nuke15.1v5.tgz").applies_to(
+        "Nuke15.1v5.tgz"
+    )
+
+
+def test_empty_manifest_is_refused(nuke_sources: Path, tmp_path: Path) -> None:
+    """Test a manifest without files to never be written or pruned to."""
+    manifest = RetainManifest(frozenset())
+
+    with pytest.raises(ValueError, match="without files"):
+        manifest.write(tmp_path / "_nuke_sources.retain")
+    with pytest.raises(ValueError, match="no files retained"):
+        prune_to_manifest(nuke_sources, manifest)
+    assert (nuke_sources / "include" / "DDImage" / "Op.h").is_file()
+
+
+def test_load_missing_manifest(tmp_path: Path) -> None:
+    """Test a missing manifest to load as None."""
+    assert RetainManifest.load(tmp_path / "_nuke_sources.retain") is None
@@ -0,0 +1,154 @@
+"""Tests related to the lock file pinning the Nuke installers.
+
+@maintainer: Gilles Vink
+"""
+
+import hashlib
+import io
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.sources.downloader import DownloadCache
+from nukedockerbuild.sources.lockfile import (
+    LockedSource,
+    SourcesLock,
+    VerifyingReader,
+    hash_url,
+)
+from tests.conftest import LocalHTTPServer, ServedFile
+
+CONTENT = b"installer" * 1000
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.mark.parametrize("test_etag", ['"abc"', None])
+def test_locked_source_line(test_etag: str | None) -> None:
+    """Test a source to be written and read as a single line."""
+    source = LockedSource(
+        "15.1", "linux", "https://example.com/a b.tgz", SHA256, 9000, test_etag
+    )
+
+    assert LockedSource.from_line(source.to_line()) == source
+
+
+@pytest.mark.parametrize(
+    "test_line", ["15.1 linux abc", "15.1 linux abc big - https://a"]
+)
+def test_locked_source_invalid_line(test_line: str) -> None:
+    """Test to raise for lines that are not a source."""
+    with pytest.raises(ValueError, match="Invalid line in sources lock"):
+        LockedSource.from_line(test_line)
+
+
+def test_write_and_load(tmp_path: Path) -> None:
+    """Test the lock to be written sorted by version and read back."""
+    lock = SourcesLock(tmp_path / "sources.lock")
+    for version in ("15.1", "9.0", "15.10"):
+        source = LockedSource(version, "linux", f"{version}_url", SHA256, 1)
+        lock.sources[source.key] = source
+
+    lock.write()
+
+    lines = lock.path.read_text().splitlines()
+    assert lines[0].startswith("#")
+    assert [line.split()[0] for line in lines[2:]] == ["9.0", "15.1", "15.10"]
+    assert SourcesLock.load(lock.path) == lock
+
+
+def test_load_missing(tmp_path: Path) -> None:
+    """Test a missing lock to be empty."""
+    assert SourcesLock.load(tmp_path / "sources.lock").sources == {}
+
+
+def test_get_only_for_same_url(tmp_path: Path) -> None:
+    """Test a pinned source to be ignored once its URL changed."""
+    lock = SourcesLock(tmp_path / "sources.lock")
+    source = LockedSource("15.1", "linux", "15.1v5_url", SHA256, 1)
+    lock.sources[source.key] = source
+
+    assert lock.get("15.1", "linux", "15.1v5_url") == source
+    assert lock.get("15.1", "linux", "15.1v6_url") is None
+    assert lock.get("15.1", "windows", "15.1v5_url") is None
+
+
+def test_update_hashes_new_sources(
+    tmp_path: Path, http_server: LocalHTTPServer
+) -> None:
+    """Test new URLs to be hashed once and reused afterwards."""
+    linux_url = http_server.add("/linux.tgz", ServedFile(CONTENT, etag='"1"'))
+    windows_url = http_server.add("/windows.zip", ServedFile(b"windows"))
+    lock = SourcesLock(tmp_path / "sources.lock")
+    wanted = [
+        ("15.1", "linux", linux_url),
+        ("15.1", "windows", windows_url),
+        ("15.0", "linux", linux_url),
+    ]
+
+    added = lock.update(wanted, workers=2)
+    lock.update(wanted)
+
+    assert len(added) == len(wanted)
+    assert lock.get("15.1", "linux", linux_url) == LockedSource(
+        "15.1", "linux", linux_url, SHA256, len(CONTENT), '"1"'
+    )
+    assert lock.get("15.0", "linux", linux_url).sha256 == SHA256
+    assert lock.get("15.1", "windows", windows_url).size == len(b"windows")
+    # Every URL is hashed once, also if more versions use it.
+    assert len(http_server.requests) == len({url for *_, url in wanted})
+
+
+def test_update_reuses_download_cache(
+    tmp_path: Path, http_server: LocalHTTPServer
+) -> None:
+    """Test a downloaded installer to be pinned without a request."""
+    url = http_server.add("/linux.tgz", ServedFile(CONTENT))
+    download_cache = DownloadCache(tmp_path / "cache")
+    download_cache.fetch(url)
+    lock = SourcesLock(tmp_path / "sources.lock")
+
+    lock.update([("15.1", "linux", url)], download_cache=download_cache)
+
+    assert lock.get("15.1", "linux", url).sha256 == SHA256
+    assert len(http_server.requests) == 1
+
+
+def test_update_prunes(tmp_path: Path) -> None:
+    """Test sources that are not wanted anymore to be removed."""
+    lock = SourcesLock(tmp_path / "sources.lock")
+    for version in ("15.0", "15.1"):
+        source = LockedSource(version, "linux", f"{version}_url", SHA256, 1)
+        lock.sources[source.key] = source
+
+    lock.update([("15.1", "linux", "15.1_url")], prune=True)
+
+    assert list(lock.sources) == [("15.1", "linux")]
+
+
+def test_hash_url_failed(http_server: LocalHTTPServer) -> None:
+    """Test to raise if the installer could not be downloaded."""
+    url = http_server.add("/linux.tgz", ServedFile(b"", status=404))
+
+    with pytest.raises(ValueError, match="returned 404"):
+        hash_url(url)
+
+
+@pytest.mark.parametrize(
+    ("test_content", "expected_error"),
+    [(CONTENT, None), (CONTENT[:-1], "does not match the sources lock")],
+)
+def test_verifying_reader(
+    test_content: bytes, expected_error: str | None
+) -> None:
+    """Test the stream to be compared to the pinned source, in full."""
+    reader = VerifyingReader(
+        io.BytesIO(test_content),
+        LockedSource("15.1", "linux", "url", SHA256, len(CONTENT)),
+    )
+    assert reader.read(10) == test_content[:10]
+
+    if expected_error:
+        with pytest.raises(ValueError, match=expected_error):
+            reader.verify()
+    else:
+        reader.verify()
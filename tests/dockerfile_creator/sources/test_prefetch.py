@@ -0,0 +1,200 @@
+"""Tests related to the prefetch of installers into the download cache.
+
+@maintainer: Gilles Vink
+"""
+
+import hashlib
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from nukedockerbuild.sources.downloader import DownloadCache
+from nukedockerbuild.sources.lockfile import LockedSource, SourcesLock
+from nukedockerbuild.sources.prefetch import (
+    BandwidthLimiter,
+    Prefetcher,
+    PrefetchProgress,
+    PrefetchSource,
+    find_sources,
+)
+from tests.conftest import LocalHTTPServer, ServedFile
+
+CONTENT = b"installer" * 20000
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+def _write_dockerfile(
+    directory: Path, nuke_version: str, operating_system: str, url: str
+) -> None:
+    """Write a dockerfile installing Nuke from URL into the tree."""
+    path = (
+        directory / "dockerfiles" / nuke_version / operating_system
+        / "Dockerfile"
+    )
+    path.parent.mkdir(parents=True)
+    path.write_text(
+        "FROM image\n"
+        f"LABEL 'com.nukedockerbuild.nuke_source'='{url}'\n"
+    )
+
+
+@pytest.fixture
+def download_cache(tmp_path: Path) -> DownloadCache:
+    """Return an empty download cache."""
+    return DownloadCache(tmp_path / "installers")
+
+
+def test_find_sources(tmp_path: Path) -> None:
+    """Test to find unique installers with their pinned hash and size."""
+    _write_dockerfile(tmp_path, "15.0", "linux", "https://a/Nuke15.0.tgz")
+    _write_dockerfile(tmp_path, "15.1", "linux", "https://a/Nuke15.1.tgz")
+    _write_dockerfile(tmp_path, "15.1", "windows", "https://a/Nuke15.1.tgz")
+    sources_lock = SourcesLock(tmp_path / "sources.lock")
+    sources_lock.sources[("15.1", "linux")] = LockedSource(
+        "15.1", "linux", "https://a/Nuke15.1.tgz", SHA256, len(CONTENT)
+    )
+
+    sources = find_sources(tmp_path, sources_lock)
+
+    assert sources == [
+        PrefetchSource("https://a/Nuke15.0.tgz"),
+        PrefetchSource("https://a/Nuke15.1.tgz", SHA256, len(CONTENT)),
+    ]
+
+
+def test_prefetch_downloads_concurrently(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test to download all installers with a worker pool."""
+    delay = 0.5
+    sources = [
+        PrefetchSource(
+            http_server.add(
+                f"/Nuke15.{minor}.tgz", ServedFile(CONTENT, delay=delay)
+            )
+        )
+        for minor in range(4)
+    ]
+    start = time.perf_counter()
+
+    summary = Prefetcher(download_cache, concurrency=len(sources)).prefetch(
+        sources
+    )
+
+    # Downloading one after the other takes the delay for every installer.
+    assert time.perf_counter() - start < delay * (len(sources) - 1)
+    assert not summary.failed
+    assert summary.downloaded_bytes == len(sources) * len(CONTENT)
+    assert [result.url for result in summary.results] == [
+        source.url for source in sources
+    ]
+    assert all(
+        download_cache.lookup(source.url).sha256 == SHA256
+        for source in sources
+    )
+
+
+def test_prefetch_skips_cached(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test to not download installers that are cached already."""
+    source = PrefetchSource(
+        http_server.add("/Nuke15.1.tgz", ServedFile(CONTENT)), SHA256
+    )
+    Prefetcher(download_cache).prefetch([source])
+
+    summary = Prefetcher(download_cache).prefetch([source])
+
+    assert summary.downloaded_bytes == 0
+    assert summary.results[0].cached.sha256 == SHA256
+    assert len(http_server.requests) == 1
+
+
+def test_prefetch_reports_failures(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test to continue with other installers if one fails."""
+    good = PrefetchSource(http_server.add("/good.tgz", ServedFile(CONTENT)))
+    missing = PrefetchSource(
+        http_server.add("/missing.tgz", ServedFile(b"", status=404))
+    )
+    mismatch = PrefetchSource(
+        http_server.add("/changed.tgz", ServedFile(b"changed")),
+        hashlib.sha256(b"pinned").hexdigest(),
+    )
+
+    summary = Prefetcher(download_cache, concurrency=2).prefetch(
+        [missing, good, mismatch]
+    )
+
+    assert [result.url for result in summary.failed] == [
+        missing.url,
+        mismatch.url,
+    ]
+    assert "404" in summary.failed[0].error
+    assert summary.results[1].cached.sha256 == SHA256
+    assert download_cache.lookup(mismatch.url) is None
+
+
+def test_prefetch_bandwidth_cap(
+    download_cache: DownloadCache, http_server: LocalHTTPServer
+) -> None:
+    """Test the bandwidth cap to be shared by all downloads."""
+    sources = [
+        PrefetchSource(http_server.add(f"/Nuke{index}.tgz", ServedFile(data)))
+        for index, data in enumerate([CONTENT, CONTENT[::-1]])
+    ]
+    rate = len(CONTENT)
+    start = time.perf_counter()
+
+    Prefetcher(
+        download_cache, concurrency=2, max_bytes_per_second=rate
+    ).prefetch(sources)
+
+    # The first second of bandwidth is available at once, as burst.
+    seconds = (len(CONTENT) * len(sources) - rate) / rate
+    assert time.perf_counter() - start >= seconds * 0.9
+
+
+def test_bandwidth_limiter() -> None:
+    """Test the limiter to sleep once the burst is used up."""
+    rate, burst = 1000, 100
+    limiter = BandwidthLimiter(rate, burst=burst)
+    start = time.perf_counter()
+
+    limiter.acquire(burst)
+    assert time.perf_counter() - start < burst / rate / 2
+    limiter.acquire(2 * burst)
+
+    # The burst is used up, so all of it waits for the rate.
+    assert time.perf_counter() - start >= 2 * burst / rate * 0.95
+
+
+def test_bandwidth_limiter_invalid() -> None:
+    """Test to raise for a limit that is not positive."""
+    with pytest.raises(ValueError, match="more than 0 bytes/s"):
+        BandwidthLimiter(0)
+
+
+def test_prefetch_progress() -> None:
+    """Test to log aggregated progress at most once per interval."""
+    progress = PrefetchProgress(2, total_bytes=4 * 1024 * 1024, interval=60)
+
+    with patch("nukedockerbuild.sources.prefetch.logger") as logger:
+        progress.add(1024 * 1024)
+        progress.add(1024 * 1024)
+        progress.finish()
+        progress.finish(failed=True)
+
+    messages = [call.args[0] for call in logger.info.call_args_list]
+    # The second download is within the interval of the first one.
+    assert [message.split(",")[0] for message in messages] == [
+        "Prefetched 0/2 installers",
+        "Prefetched 1/2 installers",
+        "Prefetched 1/2 installers",
+    ]
+    assert messages[-1].startswith(
+        "Prefetched 1/2 installers, 1 failed, 2.0 of 4.0 MB downloaded at"
+    )
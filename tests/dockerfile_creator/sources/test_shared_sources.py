@@ -0,0 +1,169 @@
+"""Tests related to splitting Nuke sources in shared and delta files.
+
+@maintainer: Gilles Vink
+"""
+
+import io
+import tarfile
+import zipfile
+from pathlib import Path
+
+from nukedockerbuild.sources.extractor import prepare_nuke_sources
+from nukedockerbuild.sources.shared_sources import (
+    SHARED_MTIME,
+    split_shared_sources,
+)
+from tests.conftest import LocalHTTPServer, ServedFile
+
+VERSION_FILES = {
+    "15.0": {
+        "include/DDImage/Op.h": "class Op;",
+        "include/DDImage/Iop.h": "class Iop;",
+        "cmake/NukeConfig.cmake": "config 15.0",
+        "libDDImage.so": "ddimage 15.0",
+    },
+    "15.1": {
+        "include/DDImage/Op.h": "class Op;",
+        "include/DDImage/Iop.h": "class Iop;",
+        "include/DDImage/New.h": "class New;",
+        "cmake/NukeConfig.cmake": "config 15.1",
+        "libDDImage.so": "ddimage 15.1",
+    },
+}
+
+
+def _prepare(root: Path, version: str, files: dict[str, str]) -> Path:
+    """Write prepared sources next to the dockerfile of a version."""
+    directory = root / "dockerfiles" / version / "linux"
+    for name, content in files.items():
+        path = directory / "_nuke_sources" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    (directory / "_nuke_sources" / "libDDImage.so.1").symlink_to(
+        "libDDImage.so"
+    )
+    return directory
+
+
+def _files(root: Path) -> dict[str, str]:
+    """Return the files and link targets below the root."""
+    return {
+        path.relative_to(root).as_posix(): (
+            f"-> {path.readlink()}" if path.is_symlink() else path.read_text()
+        )
+        for path in root.rglob("*")
+        if path.is_symlink() or path.is_file()
+    }
+
+
+def test_split_shared_sources(tmp_path: Path) -> None:
+    """Test common files to move to the shared folder of every version."""
+    directories = [
+        _prepare(tmp_path, version, files)
+        for version, files in VERSION_FILES.items()
+    ]
+
+    result = split_shared_sources(directories)
+
+    assert (result.shared_files, result.delta_files) == (3, 5)
+    assert result.shared_bytes == len("class Op;class Iop;libDDImage.so")
+    for directory in directories:
+        assert _files(directory / "_nuke_sources_shared") == {
+            "include/DDImage/Op.h": "class Op;",
+            "include/DDImage/Iop.h": "class Iop;",
+            "libDDImage.so.1": "-> libDDImage.so",
+        }
+        shared = directory / "_nuke_sources_shared" / "include"
+        assert shared.stat().st_mtime == SHARED_MTIME
+    assert set(_files(directories[0] / "_nuke_sources")) == {
+        "cmake/NukeConfig.cmake",
+        "libDDImage.so",
+    }
+    assert not (directories[0] / "_nuke_sources" / "include").exists()
+    assert "include/DDImage/New.h" in _files(directories[1] / "_nuke_sources")
+
+
+def test_split_shared_sources_again(tmp_path: Path) -> None:
+    """Test an added version to merge and split the earlier versions."""
+    directories = [
+        _prepare(tmp_path, version, files)
+        for version, files in VERSION_FILES.items()
+    ]
+    split_shared_sources(directories)
+    directories.append(
+        _prepare(tmp_path, "15.2", {"include/DDImage/Op.h": "class Op;"})
+    )
+
+    result = split_shared_sources(directories)
+
+    shared = _files(directories[-1] / "_nuke_sources_shared")
+    assert shared == {
+        "include/DDImage/Op.h": "class Op;",
+        "libDDImage.so.1": "-> libDDImage.so",
+    }
+    assert result.shared_files == len(shared)
+    assert _files(directories[0] / "_nuke_sources") == {
+        "include/DDImage/Iop.h": "class Iop;",
+        "cmake/NukeConfig.cmake": "config 15.0",
+        "libDDImage.so": "ddimage 15.0",
+    }
+    for directory, files in zip(
+        directories, [*VERSION_FILES.values(), {}], strict=True
+    ):
+        merged = _files(directory / "_nuke_sources_shared")
+        merged.update(_files(directory / "_nuke_sources"))
+        assert merged == {
+            **files,
+            "include/DDImage/Op.h": "class Op;",
+            "libDDImage.so.1": "-> libDDImage.so",
+        }
+
+
+def _archive(members: dict[str, bytes]) -> bytes:
+    """Return a Linux archive with an installer containing the members."""
+    installer = io.BytesIO()
+    with zipfile.ZipFile(installer, "w") as zip_file:
+        for name, content in members.items():
+            zip_file.writestr(name, content)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        info = tarfile.TarInfo("Nuke-linux-x86_64.run")
+        info.size = len(installer.getvalue())
+        tar.addfile(info, io.BytesIO(installer.getvalue()))
+    return buffer.getvalue()
+
+
+def test_split_after_preparing_again(
+    tmp_path: Path, http_server: LocalHTTPServer
+) -> None:
+    """Test files dropped by a new patch release to not come back."""
+    members = {
+        "include/DDImage/Op.h": b"class Op;",
+        "include/DDImage/Old.h": b"class Old;",
+    }
+    directories = {
+        version: tmp_path / "dockerfiles" / version / "linux"
+        for version in ("15.0", "15.1")
+    }
+    for version, directory in directories.items():
+        url = http_server.add(
+            f"/Nuke{version}v1.tgz", ServedFile(_archive(members))
+        )
+        prepare_nuke_sources(url, float(version), directory)
+    split_shared_sources(list(directories.values()))
+    url = http_server.add(
+        "/Nuke15.1v2.tgz",
+        ServedFile(_archive({"include/DDImage/Op.h": b"class Op;"})),
+    )
+
+    prepare_nuke_sources(url, 15.1, directories["15.1"])
+    result = split_shared_sources(list(directories.values()))
+
+    assert result.shared_files == 1
+    assert _files(directories["15.1"] / "_nuke_sources_shared") == {
+        "include/DDImage/Op.h": "class Op;"
+    }
+    assert _files(directories["15.1"] / "_nuke_sources") == {}
+    assert _files(directories["15.0"] / "_nuke_sources") == {
+        "include/DDImage/Old.h": "class Old;"
+    }
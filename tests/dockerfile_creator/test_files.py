@@ -0,0 +1,50 @@
+"""Tests for the file helpers shared by the caches and stores."""
+
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.files import open_atomic, write_atomic
+
+
+@pytest.mark.parametrize("content", ["text\n", b"\x00bytes"])
+def test_write_atomic(tmp_path: Path, content: str | bytes) -> None:
+    """Test to write text and bytes, creating the parent directory."""
+    path = tmp_path / "cache" / "index.json"
+
+    write_atomic(path, content)
+
+    assert path.read_bytes() == (
+        content if isinstance(content, bytes) else content.encode()
+    )
+    assert [child.name for child in path.parent.iterdir()] == ["index.json"]
+
+
+def test_open_atomic_keeps_file_until_complete(tmp_path: Path) -> None:
+    """Test the existing file to stay until the new one is written."""
+    path = tmp_path / "sources.lock"
+    path.write_text("old\n")
+
+    with open_atomic(path) as file:
+        file.write("new\n")
+        assert path.read_text() == "old\n"
+
+    assert path.read_text() == "new\n"
+
+
+def test_open_atomic_removes_temporary_file_on_error(tmp_path: Path) -> None:
+    """Test to leave the existing file and nothing else if writing fails."""
+    path = tmp_path / "sources.lock"
+    path.write_text("old\n")
+    msg = "interrupted"
+
+    def write_partially() -> None:
+        with open_atomic(path) as file:
+            file.write("partial")
+            raise ValueError(msg)
+
+    with pytest.raises(ValueError, match=msg):
+        write_partially()
+
+    assert path.read_text() == "old\n"
+    assert list(tmp_path.iterdir()) == [path]
@@ -0,0 +1,147 @@
+"""Tests for the timing spans of the pipeline."""
+
+import json
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from nukedockerbuild.benchmarks.render import synthetic_dockerfiles
+from nukedockerbuild.creator.create_dockerfiles import write_dockerfiles
+from nukedockerbuild.tracing import PHASES, TRACER, Tracer
+
+
+@pytest.fixture
+def tracer() -> Iterator[Tracer]:
+    """Return the module tracer, enabled for the test only."""
+    TRACER.enable()
+    yield TRACER
+    TRACER.disable()
+    TRACER.spans.clear()
+
+
+def test_span_records_only_if_enabled() -> None:
+    """Test spans to be discarded while tracing is disabled."""
+    tracer = Tracer()
+    with tracer.span("render") as span:
+        span.add(byte_count=10, item_count=1)
+    assert tracer.spans == []
+
+    tracer.enable()
+    first_bytes, second_bytes = 10, 5
+    with tracer.span("render", target="15.1-linux") as span:
+        span.add(byte_count=first_bytes, item_count=1)
+        span.add(byte_count=second_bytes)
+
+    assert len(tracer.spans) == 1
+    assert tracer.spans[0].byte_count == first_bytes + second_bytes
+    assert tracer.spans[0].attributes == {"target": "15.1-linux"}
+    assert tracer.spans[0].duration >= 0
+
+
+def test_span_records_on_error() -> None:
+    """Test a span to be recorded if the block raised."""
+    tracer = Tracer(enabled=True)
+
+    msg = "failed"
+    with pytest.raises(ValueError, match=msg), tracer.span("build"):
+        raise ValueError(msg)
+
+    assert [span.phase for span in tracer.spans] == ["build"]
+
+
+def test_summary_across_threads() -> None:
+    """Test the totals per phase of spans from concurrent threads."""
+    tracer = Tracer(enabled=True)
+    spans_per_thread, bytes_per_span = 100, 2
+
+    def download() -> None:
+        for _ in range(spans_per_thread):
+            with tracer.span("download") as span:
+                span.add(byte_count=bytes_per_span, item_count=1)
+
+    threads = [threading.Thread(target=download) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = tracer.summary()
+    assert list(summary)[: len(PHASES)] == list(PHASES)
+    spans = len(threads) * spans_per_thread
+    assert summary["download"].spans == spans
+    assert summary["download"].byte_count == spans * bytes_per_span
+    assert summary["build"].spans == 0
+
+
+def test_to_trace() -> None:
+    """Test the trace to contain a complete event per span."""
+    tracer = Tracer(enabled=True)
+    byte_count = 100
+    with tracer.span("fetch", url="https://example.com") as span:
+        span.add(byte_count=byte_count)
+
+    trace = tracer.to_trace()
+
+    (event,) = trace["traceEvents"]
+    assert event["name"] == "fetch"
+    assert event["ph"] == "X"
+    assert event["args"] == {
+        "bytes": byte_count,
+        "items": 0,
+        "url": "https://example.com",
+    }
+    assert trace["otherData"]["phases"]["fetch"]["bytes"] == byte_count
+
+
+def test_to_prometheus() -> None:
+    """Test the textfile to contain a sample per phase and metric."""
+    tracer = Tracer(enabled=True)
+    with tracer.span("write") as span:
+        span.add(byte_count=1024, item_count=3)
+
+    lines = tracer.to_prometheus().splitlines()
+
+    assert "# TYPE nukedockerbuild_phase_seconds gauge" in lines
+    assert 'nukedockerbuild_phase_bytes{phase="write"} 1024' in lines
+    assert 'nukedockerbuild_phase_items{phase="write"} 3' in lines
+    assert 'nukedockerbuild_phase_spans{phase="build"} 0' in lines
+    samples = [line for line in lines if not line.startswith("#")]
+    assert len(samples) == len(PHASES) * 4 + 2
+    assert all(sample.count(" ") == 1 for sample in samples)
+
+
+def test_write(tmp_path: Path) -> None:
+    """Test to write the trace and the textfile."""
+    tracer = Tracer(enabled=True)
+    with tracer.span("plan"):
+        pass
+
+    tracer.write_trace(tmp_path / "metrics" / "trace.json")
+    tracer.write_prometheus(tmp_path / "metrics" / "nukedockerbuild.prom")
+
+    trace = json.loads((tmp_path / "metrics" / "trace.json").read_text())
+    assert len(trace["traceEvents"]) == 1
+    assert sorted(path.name for path in (tmp_path / "metrics").iterdir()) == [
+        "nukedockerbuild.prom",
+        "trace.json",
+    ]
+
+
+def test_write_dockerfiles_spans(tmp_path: Path, tracer: Tracer) -> None:
+    """Test the generator to record render, plan and write spans."""
+    dockerfiles = synthetic_dockerfiles(20)
+
+    write_dockerfiles(tmp_path, dockerfiles)
+
+    summary = tracer.summary()
+    assert summary["render"].item_count == len(dockerfiles)
+    assert summary["write"].item_count == len(dockerfiles)
+    assert summary["write"].byte_count == summary["render"].byte_count
+    plan_steps = [
+        span.attributes["step"]
+        for span in tracer.spans
+        if span.phase == "plan"
+    ]
+    assert plan_steps == ["manifest", "removed"]